@@ -29,6 +29,9 @@
 #include <iostream>
 #include <sstream>
 #include <sys/socket.h>
+#include <sys/time.h>
+#include <sys/uio.h>
+#include <sys/un.h>
 #include <unistd.h>
 #include <sys/wait.h>
 
@@ -41,6 +44,12 @@ typedef util::unique_ptr<char[]> char_array;
 
 
 char const OMI_PYTHON_VERSION_STR[] = "OMI_PYTHON_VERSION";
+char const OMI_PYTHON_HOST_STR[] = "OMI_PYTHON_HOST_SOCKET";
+// seconds to wait for the python host to acknowledge a session
+int const HOST_ACK_TIMEOUT_SEC = 5;
+// handToHost: the session socket was sent, but the host did not
+// acknowledge it, so it may or may not serve the session
+int const HOST_NO_ACK = 2;
 char const DEFAULT_PYTHON_VERSION[] = "python";
 char const DEFAULT_OMI_PATH[] = "/opt/omi/";
 char const SCRIPT_PATH_EXTENSION[] = "/lib/Scripts/";
@@ -520,12 +529,36 @@ PythonProvider::forkExec ()
     {
         int sockets[2];
         int result = socketpair (AF_UNIX, SOCK_STREAM, 0, sockets);
+        int handed = EXIT_FAILURE;
+        if (-1 != result)
+        {
+            handed = handToHost (sockets[0]);
+            if (HOST_NO_ACK == handed)
+            {
+                // the host may hold sockets[0] already; a python process
+                // of our own must not serve the same session, so it gets
+                // a new pair
+                SCX_BOOKEND_PRINT ("the python host did not acknowledge the session");
+                close (sockets[0]);
+                close (sockets[1]);
+                result = socketpair (AF_UNIX, SOCK_STREAM, 0, sockets);
+            }
+        }
         if (-1 != result)
         {
             // socketpair succeeded
             SCX_BOOKEND_PRINT ("socketpair - succeeded");
-            m_pid = fork ();
-            if (0 == m_pid)
+            if (EXIT_SUCCESS == handed)
+            {
+                // a persistent python host took the session, there is no
+                // child process of our own to wait for
+                SCX_BOOKEND_PRINT ("handed the session to the python host");
+                close (sockets[0]);
+                m_FD = sockets[1];
+                m_pid = -2;
+                rval = EXIT_SUCCESS;
+            }
+            else if (0 == (m_pid = fork ()))
             {
                 // fork succeded, this is the child process
                 SCX_BOOKEND_PRINT ("fork - succeeded: this is the child");
@@ -595,6 +628,78 @@ PythonProvider::forkExec ()
 }
 
 
+int
+PythonProvider::handToHost (
+    int const sessionSocket)
+{
+    // if OMI_PYTHON_HOST_SOCKET names the control socket of a running
+    // "client.py --host", pass the session socket to it (SCM_RIGHTS) and
+    // wait up to HOST_ACK_TIMEOUT_SEC for the one byte acknowledgement.
+    // Returns EXIT_SUCCESS when the host took the session, EXIT_FAILURE
+    // when it was not sent and HOST_NO_ACK when it was sent but not
+    // acknowledged.
+    int rval = EXIT_FAILURE;
+    char const* const sPath = getenv (OMI_PYTHON_HOST_STR);
+    sockaddr_un addr;
+    if (NULL == sPath || '\0' == *sPath ||
+        sizeof (addr.sun_path) <= strlen (sPath))
+    {
+        return rval;
+    }
+    int hostSocket = socket (AF_UNIX, SOCK_STREAM, 0);
+    if (INVALID_SOCKET == hostSocket)
+    {
+        return rval;
+    }
+    memset (&addr, 0, sizeof (addr));
+    addr.sun_family = AF_UNIX;
+    strncpy (addr.sun_path, sPath, sizeof (addr.sun_path) - 1);
+    timeval timeout;
+    timeout.tv_sec = HOST_ACK_TIMEOUT_SEC;
+    timeout.tv_usec = 0;
+    if (0 == setsockopt (hostSocket, SOL_SOCKET, SO_RCVTIMEO,
+                         &timeout, sizeof (timeout)) &&
+        0 == setsockopt (hostSocket, SOL_SOCKET, SO_SNDTIMEO,
+                         &timeout, sizeof (timeout)) &&
+        0 == connect (hostSocket, reinterpret_cast<sockaddr*>(&addr),
+                      sizeof (addr)))
+    {
+        char tag = 'S';
+        iovec iov;
+        iov.iov_base = &tag;
+        iov.iov_len = 1;
+        char control[CMSG_SPACE (sizeof (int))];
+        memset (control, 0, sizeof (control));
+        msghdr msg;
+        memset (&msg, 0, sizeof (msg));
+        msg.msg_iov = &iov;
+        msg.msg_iovlen = 1;
+        msg.msg_control = control;
+        msg.msg_controllen = sizeof (control);
+        cmsghdr* pCmsg = CMSG_FIRSTHDR (&msg);
+        pCmsg->cmsg_level = SOL_SOCKET;
+        pCmsg->cmsg_type = SCM_RIGHTS;
+        pCmsg->cmsg_len = CMSG_LEN (sizeof (int));
+        memcpy (CMSG_DATA (pCmsg), &sessionSocket, sizeof (int));
+        char ack = 0;
+        if (1 == sendmsg (hostSocket, &msg, 0))
+        {
+            if (1 == read (hostSocket, &ack, 1) &&
+                'A' == ack)
+            {
+                rval = EXIT_SUCCESS;
+            }
+            else
+            {
+                rval = HOST_NO_ACK;
+            }
+        }
+    }
+    close (hostSocket);
+    return rval;
+}
+
+
 int
 PythonProvider::verifySocketState ()
 {
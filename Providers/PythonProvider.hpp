@@ -72,6 +72,7 @@ private:
     PythonProvider& operator = (PythonProvider const&); // = delete
 
     int forkExec ();
+    int handToHost (int const sessionSocket);
 
     int verifySocketState ();
     void handleSocketClosed ();
@@ -144,6 +145,14 @@ private:
     static unsigned char const SET = 1;
     static unsigned char const GET = 2;
     static unsigned char const INVENTORY = 3;
+    // BATCH: int32 count, then count (op, name, values) requests; the
+    // reply is the count followed by one TEST/SET/GET/INVENTORY reply per
+    // request, in order
+    static unsigned char const BATCH = 4;
+    // MUX: uint32 request id, then one request; the reply is the request
+    // id followed by the ordinary reply, and replies may arrive out of
+    // order
+    static unsigned char const MUX = 5;
 
     std::string const m_Name;
     int m_FD;
@@ -1948,8 +1948,8 @@ class nxServiceTestCases(unittest2.TestCase):
             if Name != None and len(Name) and not fnmatch.fnmatch(i['Name'].value,Name):
                 print 'Name:' + Name + ' != ' + i['Name'].value
                 return False
-            if Enabled is not None and Enabled != i['Enabled'].value.value:
-                print 'Enabled:' + repr(Enabled) + ' != ' + repr(i['Enabled'].value.value)
+            if Enabled is not None and Enabled != i['Enabled'].value:
+                print 'Enabled:' + repr(Enabled) + ' != ' + repr(i['Enabled'].value)
                 return False
             if State != None and len(State) and not fnmatch.fnmatch(i['State'].value,State):
                 print 'State:' + State + ' != ' + i['State'].value
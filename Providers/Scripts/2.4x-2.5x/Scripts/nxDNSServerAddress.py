@@ -12,6 +12,11 @@ import imp
 import socket
 protocol=imp.load_source('protocol','../protocol.py')
 
+# Edits /etc/resolv.conf, or the interface files nxIPAddress
+# rewrites, under the nxIPAddress lock.
+THREAD_SAFE = False
+THREAD_LOCK = 'nxIPAddress'
+
 """
 Ubuntu/Debian: /etc/network/interfaces:dns-nameservers 8.8.8.8 8.8.4.4
 
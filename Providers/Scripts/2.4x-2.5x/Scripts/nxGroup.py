@@ -14,6 +14,11 @@ nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 helperlib = imp.load_source('helperlib', '../helperlib.py')
 LG = nxDSCLog.DSCLog
 
+# groupadd and groupmod lock /etc/group, which nxUser changes through
+# useradd; requests for either module take the nxUser lock.
+THREAD_SAFE = False
+THREAD_LOCK = 'nxUser'
+
 # [ClassVersion("1.0.0"), FriendlyName("nxGroup"),SupportsInventory()]
 # class MSFT_nxGroupResource:OMI_BaseResource
 # {
@@ -15,18 +15,28 @@ nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 
 LG = nxDSCLog.DSCLog
 
+# customlog.conf is rewritten whole here and by nxOMSSudoCustomLog,
+# so the two modules share one lock.
+THREAD_SAFE = False
+THREAD_LOCK = 'nxOMSCustomLog'
+
 conf_path = '/etc/opt/microsoft/omsagent/conf/omsagent.d/customlog.conf'
 
 def init_vars(CustomLogObjects):
     new_customlogs = []
     if CustomLogObjects is not None :
         for customlog in CustomLogObjects:
-            if customlog['LogName'].value is not None:
-                customlog['LogName'] = customlog['LogName'].value.encode('ascii','ignore')
+            # nested values arrive plain from client.py; tests may still
+            # pass MI_Value objects
+            for key in list(customlog.keys()):
+                if 'value' in dir(customlog[key]):
+                    customlog[key] = customlog[key].value
+            if customlog['LogName'] is not None:
+                customlog['LogName'] = customlog['LogName'].encode('ascii','ignore')
 
             new_filepaths = []
-            if customlog['FilePath'] is not None and len(customlog['FilePath'].value) > 0:
-                for filepath in customlog['FilePath'].value:
+            if customlog['FilePath'] is not None and len(customlog['FilePath']) > 0:
+                for filepath in customlog['FilePath']:
                     if filepath is not None and len(filepath) > 0: 
                         new_filepaths.append(filepath.encode('ascii','ignore'))
             if len(new_filepaths) > 0:
@@ -28,15 +28,15 @@ def init_vars(Instances):
     new_instances = []
     if Instances is not None :
         for instance in Instances:
-            if instance['InstanceName'].value is not None:
-                instance['InstanceName']=instance['InstanceName'].value
-
-            if instance['ClassName'].value is not None:
-                instance['ClassName']=instance['ClassName'].value
+            # nested values arrive plain from client.py; tests may still
+            # pass MI_Value objects
+            for key in list(instance.keys()):
+                if 'value' in dir(instance[key]):
+                    instance[key] = instance[key].value
 
             new_properties = []
-            if instance['Properties'] is not None and len(instance['Properties'].value) > 0:
-                for property in instance['Properties'].value:
+            if instance['Properties'] is not None and len(instance['Properties']) > 0:
+                for property in instance['Properties']:
                     if property is not None and len(property) > 0:
                         new_properties.append(property)
 
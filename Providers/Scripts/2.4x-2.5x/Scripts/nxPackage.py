@@ -28,6 +28,10 @@ nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 helperlib = imp.load_source('helperlib', '../helperlib.py')
 LG = nxDSCLog.DSCLog
 
+# dpkg, rpm and zypper hold a system wide lock, so a second package
+# request running alongside would fail rather than wait.
+THREAD_SAFE = False
+
 # [ClassVersion("1.0.0"),FriendlyName("nxPackage"),SupportsInventory()]
 # class MSFT_nxPackageResource : OMI_BaseResource
 # {
@@ -17,6 +17,10 @@ nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 helperlib = imp.load_source('helperlib', '../helperlib.py')
 LG = nxDSCLog.DSCLog
 
+# chkconfig, update-rc.d and systemctl enable rewrite the same init
+# links and unit symlinks, so two nxService requests must not overlap.
+THREAD_SAFE = False
+
 # [ClassVersion("1.0.0"),FriendlyName("nxService"), SupportsInventory()]
 # class MSFT_nxServiceResource : OMI_BaseResource
 # {
@@ -480,9 +480,9 @@ if nxService != None:
                     cls.srv_names['Running'] = srv['Name'].value
                 if srv['State'].value == 'Stopped' :
                     cls.srv_names['Stopped'] = srv['Name'].value
-                if srv['Enabled'].value.value == True :
+                if srv['Enabled'].value == True :
                     cls.srv_names['Enabled'] = srv['Name'].value
-                if srv['Enabled'].value.value == False :
+                if srv['Enabled'].value == False :
                     cls.srv_names['Disabled'] = srv['Name'].value
                 if len(cls.srv_names.keys()) == 4:
                     break
@@ -499,8 +499,8 @@ if nxService != None:
                 if Name != None and len(Name) and not fnmatch.fnmatch(i['Name'].value,Name):
                     print 'Name:' + Name + ' != ' + i['Name'].value
                     return False
-                if Enabled is not None and Enabled != i['Enabled'].value.value:
-                    print 'Enabled:' + repr(Enabled) + ' != ' + repr(i['Enabled'].value.value)
+                if Enabled is not None and Enabled != i['Enabled'].value:
+                    print 'Enabled:' + repr(Enabled) + ' != ' + repr(i['Enabled'].value)
                     return False
                 if State != None and len(State) and not fnmatch.fnmatch(i['State'].value,State):
                     print 'State:' + State + ' != ' + i['State'].value
@@ -20,6 +20,7 @@ import imp
 protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 helperlib = imp.load_source('helperlib', '../helperlib.py')
+filehash = imp.load_source('filehash', '../filehash.py')
 
 LG = nxDSCLog.DSCLog
 try:
@@ -30,6 +31,10 @@ except ImportError:
     md5const = md5.md5
 
 BLOCK_SIZE = 8192
+# Checksum values that compare contents.  Whichever is given, the files
+# are compared by the md5 of their blocks, which this python always has;
+# equal contents are what every one of them stands for.
+CONTENT_CHECKSUMS = filehash.CHECKSUMS
 
 global show_mof
 show_mof = False
@@ -389,7 +394,7 @@ def CompareFiles(DestinationPath, SourcePath, Checksum):
     stat_src = StatFile(SourcePath)
     if stat_src.st_size != stat_dest.st_size:
         return -1
-    if Checksum == "md5":
+    if Checksum in CONTENT_CHECKSUMS:
         src_error = None
         dest_error = None
         src_hash = md5const()
@@ -429,6 +434,9 @@ def CompareFiles(DestinationPath, SourcePath, Checksum):
             return -1
         else:
             return 0
+    else:
+        LG().Log('ERROR', "Unknown Checksum " + Checksum + ", " + DestinationPath + " is taken to differ from " + SourcePath)
+        return -1
 
 
 def RemoveTree(path):
@@ -1107,7 +1115,10 @@ def TestRemoteFile(fc):
         LG().Log('ERROR', repr(e))
         return False
     h = resp.info()
-    if fc.Checksum != 'md5' :  # if not 'md5' check the last_modified header time before we download
+    if fc.Checksum not in CONTENT_CHECKSUMS and fc.Checksum not in ('ctime', 'mtime'):
+        LG().Log('ERROR', "Unknown Checksum " + fc.Checksum + ", " + fc.DestinationPath + " is taken to differ from " + fc.SourcePath)
+        return False
+    if fc.Checksum not in CONTENT_CHECKSUMS:  # check the last_modified header time before we download
         lm = h.getheader('last-modified')
         remote_mtime = GetTimeFromString(lm)
         destination_mtime = None
@@ -1123,7 +1134,7 @@ def TestRemoteFile(fc):
             return True
         else:
             return False
-    #md5
+    # contents, by their md5
     if not os.path.exists(fc.DestinationPath):
         return False
     src_data=b'keep going'
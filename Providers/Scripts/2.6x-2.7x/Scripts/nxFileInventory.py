@@ -19,15 +19,10 @@ import imp
 protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 LG = nxDSCLog.DSCLog
-try:
-    import hashlib
-    md5const = hashlib.md5
-    shaconst = hashlib.sha256
-except ImportError: # Only sha-1 is available for python2.4.
-    import md5
-    md5const = md5.md5
-    import sha
-    shaconst = sha.sha
+filehash = imp.load_source('filehash', '../filehash.py')
+
+# Only reads the trees it lists, so two inventories may run at once.
+THREAD_SAFE = True
 
 # [ClassVersion("1.0.0"), Description("The configuration provider for files and directories."), FriendlyName("nxFileInventory")]
 # class MSFT_nxFileInventoryResource:OMI_BaseResource
@@ -36,7 +31,7 @@ except ImportError: # Only sha-1 is available for python2.4.
 #   [Write, InventoryFilter] boolean Recurse;  //default = false
 #   [Write, InventoryFilter] boolean UseSudo;  //default = false
 #   [Write, ValueMap{"follow", "manage", "ignore" }, Values{"follow", "manage", "ignore"},InventoryFilter] string Links; //default follow
-#   [Write, ValueMap{"md5", "sha-256", "mtime", "ctime"}, Values{"md5","sha-256","mtime","ctime"},InventoryFilter] string Checksum; //default md5
+#   [Write, ValueMap{"md5", "sha-256", "blake2b", "xxh3", "xxh128", "mtime", "ctime"}, Values{"md5","sha-256","blake2b","xxh3","xxh128","mtime","ctime"},InventoryFilter] string Checksum; //default md5
 #   [Write, ValueMap{"file", "directory", "*"},Values{"file", "directory","*"}, InventoryFilter] string Type; //default *
 #   [Write, InventoryFilter] uint32 MaxContentsReturnable;  //default 1024 bytes
 #   [Write, InventoryFilter] uint64 MaxOutputSize; //default 10485760 bytes
@@ -252,7 +247,7 @@ def GetFileInfo(fname, Links, MaxContentsReturnable, Checksum):
     # dont attempt to read the file
     if stat_info.st_size == 0:
        d['Contents'] = ''
-       if Checksum == 'md5' or Checksum == 'sha-256':
+       if Checksum in filehash.CHECKSUMS:
         d['Checksum'] = ""
        elif Checksum == "ctime":
         d['Checksum']= str(int(stat_info.st_ctime))
@@ -260,7 +255,7 @@ def GetFileInfo(fname, Links, MaxContentsReturnable, Checksum):
         d['Checksum']= str(int(stat_info.st_mtime))
        return d
 
-    if Checksum == 'md5' or Checksum == 'sha-256':
+    if Checksum in filehash.CHECKSUMS:
         d['Checksum'] = GetChecksum(fname,Checksum)
     elif Checksum == "ctime":
         d['Checksum']= str(int(stat_info.st_ctime))
@@ -293,7 +288,7 @@ def GetDirInfo(dname, stat_info, Checksum, Links):
         d['Group'] = grp.getgrgid(stat_info.st_gid).gr_name
     except:
         d['Group'] = str(stat_info.st_gid)
-    if Checksum == 'md5' or Checksum == 'sha-256':
+    if Checksum in filehash.CHECKSUMS:
         d['Checksum'] = '0'
     elif Checksum == "ctime":
         d['Checksum']= str(int(stat_info.st_ctime))
@@ -376,17 +371,12 @@ def StatFile(path):
     return d
 
 def GetChecksum(fname, Checksum):
-    src_error = None
-    src_block = b'loopme'
-    if Checksum == "md5":
-        src_hash = md5const()
-    else : # sha-256
-        src_hash = shaconst()
-    with opened_bin_w_error(fname, 'rb') as (src_file, src_error):
-        if src_error:
-            return ""
-        while src_block :
-            src_block = src_file.read(8192)
-            src_hash.update(src_block)
-        return src_hash.hexdigest()
+    try:
+        return filehash.hash_file(fname, Checksum).hexdigest()
+    except (IOError, OSError):
+        return ""
+    except ValueError:
+        LG().Log('ERROR', 'Checksum ' + Checksum + ' is not available, this python has ' +
+                 ', '.join(filehash.available()))
+        return ""
 
@@ -18,6 +18,10 @@ protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 LG = nxDSCLog.DSCLog
 
+# FilePath is read, edited and written back whole; a second request
+# for the same file at the same time would undo the first.
+THREAD_SAFE = False
+
 # [ClassVersion("1.0.0"), FriendlyName("nxFileLine")]
 # class OMI_nxFileLine : OMI_BaseResource
 # {
@@ -14,6 +14,11 @@ import imp
 import socket
 protocol=imp.load_source('protocol','../protocol.py')
 
+# The interface files rewritten here include /etc/network/interfaces,
+# which nxDNSServerAddress edits too; both take the nxIPAddress lock.
+THREAD_SAFE = False
+THREAD_LOCK = 'nxIPAddress'
+
 """
 MOF:
 
@@ -16,6 +16,11 @@ protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 LG = nxDSCLog.DSCLog
 
+# MYSQL_PWD is set in os.environ for each mysql call; nxMySqlUser and
+# nxMySqlGrant do the same and take the same lock.
+THREAD_SAFE = False
+THREAD_LOCK = 'nxMySql'
+
 # mysqladmin -u root password 'new-password'
 # mysqladmin -h localhost -u root -ppassword create bedrock
 # mysql -e "use mysql; show databases; quit"
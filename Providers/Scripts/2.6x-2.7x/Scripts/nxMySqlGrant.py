@@ -16,6 +16,11 @@ protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 LG = nxDSCLog.DSCLog
 
+# The grants are run through mysql with the credential in MYSQL_PWD in
+# os.environ, which nxMySqlDatabase and nxMySqlUser set too.
+THREAD_SAFE = False
+THREAD_LOCK = 'nxMySql'
+
 
 
 # [ClassVersion("1.0.0"),FriendlyName("nxMySqlGrant")] 
@@ -16,6 +16,11 @@ protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 LG = nxDSCLog.DSCLog
 
+# Every mysql call here reads the credential from MYSQL_PWD in
+# os.environ, shared with nxMySqlDatabase and nxMySqlGrant.
+THREAD_SAFE = False
+THREAD_LOCK = 'nxMySql'
+
 # [ClassVersion("1.0.0"),FriendlyName("nxMySqlUser")] 
 # class MSFT_nxMySqlUserResource : OMI_BaseResource
 # { 
@@ -11,6 +11,9 @@ protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 LG = nxDSCLog.DSCLog
 
+# Keeps no state and changes nothing.
+THREAD_SAFE = True
+
 global show_mof
 show_mof = False
 
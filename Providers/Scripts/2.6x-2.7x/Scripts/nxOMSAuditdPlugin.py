@@ -14,6 +14,10 @@ nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 
 LG = nxDSCLog.DSCLog
 
+# Set_Marshall installs the auditd plugin and rules and restarts
+# omsagent and auoms.
+THREAD_SAFE = False
+
 PLUGIN_CONF = '/etc/audisp/plugins.d/auoms.conf'
 OMSAGENT_CONF = '/etc/opt/microsoft/omsagent/conf/omsagent.d/auoms.conf'
 MODULE_RESOURCE_DIR = '/opt/microsoft/omsconfig/modules/nxOMSAuditdPlugin/DSCResources/MSFT_nxOMSAuditdPluginResource'
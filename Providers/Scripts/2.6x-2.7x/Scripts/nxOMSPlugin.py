@@ -14,6 +14,10 @@ protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 
 LG = nxDSCLog.DSCLog
+
+# Set_Marshall copies plugin and conf files into the omsagent
+# directories and restarts omsagent.
+THREAD_SAFE = False
 try:
     import hashlib
     md5const = hashlib.md5
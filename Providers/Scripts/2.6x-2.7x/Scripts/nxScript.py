@@ -21,6 +21,10 @@ protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 LG = nxDSCLog.DSCLog
 
+# The scripts are started with a preexec_fn that drops to User, and
+# subprocess does not support preexec_fn with other threads running.
+THREAD_SAFE = False
+
 # 	[Key] string GetScript;
 # 	[Key] string SetScript;
 # 	[Key] string TestScript;
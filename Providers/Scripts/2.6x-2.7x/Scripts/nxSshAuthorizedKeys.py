@@ -17,6 +17,9 @@ protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 LG = nxDSCLog.DSCLog
 
+# The authorized_keys file of UserName is rewritten whole.
+THREAD_SAFE = False
+
 # [Key] string KeyComment;
 # [write,ValueMap{"Present", "Absent"},Values{"Present", "Absent"}] string Ensure;
 # [write] string UserName;
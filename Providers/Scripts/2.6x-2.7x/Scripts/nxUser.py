@@ -17,6 +17,11 @@ nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 helperlib = imp.load_source('helperlib', '../helperlib.py')
 LG = nxDSCLog.DSCLog
 
+# useradd, usermod and userdel lock /etc/passwd and /etc/group, which
+# nxGroup changes as well; both modules take the nxUser lock.
+THREAD_SAFE = False
+THREAD_LOCK = 'nxUser'
+
 # [ClassVersion("1.0.0"), FriendlyName("nxUser"),SupportsInventory()]
 # class MSFT_nxUserResource : OMI_BaseResource
 # {
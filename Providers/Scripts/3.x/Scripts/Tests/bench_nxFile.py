@@ -0,0 +1,752 @@
+#!/usr/bin/env python3
+#============================================================================
+# Copyright (c) Microsoft Corporation. All rights reserved. See license.txt for license information.
+#============================================================================
+"""
+Benchmarks for the file operations of Scripts/nxFile.py.  Run from
+Providers/Scripts/3.x so that nxFile finds ../protocol.py.
+
+    python3 Scripts/Tests/bench_nxFile.py [--dir DIR] [--sizes MB,...]
+        [--tree DIRSxFILES] [--nxfile PATH] [--threads N,...] [--latency MS]
+        [--delta-gb GB] [--entries N] [compare] [walk] [set] [copy] [delta]
+        [manifest] [journal] [hash] [owner] [inventory]
+
+compare: CompareFiles with md5 on two equal local files, and on two that
+         differ half way: the previous loop (md5 of both files, hexdigest
+         per 8KB block), the byte comparison alone, the byte comparison
+         feeding the hash cache, and the hash cache answering.  Files up
+         to the size of the page cache are read from memory, larger ones
+         from disk.
+walk:    a recursive directory Test (Checksum mtime) of two identical trees
+         of --tree DIRSxFILES empty files, with the time taken and the
+         stat family calls made (counted in os, as strace is not always
+         at hand).  --nxfile loads another nxFile.py (for example one
+         exported from an older commit) to compare against.
+set:     a recursive directory Set copying a --tree of 16KB files into an
+         empty directory, then a Set over the copy that finds nothing to
+         do, with each of --threads (1 is the serial walk).  --latency
+         adds a sleep to each file copied or compared, standing in for the
+         round trips of a network file system.
+copy:    CopyFile of a --sizes file within --dir, by shutil.copyfile (as
+         before) and by each of COPY_METHODS alone, and of a sparse file
+         of the same size with 1% data.  Run once with --dir on ext4 and
+         once on tmpfs (/dev/shm).
+delta:   updating a --delta-gb file (default 5) in --dir whose source
+         differs in 1% of its DELTA_BLOCK_SIZE blocks, by CopyFile and by
+         DeltaUpdateFile: the time including the sync of what was
+         written, the bytes written by system calls (wchar of
+         /proc/self/io) and the bytes the device of --dir took in
+         (/sys/dev/block/*/stat, so other writers on it count too).
+manifest: opening a source tree manifest of --entries records (default
+         1e6), looking up 10000 paths in it and reading all of it; then a
+         recursive directory Test (Checksum md5) of a --tree of 4KB files
+         walking both trees, and checking the destination against the
+         manifest of the source.
+journal: a recursive directory Test (Checksum md5) of a --tree of 4KB
+         files after 10 of them changed: checking both trees whole, and
+         with a ChangeWatcher (on a thread) journaling them.
+hash:    GB/s of each checksum algorithm this python has (filehash) on
+         the same --sizes files in --dir, read from the page cache: the
+         previous loop (a new 8KB string per read, as nxFileInventory
+         had it) for md5 and sha-256, and filehash.hash_file.
+owner:   a recursive directory Test with Owner and Group (Checksum
+         mtime) of two --tree trees of empty files, and a recursive
+         nxFileInventory of one, with the user and group lookups reaching
+         NSS: without the idcache (a TTL of 0, each one asked as before),
+         with it, and with it preloaded from /etc/passwd and /etc/group.
+         --latency adds a sleep to each lookup NSS answers, standing in
+         for the round trip to an LDAP or SSSD server.
+inventory: a recursive nxFileInventory (Checksum md5) of a --tree of 4KB
+         files: without the inventory index, the run that writes it, a
+         run with nothing changed and one after 1% of the files changed,
+         with the number of files each run read.
+"""
+import hashlib
+import imp
+import os
+import shutil
+import sys
+import threading
+import time
+
+sys.path.insert(0, '.')
+NXFILE_PATH = './Scripts/nxFile.py'
+if '--nxfile' in sys.argv:
+    i = sys.argv.index('--nxfile')
+    NXFILE_PATH = sys.argv[i + 1]
+    del sys.argv[i:i + 2]
+nxFile = imp.load_source('nxFile', NXFILE_PATH)
+nxFileWatcher = imp.load_source('nxFileWatcher', '../nxFileWatcher.py')
+# the delta engine, or nxFile itself for an nxFile.py from before it was split out
+nxFileDelta = getattr(nxFile, 'nxFileDelta', nxFile)
+nxFileWatcher.nxFile = nxFile
+
+BENCH_DIR = '/tmp/bench_nxFile'
+SIZES_MB = (1, 16, 256, 1024)
+TREE = (50, 1000)
+THREADS = (1, 2, 4, 8, 16)
+LATENCY_MS = 0
+DELTA_GB = 5
+ENTRIES = 1000000
+if '--dir' in sys.argv:
+    i = sys.argv.index('--dir')
+    BENCH_DIR = sys.argv[i + 1]
+    del sys.argv[i:i + 2]
+if '--sizes' in sys.argv:
+    i = sys.argv.index('--sizes')
+    SIZES_MB = [int(mb) for mb in sys.argv[i + 1].split(',')]
+    del sys.argv[i:i + 2]
+if '--tree' in sys.argv:
+    i = sys.argv.index('--tree')
+    TREE = tuple([int(n) for n in sys.argv[i + 1].split('x')])
+    del sys.argv[i:i + 2]
+if '--threads' in sys.argv:
+    i = sys.argv.index('--threads')
+    THREADS = [int(n) for n in sys.argv[i + 1].split(',')]
+    del sys.argv[i:i + 2]
+if '--latency' in sys.argv:
+    i = sys.argv.index('--latency')
+    LATENCY_MS = float(sys.argv[i + 1])
+    del sys.argv[i:i + 2]
+if '--entries' in sys.argv:
+    i = sys.argv.index('--entries')
+    ENTRIES = int(sys.argv[i + 1])
+    del sys.argv[i:i + 2]
+if '--delta-gb' in sys.argv:
+    i = sys.argv.index('--delta-gb')
+    DELTA_GB = float(sys.argv[i + 1])
+    del sys.argv[i:i + 2]
+
+
+def make_file(path, size_mb, chunk):
+    with open(path, 'wb') as F:
+        for _ in range(size_mb):
+            F.write(chunk)
+
+
+def md5_blocks(src, dest):
+    """ CompareFiles with md5 before the byte comparison."""
+    src_hash = nxFile.md5const()
+    dest_hash = nxFile.md5const()
+    src_block = dest_block = b'loopme'
+    with open(src, 'rb') as src_file, open(dest, 'rb') as dest_file:
+        while src_block or dest_block:
+            src_block = src_file.read(nxFile.BLOCK_SIZE)
+            dest_block = dest_file.read(nxFile.BLOCK_SIZE)
+            src_hash.update(src_block)
+            dest_hash.update(dest_block)
+            if src_hash.hexdigest() != dest_hash.hexdigest():
+                return -1
+    return 0
+
+
+def timed(fn):
+    start = time.perf_counter()
+    ret = fn()
+    return ret, time.perf_counter() - start
+
+
+def bench_compare():
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    nxFile.cache_file_dir = BENCH_DIR + '/cache/'
+    nxFile.HASH_CACHE_RACY_NS = 0
+    chunk = os.urandom(1048576)
+    print('%8s %-6s %14s %14s %14s %14s' %
+          ('size', 'case', 'md5 blocks', 'bytes', 'bytes+cache', 'cached'))
+    for size_mb in SIZES_MB:
+        src = BENCH_DIR + '/src'
+        dest = BENCH_DIR + '/dest'
+        make_file(src, size_mb, chunk)
+        make_file(dest, size_mb, chunk)
+        cases = [('same', 0)]
+        if 1 < size_mb:
+            cases.append(('differ', -1))
+        for case, expected in cases:
+            if case == 'differ':
+                with open(dest, 'r+b') as F:
+                    F.seek(size_mb * 1048576 // 2)
+                    F.write(b'\xff' * 16)
+            results = []
+            ret, secs = timed(lambda: md5_blocks(src, dest))
+            results.append((ret, secs))
+            ret, secs = timed(lambda: nxFile.CompareFileContents(src, dest))
+            results.append((ret, secs))
+            nxFile.hash_cache = None
+            ret, secs = timed(lambda: nxFile.CompareFiles(dest, src, 'md5'))
+            results.append((ret, secs))
+            ret, secs = timed(lambda: nxFile.CompareFiles(dest, src, 'md5'))
+            cached = nxFile.hash_cache.hits == 2
+            results.append((ret, secs))
+            for ret, secs in results:
+                assert ret == expected
+            cells = []
+            for i in range(len(results)):
+                ret, secs = results[i]
+                if i == 3 and not cached:
+                    cells.append('-')
+                else:
+                    cells.append('%7.1f MB/s' % (size_mb / secs) if i < 3
+                                 else '%9.3f ms' % (secs * 1000))
+            print('%6dMB %-6s %14s %14s %14s %14s' %
+                  ((size_mb, case) + tuple(cells)))
+        os.unlink(src)
+        os.unlink(dest)
+
+
+class CountingEntry:
+    """ A DirEntry that counts the lstat it makes (once, as DirEntry
+        caches it)."""
+
+    def __init__(self, entry, counts, source=False):
+        self.entry = entry
+        self.name = entry.name
+        self.path = entry.path
+        self.counts = counts
+        self.source = source
+        self.stat_result = None
+
+    def is_symlink(self):
+        return self.entry.is_symlink()
+
+    def is_file(self, follow_symlinks=True):
+        return self.entry.is_file(follow_symlinks=follow_symlinks)
+
+    def is_dir(self, follow_symlinks=True):
+        return self.entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def stat(self, follow_symlinks=True):
+        if self.stat_result is None:
+            self.counts['lstat'] += 1
+            if self.source:
+                self.counts['source'] += 1
+            self.stat_result = self.entry.stat(follow_symlinks=follow_symlinks)
+        return self.stat_result
+
+
+class CountingScandir:
+    def __init__(self, it, counts, source=False):
+        self.it = it
+        self.counts = counts
+        self.source = source
+
+    def __iter__(self):
+        for entry in self.it:
+            yield CountingEntry(entry, self.counts, self.source)
+
+    def close(self):
+        self.it.close()
+
+
+def count_calls(counts, source=None):
+    """ Wrap the os functions nxFile and os.path reach the file system
+        through; returns a function that puts them back.  Calls on paths
+        under source are also counted in counts['source']."""
+    saved = {}
+    counts['source'] = 0
+
+    def wrap(name, key):
+        fn = getattr(os, name)
+        saved[name] = fn
+
+        def counted(*args, **kwargs):
+            counts[key] += 1
+            if source is not None and str(args[0]).startswith(source):
+                counts['source'] += 1
+            return fn(*args, **kwargs)
+        setattr(os, name, counted)
+
+    for name in ('stat', 'lstat', 'listdir'):
+        counts[name] = 0
+        wrap(name, name)
+    if hasattr(os, 'scandir'):
+        counts['scandir'] = 0
+        scandir = os.scandir
+        saved['scandir'] = scandir
+
+        def counted_scandir(path):
+            counts['scandir'] += 1
+            in_source = source is not None and str(path).startswith(source)
+            if in_source:
+                counts['source'] += 1
+            return CountingScandir(scandir(path), counts, in_source)
+        os.scandir = counted_scandir
+
+    def restore():
+        for name, fn in saved.items():
+            setattr(os, name, fn)
+    return restore
+
+
+def make_tree(root, dirs, files, data=b''):
+    if os.path.exists(root + '/done'):
+        return
+    # the same in both trees, for Checksum mtime
+    mtime = 1500000000
+    for d in range(dirs):
+        path = '%s/d%04d' % (root, d)
+        os.makedirs(path, exist_ok=True)
+        for f in range(files):
+            name = '%s/f%05d' % (path, f)
+            fd = os.open(name, os.O_CREAT | os.O_WRONLY, 0o644)
+            if data:
+                os.write(fd, data)
+            os.close(fd)
+            os.utime(name, (mtime, mtime))
+    open(root + '/done', 'w').close()
+
+
+def bench_walk():
+    dirs, files = TREE
+    src = '%s/tree_%dx%d/src' % (BENCH_DIR, dirs, files)
+    dest = '%s/tree_%dx%d/dest' % (BENCH_DIR, dirs, files)
+    make_tree(src, dirs, files)
+    make_tree(dest, dirs, files)
+    for path in (src, dest):
+        os.utime(path + '/done', (0, 0))
+    counts = {}
+    restore = count_calls(counts)
+    try:
+        start = time.perf_counter()
+        ret = nxFile.Test(dest, src, 'present', 'directory', False, '',
+                          'mtime', True, 'follow', '', '', '')
+        elapsed = time.perf_counter() - start
+    finally:
+        restore()
+    assert ret == [0], ret
+    entries = dirs * files + dirs
+    print('%s: %d files in %d directories, both trees' %
+          (NXFILE_PATH, dirs * files, dirs))
+    print('  Test %.2f s, %.1f us per entry' %
+          (elapsed, elapsed * 1e6 / entries))
+    for name in ('scandir', 'listdir', 'stat', 'lstat'):
+        if name in counts:
+            print('  %-8s %9d  %5.2f per entry' %
+                  (name, counts[name], counts[name] / float(entries)))
+
+
+def bench_set():
+    dirs, files = TREE
+    src = '%s/tree_%dx%d_16k/src' % (BENCH_DIR, dirs, files)
+    dest = '%s/tree_%dx%d_16k/dest' % (BENCH_DIR, dirs, files)
+    make_tree(src, dirs, files, os.urandom(16384))
+    nxFile.cache_file_dir = BENCH_DIR + '/cache/'
+    if LATENCY_MS:
+        def slow(fn):
+            def call(*args):
+                time.sleep(LATENCY_MS / 1000.0)
+                return fn(*args)
+            return call
+        nxFile.CopyFile = slow(nxFile.CopyFile)
+        nxFile.CompareFileContents = slow(nxFile.CompareFileContents)
+    print('%d files of 16KB in %d directories, %gms per file' %
+          (dirs * files, dirs, LATENCY_MS))
+    print('%8s %12s %12s' % ('threads', 'copy', 'no change'))
+    for threads in THREADS:
+        nxFile.SET_THREADS = threads
+        if os.path.exists(dest):
+            nxFile.RemoveTree(dest)
+        os.system('sync')
+        times = []
+        for _ in range(2):
+            nxFile.hash_cache = None
+            start = time.perf_counter()
+            ret = nxFile.Set(dest, src, 'present', 'directory', False, '',
+                             'md5', True, 'follow', '', '', '')
+            times.append(time.perf_counter() - start)
+            assert ret == [0], ret
+        print('%8d %10.2f s %10.2f s' % (threads, times[0], times[1]))
+    nxFile.RemoveTree(dest)
+
+
+def bench_copy():
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    chunk = os.urandom(1048576)
+    methods = list(nxFile.COPY_METHODS)
+    print('%s' % BENCH_DIR)
+    print('%8s %-6s %16s' % ('size', 'file', 'shutil.copyfile') +
+          ''.join([' %16s' % m for m in methods]))
+    src = BENCH_DIR + '/src'
+    dest = BENCH_DIR + '/dest'
+    for size_mb in SIZES_MB:
+        make_file(src, size_mb, chunk)
+        sparse = BENCH_DIR + '/sparse'
+        with open(sparse, 'wb') as F:
+            # 1% data: one block in each 100MB
+            total = size_mb * 1048576
+            step = min(total, 100 * 1048576)
+            F.truncate(total)
+            for i in range(0, total, step):
+                F.seek(i)
+                F.write(chunk[:step // 100])
+        for label, path in (('dense', src), ('sparse', sparse)):
+            cells = []
+            for method in [None] + methods:
+                if os.path.exists(dest):
+                    os.unlink(dest)
+                if method is None:
+                    ret, secs = timed(lambda: shutil.copyfile(path, dest))
+                    blocks = os.stat(dest).st_blocks
+                else:
+                    nxFile.COPY_METHODS = (method,)
+                    ret, secs = timed(lambda: nxFile.CopyFile(path, dest))
+                    assert ret is None
+                    assert os.stat(dest).st_blocks <= blocks
+                cells.append('%11.0f MB/s' % (size_mb / secs))
+            print('%6dMB %-6s' % (size_mb, label) + ''.join([' %16s' % c for c in cells]))
+        os.unlink(sparse)
+    nxFile.COPY_METHODS = tuple(methods)
+    for path in (src, dest):
+        os.unlink(path)
+
+
+def written_bytes(path):
+    """ wchar of this process and the bytes written to the device of path,
+        or None for a file system without one."""
+    wchar = 0
+    with open('/proc/self/io') as F:
+        for line in F:
+            if line.startswith('wchar:'):
+                wchar = int(line.split()[1])
+    st = os.stat(path)
+    try:
+        with open('/sys/dev/block/%d:%d/stat' % (os.major(st.st_dev), os.minor(st.st_dev))) as F:
+            device = int(F.read().split()[6]) * 512
+    except (IOError, OSError):
+        device = None
+    return wchar, device
+
+
+def change_blocks(path, size, fraction):
+    import random
+    block_size = nxFileDelta.DELTA_BLOCK_SIZE
+    blocks = size // block_size
+    with open(path, 'r+b') as F:
+        for block in random.sample(range(blocks), int(blocks * fraction)):
+            F.seek(block * block_size + random.randrange(block_size - 16))
+            F.write(os.urandom(16))
+
+
+def bench_delta():
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    src = BENCH_DIR + '/delta_src'
+    dest = BENCH_DIR + '/delta_dest'
+    size = int(DELTA_GB * 1024) * 1048576
+    if not os.path.exists(src) or os.path.getsize(src) != size:
+        with open(src, 'wb') as F:
+            for _ in range(size // (64 * 1048576)):
+                F.write(os.urandom(64 * 1048576))
+    if not os.path.exists(dest) or os.path.getsize(dest) != size:
+        shutil.copyfile(src, dest)
+    print('%.1fGB, %d byte blocks, 1%% of them changed' % (size / 1073741824.0, nxFileDelta.DELTA_BLOCK_SIZE))
+    print('%-16s %10s %14s %14s' % ('', 'time', 'wchar', 'device'))
+    for label, update in (('CopyFile', nxFile.CopyFile),
+                          ('DeltaUpdateFile', nxFileDelta.DeltaUpdateFile)):
+        change_blocks(src, size, 0.01)
+        os.sync()
+        wchar, device = written_bytes(BENCH_DIR)
+        start = time.perf_counter()
+        assert update(src, dest) is None
+        os.sync()
+        elapsed = time.perf_counter() - start
+        wchar_after, device_after = written_bytes(BENCH_DIR)
+        print('%-16s %8.1f s %11.1f MB %14s' %
+              (label, elapsed, (wchar_after - wchar) / 1048576.0,
+               device is None and '-' or '%11.1f MB' % ((device_after - device) / 1048576.0)))
+    assert nxFile.CompareFileContents(src, dest) == 0
+
+
+def write_manifest(path, entries):
+    """ A manifest of entries files d0000/f00000... without a tree."""
+    files = 1000
+    names = [b'']
+    for i in range(entries - 1):
+        names.append(b'd%04d/f%05d' % (i // files, i % files))
+    records = []
+    offset = 0
+    digest = b'\x00' * 16
+    for name in names:
+        records.append(nxFile.Manifest.RECORD.pack(
+            offset, len(name), 0o100644, 0, 0, 4096, 0, 0, digest))
+        offset += len(name)
+    with open(path, 'wb') as F:
+        F.write(nxFile.Manifest.HEADER.pack(nxFile.Manifest.MAGIC, entries, b'md5'))
+        F.write(b''.join(records))
+        F.write(b''.join(names))
+    return names
+
+
+def bench_manifest():
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = BENCH_DIR + '/synthetic.nxmanifest'
+    names = write_manifest(path, ENTRIES)
+    os.system('sync')
+    print('manifest of %d entries, %.1f MB' %
+          (ENTRIES, os.path.getsize(path) / 1048576.0))
+    start = time.perf_counter()
+    manifest = nxFile.Manifest(path)
+    found = manifest.find(b'')
+    elapsed = time.perf_counter() - start
+    assert found is not None
+    print('  open               %10.3f ms' % (elapsed * 1000))
+    lookups = [names[(i * 7919) % ENTRIES] for i in range(10000)]
+    start = time.perf_counter()
+    for name in lookups:
+        assert manifest.find(name) is not None
+    elapsed = time.perf_counter() - start
+    print('  find               %10.2f us per path' % (elapsed * 1e6 / len(lookups)))
+    start = time.perf_counter()
+    count = 0
+    for name, entry in manifest:
+        count += 1
+    elapsed = time.perf_counter() - start
+    assert count == ENTRIES
+    print('  read all entries   %10.3f s' % elapsed)
+    manifest.close()
+    os.remove(path)
+
+    dirs, files = TREE
+    src = '%s/tree_%dx%d_4k/src' % (BENCH_DIR, dirs, files)
+    dest = '%s/tree_%dx%d_4k/dest' % (BENCH_DIR, dirs, files)
+    data = os.urandom(4096)
+    make_tree(src, dirs, files, data)
+    make_tree(dest, dirs, files, data)
+    nxFile.cache_file_dir = BENCH_DIR + '/cache/'
+    for path in (src, dest):
+        os.utime(path + '/done', (0, 0))
+    start = time.perf_counter()
+    entries = nxFile.WriteManifest(src)
+    print('%d files of 4KB in %d directories: manifest written in %.2f s' %
+          (dirs * files, dirs, time.perf_counter() - start))
+    print('%-22s %10s %10s %10s %10s' %
+          ('Test', 'time', 'lstat', 'scandir', 'on source'))
+    for label, use_manifest in (('walk both trees', False),
+                                ('destination+manifest', True)):
+        for cached in (False, True):
+            if not cached:
+                # neither md5 nor contents cached
+                nxFile.hash_cache = None
+                if os.path.exists(nxFile.cache_file_dir):
+                    shutil.rmtree(nxFile.cache_file_dir)
+                os.system('sync; echo 3 > /proc/sys/vm/drop_caches 2>/dev/null')
+            if not use_manifest:
+                os.rename(src + nxFile.MANIFEST_SUFFIX, src + '.off')
+            counts = {}
+            restore = count_calls(counts, src)
+            try:
+                start = time.perf_counter()
+                ret = nxFile.Test_Marshall(dest, src, 'present', 'directory', False, '',
+                                           'md5', True, 'follow', '', '', '')
+                elapsed = time.perf_counter() - start
+            finally:
+                restore()
+                if not use_manifest:
+                    os.rename(src + '.off', src + nxFile.MANIFEST_SUFFIX)
+            assert ret == [0], ret
+            print('%-22s %8.2f s %10d %10d %10d%s' %
+                  (label, elapsed, counts['lstat'] + counts['stat'],
+                   counts.get('scandir', 0), counts['source'],
+                   cached and '  (hash cache warm)' or ''))
+    os.remove(src + nxFile.MANIFEST_SUFFIX)
+
+
+def bench_journal():
+    dirs, files = TREE
+    src = '%s/tree_%dx%d_4k/src' % (BENCH_DIR, dirs, files)
+    dest = '%s/tree_%dx%d_4k/dest' % (BENCH_DIR, dirs, files)
+    data = os.urandom(4096)
+    make_tree(src, dirs, files, data)
+    make_tree(dest, dirs, files, data)
+    with open(src + '/d0000/f00000', 'rb') as F:
+        # of an earlier run
+        data = F.read()
+    nxFile.cache_file_dir = BENCH_DIR + '/cache/'
+    for path in (src, dest):
+        os.utime(path + '/done', (0, 0))
+
+    def change(n):
+        for d in range(10):
+            name = '%s/d%04d/f%05d' % (dest, d % dirs, n)
+            with open(name, 'wb') as F:
+                F.write(data)
+            os.utime(name, (1500000000, 1500000000))
+
+    def test():
+        """ Seconds taken by the Test, and by the save of the hash cache
+            after it."""
+        start = time.perf_counter()
+        ret = nxFile.Test(dest, src, 'present', 'directory', False, '',
+                          'md5', True, 'follow', '', '', '')
+        tested = time.perf_counter()
+        nxFile.SaveHashCache()
+        assert ret == [0], ret
+        return tested - start, time.perf_counter() - tested
+
+    print('%d files of 4KB in %d directories, 10 changed' % (dirs * files, dirs))
+    test()
+    change(1)
+    print('%-22s %10s %16s' % ('Test', 'time', 'hash cache save'))
+    print('%-22s %8.3f s %14.3f s' % (('whole trees',) + test()))
+    start = time.perf_counter()
+    watcher = nxFileWatcher.ChangeWatcher([dest, src])
+    thread = threading.Thread(target=watcher.run)
+    thread.daemon = True
+    thread.start()
+    while not nxFile.WatcherRunning() or len(watcher.roots) != 2 or \
+            not all(watcher.roots.values()):
+        time.sleep(0.01)
+    print('(watcher started in %.3f s, %d watches)' %
+          (time.perf_counter() - start, len(watcher.watches)))
+    print('%-22s %8.3f s %14.3f s' % (('first, whole trees',) + test()))
+    for n in (2, 3):
+        change(n)
+        time.sleep(nxFileWatcher.JOURNAL_BATCH_DELAY * 3)
+        print('%-22s %8.3f s %14.3f s' % (('changed paths only',) + test()))
+    watcher.close()
+
+
+def read_blocks(path, name):
+    """ The hash of path as nxFileInventory.GetChecksum took it before."""
+    file_hash = {'md5': hashlib.md5, 'sha-256': hashlib.sha256}[name]()
+    with open(path, 'rb') as F:
+        block = F.read(8192)
+        while block:
+            file_hash.update(block)
+            block = F.read(8192)
+    return file_hash
+
+
+def bench_hash():
+    filehash = nxFile.filehash
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    chunk = os.urandom(1048576)
+    paths = []
+    for size_mb in SIZES_MB:
+        path = BENCH_DIR + '/hash%d' % size_mb
+        make_file(path, size_mb, chunk)
+        paths.append((size_mb, path))
+    print('%-22s' % 'algorithm' + ''.join(['%12s' % ('%dMB' % size_mb)
+                                            for size_mb, path in paths]))
+    rows = []
+    for name in ('md5', 'sha-256'):
+        rows.append((name + ' 8KB reads', lambda path, name=name: read_blocks(path, name)))
+    for name in filehash.CHECKSUMS:
+        if name in filehash.ALGORITHMS:
+            rows.append((name, lambda path, name=name: filehash.hash_file(path, name)))
+        else:
+            print('%-22s (not available)' % name)
+    for label, fn in rows:
+        cells = []
+        for size_mb, path in paths:
+            fn(path)
+            secs = min([timed(lambda: fn(path))[1] for _ in range(3)])
+            cells.append('%7.2f GB/s' % (size_mb / 1024.0 / secs))
+        print('%-22s' % label + ''.join(['%12s' % cell for cell in cells]))
+    for size_mb, path in paths:
+        os.remove(path)
+
+
+def count_lookups(idcache, counts):
+    """ Count (and slow down by --latency) the lookups of idcache that
+        reach NSS."""
+    for cache in idcache.caches:
+        def counted(key, fn=cache.lookup):
+            counts['nss'] += 1
+            if LATENCY_MS:
+                time.sleep(LATENCY_MS / 1000.0)
+            return fn(key)
+        cache.lookup = counted
+
+
+def bench_owner():
+    nxFileInventory = imp.load_source('nxFileInventory', './Scripts/nxFileInventory.py')
+    dirs, files = TREE
+    src = '%s/tree_%dx%d/src' % (BENCH_DIR, dirs, files)
+    dest = '%s/tree_%dx%d/dest' % (BENCH_DIR, dirs, files)
+    make_tree(src, dirs, files)
+    make_tree(dest, dirs, files)
+    for path in (src, dest):
+        os.utime(path + '/done', (0, 0))
+    owner = nxFile.idcache.getpwuid(os.getuid()).pw_name
+    group = nxFile.idcache.getgrgid(os.getgid()).gr_name
+    counts = {'nss': 0}
+    count_lookups(nxFile.idcache, counts)
+    count_lookups(nxFileInventory.idcache, counts)
+    print('%d files in %d directories, Owner %s, Group %s, %gms per NSS lookup' %
+          (dirs * files, dirs, owner, group, LATENCY_MS))
+    print('%-10s %12s %10s %14s %10s' % ('', 'Test', 'NSS', 'Inventory', 'NSS'))
+    for case, ttl, preload in (('uncached', 0, False), ('cached', 300, False),
+                               ('preloaded', 300, True)):
+        cells = []
+        for idcache, run in (
+                (nxFile.idcache,
+                 lambda: nxFile.Test(dest, src, 'present', 'directory', False, '',
+                                     'mtime', True, 'follow', owner, group, '')),
+                (nxFileInventory.idcache,
+                 lambda: len(list(nxFileInventory.DoInventory(src + '/', True, 'follow', 'mtime', '*',
+                                                              0, 1 << 40, False))))):
+            idcache.clear()
+            idcache.TTL = ttl
+            if preload:
+                idcache.preload()
+            counts['nss'] = 0
+            ret, secs = timed(run)
+            cells.append('%10.2f s' % secs)
+            cells.append('%10d' % counts['nss'])
+        print('%-10s %12s %10s %14s %10s' % tuple([case] + cells))
+
+
+def bench_inventory():
+    nxFileInventory = imp.load_source('nxFileInventory', './Scripts/nxFileInventory.py')
+    nxFileInventory.cache_file_dir = BENCH_DIR + '/cache/nxFileInventory/'
+    nxFileInventory.INDEX_RACY_NS = 0
+    dirs, files = TREE
+    src = '%s/tree_%dx%d_4k/src' % (BENCH_DIR, dirs, files)
+    make_tree(src, dirs, files, os.urandom(4096))
+    opened = [0]
+    GetChecksum = nxFileInventory.GetChecksum
+
+    def counted(fname, Checksum):
+        opened[0] += 1
+        return GetChecksum(fname, Checksum)
+    nxFileInventory.GetChecksum = counted
+    shutil.rmtree(nxFileInventory.cache_file_dir, ignore_errors=True)
+    print('%d files of 4KB in %d directories' % (dirs * files, dirs))
+    print('%-14s %10s %10s' % ('', 'inventory', 'files read'))
+    changed = ['%s/d%04d/f%05d' % (src, i % dirs, i // dirs)
+               for i in range(0, dirs * files, 100)]
+    for case, index in (('no index', False), ('first', True),
+                        ('unchanged', True), ('1% changed', True)):
+        nxFileInventory.INVENTORY_INDEX = index
+        if case == '1% changed':
+            for path in changed:
+                os.utime(path, None)
+        opened[0] = 0
+        ret, secs = timed(lambda: len(list(nxFileInventory.DoInventory(
+            src + '/', True, 'follow', 'md5', 'file', 1024, 1 << 40, False))))
+        print('%-14s %8.2f s %10d' % (case, secs, opened[0]))
+    for path in changed:
+        os.utime(path, (1500000000, 1500000000))
+
+
+if __name__ == '__main__':
+    which = sys.argv[1:] or ['compare']
+    if 'compare' in which:
+        bench_compare()
+    if 'walk' in which:
+        bench_walk()
+    if 'set' in which:
+        bench_set()
+    if 'copy' in which:
+        bench_copy()
+    if 'delta' in which:
+        bench_delta()
+    if 'manifest' in which:
+        bench_manifest()
+    if 'journal' in which:
+        bench_journal()
+    if 'hash' in which:
+        bench_hash()
+    if 'owner' in which:
+        bench_owner()
+    if 'inventory' in which:
+        bench_inventory()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+#============================================================================
+# Copyright (c) Microsoft Corporation. All rights reserved. See license.txt for license information.
+#============================================================================
+"""
+Micro-benchmarks for the wire codecs in Providers/Scripts/protocol.py.
+
+    python3 bench_protocol.py [--protocol PATH] [arrays] [values] [plain]
+
+arrays: encode/decode throughput of the numeric MI_*A codecs compared with
+        the previous one struct call per element loop, 1e3 to 1e6 elements.
+values: memory per value object and decode rate of an MI_InstanceA
+        response.  --protocol loads another protocol.py (for example one
+        exported from an older commit) to compare against.
+plain:  decoding a request carrying a large PerfCounterObject (nxOMSPerfCounter)
+        into handler arguments: read_values plus unwrapping .value, as
+        client.translate_input used to, against read_plain_values.
+"""
+import gc
+import imp
+import os
+import struct
+import sys
+import time
+import tracemalloc
+
+PROTOCOL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', '..', 'protocol.py')
+if '--protocol' in sys.argv:
+    i = sys.argv.index('--protocol')
+    PROTOCOL_PATH = sys.argv[i + 1]
+    del sys.argv[i:i + 2]
+protocol = imp.load_source('protocol', PROTOCOL_PATH)
+protocol.DO_TRACE = False
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+
+class Sink:
+    """ Stands in for the session socket: collects what is sent and plays
+        it back through recv()."""
+
+    def __init__(self, data=b''):
+        self.chunks = []
+        self.data = data
+        self.pos = 0
+
+    def sendall(self, buf):
+        self.chunks.append(buf)
+
+    send = sendall
+
+    def getvalue(self):
+        return b''.join(self.chunks)
+
+    def recv(self, n):
+        buf = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return buf
+
+
+def best_of(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def encode_per_element(vals, code):
+    fd = Sink()
+    fd.sendall(struct.pack('@B', protocol.MI_UINT32A))
+    fd.sendall(struct.pack('@i', len(vals)))
+    for val in vals:
+        fd.sendall(struct.pack('@' + code, val))
+    return fd.getvalue()
+
+
+def decode_per_element(data, code):
+    fd = Sink(data)
+    fd.recv(1)
+    count = struct.unpack('@i', fd.recv(4))[0]
+    size = struct.calcsize('@' + code)
+    vals = []
+    for _ in range(count):
+        vals.append(struct.unpack('@' + code, fd.recv(size))[0])
+    return vals
+
+
+def encode_bulk(vals, code):
+    fd = Sink()
+    protocol.write_array(fd, protocol.MI_UINT32A, code, vals)
+    return fd.getvalue()
+
+
+def decode_bulk(data, code):
+    fd = protocol.SocketReader(Sink(data), len(data))
+    fd.recv(1)
+    return protocol.read_array(fd, code)
+
+
+def bench_arrays():
+    print('%-6s %9s %16s %16s %8s' %
+          ('type', 'elements', 'per-element', 'bulk', 'speedup'))
+    for code, label in (('I', 'uint32'), ('d', 'real64')):
+        for count in SIZES:
+            if code == 'd':
+                vals = [float(i) for i in range(count)]
+            else:
+                vals = list(range(count))
+            data = encode_bulk(vals, code)
+            assert data == encode_per_element(vals, code)
+            assert decode_bulk(data, code) == vals
+            for op, old, new, arg in (
+                    ('enc', encode_per_element, encode_bulk, vals),
+                    ('dec', decode_per_element, decode_bulk, data)):
+                t_old = best_of(lambda: old(arg, code))
+                t_new = best_of(lambda: new(arg, code))
+                print('%-6s %9d %9.1f Melem/s %9.1f Melem/s %7.1fx  %s' %
+                      (label, count, count / t_old / 1e6, count / t_new / 1e6,
+                       t_old / t_new, op))
+
+
+def bytes_per_value(make, count=100000):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objs = [make(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objs
+    return (after - before) / float(count)
+
+
+def inventory_response(count):
+    """ An Inventory style response: count instances of ten properties."""
+    p = protocol
+    instances = []
+    for i in range(count):
+        instances.append({
+            'DestinationPath': p.MI_String('/var/lib/item/%08d' % i),
+            'Type': p.MI_String('file'),
+            'Owner': p.MI_String('root'),
+            'Group': p.MI_String('root'),
+            'Mode': p.MI_String('644'),
+            'FileSize': p.MI_Uint64(i * 512),
+            'Links': p.MI_Uint32(1),
+            'Checksum': p.MI_String('d41d8cd98f00b204e9800998ecf8427e'),
+            'Recurse': p.MI_Boolean(False),
+            'Attributes': p.MI_Uint16(i & 0xffff),
+        })
+    fd = Sink()
+    protocol.write_values(fd, {'__Inventory': p.MI_InstanceA(instances)})
+    return fd.getvalue()
+
+
+def bench_values():
+    print('bytes per value object (tracemalloc, 1e5 objects)')
+    for label, make in (
+            ('MI_Boolean', lambda i: protocol.MI_Boolean(i & 1)),
+            ('MI_Uint32', lambda i: protocol.MI_Uint32(i)),
+            ('MI_Uint64', lambda i: protocol.MI_Uint64(i)),
+            ('MI_String', lambda i: protocol.MI_String('x')),
+            ('MI_Timestamp', lambda i: protocol.MI_Timestamp.from_time(i))):
+        print('  %-14s %8.1f' % (label, bytes_per_value(make)))
+    print('decode rate of an MI_InstanceA response, 10 properties each')
+    stderr = sys.stderr
+    for count in (1000, 10000, 100000):
+        data = inventory_response(count)
+        if hasattr(protocol, 'SocketReader'):
+            fd = protocol.SocketReader(Sink(data), len(data))
+        else:
+            fd = Sink(data)
+        # older protocol.py prints every decoded instance to stderr
+        sys.stderr = open(os.devnull, 'w')
+        try:
+            start = time.perf_counter()
+            d = protocol.read_values(fd)
+            elapsed = time.perf_counter() - start
+        finally:
+            sys.stderr.close()
+            sys.stderr = stderr
+        assert len(d['__Inventory'].value) == count
+        print('  %7d instances %8.3f s %10.0f values/s %7.1f MB' %
+              (count, elapsed, count * 10 / elapsed, len(data) / 1e6))
+
+
+def perf_counter_request(count):
+    """ The values of an nxOMSPerfCounter Set request with count
+        PerfCounterObject instances of 8 counters each."""
+    p = protocol
+    objects = []
+    for i in range(count):
+        objects.append({
+            'ObjectName': p.MI_String('Logical Disk %d' % i),
+            'InstanceName': p.MI_String('*'),
+            'AllInstances': p.MI_Boolean(True),
+            'IntervalSeconds': p.MI_Uint16(30),
+            'PerformanceCounter': p.MI_StringA(
+                ['%% Counter %d' % j for j in range(8)]),
+        })
+    fd = Sink()
+    protocol.write_values(fd, {
+        'Name': p.MI_String('PerfCounters'),
+        'HeartbeatIntervalSeconds': p.MI_Uint16(300),
+        'PerfCounterObject': p.MI_InstanceA(objects)})
+    return fd.getvalue()
+
+
+def unwrap_input(d):
+    # what callMOF received before: top level .value, nested MI_Values
+    kwargs = {}
+    for key, value in d.items():
+        kwargs[key] = value.value
+    return kwargs
+
+
+def bench_plain():
+    print('%9s %12s %12s %8s %12s %12s' %
+          ('instances', 'MI_Value', 'plain', 'speedup', 'MI_Value MB', 'plain MB'))
+    for count in (100, 1000, 10000, 100000):
+        data = perf_counter_request(count)
+        def old():
+            return unwrap_input(protocol.read_values(
+                protocol.SocketReader(Sink(data), len(data))))
+        def new():
+            return protocol.read_plain_values(
+                protocol.SocketReader(Sink(data), len(data)))
+        assert len(old()['PerfCounterObject']) == len(new()['PerfCounterObject'])
+        t_old = best_of(old)
+        t_new = best_of(new)
+        peaks = []
+        for fn in (old, new):
+            gc.collect()
+            tracemalloc.start()
+            kwargs = fn()
+            peaks.append(tracemalloc.get_traced_memory()[0] / 1e6)
+            tracemalloc.stop()
+            del kwargs
+        print('%9d %10.1fms %10.1fms %7.1fx %12.1f %12.1f' %
+              (count, t_old * 1000, t_new * 1000, t_old / t_new,
+               peaks[0], peaks[1]))
+
+
+if __name__ == '__main__':
+    which = sys.argv[1:] or ['arrays', 'values', 'plain']
+    if 'arrays' in which:
+        bench_arrays()
+    if 'values' in which:
+        bench_values()
+    if 'plain' in which:
+        bench_plain()
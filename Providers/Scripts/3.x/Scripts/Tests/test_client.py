@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+#============================================================================
+# Copyright (c) Microsoft Corporation. All rights reserved. See license.txt for license information.
+#============================================================================
+"""
+Tests for the session loop of Providers/Scripts/client.py, driven over a
+socketpair with fake provider modules.
+
+client.py starts serving the socket OMI passes it as soon as it is run,
+so only the code before its start up block is loaded here.
+"""
+import imp
+import os
+import shutil
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+try:
+    import unittest2
+except:
+    import unittest as unittest2
+
+ScriptsDir = os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                           '..', '..', '..'))
+sys.path.insert(0, ScriptsDir)
+protocol = imp.load_source('protocol', os.path.join(ScriptsDir, 'protocol.py'))
+protocol.DO_TRACE = False
+
+
+def load_client():
+    path = os.path.join(ScriptsDir, 'client.py')
+    F = open(path, 'r')
+    try:
+        source = F.read()
+    finally:
+        F.close()
+    source = source[:source.index('\n##############################')]
+    client = types.ModuleType('client')
+    client.__file__ = path
+    exec(compile(source, path, 'exec'), client.__dict__)
+    client.DO_TRACE = False
+    client.events = False
+    return client
+
+client = load_client()
+
+
+class Sink:
+    """ Collects what the protocol writers send."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def sendall(self, buf):
+        self.chunks.append(buf)
+
+    send = sendall
+
+    def getvalue(self):
+        return b''.join(self.chunks)
+
+
+class Peer:
+    """ A file read back as the socket it was received from."""
+
+    def __init__(self, F):
+        self.file = F
+
+    def recv(self, n):
+        return self.file.read(n)
+
+
+def encode_request(op, name, args):
+    out = Sink()
+    out.send(struct.pack('@B', op))
+    protocol.write_string(out, name)
+    protocol.write_values(out, args)
+    return out.getvalue()
+
+
+def read_response(sock, values=True):
+    """ (rval, values) for a success, (rval, text) for a failure.  A
+        success without values, as a Test answers, is (0, None)."""
+    rval = struct.unpack('@i', recv_exactly(sock, 4))[0]
+    if rval == 0 and not values:
+        return (rval, None)
+    if rval == 0:
+        return (rval, protocol.read_plain_values(protocol.SocketReader(sock, 1)))
+    return (rval, protocol.read_string(protocol.SocketReader(sock, 1)))
+
+
+def recv_exactly(sock, n):
+    buf = b''
+    while len(buf) < n:
+        data = sock.recv(n - len(buf))
+        if len(data) == 0:
+            raise socket.error('connection closed')
+        buf += data
+    return buf
+
+
+def encode_batch(requests):
+    """ A BATCH frame of the (op, name, args) requests."""
+    data = struct.pack('@B', client.OP_BATCH) + struct.pack('@i', len(requests))
+    for op, name, args in requests:
+        data += encode_request(op, name, args)
+    return data
+
+
+def fake_provider(name):
+    """ A provider whose Get answers with its Name and the pid that
+        served it, whose Test fails for Name 'missing' and whose Set
+        raises."""
+    module = types.ModuleType(name)
+
+    def Get_Marshall(Name):
+        return [0, {'Name': protocol.MI_String(Name),
+                    'Pid': protocol.MI_Uint32(os.getpid())}]
+
+    def Test_Marshall(Name):
+        if Name == 'missing':
+            return [-1]
+        return [0]
+
+    def Set_Marshall(Name):
+        raise ValueError(Name)
+    module.Get_Marshall = Get_Marshall
+    module.Test_Marshall = Test_Marshall
+    module.Set_Marshall = Set_Marshall
+    return module
+
+
+def streaming_provider(name, count, size):
+    """ A provider whose Inventory streams count instances with Contents
+        of size bytes from a generator."""
+    module = types.ModuleType(name)
+
+    def Inventory_Marshall(Name):
+        def instances():
+            for i in range(count):
+                yield {'Name': protocol.MI_String(Name + str(i)),
+                       'Contents': protocol.MI_String('x' * size)}
+        return [0, {'Inventory': protocol.MI_InstanceA(instances())}]
+    module.Inventory_Marshall = Inventory_Marshall
+    module.THREAD_SAFE = True
+    return module
+
+
+def encode_mux(req_id, op, name, args):
+    return struct.pack('@B', client.OP_MUX) + struct.pack('@I', req_id) + \
+        encode_request(op, name, args)
+
+
+class CallLog:
+    """ What the sleeping providers sharing it did: ('start', Name) and
+        ('end', Name) in the order they happened, and the most calls that
+        ran at once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.running = 0
+        self.most = 0
+
+    def start(self, name):
+        self.lock.acquire()
+        self.events.append(('start', name))
+        self.running += 1
+        self.most = max(self.most, self.running)
+        self.lock.release()
+
+    def end(self, name):
+        self.lock.acquire()
+        self.events.append(('end', name))
+        self.running -= 1
+        self.lock.release()
+
+
+def sleeping_provider(name, log, thread_safe=True, thread_lock=None):
+    """ A provider whose Get sleeps for Delay seconds."""
+    module = types.ModuleType(name)
+
+    def Get_Marshall(Name, Delay):
+        log.start(Name)
+        try:
+            time.sleep(Delay)
+        finally:
+            log.end(Name)
+        return [0, {'Name': protocol.MI_String(Name)}]
+    module.Get_Marshall = Get_Marshall
+    module.THREAD_SAFE = thread_safe
+    if thread_lock is not None:
+        module.THREAD_LOCK = thread_lock
+    return module
+
+
+class ServeTestCases(unittest2.TestCase):
+    """
+    Requests sent to client.serve() over a socketpair.
+    """
+
+    def setUp(self):
+        client.provider_modules['Fake'] = fake_provider('Fake')
+        self.sessions = []
+
+    def tearDown(self):
+        for ours, theirs, t in self.sessions:
+            ours.close()
+            t.join(10)
+            theirs.close()
+        for name in list(client.provider_modules.keys()):
+            if name.startswith('Fake') or name.startswith('Sleep'):
+                del client.provider_modules[name]
+        client.provider_locks.clear()
+
+    def start_session(self):
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        ours.settimeout(10)
+        t = threading.Thread(target=client.serve, args=(theirs,))
+        t.start()
+        self.sessions.append((ours, theirs, t))
+        return ours
+
+    def end_session(self, sock):
+        """ Closes the session as OMI does and waits for serve() to
+            return."""
+        for ours, theirs, t in self.sessions:
+            if ours is sock:
+                ours.shutdown(socket.SHUT_WR)
+                t.join(10)
+                self.assertFalse(t.is_alive())
+
+    def get(self, name):
+        return (2, 'Fake', {'Name': protocol.MI_String(name)})
+
+    def testBatch(self):
+        sock = self.start_session()
+        count = 50
+        sock.sendall(encode_batch([self.get('item' + str(i)) for i in range(count)]))
+        self.assertEqual(struct.unpack('@i', recv_exactly(sock, 4))[0], count)
+        for i in range(count):
+            rval, values = read_response(sock)
+            self.assertEqual(rval, 0)
+            self.assertEqual(values['Name'], 'item' + str(i))
+        self.end_session(sock)
+
+    def testBatchFailures(self):
+        # a failed, raising or unknown request gets a failure entry and the
+        # rest of the batch is still answered, in order
+        sock = self.start_session()
+        sock.sendall(encode_batch([
+            self.get('first'),
+            (0, 'Fake', {'Name': protocol.MI_String('present')}),
+            (0, 'Fake', {'Name': protocol.MI_String('missing')}),
+            (1, 'Fake', {'Name': protocol.MI_String('raises')}),
+            (3, 'Fake', {'Name': protocol.MI_String('no Inventory')}),
+            (9, 'Fake', {'Name': protocol.MI_String('unknown op')}),
+            self.get('last')]))
+        self.assertEqual(struct.unpack('@i', recv_exactly(sock, 4))[0], 7)
+        self.assertEqual(read_response(sock), (0, {'Name': 'first', 'Pid': os.getpid()}))
+        self.assertEqual(read_response(sock, False), (0, None))
+        for i in range(4):
+            rval, text = read_response(sock)
+            self.assertEqual(rval, 1)
+        self.assertEqual(text, 'Unsupported op in batch: 9')
+        self.assertEqual(read_response(sock), (0, {'Name': 'last', 'Pid': os.getpid()}))
+        # the session goes on after the batch
+        sock.sendall(encode_request(*self.get('after')))
+        self.assertEqual(read_response(sock), (0, {'Name': 'after', 'Pid': os.getpid()}))
+        self.end_session(sock)
+
+    def testEmptyBatch(self):
+        sock = self.start_session()
+        sock.sendall(encode_batch([]))
+        self.assertEqual(struct.unpack('@i', recv_exactly(sock, 4))[0], 0)
+        sock.sendall(encode_request(*self.get('after')))
+        self.assertEqual(read_response(sock)[1]['Name'], 'after')
+        self.end_session(sock)
+
+    def sleep(self, module, name, delay):
+        return (2, module, {'Name': protocol.MI_String(name),
+                            'Delay': protocol.MI_Real64(delay)})
+
+    def read_mux_response(self, sock):
+        req_id = struct.unpack('@I', recv_exactly(sock, 4))[0]
+        return (req_id, read_response(sock))
+
+    def run_mux(self, requests):
+        """ Sends the (module, Name, Delay) requests as MUX frames with
+            ids 1, 2, ... and returns the ids in the order answered."""
+        sock = self.start_session()
+        data = b''
+        for i in range(len(requests)):
+            data += encode_mux(i + 1, *self.sleep(*requests[i]))
+        sock.sendall(data)
+        order = []
+        for i in range(len(requests)):
+            req_id, response = self.read_mux_response(sock)
+            self.assertEqual(response, (0, {'Name': requests[req_id - 1][1]}))
+            order.append(req_id)
+        self.end_session(sock)
+        return order
+
+    def stream_peak(self, frame, count, size):
+        """ Sends frame, which asks FakeStream for an Inventory of count
+            instances, and returns the peak traced memory while the
+            response is drained to a file, and the file."""
+        client.provider_modules['FakeStream'] = streaming_provider('FakeStream', count, size)
+        sock = self.start_session()
+        ours, theirs, t = self.sessions[-1]
+        received = tempfile.TemporaryFile()
+
+        def drain():
+            while True:
+                data = sock.recv(65536)
+                if len(data) == 0:
+                    break
+                received.write(data)
+        drainer = threading.Thread(target=drain)
+        tracemalloc.start()
+        try:
+            drainer.start()
+            sock.sendall(frame)
+            # serve() answers what it has read before it returns
+            sock.shutdown(socket.SHUT_WR)
+            t.join(60)
+            theirs.close()
+            drainer.join(60)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertFalse(t.is_alive())
+        received.seek(0)
+        return peak, received
+
+    def testBatchStreamedInventoryMemory(self):
+        count = 4000
+        size = 8192
+        peak, received = self.stream_peak(
+            encode_batch([(3, 'FakeStream', {'Name': protocol.MI_String('f')})]), count, size)
+        self.assertLess(peak, 8 * protocol.WRITE_FLUSH_SIZE)
+        self.assertEqual(struct.unpack('@i', received.read(4))[0], 1)
+        rval, values = read_response(Peer(received))
+        self.assertEqual(rval, 0)
+        self.assertEqual(len(values['Inventory']), count)
+        self.assertEqual(values['Inventory'][-1]['Name'], 'f' + str(count - 1))
+
+    def testMuxStreamedInventoryMemory(self):
+        count = 4000
+        size = 8192
+        peak, received = self.stream_peak(
+            encode_mux(5, 3, 'FakeStream', {'Name': protocol.MI_String('m')}), count, size)
+        # a streamed Inventory is passed on in WRITE_FLUSH_SIZE pieces, not
+        # collected whole
+        self.assertLess(peak, 8 * protocol.WRITE_FLUSH_SIZE)
+        self.assertLess(8 * protocol.WRITE_FLUSH_SIZE, count * size)
+        self.assertEqual(struct.unpack('@I', received.read(4))[0], 5)
+        rval, values = read_response(Peer(received))
+        self.assertEqual(rval, 0)
+        self.assertEqual(len(values['Inventory']), count)
+
+    def testMuxOutOfOrder(self):
+        log = CallLog()
+        client.provider_modules['Sleep'] = sleeping_provider('Sleep', log)
+        order = self.run_mux([('Sleep', 'slowest', 0.6), ('Sleep', 'slow', 0.4),
+                              ('Sleep', 'fast', 0.2), ('Sleep', 'now', 0.0)])
+        self.assertEqual(order, [4, 3, 2, 1])
+        self.assertEqual(log.most, client.MUX_MAX_WORKERS)
+
+    def testMuxBatch(self):
+        log = CallLog()
+        client.provider_modules['Sleep'] = sleeping_provider('Sleep', log)
+        sock = self.start_session()
+        batch = encode_batch([self.sleep('Sleep', 'b' + str(i), 0) for i in range(3)])
+        sock.sendall(struct.pack('@B', client.OP_MUX) + struct.pack('@I', 9) + batch)
+        self.assertEqual(struct.unpack('@I', recv_exactly(sock, 4))[0], 9)
+        self.assertEqual(struct.unpack('@i', recv_exactly(sock, 4))[0], 3)
+        for i in range(3):
+            self.assertEqual(read_response(sock), (0, {'Name': 'b' + str(i)}))
+        self.end_session(sock)
+
+    def testMuxSerializesThreadUnsafe(self):
+        log = CallLog()
+        client.provider_modules['Sleep'] = sleeping_provider('Sleep', log, False)
+        order = self.run_mux([('Sleep', 'one', 0.1), ('Sleep', 'two', 0.1),
+                              ('Sleep', 'three', 0.1)])
+        self.assertEqual(sorted(order), [1, 2, 3])
+        self.assertEqual(log.most, 1)
+
+    def testMuxSerializesUnmarked(self):
+        # a module that does not declare THREAD_SAFE is taken as unsafe
+        log = CallLog()
+        module = sleeping_provider('Sleep', log)
+        del module.THREAD_SAFE
+        client.provider_modules['Sleep'] = module
+        order = self.run_mux([('Sleep', 'one', 0.1), ('Sleep', 'two', 0.1)])
+        self.assertEqual(sorted(order), [1, 2])
+        self.assertEqual(log.most, 1)
+
+    def testMuxSharedThreadLock(self):
+        # two modules naming the same THREAD_LOCK never run at once, and a
+        # thread safe module runs alongside them
+        shared = CallLog()
+        client.provider_modules['SleepA'] = sleeping_provider('SleepA', shared, False, 'Sleep')
+        client.provider_modules['SleepB'] = sleeping_provider('SleepB', shared, False, 'Sleep')
+        free = CallLog()
+        client.provider_modules['SleepFree'] = sleeping_provider('SleepFree', free)
+        order = self.run_mux([('SleepA', 'a', 0.2), ('SleepB', 'b', 0.2),
+                              ('SleepFree', 'c', 0.1), ('SleepFree', 'd', 0.1)])
+        self.assertEqual(sorted(order), [1, 2, 3, 4])
+        self.assertEqual(shared.most, 1)
+        self.assertEqual(free.most, 2)
+
+    def testInOrderWaitsForMux(self):
+        log = CallLog()
+        client.provider_modules['Sleep'] = sleeping_provider('Sleep', log)
+        sock = self.start_session()
+        sock.sendall(encode_mux(7, *self.sleep('Sleep', 'multiplexed', 0.3)) +
+                     encode_request(*self.sleep('Sleep', 'in order', 0)))
+        self.assertEqual(self.read_mux_response(sock),
+                         (7, (0, {'Name': 'multiplexed'})))
+        self.assertEqual(read_response(sock), (0, {'Name': 'in order'}))
+        self.assertEqual(log.events, [('start', 'multiplexed'), ('end', 'multiplexed'),
+                                      ('start', 'in order'), ('end', 'in order')])
+        self.end_session(sock)
+
+    def testMuxAnsweredAtEndOfInput(self):
+        log = CallLog()
+        client.provider_modules['Sleep'] = sleeping_provider('Sleep', log)
+        sock = self.start_session()
+        sock.sendall(encode_mux(3, *self.sleep('Sleep', 'last', 0.2)))
+        sock.shutdown(socket.SHUT_WR)
+        self.assertEqual(self.read_mux_response(sock), (3, (0, {'Name': 'last'})))
+        self.end_session(sock)
+
+
+class HostTestCases(unittest2.TestCase):
+    """
+    Sessions handed to a running client.Host.
+    """
+
+    def setUp(self):
+        if not client.host_supported():
+            self.skipTest('host mode needs socket.sendmsg/recvmsg')
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, client.HOST_SOCKET_NAME)
+        self.saved = (client.HOST_MIN_WORKERS, client.HOST_MAX_WORKERS,
+                      client.HOST_MAX_REQUESTS)
+        client.provider_modules['Fake'] = fake_provider('Fake')
+        self.pid = None
+
+    def tearDown(self):
+        if self.pid is not None:
+            os.kill(self.pid, signal.SIGTERM)
+            os.waitpid(self.pid, 0)
+        client.HOST_MIN_WORKERS, client.HOST_MAX_WORKERS, \
+            client.HOST_MAX_REQUESTS = self.saved
+        del client.provider_modules['Fake']
+        shutil.rmtree(self.dir)
+
+    def start_host(self):
+        self.pid = os.fork()
+        if self.pid == 0:
+            status = 0
+            try:
+                try:
+                    client.Host(self.path).run()
+                except:
+                    status = 1
+            finally:
+                os._exit(status)
+        deadline = time.time() + 10
+        while not os.path.exists(self.path):
+            self.assertTrue(time.time() < deadline, 'host did not start')
+            time.sleep(0.01)
+
+    def hand_session(self):
+        """ Passes a new session to the host as PythonProvider does and
+            returns our end of it, or None without an ack."""
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        ctl = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        ctl.settimeout(5)
+        try:
+            ctl.connect(self.path)
+            client.send_fd(ctl, 'S', theirs.fileno())
+            ack = ctl.recv(1)
+        finally:
+            ctl.close()
+            theirs.close()
+        if ack != b'A':
+            ours.close()
+            return None
+        ours.settimeout(10)
+        return ours
+
+    def get(self, sock, name):
+        sock.sendall(encode_request(2, 'Fake', {'Name': protocol.MI_String(name)}))
+        rval, values = read_response(sock)
+        self.assertEqual(rval, 0)
+        self.assertEqual(values['Name'], name)
+        return values['Pid']
+
+    def testHostServesSessions(self):
+        client.HOST_MIN_WORKERS = 1
+        client.HOST_MAX_WORKERS = 1
+        client.HOST_MAX_REQUESTS = 100
+        self.start_host()
+        pids = []
+        for i in range(3):
+            sock = self.hand_session()
+            self.assertTrue(sock is not None)
+            try:
+                pids.append(self.get(sock, 'session' + str(i)))
+                pids.append(self.get(sock, 'again' + str(i)))
+            finally:
+                sock.close()
+        self.assertEqual(len(set(pids)), 1)
+        self.assertNotEqual(pids[0], self.pid)
+
+    def testHostRetiresWorkerAfterLastSession(self):
+        # every worker exits after one session; the next session must go
+        # to a new worker instead of the one that is exiting
+        client.HOST_MIN_WORKERS = 1
+        client.HOST_MAX_WORKERS = 1
+        client.HOST_MAX_REQUESTS = 1
+        self.start_host()
+        pids = []
+        for i in range(4):
+            sock = self.hand_session()
+            self.assertTrue(sock is not None)
+            try:
+                pids.append(self.get(sock, 'session' + str(i)))
+            finally:
+                sock.close()
+        self.assertEqual(len(set(pids)), 4)
+
+    def testHostDropsUnacknowledgedSession(self):
+        client.HOST_MIN_WORKERS = 1
+        client.HOST_MAX_WORKERS = 1
+        host = client.Host(self.path)
+        host.listen()
+        try:
+            ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+            ctl = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            ctl.connect(self.path)
+            client.send_fd(ctl, 'S', theirs.fileno())
+            theirs.close()
+            # the provider gave up waiting for the ack before it came
+            ctl.close()
+            host.accept()
+            self.assertEqual(host.pending, [])
+            # the host no longer holds the other end of the session
+            ours.settimeout(5)
+            self.assertEqual(ours.recv(1), b'')
+            ours.close()
+        finally:
+            host.listener.close()
+
+
+if __name__ == '__main__':
+    unittest2.main()
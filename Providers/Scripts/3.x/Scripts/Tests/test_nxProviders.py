@@ -21,6 +21,8 @@ import fnmatch
 import pickle
 import hashlib
 import base64
+import threading
+import http.server
 from contextlib import contextmanager
 
 @contextmanager
@@ -163,6 +165,10 @@ os.chdir('../..')
 nxUser=imp.load_source('nxUser','./Scripts/nxUser.py') 
 nxGroup=imp.load_source('nxGroup','./Scripts/nxGroup.py') 
 nxFile=imp.load_source('nxFile','./Scripts/nxFile.py') 
+nxFileDelta=nxFile.nxFileDelta
+nxFileRemote=nxFile.nxFileRemote
+nxFileWatcher=imp.load_source('nxFileWatcher','../nxFileWatcher.py')
+nxFileWatcher.nxFile=nxFile
 nxScript=imp.load_source('nxScript','./Scripts/nxScript.py') 
 nxService=imp.load_source('nxService','./Scripts/nxService.py') 
 nxPackage=imp.load_source('nxPackage','./Scripts/nxPackage.py') 
@@ -559,6 +565,19 @@ class nxGroupTestCases(unittest2.TestCase):
         self.assertTrue(nxGroup.Set_Marshall("jojomamas", "Present", ["jojoma"], "", "", "1101" ) ==
                         [0],'Set("jojomamas", "Present", ["jojoma"], "", "", "1101" ) should return == [0]')
 
+    def testSetGroupClearsIdCache(self):
+        idcache = nxFile.idcache
+        idcache.clear()
+        try:
+            # nxFile remembers that gid 1101 is unknown...
+            self.assertRaises(KeyError, idcache.getgrgid, 1101)
+            self.assertTrue(nxGroup.Set_Marshall("jojomamas", "Present", ["jojoma"], "", "", "1101" ) ==
+                            [0],'Set("jojomamas", "Present", ["jojoma"], "", "", "1101" ) should return == [0]')
+            # ...until a Set creates it
+            self.assertTrue(idcache.getgrgid(1101).gr_name == 'jojomamas', 'The new group jojomamas should be found by nxFile.')
+        finally:
+            idcache.clear()
+
     def testSetGroupAbsent(self):
         self.assertTrue(nxGroup.Set_Marshall("jojomamas", "Present", ["jojoma"], "", "", "1101" ) ==
                         [0],'Set("jojomamas", "Present", ["jojoma"], "", "", "1101" ) should return == [0]')
@@ -1183,6 +1202,114 @@ class nxFileTestCases(unittest2.TestCase):
         self.assertTrue(nxFile.Test_Marshall("/tmp/12.pp", "/tmp/1.pp", "", "", "", "", "md5", "", "", "", "", "")==
                         [-1],'nxFile.Test_Marshall("/tmp/12.pp", "/tmp/1.pp", "", "", "", "", "md5", "", "", "", "", "") should return [-1]')
 
+    def testTestCompareFilesMD5Cache(self):
+        cache_file_dir = nxFile.cache_file_dir
+        nxFile.cache_file_dir = '/tmp/hashcache.pp/'
+        nxFile.hash_cache = None
+        try:
+            nxFile.WriteFile('/tmp/1.pp', "These are the contents of 1.pp")
+            nxFile.WriteFile('/tmp/12.pp', "These are the contents of 1.pp")
+            st_src = os.stat('/tmp/1.pp')
+            st_dest = os.stat('/tmp/12.pp')
+            cache = nxFile.GetHashCache()
+            # entries hashed well after the files last changed are used
+            cache.updated[(st_src.st_dev, st_src.st_ino)] = (st_src.st_size, st_src.st_mtime_ns, st_src.st_ctime_ns,
+                                                            nxFile.time_ns() + nxFile.HASH_CACHE_RACY_NS, 0, b'0' * 16)
+            cache.updated[(st_dest.st_dev, st_dest.st_ino)] = (st_dest.st_size, st_dest.st_mtime_ns, st_dest.st_ctime_ns,
+                                                              nxFile.time_ns() + nxFile.HASH_CACHE_RACY_NS, 0, b'0' * 16)
+            self.assertTrue(nxFile.CompareFiles('/tmp/12.pp', '/tmp/1.pp', 'md5') == 0 and cache.hits == 2,
+                            'Both digests should come from the cache.')
+            nxFile.SaveHashCache()
+            self.assertTrue(os.path.isfile('/tmp/hashcache.pp/' + nxFile.hash_cache_name), 'The hash cache was not saved.')
+            nxFile.hash_cache = None
+            self.assertTrue(len(nxFile.GetHashCache().read_index()) == 2, 'The saved hash cache should have 2 entries.')
+            # a change of contents changes ctime, so the file is hashed again
+            nxFile.WriteFile('/tmp/12.pp', "These are the contents of 12.p")
+            self.assertTrue(nxFile.CompareFiles('/tmp/12.pp', '/tmp/1.pp', 'md5') == -1,
+                            'nxFile.CompareFiles should notice the new contents of /tmp/12.pp')
+            self.assertTrue(nxFile.hash_cache.misses == 1, 'Only /tmp/12.pp should be hashed again.')
+        finally:
+            nxFile.cache_file_dir = cache_file_dir
+            nxFile.hash_cache = None
+
+    def testTestCompareFilesOtherChecksum(self):
+        cache_file_dir = nxFile.cache_file_dir
+        nxFile.cache_file_dir = '/tmp/hashcache.pp/'
+        nxFile.hash_cache = None
+        try:
+            nxFile.WriteFile('/tmp/1.pp', "These are the contents of 1.pp")
+            nxFile.WriteFile('/tmp/12.pp', "These are the contents of 12.p")
+            cache = nxFile.GetHashCache()
+            for path in ('/tmp/1.pp', '/tmp/12.pp'):
+                st = os.stat(path)
+                cache.updated[(st.st_dev, st.st_ino)] = (st.st_size, st.st_mtime_ns, st.st_ctime_ns,
+                                                        nxFile.time_ns() + nxFile.HASH_CACHE_RACY_NS, 0, b'0' * 16)
+            # digests of the cache's algorithm do not stand for another
+            other = [name for name in nxFile.CONTENT_CHECKSUMS if name != cache.algorithm][0]
+            self.assertTrue(nxFile.CompareFiles('/tmp/12.pp', '/tmp/1.pp', other) == -1 and cache.hits == 0,
+                            'A Checksum of ' + other + ' should compare the contents, not ' + cache.algorithm + ' digests.')
+            self.assertTrue(nxFile.CompareFiles('/tmp/12.pp', '/tmp/1.pp', cache.algorithm) == 0 and cache.hits == 2,
+                            'A Checksum of ' + cache.algorithm + ' should take the digests from the cache.')
+        finally:
+            nxFile.cache_file_dir = cache_file_dir
+            nxFile.hash_cache = None
+
+    def testIdCache(self):
+        idcache = nxFile.idcache
+        idcache.clear()
+        try:
+            self.assertTrue(idcache.getpwuid(0) == pwd.getpwuid(0) and idcache.getgrgid(0) == grp.getgrgid(0),
+                            'idcache should return what pwd and grp do.')
+            hits = idcache.users_by_uid.hits
+            idcache.getpwuid(0)
+            self.assertTrue(idcache.users_by_uid.hits == hits + 1, 'A second lookup of uid 0 should be a hit.')
+            # an unknown uid is remembered, an unknown name is not
+            for i in range(2):
+                self.assertRaises(KeyError, idcache.getpwuid, 4000321)
+                self.assertRaises(KeyError, idcache.getgrnam, 'nosuchgroup.pp')
+            self.assertTrue(4000321 in idcache.users_by_uid.entries and
+                            'nosuchgroup.pp' not in idcache.groups_by_name.entries, 'Only the unknown uid should be kept.')
+            idcache.clear()
+            open('/tmp/passwd.pp', 'w').write('+@netgroup::::::\nppuser:x:4000322:4000323:pp:/tmp:/bin/false\n')
+            open('/tmp/group.pp', 'w').write('ppgroup:x:4000323:ppuser,root\n')
+            idcache.preload('/tmp/passwd.pp', '/tmp/group.pp')
+            self.assertTrue(idcache.getpwnam('ppuser').pw_uid == 4000322 and idcache.getpwuid(4000322).pw_gid == 4000323,
+                            'ppuser should be preloaded.')
+            self.assertTrue(idcache.getgrgid(4000323).gr_mem == ['ppuser', 'root'], 'ppgroup should be preloaded.')
+            self.assertTrue(len(idcache.users_by_name.entries) == 1, 'The +@netgroup entry should be left to NSS.')
+        finally:
+            idcache.clear()
+
+    def testCompareFileContents(self):
+        data = os.urandom(nxFile.COMPARE_BLOCK_SIZE * 2 + 100)
+        open('/tmp/1.pp', 'wb').write(data)
+        open('/tmp/12.pp', 'wb').write(data)
+        file_hash = hashlib.md5()
+        self.assertTrue(nxFile.CompareFileContents('/tmp/1.pp', '/tmp/12.pp', file_hash) == 0,
+                        'nxFile.CompareFileContents should find /tmp/1.pp and /tmp/12.pp the same.')
+        self.assertTrue(file_hash.digest() == hashlib.md5(data).digest(), 'The contents fed to the hash differ from the file.')
+        open('/tmp/12.pp', 'wb').write(data[:-1] + bytes([data[-1] ^ 1]))
+        self.assertTrue(nxFile.CompareFileContents('/tmp/1.pp', '/tmp/12.pp') == -1,
+                        'nxFile.CompareFileContents should notice the last byte differs.')
+        open('/tmp/12.pp', 'wb').write(data[:-1])
+        self.assertTrue(nxFile.CompareFileContents('/tmp/1.pp', '/tmp/12.pp') == -1,
+                        'nxFile.CompareFileContents should notice /tmp/12.pp is shorter.')
+
+    def testScanDirPathKind(self):
+        os.makedirs('/tmp/pp/sub')
+        open('/tmp/pp/1.pp', 'w').write('1')
+        os.symlink('/tmp/pp/1.pp', '/tmp/pp/link.pp')
+        fc = nxFile.FileContext('/tmp/pp', '', 'present', 'directory', False, '', '', True, 'follow', '', '', '')
+        names = nxFile.ScanDir('/tmp/pp', fc)
+        self.assertTrue(sorted(names) == ['1.pp', 'link.pp', 'sub'], 'nxFile.ScanDir listed ' + repr(names))
+        self.assertTrue(nxFile.PathKind('/tmp/pp/1.pp', fc) == 'file', '/tmp/pp/1.pp should be a file.')
+        self.assertTrue(nxFile.PathKind('/tmp/pp/link.pp', fc) == 'link', '/tmp/pp/link.pp should be a link.')
+        self.assertTrue(nxFile.PathKind('/tmp/pp/sub', fc) == 'directory', '/tmp/pp/sub should be a directory.')
+        self.assertTrue(nxFile.PathKind('/tmp/pp/none.pp', fc) is None, '/tmp/pp/none.pp does not exist.')
+        st = nxFile.CachedLStat('/tmp/pp/1.pp', fc)
+        self.assertTrue(st.st_size == 1 and nxFile.CachedLStat('/tmp/pp/1.pp', fc) is st,
+                        'nxFile.CachedLStat should keep the lstat of /tmp/pp/1.pp.')
+
     def testSetFileCopy(self):
         self.assertTrue(nxFile.Set_Marshall("/tmp/1.pp", "", "Present", "File", "", "These are the contents of 1.pp", "md5", "", "", "", "", "")==
                         [0],'nxFile.Set_Marshall("/tmp/1.pp", "", "Present", "File", "", "These are the contents of 1.pp", "md5", "", "", "", "", "") should return [0]')
@@ -1192,6 +1319,198 @@ class nxFileTestCases(unittest2.TestCase):
         self.assertTrue(d==
                         "These are the contents of 1.pp","File contents mismatch:"+d)
 
+    def testSetDirectoryRecurseThreads(self):
+        for d in ('/tmp/srcpp/a', '/tmp/srcpp/b'):
+            os.makedirs(d)
+            for i in range(20):
+                open(d + '/' + str(i) + '.pp', 'w').write(d + str(i))
+        os.makedirs('/tmp/destpp/b/7.pp')
+        threads = nxFile.SET_THREADS
+        nxFile.SET_THREADS = 4
+        try:
+            self.assertTrue(nxFile.Set_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "md5", True, "", "", "", "")==
+                            [-1],'nxFile.Set_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "md5", True, "", "", "", "") should return [-1]')
+            copied = len(os.listdir('/tmp/destpp/a')) + len(os.listdir('/tmp/destpp/b'))
+            self.assertTrue(copied == 40, 'The files besides /tmp/destpp/b/7.pp should still be set, found ' + str(copied))
+            self.assertTrue(nxFile.Set_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", True, "", "md5", True, "", "", "", "")==
+                            [0],'nxFile.Set_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", True, "", "md5", True, "", "", "", "") should return [0]')
+        finally:
+            nxFile.SET_THREADS = threads
+        self.assertTrue(nxFile.Test_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", "", "", "md5", True, "", "", "", "")==
+                        [0],'nxFile.Test_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", "", "", "md5", True, "", "", "", "") should return [0]')
+
+    def testCopyFileSparse(self):
+        os.makedirs('/tmp/pp')
+        with open('/tmp/pp/1.pp', 'wb') as F:
+            F.truncate(8 * 1048576)
+            F.seek(4 * 1048576)
+            F.write(b'x' * 4096)
+        for methods in (nxFile.COPY_METHODS, ('readinto',)):
+            copy_methods = nxFile.COPY_METHODS
+            nxFile.COPY_METHODS = methods
+            try:
+                self.assertTrue(nxFile.CopyFile('/tmp/pp/1.pp', '/tmp/pp/12.pp') is None, 'nxFile.CopyFile failed using ' + methods[0])
+            finally:
+                nxFile.COPY_METHODS = copy_methods
+            self.assertTrue(open('/tmp/pp/1.pp', 'rb').read() == open('/tmp/pp/12.pp', 'rb').read(),
+                            '/tmp/pp/12.pp differs from /tmp/pp/1.pp using ' + methods[0])
+            self.assertTrue(os.stat('/tmp/pp/12.pp').st_blocks <= os.stat('/tmp/pp/1.pp').st_blocks,
+                            'The holes of /tmp/pp/1.pp were filled using ' + methods[0])
+        self.assertTrue(sorted(os.listdir('/tmp/pp')) == ['1.pp', '12.pp'], 'Temporary files were left behind in /tmp/pp')
+
+    def testCopyFileKeepsAttributes(self):
+        os.makedirs('/tmp/pp')
+        open('/tmp/pp/1.pp', 'wb').write(os.urandom(nxFileDelta.DELTA_BLOCK_SIZE * 20))
+        open('/tmp/pp/12.pp', 'wb').write(b'old')
+        try:
+            os.setxattr('/tmp/pp/12.pp', 'user.nxfile', b'kept')
+        except OSError:
+            self.skipTest('/tmp does not support user extended attributes')
+        os.chown('/tmp/pp/12.pp', 1, 1)
+        self.assertTrue(nxFile.CopyFile('/tmp/pp/1.pp', '/tmp/pp/12.pp') is None, 'nxFile.CopyFile failed.')
+        self.assertTrue(os.getxattr('/tmp/pp/12.pp', 'user.nxfile') == b'kept', 'The copy lost the extended attributes of /tmp/pp/12.pp')
+        self.assertTrue(os.stat('/tmp/pp/12.pp')[4:6] == (1, 1), 'The copy lost the owner of /tmp/pp/12.pp')
+        # blocks that moved make the delta update write a new file too
+        data = b'inserted' + open('/tmp/pp/1.pp', 'rb').read()
+        open('/tmp/pp/1.pp', 'wb').write(data)
+        self.assertTrue(nxFileDelta.DeltaUpdateFile('/tmp/pp/1.pp', '/tmp/pp/12.pp') is None, 'nxFileDelta.DeltaUpdateFile failed.')
+        self.assertTrue(open('/tmp/pp/12.pp', 'rb').read() == data, '/tmp/pp/12.pp differs from /tmp/pp/1.pp')
+        self.assertTrue(os.getxattr('/tmp/pp/12.pp', 'user.nxfile') == b'kept', 'The delta update lost the extended attributes of /tmp/pp/12.pp')
+        # what cannot be given to a new file is kept by writing in place
+        keep_attributes = nxFile.KeepAttributes
+        nxFile.KeepAttributes = lambda path, fd: False
+        try:
+            ino = os.stat('/tmp/pp/12.pp').st_ino
+            open('/tmp/pp/1.pp', 'wb').write(b'new')
+            self.assertTrue(nxFile.CopyFile('/tmp/pp/1.pp', '/tmp/pp/12.pp') is None, 'nxFile.CopyFile failed.')
+            self.assertTrue(open('/tmp/pp/12.pp', 'rb').read() == b'new' and os.stat('/tmp/pp/12.pp').st_ino == ino,
+                            '/tmp/pp/12.pp should be written in place.')
+            open('/tmp/pp/1.pp', 'wb').write(b'inserted' + data)
+            self.assertTrue(nxFileDelta.DeltaUpdateFile('/tmp/pp/1.pp', '/tmp/pp/12.pp') is None, 'nxFileDelta.DeltaUpdateFile failed.')
+            self.assertTrue(open('/tmp/pp/12.pp', 'rb').read() == b'inserted' + data and os.stat('/tmp/pp/12.pp').st_ino == ino,
+                            '/tmp/pp/12.pp should be updated in place.')
+        finally:
+            nxFile.KeepAttributes = keep_attributes
+        self.assertTrue(sorted(os.listdir('/tmp/pp')) == ['1.pp', '12.pp'], 'Temporary files were left behind in /tmp/pp')
+
+    def testDeltaUpdateFile(self):
+        block_size = nxFileDelta.DELTA_BLOCK_SIZE
+        base = os.urandom(block_size * 20)
+        open('/tmp/12.pp', 'wb').write(base)
+        ino = os.stat('/tmp/12.pp').st_ino
+        # changed in place: only the changed block is written, in place
+        data = base[:block_size * 5] + b'x' * 10 + base[block_size * 5 + 10:]
+        open('/tmp/1.pp', 'wb').write(data)
+        plan = nxFileDelta.DeltaPlan(os.open('/tmp/1.pp', os.O_RDONLY), len(data), os.open('/tmp/12.pp', os.O_RDONLY), block_size)
+        self.assertTrue([op for op in plan if op[0] == 'data'] == [('data', block_size * 5, block_size)],
+                        'Only block 5 should be taken from the source: ' + repr(plan))
+        delta_min_size = nxFile.DELTA_MIN_SIZE
+        nxFile.DELTA_MIN_SIZE = 1
+        try:
+            self.assertTrue(nxFile.Set_Marshall("/tmp/12.pp", "/tmp/1.pp", "", "", "", "", "md5", "", "", "", "", "")==
+                            [0],'nxFile.Set_Marshall("/tmp/12.pp", "/tmp/1.pp", "", "", "", "", "md5", "", "", "", "", "") should return [0]')
+        finally:
+            nxFile.DELTA_MIN_SIZE = delta_min_size
+        self.assertTrue(open('/tmp/12.pp', 'rb').read() == data and os.stat('/tmp/12.pp').st_ino == ino,
+                        '/tmp/12.pp should be updated in place.')
+        # inserted and removed data: the blocks after are found where they moved to
+        data = base[:block_size * 3] + b'inserted' + base[block_size * 3:block_size * 9] + base[block_size * 9 + 100:]
+        open('/tmp/1.pp', 'wb').write(data)
+        plan = nxFileDelta.DeltaPlan(os.open('/tmp/1.pp', os.O_RDONLY), len(data), os.open('/tmp/12.pp', os.O_RDONLY), block_size)
+        self.assertTrue(sum([op[2] for op in plan if op[0] == 'data']) < block_size * 3,
+                        'The moved blocks should be taken from the destination: ' + repr(plan))
+        self.assertTrue(nxFileDelta.DeltaUpdateFile('/tmp/1.pp', '/tmp/12.pp') is None, 'nxFileDelta.DeltaUpdateFile failed.')
+        self.assertTrue(open('/tmp/12.pp', 'rb').read() == data, '/tmp/12.pp differs from /tmp/1.pp')
+        # nothing in common: the search gives up and the file is copied whole
+        data = os.urandom(block_size * 20)
+        open('/tmp/1.pp', 'wb').write(data)
+        start = time.time()
+        plan = nxFileDelta.DeltaPlan(os.open('/tmp/1.pp', os.O_RDONLY), len(data), os.open('/tmp/12.pp', os.O_RDONLY), block_size)
+        self.assertTrue(plan is None, 'Files with nothing in common should be copied whole: ' + repr(plan))
+        self.assertTrue(time.time() - start < 10, 'The search for moved blocks should give up.')
+        self.assertTrue(nxFileDelta.DeltaUpdateFile('/tmp/1.pp', '/tmp/12.pp') is None, 'nxFileDelta.DeltaUpdateFile failed.')
+        self.assertTrue(open('/tmp/12.pp', 'rb').read() == data, '/tmp/12.pp differs from /tmp/1.pp')
+
+    def testTestDirectoryManifest(self):
+        os.makedirs('/tmp/srcpp/a')
+        open('/tmp/srcpp/a/1.pp', 'w').write('one')
+        open('/tmp/srcpp/2.pp', 'w').write('two')
+        self.assertTrue(nxFile.Set_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "md5", True, "", "", "", "")==
+                        [0],'nxFile.Set_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "md5", True, "", "", "", "") should return [0]')
+        self.assertTrue(nxFile.WriteManifest('/tmp/srcpp') == 4, 'The manifest should have 4 entries.')
+        self.assertTrue(nxFile.Test_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "md5", True, "", "", "", "")==
+                        [0],'nxFile.Test_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "md5", True, "", "", "", "") should return [0]')
+        # the source is not read: a change the manifest does not have goes unseen
+        open('/tmp/srcpp/a/1.pp', 'w').write('ONE')
+        self.assertTrue(nxFile.Test_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "md5", True, "", "", "", "")==
+                        [0],'The manifest, not /tmp/srcpp/a/1.pp, should be compared with /tmp/destpp/a/1.pp')
+        # its md5 digests do not stand for another Checksum
+        self.assertTrue(nxFile.Test_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "sha-256", True, "", "", "", "")==
+                        [-1],'With a Checksum of sha-256, /tmp/srcpp/a/1.pp rather than the manifest should be compared with /tmp/destpp/a/1.pp')
+        open('/tmp/destpp/a/1.pp', 'w').write('ONE')
+        self.assertTrue(nxFile.Test_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "md5", True, "", "", "", "")==
+                        [-1],'/tmp/destpp/a/1.pp differs from the manifest, Test should return [-1]')
+        os.remove('/tmp/destpp/a/1.pp')
+        self.assertTrue(nxFile.Test_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "md5", True, "", "", "", "")==
+                        [-1],'/tmp/destpp/a/1.pp is missing, Test should return [-1]')
+        os.symlink('/tmp/srcpp/2.pp', '/tmp/srcpp/link.pp')
+        self.assertTrue(nxFile.WriteManifest('/tmp/srcpp') == 5, 'The manifest should have 5 entries.')
+        manifest = nxFile.Manifest('/tmp/srcpp' + nxFile.MANIFEST_SUFFIX)
+        try:
+            names = [name for name, entry in manifest]
+            self.assertTrue(names == [b'', b'2.pp', b'a', b'a/1.pp', b'link.pp'], 'Manifest entries: ' + repr(names))
+            self.assertTrue(manifest.find(b'a/1.pp').digest == nxFile.Digest16(nxFile.filehash.digest(manifest.algorithm, b'ONE')),
+                            'Manifest digest of a/1.pp')
+            self.assertTrue(manifest.find(b'link.pp').target == b'/tmp/srcpp/2.pp', 'Manifest target of link.pp')
+            self.assertTrue(manifest.find(b'a/2.pp') is None, 'a/2.pp is not in the manifest.')
+        finally:
+            manifest.close()
+
+    def testTestDirectoryJournal(self):
+        for d in ('/tmp/srcpp/a', '/tmp/srcpp/b'):
+            os.makedirs(d)
+            for i in range(5):
+                open(d + '/' + str(i) + '.pp', 'w').write(d + str(i))
+        self.assertTrue(nxFile.Set_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "md5", True, "", "", "", "")==
+                        [0],'nxFile.Set_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "md5", True, "", "", "", "") should return [0]')
+        cache_file_dir = nxFile.cache_file_dir
+        nxFile.cache_file_dir = '/tmp/cachepp/'
+        watcher = nxFileWatcher.ChangeWatcher(['/tmp/destpp', '/tmp/srcpp'])
+        try:
+            for root in ('/tmp/destpp', '/tmp/srcpp'):
+                watcher.start(root)
+            watcher.write_status()
+            test = lambda: nxFile.Test_Marshall("/tmp/destpp", "/tmp/srcpp", "Present", "Directory", False, "", "md5", True, "", "", "", "")
+            self.assertTrue(test() == [0], 'The first Test checks the whole tree and should return [0]')
+            # a change the watcher does not see goes unchecked
+            open('/tmp/destpp/a/1.pp', 'w').write('changed')
+            os.read(watcher.fd, 65536)
+            self.assertTrue(test() == [0], 'Only the journaled paths should be checked.')
+            open('/tmp/destpp/b/2.pp', 'w').write('changed')
+            os.makedirs('/tmp/destpp/c/d')
+            watcher.read_events()
+            self.assertTrue(test() == [-1], '/tmp/destpp/b/2.pp was journaled and differs, Test should return [-1]')
+            # after a Test that failed, the whole tree is checked
+            open('/tmp/destpp/b/2.pp', 'w').write('/tmp/srcpp/b2')
+            watcher.read_events()
+            self.assertTrue(test() == [-1], '/tmp/destpp/a/1.pp differs, Test should return [-1]')
+            open('/tmp/destpp/a/1.pp', 'w').write('/tmp/srcpp/a1')
+            watcher.read_events()
+            self.assertTrue(test() == [0], 'The trees are the same again, Test should return [0]')
+            self.assertTrue('/tmp/destpp' in [w[0] for w in watcher.watches.values() if w[1] == 'c/d'],
+                            'The new directory /tmp/destpp/c/d should be watched.')
+            # a new journal (an overflow of the inotify queue) checks the whole tree
+            open('/tmp/destpp/a/1.pp', 'w').write('changed')
+            os.read(watcher.fd, 65536)
+            watcher.start('/tmp/destpp')
+            self.assertTrue(test() == [-1], '/tmp/destpp/a/1.pp differs, Test should return [-1]')
+            os.remove('/tmp/cachepp/journal/watcher.json')
+            self.assertTrue(nxFile.OpenJournals('/tmp/destpp', '/tmp/srcpp', None) is None,
+                            'Without a running watcher the journals should not be used.')
+        finally:
+            watcher.close()
+            nxFile.cache_file_dir = cache_file_dir
+
     def testSetDirectoryPresent(self):
         self.assertTrue(nxFile.Set_Marshall("/tmp/pp", "", "Present", "Directory", "", "", "md5", "", "", "", "", "")==
                         [0],'nxFile.Set_Marshall("/tmp/pp", "", "Present", "Directory", "", "", "md5", "", "", "", "", "") should return [0]')
@@ -1392,6 +1711,189 @@ class nxFileTestCases(unittest2.TestCase):
         self.assertTrue(nxFile.Test_Marshall("/tmp/pp", "", "Present", "Directory", "", "", "md5", "", "", "", "", '776')==
                         [0],'nxFile.Test_Marshall("/tmp/pp", "", "Present", "Directory", "", "", "md5", "", "", "", "", 776) should return [0]')
 
+    def testRemoteFileConditionalGet(self):
+        body = os.urandom(100000)
+        requests = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            etag = '"1"'
+
+            def do_GET(self):
+                requests.append(self.headers.get('If-None-Match'))
+                if self.headers.get('If-None-Match') == self.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', self.etag)
+                self.send_header('Last-Modified', 'Mon, 01 Jan 2018 00:00:00 GMT')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        url = 'http://127.0.0.1:' + str(server.server_address[1]) + '/1.pp'
+        cache_file_dir = nxFile.cache_file_dir
+        nxFile.cache_file_dir = '/tmp/remotecache.pp/'
+        nxFile.hash_cache = None
+        try:
+            self.assertTrue(nxFile.Test_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "")==
+                            [-1],'nxFile.Test_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "") should return [-1]')
+            self.assertTrue(nxFile.Set_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "")==
+                            [0],'nxFile.Set_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "") should return [0]')
+            self.assertTrue(open('/tmp/1.pp', 'rb').read() == body, 'The contents of /tmp/1.pp differ from the remote file.')
+            self.assertTrue(nxFile.Test_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "")==
+                            [0],'nxFile.Test_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "") should return [0]')
+            # Set downloads, Test finds it unchanged
+            self.assertTrue(requests == [None, '"1"'], 'Only the first request should download the file: ' + repr(requests))
+            Handler.etag = '"2"'
+            body = body[::-1]
+            self.assertTrue(nxFile.Test_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "")==
+                            [-1],'nxFile.Test_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "") should notice the new contents')
+        finally:
+            server.shutdown()
+            server.server_close()
+            nxFile.cache_file_dir = cache_file_dir
+            nxFile.hash_cache = None
+
+    def testRemoteFileModeAndModifiedTime(self):
+        body = os.urandom(10000)
+        requests = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def send_headers(self):
+                self.send_response(200)
+                self.send_header('Last-Modified', 'Mon, 01 Jan 2018 00:00:00 GMT')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+
+            def do_HEAD(self):
+                requests.append('HEAD')
+                self.send_headers()
+
+            def do_GET(self):
+                requests.append('GET')
+                self.send_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        url = 'http://127.0.0.1:' + str(server.server_address[1]) + '/1.pp'
+        cache_file_dir = nxFile.cache_file_dir
+        nxFile.cache_file_dir = '/tmp/remotecache.pp/'
+        nxFile.hash_cache = None
+        umask = os.umask(0o022)
+        try:
+            # without Mode, the file gets the mode of a new file
+            self.assertTrue(nxFile.Set_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "mtime", "", "", "", "", "")==
+                            [0],'nxFile.Set_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "mtime", "", "", "", "", "") should return [0]')
+            self.assertTrue(open('/tmp/1.pp', 'rb').read() == body, 'The contents of /tmp/1.pp differ from the remote file.')
+            self.assertTrue((os.stat('/tmp/1.pp').st_mode & 0o777) == 0o644,
+                            'The mode of /tmp/1.pp should be 644, not ' + oct(os.stat('/tmp/1.pp').st_mode & 0o777))
+            # checking the modified time transfers no body
+            del requests[:]
+            nxFile.Test_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "mtime", "", "", "", "", "")
+            self.assertTrue(requests == ['HEAD'], 'The modified time should be asked for with HEAD: ' + repr(requests))
+        finally:
+            os.umask(umask)
+            server.shutdown()
+            server.server_close()
+            nxFile.cache_file_dir = cache_file_dir
+            nxFile.hash_cache = None
+
+    def testRemoteFileRanges(self):
+        body = os.urandom(100000)
+        requests = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            # bytes sent of each of the next len(cuts) answers before the
+            # connection drops
+            cuts = []
+            content_md5 = base64.b64encode(hashlib.md5(body).digest()).decode('ascii')
+
+            def do_GET(self):
+                requests.append(self.headers.get('Range'))
+                start, end = 0, len(body) - 1
+                if self.headers.get('Range') and self.headers.get('If-Range') == '"1"':
+                    start, end = [int(n) for n in self.headers.get('Range')[len('bytes='):].split('-')]
+                    self.send_response(206)
+                    self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(body)))
+                else:
+                    self.send_response(200)
+                    self.send_header('Content-MD5', self.content_md5)
+                self.send_header('ETag', '"1"')
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(end + 1 - start))
+                self.end_headers()
+                if self.cuts:
+                    end = start + self.cuts.pop(0) - 1
+                    self.close_connection = True
+                self.wfile.write(body[start:end + 1])
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        url = 'http://127.0.0.1:' + str(server.server_address[1]) + '/1.pp'
+        saved = (nxFile.cache_file_dir, nxFileRemote.REMOTE_RETRIES, nxFileRemote.REMOTE_SEGMENTS, nxFileRemote.REMOTE_SEGMENT_MIN_SIZE)
+        nxFile.cache_file_dir = '/tmp/remotecache.pp/'
+        nxFile.hash_cache = None
+        try:
+            # the first answer drops half way, the rest is asked for
+            Handler.cuts = [50000]
+            self.assertTrue(nxFile.Set_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "")==
+                            [0],'nxFile.Set_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "") should return [0]')
+            self.assertTrue(requests == [None, 'bytes=50000-99999'], 'The download should resume at byte 50000: ' + repr(requests))
+            self.assertTrue(open('/tmp/1.pp', 'rb').read() == body, 'The contents of /tmp/1.pp differ from the remote file.')
+
+            # a download that fails is kept and resumed by the next Set
+            os.system('rm -rf /tmp/1.pp /tmp/remotecache.pp')
+            del requests[:]
+            nxFileRemote.REMOTE_RETRIES = 1
+            Handler.cuts = [30000, 20000]
+            self.assertRaises(Exception, nxFile.Set_Marshall, "/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "")
+            self.assertTrue(nxFile.Set_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "")==
+                            [0],'nxFile.Set_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "") should return [0]')
+            self.assertTrue(requests == [None, 'bytes=30000-99999', 'bytes=50000-99999'], 'The download should resume at byte 50000: ' + repr(requests))
+            self.assertTrue(open('/tmp/1.pp', 'rb').read() == body, 'The contents of /tmp/1.pp differ from the remote file.')
+
+            # parallel ranges
+            os.system('rm -rf /tmp/1.pp /tmp/remotecache.pp')
+            del requests[:]
+            nxFileRemote.REMOTE_SEGMENTS = 4
+            nxFileRemote.REMOTE_SEGMENT_MIN_SIZE = 1
+            self.assertTrue(nxFile.Set_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "")==
+                            [0],'nxFile.Set_Marshall("/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "") should return [0]')
+            self.assertTrue(sorted(requests[1:]) == ['bytes=0-24999', 'bytes=25000-49999', 'bytes=50000-74999', 'bytes=75000-99999'],
+                            'The file should be fetched in 4 ranges: ' + repr(requests))
+            self.assertTrue(open('/tmp/1.pp', 'rb').read() == body, 'The contents of /tmp/1.pp differ from the remote file.')
+
+            # the digest is checked before the file is used
+            os.system('rm -rf /tmp/1.pp /tmp/remotecache.pp')
+            Handler.content_md5 = base64.b64encode(hashlib.md5(b'other').digest()).decode('ascii')
+            self.assertRaises(Exception, nxFile.Set_Marshall, "/tmp/1.pp", url, "Present", "File", "", "", "md5", "", "", "", "", "")
+            self.assertTrue(not os.path.exists('/tmp/1.pp'), '/tmp/1.pp should not be written from a download that fails its digest.')
+        finally:
+            server.shutdown()
+            server.server_close()
+            nxFile.cache_file_dir, nxFileRemote.REMOTE_RETRIES, nxFileRemote.REMOTE_SEGMENTS, nxFileRemote.REMOTE_SEGMENT_MIN_SIZE = saved
+            nxFile.hash_cache = None
+
     def testRemoteFilePass(self):
         self.assertTrue(nxFile.Test_Marshall("/tmp/Python-2.4.6.tgz",\
                "https://www.python.org/ftp/python/2.4.6/Python-2.4.6.tgz", "Present", "File", "", "", "ctime", "", "", "", "", '776') ==
@@ -1956,8 +2458,8 @@ class nxServiceTestCases(unittest2.TestCase):
             if Name != None and len(Name) and not fnmatch.fnmatch(i['Name'].value,Name):
                 print('Name:' + Name + ' != ' + i['Name'].value)
                 return False
-            if Enabled is not None and Enabled != i['Enabled'].value.value:
-                print('Enabled:' + repr(Enabled) + ' != ' + repr(i['Enabled'].value.value))
+            if Enabled is not None and Enabled != i['Enabled'].value:
+                print('Enabled:' + repr(Enabled) + ' != ' + repr(i['Enabled'].value))
                 return False
             if State != None and len(State) and not fnmatch.fnmatch(i['State'].value,State):
                 print('State:' + State + ' != ' + i['State'].value)
@@ -3335,6 +3837,63 @@ class nxFileInventoryTestCases(unittest2.TestCase):
 #        for d in r[1]['__Inventory'].value:
 #            print(d['DestinationPath'], d['Contents'])
 
+    def testFileInventoryInventory_MarshallSingleFileChecksums(self):
+        data = open(self.basepath + 'basedirfile1.txt', 'rb').read()
+        for name in nxFileInventory.filehash.available():
+            d = {'Links': u'ignore', 'MaxOutputSize': None, \
+                 'Checksum': name, 'Recurse': False, \
+                 'MaxContentsReturnable': None, \
+                 'DestinationPath': self.basepath + 'basedirfile1.txt', 'UseSudo': True, 'Type': u'file'}
+            r = nxFileInventory.Inventory_Marshall(**d)
+            self.assertTrue(r[0] == 0,'Inventory_Marshall('+repr(d)+')[0] should return == 0')
+            checksum = r[1]['__Inventory'].value[0]['Checksum'].value
+            file_hash = nxFileInventory.filehash.new(name)
+            file_hash.update(data)
+            self.assertTrue(checksum == file_hash.hexdigest(), name + ' of basedirfile1.txt is ' + repr(checksum))
+        if 'blake2b' in nxFileInventory.filehash.ALGORITHMS:
+            self.assertTrue(nxFileInventory.GetChecksum(self.basepath + 'basedirfile1.txt', 'blake2b') ==
+                            hashlib.blake2b(data).hexdigest(), 'GetChecksum blake2b of basedirfile1.txt')
+
+    def testFileInventoryIndex(self):
+        cache_file_dir = nxFileInventory.cache_file_dir
+        racy_ns = nxFileInventory.INDEX_RACY_NS
+        GetChecksum = nxFileInventory.GetChecksum
+        nxFileInventory.cache_file_dir = '/tmp/inventoryindex.pp/'
+        nxFileInventory.INDEX_RACY_NS = 0
+        read = []
+        def counted(fname, Checksum):
+            read.append(fname)
+            return GetChecksum(fname, Checksum)
+        nxFileInventory.GetChecksum = counted
+        d = {'Links': u'ignore', 'MaxOutputSize': None, \
+             'Checksum': u'md5', 'Recurse': True, \
+             'MaxContentsReturnable': None, \
+             'DestinationPath': self.basepath + 'joedir0/', 'UseSudo': True, 'Type': u'file'}
+        try:
+            os.system('rm -rf /tmp/inventoryindex.pp')
+            first = self.MakeList(nxFileInventory.Inventory_Marshall(**d))
+            self.assertTrue(len(read) > 0 and len(os.listdir('/tmp/inventoryindex.pp')) == 1,
+                            'The first inventory should read the files and write an index.')
+            index = '/tmp/inventoryindex.pp/' + os.listdir('/tmp/inventoryindex.pp')[0]
+            self.assertTrue((os.stat('/tmp/inventoryindex.pp').st_mode & 0o777) == 0o700 and (os.stat(index).st_mode & 0o777) == 0o600,
+                            'The index holds file contents, only root should read it.')
+            del read[:]
+            r = nxFileInventory.Inventory_Marshall(**d)
+            self.assertTrue(self.MakeList(r) == first and read == [], 'The second inventory should read no file: ' + repr(read))
+            contents = [i['Contents'].value for i in r[1]['__Inventory'].value
+                        if i['DestinationPath'].value.endswith('joedir0file1.txt')]
+            self.assertTrue(contents == ['Contents of joedir0file1.txt\n'], 'Indexed contents ' + repr(contents))
+            os.utime(self.basepath + 'joedir0/joedir0file2.txt', None)
+            del read[:]
+            self.assertTrue(self.MakeList(nxFileInventory.Inventory_Marshall(**d)) == first and
+                            read == [self.basepath + 'joedir0/joedir0file2.txt'],
+                            'Only the touched file should be read again: ' + repr(read))
+        finally:
+            nxFileInventory.cache_file_dir = cache_file_dir
+            nxFileInventory.INDEX_RACY_NS = racy_ns
+            nxFileInventory.GetChecksum = GetChecksum
+            os.system('rm -rf /tmp/inventoryindex.pp')
+
     def testFileInventoryInventory_MarshallSingleFile_omsadminconf(self):
         d = {'Links': u'ignore', 'MaxOutputSize': None, \
              'Checksum': u'md5', 'Recurse': False, \
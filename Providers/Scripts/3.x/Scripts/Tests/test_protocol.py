@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+#============================================================================
+# Copyright (c) Microsoft Corporation. All rights reserved. See license.txt for license information.
+#============================================================================
+"""
+Round trip tests for the wire codecs in Providers/Scripts/protocol.py:
+every MI type is written with write_values and read back with read_values
+and read_plain_values, whole and one byte per recv.
+"""
+import imp
+import os
+import socket
+import struct
+import sys
+import threading
+try:
+    import unittest2
+except:
+    import unittest as unittest2
+
+PROTOCOL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', '..', 'protocol.py')
+protocol = imp.load_source('protocol', PROTOCOL_PATH)
+protocol.DO_TRACE = False
+
+
+class Sink:
+    """ Stands in for the session socket: collects what is sent and plays
+        it back through recv()."""
+
+    def __init__(self, data=b''):
+        self.chunks = []
+        self.data = data
+        self.pos = 0
+
+    def sendall(self, buf):
+        self.chunks.append(buf)
+
+    send = sendall
+
+    def getvalue(self):
+        return b''.join(self.chunks)
+
+    def recv(self, n):
+        buf = self.data[self.pos:self.pos + n]
+        self.pos += len(buf)
+        return buf
+
+
+class TricklePeer(Sink):
+    """ A peer that delivers at most one byte per recv, as a socket may
+        under load."""
+
+    def recv(self, n):
+        return Sink.recv(self, min(n, 1))
+
+
+def send_bytewise(sock, data):
+    """ Sends data one byte per send, then closes sock."""
+    try:
+        for i in range(len(data)):
+            sock.sendall(data[i:i + 1])
+    finally:
+        sock.close()
+
+
+def encode(values):
+    out = Sink()
+    protocol.write_values(out, values)
+    return out.getvalue()
+
+
+def timestamp():
+    return protocol.MI_Timestamp(2016, 2, 29, 23, 59, 58, 123456, -480)
+
+
+def interval():
+    return protocol.MI_Interval(3, 4, 5, 6, 7)
+
+
+TIMESTAMP_FIELDS = (2016, 2, 29, 23, 59, 58, 123456, -480)
+INTERVAL_FIELDS = (3, 4, 5, 6, 7)
+
+
+def all_values():
+    """ One value of every MI type, named after the type, with the Python
+        value read_plain_values has to return for it."""
+    return [
+        ('Boolean', protocol.MI_Boolean(True), True),
+        ('Uint8', protocol.MI_Uint8(255), 255),
+        ('Sint8', protocol.MI_Sint8(-128), -128),
+        ('Uint16', protocol.MI_Uint16(65535), 65535),
+        ('Sint16', protocol.MI_Sint16(-32768), -32768),
+        ('Uint32', protocol.MI_Uint32(4294967295), 4294967295),
+        ('Sint32', protocol.MI_Sint32(-2147483648), -2147483648),
+        ('Uint64', protocol.MI_Uint64(18446744073709551615), 18446744073709551615),
+        ('Sint64', protocol.MI_Sint64(-9223372036854775808), -9223372036854775808),
+        ('Real32', protocol.MI_Real32(1.5), 1.5),
+        ('Real64', protocol.MI_Real64(-2.25e300), -2.25e300),
+        ('Char16', protocol.MI_Char16(0x263A), 0x263A),
+        ('Timestamp', timestamp(), TIMESTAMP_FIELDS),
+        ('Interval', interval(), INTERVAL_FIELDS),
+        ('String', protocol.MI_String(u'café ☺'), u'café ☺'),
+        ('EmptyString', protocol.MI_String(''), ''),
+        ('Instance', protocol.MI_Instance({'Key': protocol.MI_String('k'),
+                                           'Count': protocol.MI_Uint32(7)}),
+         {'Key': 'k', 'Count': 7}),
+        ('BooleanA', protocol.MI_BooleanA([True, False, True]), [True, False, True]),
+        ('Uint8A', protocol.MI_Uint8A([0, 1, 255]), [0, 1, 255]),
+        ('Sint8A', protocol.MI_Sint8A([-128, 0, 127]), [-128, 0, 127]),
+        ('Uint16A', protocol.MI_Uint16A([0, 65535]), [0, 65535]),
+        ('Sint16A', protocol.MI_Sint16A([-32768, 32767]), [-32768, 32767]),
+        ('Uint32A', protocol.MI_Uint32A([0, 4294967295]), [0, 4294967295]),
+        ('Sint32A', protocol.MI_Sint32A([-2147483648, 2147483647]),
+         [-2147483648, 2147483647]),
+        ('Uint64A', protocol.MI_Uint64A([0, 18446744073709551615]),
+         [0, 18446744073709551615]),
+        ('Sint64A', protocol.MI_Sint64A([-9223372036854775808, 1]),
+         [-9223372036854775808, 1]),
+        ('Real32A', protocol.MI_Real32A([0.5, -4.0]), [0.5, -4.0]),
+        ('Real64A', protocol.MI_Real64A([1e-300, 3.0]), [1e-300, 3.0]),
+        ('Char16A', protocol.MI_Char16A([65, 0x263A]), [65, 0x263A]),
+        ('DatetimeA', protocol.MI_DatetimeA([timestamp(), interval()]),
+         [TIMESTAMP_FIELDS, INTERVAL_FIELDS]),
+        ('StringA', protocol.MI_StringA(['a', '', u'☺']), ['a', '', u'☺']),
+        ('InstanceA', protocol.MI_InstanceA([{'Name': protocol.MI_String('one')},
+                                             {'Name': protocol.MI_String('two'),
+                                              'Size': protocol.MI_Uint64(2)}]),
+         [{'Name': 'one'}, {'Name': 'two', 'Size': 2}]),
+        ]
+
+
+# every array type, empty
+EMPTY_ARRAYS = (protocol.MI_BooleanA, protocol.MI_Uint8A, protocol.MI_Sint8A,
+                protocol.MI_Uint16A, protocol.MI_Sint16A, protocol.MI_Uint32A,
+                protocol.MI_Sint32A, protocol.MI_Uint64A, protocol.MI_Sint64A,
+                protocol.MI_Real32A, protocol.MI_Real64A, protocol.MI_Char16A,
+                protocol.MI_DatetimeA, protocol.MI_StringA, protocol.MI_InstanceA)
+
+# every type that can be sent as a null value
+NULL_VALUES = (protocol.MI_Boolean(None), protocol.MI_Uint8(None),
+               protocol.MI_Sint8(None), protocol.MI_Uint16(None),
+               protocol.MI_Sint16(None), protocol.MI_Uint32(None),
+               protocol.MI_Sint32(None), protocol.MI_Uint64(None),
+               protocol.MI_Sint64(None), protocol.MI_Real32(None),
+               protocol.MI_Real64(None), protocol.MI_Char16(None),
+               protocol.MI_Timestamp(), protocol.MI_String(None),
+               protocol.MI_Instance(None))
+
+
+class ProtocolTestCases(unittest2.TestCase):
+
+    def assertDatetime(self, value, fields):
+        if len(fields) == 8:
+            self.assertTrue(isinstance(value, protocol.MI_Timestamp))
+            self.assertEqual((value.year, value.month, value.day, value.hour,
+                              value.minute, value.second, value.microseconds,
+                              value.utc), fields)
+        else:
+            self.assertTrue(isinstance(value, protocol.MI_Interval))
+            self.assertEqual((value.days, value.hours, value.minutes,
+                              value.seconds, value.microseconds), fields)
+
+    def assertValues(self, decoded, expected):
+        """ decoded, from read_values, against the (name, MI value, plain
+            value) triples of expected."""
+        self.assertEqual(sorted(decoded.keys()), sorted([e[0] for e in expected]))
+        for name, value, plain in expected:
+            got = decoded[name]
+            self.assertEqual(got.type, value.type, name)
+            if isinstance(value, protocol.MI_Datetime):
+                self.assertDatetime(got, plain)
+            elif isinstance(value, protocol.MI_DatetimeA):
+                self.assertEqual(len(got.value), len(plain))
+                for element, fields in zip(got.value, plain):
+                    self.assertDatetime(element, fields)
+            else:
+                self.assertEqual(got, value, name)
+
+    def assertPlainValues(self, decoded, expected):
+        expected = dict([(e[0], e[2]) for e in expected])
+        self.assertEqual(decoded, expected)
+        for name, plain in expected.items():
+            self.assertEqual(type(decoded[name]), type(plain), name)
+
+    def testRoundTripAllTypes(self):
+        expected = all_values()
+        data = encode(dict([(e[0], e[1]) for e in expected]))
+        peer = Sink(data)
+        self.assertValues(protocol.read_values(peer), expected)
+        self.assertEqual(peer.pos, len(data))
+        peer = Sink(data)
+        self.assertPlainValues(protocol.read_plain_values(peer), expected)
+        self.assertEqual(peer.pos, len(data))
+
+    def testRoundTripOneBytePerRecv(self):
+        # the session is read through a SocketReader, which has to put the
+        # values back together however the peer splits them
+        expected = all_values()
+        data = encode(dict([(e[0], e[1]) for e in expected]))
+        reader = protocol.SocketReader(TricklePeer(data + data), 7)
+        self.assertValues(protocol.read_values(reader), expected)
+        self.assertPlainValues(protocol.read_plain_values(reader), expected)
+        self.assertEqual(reader.total, 2 * len(data))
+        self.assertEqual(reader.recv(1), b'')
+
+    def testSocketReaderOneBytePerRecv(self):
+        data = encode(dict([(e[0], e[1]) for e in all_values()]))
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            writer = threading.Thread(target=send_bytewise, args=(theirs, data))
+            writer.start()
+            reader = protocol.SocketReader(ours, 1)
+            self.assertPlainValues(protocol.read_plain_values(reader), all_values())
+            self.assertEqual(reader.recv(1), b'')
+            writer.join()
+        finally:
+            ours.close()
+
+    def testSocketReaderTruncatedFrame(self):
+        data = encode({'Name': protocol.MI_String('truncated')})
+        reader = protocol.SocketReader(TricklePeer(data[:-3]), 1)
+        self.assertRaises(socket.error, protocol.read_plain_values, reader)
+
+    def testNullValues(self):
+        # write_values leaves null values out
+        values = dict([(protocol.MI_TYPE_NAMES[v.type], v) for v in NULL_VALUES])
+        values['Present'] = protocol.MI_Uint8(1)
+        data = encode(values)
+        self.assertEqual(protocol.read_values(Sink(data)),
+                         {'Present': protocol.MI_Uint8(1)})
+        self.assertEqual(protocol.read_plain_values(Sink(data)), {'Present': 1})
+        # a null sent by the other side reads back as null
+        for value in NULL_VALUES:
+            out = Sink()
+            value.write(out)
+            data = out.getvalue()
+            self.assertEqual(data, struct.pack('@B', value.type | protocol.MI_NULL_FLAG))
+            got = protocol.MI_Value.read(Sink(data))
+            if got is not None:
+                self.assertTrue(got.is_null(), repr(value))
+            self.assertEqual(protocol.read_plain(Sink(data)), None)
+
+    def testEmptyArrays(self):
+        values = {}
+        for cls in EMPTY_ARRAYS:
+            values[cls.__name__] = cls([])
+        data = encode(values)
+        for cls in EMPTY_ARRAYS:
+            out = Sink()
+            values[cls.__name__].write(out)
+            self.assertEqual(out.getvalue(),
+                             struct.pack('@B', values[cls.__name__].type |
+                                         protocol.MI_NULL_FLAG))
+        decoded = protocol.read_values(Sink(data))
+        self.assertEqual(sorted(decoded.keys()), sorted(values.keys()))
+        for name, value in decoded.items():
+            self.assertEqual(value.type, values[name].type)
+            self.assertEqual(value.value, [])
+        plain = protocol.read_plain_values(Sink(data))
+        self.assertEqual(plain, dict([(name, []) for name in values]))
+
+    def testInstanceAFromGenerator(self):
+        produced = []
+
+        def instances(count):
+            for i in range(count):
+                produced.append(i)
+                yield {'Name': protocol.MI_String('file' + str(i)),
+                       'Size': protocol.MI_Uint64(i)}
+
+        value = protocol.MI_InstanceA(instances(1000))
+        self.assertFalse(value.is_null())
+        self.assertEqual(produced, [])
+        data = encode({'Inventory': value, 'Count': protocol.MI_Uint32(1000)})
+        self.assertEqual(len(produced), 1000)
+        # the same bytes as a list of the same instances
+        self.assertEqual(data, encode({'Inventory': protocol.MI_InstanceA(list(instances(1000))),
+                                       'Count': protocol.MI_Uint32(1000)}))
+        plain = protocol.read_plain_values(protocol.SocketReader(TricklePeer(data), 1))
+        self.assertEqual(plain['Count'], 1000)
+        self.assertEqual(plain['Inventory'][999], {'Name': 'file999', 'Size': 999})
+        decoded = protocol.read_values(Sink(data))
+        self.assertEqual(len(decoded['Inventory'].value), 1000)
+        self.assertEqual(decoded['Inventory'].value[0]['Name'],
+                         protocol.MI_String('file0'))
+
+    def testInstanceAFromEmptyGenerator(self):
+        value = protocol.MI_InstanceA(iter([]))
+        data = encode({'Inventory': value})
+        self.assertEqual(protocol.read_plain_values(Sink(data)), {'Inventory': []})
+        self.assertEqual(protocol.read_values(Sink(data))['Inventory'].value, [])
+
+    def testInstanceAGeneratorValue(self):
+        # reading .value turns the stream into a list
+        value = protocol.MI_InstanceA(iter([{'A': protocol.MI_Uint8(1)}]))
+        self.assertEqual(value.value, [{'A': protocol.MI_Uint8(1)}])
+        self.assertEqual(protocol.read_plain_values(Sink(encode({'I': value}))),
+                         {'I': [{'A': 1}]})
+
+
+if __name__ == '__main__':
+    unittest2.main()
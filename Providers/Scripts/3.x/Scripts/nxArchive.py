@@ -15,6 +15,7 @@ import tarfile
 import zipfile
 protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
+idcache = imp.load_source('idcache', '../idcache.py')
 LG = nxDSCLog.DSCLog
 try:
     import hashlib
@@ -37,6 +38,37 @@ cache_file_dir = '/var/opt/microsoft/dsc/cache/nxArchive/'
 # };
 
 
+class IdCacheTarFile(tarfile.TarFile):
+    """
+    A TarFile that, extracting as root, looks up the owner and group names
+    of its members through idcache rather than once per member.
+    """
+
+    def chown(self, tarinfo, targetpath, numeric_owner=False):
+        if not hasattr(os, 'geteuid') or os.geteuid() != 0:
+            return
+        g = tarinfo.gid
+        u = tarinfo.uid
+        if not numeric_owner:
+            try:
+                if tarinfo.gname:
+                    g = idcache.getgrnam(tarinfo.gname)[2]
+            except KeyError:
+                pass
+            try:
+                if tarinfo.uname:
+                    u = idcache.getpwnam(tarinfo.uname)[2]
+            except KeyError:
+                pass
+        try:
+            if tarinfo.issym() and hasattr(os, 'lchown'):
+                os.lchown(targetpath, u, g)
+            else:
+                os.chown(targetpath, u, g)
+        except OSError:
+            raise tarfile.ExtractError('could not change owner')
+
+
 def init_vars(DestinationPath, SourcePath, Ensure, Force, Checksum):
     if DestinationPath is None:
         DestinationPath = ''
@@ -337,7 +369,7 @@ def Set(DestinationPath, SourcePath, Ensure, Force, Checksum):
                     SourcePath + '> is not a valid tarfile')
         arch = None
         try:
-            arch = tarfile.open(SourcePath, 'r')
+            arch = IdCacheTarFile.open(SourcePath, 'r')
         except Exception as error:
             if arch is not None:
                 arch.close()
@@ -14,6 +14,9 @@ import imp
 protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 LG = nxDSCLog.DSCLog
+
+# Changing the time zone sets TZ in os.environ for the whole process.
+THREAD_SAFE = False
 try:
     import hashlib
     md5const = hashlib.md5
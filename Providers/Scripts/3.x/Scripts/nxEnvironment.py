@@ -13,6 +13,10 @@ protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 LG = nxDSCLog.DSCLog
 
+# Set_Marshall edits /etc/environment and
+# /etc/profile.d/DSCEnvironment.sh in place.
+THREAD_SAFE = False
+
 global show_mof
 show_mof = False
 
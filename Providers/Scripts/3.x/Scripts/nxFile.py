@@ -8,16 +8,28 @@ from contextlib import contextmanager
 
 import os
 import sys
-import pwd
+import errno
+import fcntl
+import stat
+import struct
 import shutil
-import grp
+import tempfile
 import codecs
-import urllib.request
+import io
+import json
 import time
+import threading
+import concurrent.futures
+import mmap
 import imp
 protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 helperlib = imp.load_source('helperlib', '../helperlib.py')
+filehash = imp.load_source('filehash', '../filehash.py')
+idcache = imp.load_source('idcache', '../idcache.py')
+nxFileDelta = imp.load_source('nxFileDelta', '../nxFileDelta.py')
+nxFileRemote = imp.load_source('nxFileRemote', '../nxFileRemote.py')
+nxFileDelta.nxFile = nxFileRemote.nxFile = sys.modules[__name__]
 
 LG = nxDSCLog.DSCLog
 try:
@@ -28,6 +40,78 @@ except ImportError:
     md5const = md5.md5
 
 BLOCK_SIZE = 8192
+COMPARE_BLOCK_SIZE = 1048576
+
+# Checksum values that compare contents: local files are compared byte
+# by byte whichever is given.
+CONTENT_CHECKSUMS = filehash.CHECKSUMS
+# Digests of local files, kept across runs in cache_file_dir +
+# hash_cache_name and used while a file keeps its device, inode, size,
+# mtime and ctime, and the digests in manifests, are of HASH_ALGORITHM.
+# nxFileHashAlgorithm in dsc.conf overrides it, xxh128 being several
+# times faster.  Either is only used for the resources whose Checksum it
+# is; the others compare contents byte by byte.
+HASH_ALGORITHM = 'md5'
+cache_file_dir = '/var/opt/microsoft/dsc/cache/nxFile/'
+hash_cache_name = 'digests.idx'
+HASH_CACHE_MAX_ENTRIES = 100000
+# A file whose ctime is this close to the time it was hashed may change
+# again without its timestamps changing (coarse timestamp granularity), so
+# such an entry is not trusted and the file is hashed again.
+HASH_CACHE_RACY_NS = 2 * 1000000000
+# last_used is only rewritten when older than this, so that a run where
+# every lookup hits does not rewrite the index
+HASH_CACHE_USED_RESOLUTION = 86400
+# time.time_ns is new in python 3.7
+time_ns = getattr(time, 'time_ns', None) or (lambda: int(time.time() * 1000000000))
+# http(s) SourcePaths are downloaded into a cache under cache_file_dir by
+# nxFileRemote.py.
+# Local files are compared byte by byte.  When True, the contents the two
+# files turn out to share are also fed to one md5, so that the cache can
+# answer the next comparison without reading either file.
+HASH_CACHE_LOCAL = True
+
+# CopyFile tries these in order for each extent of data in the source;
+# copy_file_range lets the file system share the blocks (reflink on btrfs
+# and xfs), sendfile copies in the kernel, readinto through one buffer of
+# COPY_BLOCK_SIZE.
+COPY_METHODS = ('copy_file_range', 'sendfile', 'readinto')
+COPY_BLOCK_SIZE = 1048576
+# errors meaning a copy method does not work for these files
+COPY_UNSUPPORTED = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP,
+                    errno.ENOTSUP, errno.EBADF)
+
+# Opt-in delta updates, rsync style: a destination of at least
+# nxFileDeltaMinSize bytes (dsc.conf; unset leaves it off) that differs
+# from its source is patched by nxFileDelta.py where its blocks differ,
+# rather than copied whole.
+DELTA_MIN_SIZE = None
+
+# A directory SourcePath may be published with a manifest beside it,
+# SourcePath + MANIFEST_SUFFIX, that nxFileManifest.py writes: the path,
+# lstat and md5 of each entry of the tree, sorted by path.  A recursive
+# directory Test then checks the destination against the manifest and
+# reads nothing of the source but its symlinks.  The manifest is trusted
+# as it is, so it is to be written again whenever the tree changes.
+MANIFEST_SUFFIX = '.nxmanifest'
+
+# nxFileWatcher.py journals the changes to the trees of recursive
+# directory resources with inotify, under cache_file_dir +
+# journal_cache_name.  After a Test has found a tree in order, the next
+# one checks only the paths changed since; the whole tree is checked when
+# no watcher is running, or it started its journal again (its inotify
+# queue overflowed, it was restarted, the journal grew too long).
+journal_cache_name = 'journal/'
+# seconds between the watcher's updates of its status; a status older
+# than three of them is taken for a watcher that is not running
+JOURNAL_HEARTBEAT = 5
+
+# Threads a recursive directory Set compares and copies files with.
+# nxFileSetThreads in dsc.conf overrides it; 1 keeps the serial walk.
+SET_THREADS = min(32, (getattr(os, 'cpu_count', lambda: None)() or 1) + 4)
+# Files queued per thread at most, so that the walk of a large tree does
+# not run far ahead of the copies.
+SET_QUEUE_PER_THREAD = 64
 
 global show_mof
 show_mof = False
@@ -69,14 +153,20 @@ def init_locals(DestinationPath, SourcePath, Ensure, Type, Force, Contents,
 def Set_Marshall(DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, Recurse, Links, Owner, Group, Mode):
     DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, Recurse, Links, Owner, Group, Mode \
                      = init_locals(DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, Recurse, Links, Owner, Group, Mode)
-    retval = Set(DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, Recurse, Links, Owner, Group, Mode)
+    try:
+        retval = Set(DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, Recurse, Links, Owner, Group, Mode)
+    finally:
+        SaveHashCache()
     return retval
 
 
 def Test_Marshall(DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, Recurse, Links, Owner, Group, Mode):
     DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, Recurse, Links, Owner, Group, Mode \
                      = init_locals(DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, Recurse, Links, Owner, Group, Mode)
-    retval = Test(DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, Recurse, Links, Owner, Group, Mode)
+    try:
+        retval = Test(DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, Recurse, Links, Owner, Group, Mode)
+    finally:
+        SaveHashCache()
     return retval
 
 
@@ -314,6 +404,79 @@ def ListDir(path):
     return d
 
 
+def ScanDir(path, fc):
+    """
+    List the directory like ListDir.  The DirEntry of each name is kept in
+    fc.stat_cache, so that its type, and its lstat, which the DirEntry
+    takes once, cost no further system calls.
+    """
+    if not hasattr(os, 'scandir'):
+        return ListDir(path)
+    d = []
+    try:
+        it = os.scandir(path)
+        try:
+            for entry in it:
+                d.append(entry.name)
+                fc.stat_cache[os.path.join(path, entry.name)] = entry
+        finally:
+            if hasattr(it, 'close'):
+                it.close()
+    except OSError as error:
+        print("Exception listing dir" + path  + " Error Code: " + str(error.errno) + " Error: " +error.strerror, file=sys.stderr)
+        LG().Log('ERROR', "Exception listing dir " + path + " Error Code: " + str(error.errno) + " Error: " + error.strerror)
+        return None
+    return d
+
+
+def CachedLStat(path, fc):
+    """
+    lstat of path, or None if it does not exist.  The result is kept in
+    fc.stat_cache for the rest of the Test or Set.
+    """
+    st = fc.stat_cache.get(path)
+    if st is None or hasattr(st, 'is_symlink'):
+        try:
+            if st is None:
+                st = os.lstat(path)
+            else:
+                st = st.stat(follow_symlinks=False)
+        except OSError:
+            return None
+        fc.stat_cache[path] = st
+    return st
+
+
+def PathKind(path, fc):
+    """
+    'link', 'file', 'directory' or 'other' for what is at path, without
+    following a symlink, or None if nothing is.
+    """
+    st = fc.stat_cache.get(path)
+    if st is not None and hasattr(st, 'is_symlink'):
+        # the type came with the directory listing
+        try:
+            if st.is_symlink():
+                return 'link'
+            if st.is_file(follow_symlinks=False):
+                return 'file'
+            if st.is_dir(follow_symlinks=False):
+                return 'directory'
+        except OSError:
+            return None
+        return 'other'
+    st = CachedLStat(path, fc)
+    if st is None:
+        return None
+    if stat.S_ISLNK(st.st_mode):
+        return 'link'
+    if stat.S_ISREG(st.st_mode):
+        return 'file'
+    if stat.S_ISDIR(st.st_mode):
+        return 'directory'
+    return 'other'
+
+
 def Symlink(spath, dpath):
     error = None
     if spath == dpath:  # Nothing to Link
@@ -375,64 +538,208 @@ def RemoveFile(path):
 
 
 def CopyFile(spath, dpath):
+    """
+    Copy spath to a temporary file beside dpath and rename it over dpath,
+    so that dpath is never seen half written.  Only the data extents of
+    spath are copied, so holes in a sparse file stay holes.  The copy
+    keeps the mode, owner and extended attributes of the dpath it
+    replaces, or takes the mode of spath.  When those cannot all be given
+    to the new file, dpath is written in place instead.
+    """
     error = None
     if spath == dpath:  # Nothing to copy!
         return error
+    tmp = None
     try:
-        shutil.copyfile(spath,dpath)
-    except OSError as error:
-        print("Exception copying tree " + spath  + ' to ' + dpath + " Error Code: " + str(error.errno) + " Error: " +error.strerror, file=sys.stderr)
-        LG().Log('ERROR', "Exception copying tree " + spath + ' to ' + dpath + " Error Code: " + str(error.errno) + " Error: " + error.strerror)
-        return error
-    except IOError as error:
+        src_fd = os.open(spath, os.O_RDONLY)
+        try:
+            src_stat = os.fstat(src_fd)
+            try:
+                mode = os.stat(dpath).st_mode
+            except OSError:
+                mode = src_stat.st_mode
+            dest_fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(dpath) + '.',
+                                            dir=os.path.dirname(dpath) or '.')
+            try:
+                kept = KeepAttributes(dpath, dest_fd)
+                if kept:
+                    os.fchmod(dest_fd, stat.S_IMODE(mode))
+                    CopyExtents(src_fd, dest_fd, src_stat.st_size)
+            finally:
+                os.close(dest_fd)
+            if not kept:
+                os.unlink(tmp)
+                tmp = None
+                dest_fd = os.open(dpath, os.O_WRONLY | os.O_TRUNC)
+                try:
+                    CopyExtents(src_fd, dest_fd, src_stat.st_size)
+                finally:
+                    os.close(dest_fd)
+        finally:
+            os.close(src_fd)
+        if tmp is not None:
+            os.rename(tmp, dpath)
+    except (OSError, IOError) as error:
+        if tmp is not None and os.path.exists(tmp):
+            RemoveFile(tmp)
         print("Exception copying tree " + spath  + ' to ' + dpath + " Error Code: " + str(error.errno) + " Error: " +error.strerror, file=sys.stderr)
         LG().Log('ERROR', "Exception copying tree " + spath + ' to ' + dpath + " Error Code: " + str(error.errno) + " Error: " + error.strerror)
         return error
-    return error
+    return None
+
+
+def KeepAttributes(path, fd):
+    """
+    Give fd, a new file that is to be renamed over path, the owner, group
+    and extended attributes of path, which carry its ACLs and SELinux
+    label.  Returns False when any of them could not be set, or cannot
+    be listed, and path should be written in place instead.
+    """
+    try:
+        path_stat = os.stat(path)
+    except OSError:
+        # nothing to keep
+        return True
+    if not hasattr(os, 'listxattr'):
+        return False
+    try:
+        fd_stat = os.fstat(fd)
+        if (fd_stat.st_uid, fd_stat.st_gid) != (path_stat.st_uid, path_stat.st_gid):
+            os.fchown(fd, path_stat.st_uid, path_stat.st_gid)
+        try:
+            names = os.listxattr(path)
+        except OSError as error:
+            if error.errno not in (errno.ENOTSUP, errno.EOPNOTSUPP):
+                raise
+            names = []
+        for name in names:
+            os.setxattr(fd, name, os.getxattr(path, name))
+    except OSError as error:
+        LG().Log('INFO', "Unable to give a new copy the attributes of " + path + ", writing it in place.  Error: " + error.strerror)
+        return False
+    return True
 
 
-def CompareFiles(DestinationPath, SourcePath, Checksum):
+def DataExtents(fd, size):
+    """
+    The (offset, length) of the data in fd, skipping holes.  Where the
+    file system cannot tell, the whole file is data.
+    """
+    if not hasattr(os, 'SEEK_DATA'):
+        return [(0, size)]
+    extents = []
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as error:
+            if error.errno == errno.ENXIO:
+                # only a hole is left
+                break
+            if error.errno in COPY_UNSUPPORTED:
+                return [(0, size)]
+            raise
+        end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+        if start < end:
+            extents.append((start, end - start))
+        offset = end
+    return extents
+
+
+def CopyExtents(src_fd, dest_fd, size):
+    """
+    Copy the data extents of src_fd to the same offsets of dest_fd, by
+    the first of COPY_METHODS that works, and give dest_fd the size of
+    src_fd, which leaves the holes between.
+    """
+    methods = CopyMethods()
+    for offset, length in DataExtents(src_fd, size):
+        CopyRange(src_fd, dest_fd, offset, offset, length, methods)
+    os.ftruncate(dest_fd, size)
+
+
+def CopyMethods():
+    return [m for m in COPY_METHODS if m == 'readinto' or hasattr(os, m)]
+
+
+def CopyRange(src_fd, dest_fd, src_offset, dest_offset, length, methods):
+    """
+    Copy length bytes at src_offset in src_fd to dest_offset in dest_fd by
+    the first of methods, a list from CopyMethods, that works.  Methods
+    that do not work for these files are taken off the list.
+    """
+    end = src_offset + length
+    buf = None
+    while src_offset < end:
+        method = methods[0]
+        try:
+            if method == 'copy_file_range':
+                n = os.copy_file_range(src_fd, dest_fd, end - src_offset, src_offset, dest_offset)
+            elif method == 'sendfile':
+                os.lseek(dest_fd, dest_offset, os.SEEK_SET)
+                n = os.sendfile(dest_fd, src_fd, src_offset, end - src_offset)
+            else:
+                if buf is None:
+                    buf = memoryview(bytearray(min(COPY_BLOCK_SIZE, length)))
+                    src_file = io.FileIO(src_fd, 'rb', closefd=False)
+                src_file.seek(src_offset)
+                n = src_file.readinto(buf[:end - src_offset])
+                os.lseek(dest_fd, dest_offset, os.SEEK_SET)
+                written = 0
+                while written < n:
+                    written += os.write(dest_fd, buf[written:n])
+        except OSError as error:
+            if method != 'readinto' and error.errno in COPY_UNSUPPORTED:
+                methods.pop(0)
+                continue
+            raise
+        if n == 0:
+            # the source is shorter than it was
+            break
+        src_offset += n
+        dest_offset += n
+
+
+def CompareFiles(DestinationPath, SourcePath, Checksum, stat_dest=None, stat_src=None):
     """
     If the files differ in size, return -1.
-    Reading and computing the hash here is done in a block-by-block manner,
-    in case the file is quite large.
+    With a Checksum of CONTENT_CHECKSUMS, the digests are taken from the
+    hash cache when it has both files; otherwise the contents are
+    compared directly.
+    stat_dest and stat_src, when the caller has them, are the stats of
+    the files (following symlinks).
     """
     if SourcePath == DestinationPath:  # Files are the same!
         return 0
-    stat_dest = StatFile(DestinationPath)
-    stat_src = StatFile(SourcePath)
+    if stat_dest is None:
+        stat_dest = StatFile(DestinationPath)
+    if stat_src is None:
+        stat_src = StatFile(SourcePath)
     if stat_src.st_size != stat_dest.st_size:
         return -1
-    if Checksum == "md5":
-        src_error = None
-        dest_error = None
-        src_hash = md5const()
-        dest_hash = md5const()
-        src_block = b'loopme'
-        dest_block = b'loopme'
-        with opened_bin_w_error(SourcePath, 'rb') as (src_file, src_error):
-            if src_error:
-                print("Exception opening source file " + SourcePath  + " Error Code: " + str(src_error.errno) +
-                      " Error: " + src_error.strerror, file=sys.stderr)
-                LG().Log('ERROR', "Exception opening source file " + SourcePath + " Error Code: " + str(src_error.errno) +
-                        " Error: " + src_error.strerror)
+    if Checksum in CONTENT_CHECKSUMS:
+        cache = GetHashCache()
+        if cache.algorithm != Checksum:
+            # the cache's digests do not stand for Checksum
+            return CompareFileContents(SourcePath, DestinationPath, None, stat_src.st_size)
+        src_digest = cache.lookup(stat_src)
+        dest_digest = cache.lookup(stat_dest)
+        if src_digest is not None and dest_digest is not None:
+            if src_digest != dest_digest:
                 return -1
-            with opened_bin_w_error(DestinationPath, 'rb') as (dest_file, dest_error):
-                if dest_error:
-                    print("Exception opening destination file " + DestinationPath + " Error Code: " + str(dest_error.errno) +
-                          " Error: " + dest_error.strerror, file=sys.stderr)
-                    LG().Log('ERROR', "Exception opening destination file " + DestinationPath + " Error Code: " + str(dest_error.errno) +
-                          " Error: " + dest_error.strerror)
-                    return -1
-                while src_block or dest_block :
-                    src_block = src_file.read(BLOCK_SIZE)
-                    dest_block = dest_file.read(BLOCK_SIZE)
-                    src_hash.update(src_block)
-                    dest_hash.update(dest_block)
-                    if src_hash.hexdigest() != dest_hash.hexdigest():
-                        return -1
-        if src_hash.hexdigest() == dest_hash.hexdigest():
             return 0
+        file_hash = None
+        if HASH_CACHE_LOCAL:
+            hashed_ns = time_ns()
+            file_hash = filehash.new(cache.algorithm)
+        if CompareFileContents(SourcePath, DestinationPath, file_hash, stat_src.st_size) == -1:
+            return -1
+        if file_hash is not None:
+            # the files are the same, so is their digest
+            cache.bytes_hashed += stat_src.st_size
+            cache.store(stat_src, hashed_ns, file_hash.digest())
+            cache.store(stat_dest, hashed_ns, file_hash.digest())
+        return 0
     elif Checksum == "ctime":
         if stat_src.st_ctime != stat_dest.st_ctime:
             return -1
@@ -445,6 +752,642 @@ def CompareFiles(DestinationPath, SourcePath, Checksum):
             return 0
 
 
+class HashCache:
+    """
+    Digests of files by (st_dev, st_ino), of algorithm.  An entry is used while the
+    file keeps the st_size, st_mtime_ns and st_ctime_ns it had when it was
+    hashed.  The index is a header and fixed size records; save() merges
+    what this process hashed into it under an flock, as other nxFile
+    processes share it, and evicts the least recently used entries beyond
+    max_entries.
+    """
+    # magic, count, algorithm
+    HEADER = struct.Struct('<8sI16s')
+    # dev, ino, size, mtime_ns, ctime_ns, hashed_ns, last_used, digest
+    RECORD = struct.Struct('<QQQqqqI16s')
+    MAGIC = b'nxFhsh\x00\x01'
+
+    def __init__(self, path, max_entries, algorithm):
+        self.path = path
+        self.max_entries = max_entries
+        self.algorithm = algorithm
+        self.entries = None
+        self.updated = {}
+        # a recursive Set looks files up from several threads
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_hashed = 0
+
+    def read_index(self):
+        entries = {}
+        try:
+            with open(self.path, 'rb') as F:
+                data = F.read()
+        except (IOError, OSError):
+            return entries
+        if len(data) < self.HEADER.size:
+            return entries
+        magic, count, algorithm = self.HEADER.unpack_from(data)
+        if magic != self.MAGIC or \
+                len(data) != self.HEADER.size + count * self.RECORD.size:
+            LG().Log('WARNING', "Discarding damaged hash cache " + self.path)
+            return entries
+        algorithm = algorithm.rstrip(b'\0').decode('ascii', 'replace')
+        if algorithm != self.algorithm:
+            LG().Log('INFO', "Discarding hash cache " + self.path + " of " + algorithm + " digests for " + self.algorithm)
+            return entries
+        for rec in self.RECORD.iter_unpack(data[self.HEADER.size:]):
+            entries[(rec[0], rec[1])] = rec[2:]
+        return entries
+
+    def lookup(self, st):
+        """
+        Cached digest (Digest16) of the file whose stat is st, or None.
+        """
+        with self.lock:
+            digest = self.find(st)
+            if digest is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return digest
+
+    def find(self, st):
+        if self.entries is None:
+            self.entries = self.read_index()
+        key = (st.st_dev, st.st_ino)
+        entry = self.updated.get(key)
+        if entry is None:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        size, mtime_ns, ctime_ns, hashed_ns, last_used, digest = entry
+        if size != st.st_size or mtime_ns != st.st_mtime_ns or \
+                ctime_ns != st.st_ctime_ns or \
+                hashed_ns - HASH_CACHE_RACY_NS <= ctime_ns:
+            return None
+        now = int(time.time())
+        if HASH_CACHE_USED_RESOLUTION <= now - last_used:
+            self.updated[key] = entry[:4] + (now, digest)
+        return digest
+
+    def store(self, st, hashed_ns, digest):
+        """
+        Remember digest for the file whose stat is st, hashed from
+        hashed_ns on.
+        """
+        with self.lock:
+            self.updated[(st.st_dev, st.st_ino)] = (st.st_size, st.st_mtime_ns,
+                st.st_ctime_ns, hashed_ns, int(time.time()), Digest16(digest))
+
+    def save(self):
+        """
+        Writes the entries hashed or used since the last save, logs the
+        hit metrics of that period and starts them again from zero.
+        """
+        if len(self.updated):
+            self.write_index()
+        if self.hits or self.misses:
+            LG().Log('INFO', "nxFile hash cache: " + str(self.hits) + " hits, " + str(self.misses) + " misses, " +
+                     str(self.bytes_hashed) + " bytes hashed, " + str(self.evictions) + " evicted")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_hashed = 0
+
+    def write_index(self):
+        if not os.path.isdir(cache_file_dir):
+            if MakeDirs(cache_file_dir) is not None:
+                return
+        try:
+            with open(self.path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                entries = self.read_index()
+                entries.update(self.updated)
+                if self.max_entries < len(entries):
+                    by_use = sorted(entries.keys(), key=lambda k: entries[k][4])
+                    for key in by_use[:len(entries) - self.max_entries]:
+                        del entries[key]
+                        self.evictions += 1
+                tmp = self.path + '.' + str(os.getpid())
+                with open(tmp, 'wb') as F:
+                    F.write(self.HEADER.pack(self.MAGIC, len(entries), self.algorithm.encode('ascii')))
+                    F.write(b''.join([self.RECORD.pack(*(key + entry))
+                                      for key, entry in entries.items()]))
+                os.rename(tmp, self.path)
+        except (IOError, OSError) as error:
+            print("Exception writing hash cache " + self.path + " Error: " + str(error), file=sys.stderr)
+            LG().Log('ERROR', "Exception writing hash cache " + self.path + " Error: " + str(error))
+            return
+        self.entries = entries
+        self.updated = {}
+
+
+hash_cache = None
+hash_cache_lock = threading.Lock()
+
+
+def GetHashCache():
+    global hash_cache
+    if hash_cache is None:
+        with hash_cache_lock:
+            if hash_cache is None:
+                hash_cache = HashCache(cache_file_dir + hash_cache_name, HASH_CACHE_MAX_ENTRIES, HashAlgorithm())
+    return hash_cache
+
+
+hash_algorithm = None
+
+
+def HashAlgorithm():
+    """
+    HASH_ALGORITHM, or nxFileHashAlgorithm in dsc.conf if this python has
+    that algorithm.
+    """
+    global hash_algorithm
+    if hash_algorithm is None:
+        algorithm = ReadConf('nxFileHashAlgorithm')
+        if algorithm is not None and algorithm not in filehash.ALGORITHMS:
+            LG().Log('WARNING', "Ignoring nxFileHashAlgorithm=" + algorithm + ", this python has " +
+                     ", ".join(filehash.available()))
+            algorithm = None
+        hash_algorithm = algorithm or HASH_ALGORITHM
+    return hash_algorithm
+
+
+def Digest16(digest):
+    """
+    digest as the hash cache and manifests keep it: its first 16 bytes,
+    padded with NULs if shorter.
+    """
+    return digest[:16].ljust(16, b'\0')
+
+
+def SaveHashCache():
+    if hash_cache is not None:
+        hash_cache.save()
+
+
+def HashFile(path, algorithm):
+    """
+    Digest of algorithm of the file at path, or None if it cannot be read.
+    """
+    try:
+        return filehash.hash_file(path, algorithm).digest()
+    except (IOError, OSError) as error:
+        print("Exception reading file " + path + " Error Code: " + str(error.errno) +
+              " Error: " + error.strerror, file=sys.stderr)
+        LG().Log('ERROR', "Exception reading file " + path + " Error Code: " + str(error.errno) +
+                 " Error: " + error.strerror)
+        return None
+
+
+def FileDigest(path, st, algorithm):
+    """
+    Digest16 of algorithm of the file at path, whose stat is st; from the
+    hash cache, or read and then kept in it, if the cache is of algorithm.
+    """
+    cache = GetHashCache()
+    if algorithm != cache.algorithm:
+        digest = HashFile(path, algorithm)
+        return digest is not None and Digest16(digest) or None
+    digest = cache.lookup(st)
+    if digest is None:
+        hashed_ns = time_ns()
+        digest = HashFile(path, algorithm)
+        if digest is not None:
+            cache.bytes_hashed += st.st_size
+            cache.store(st, hashed_ns, digest)
+            digest = Digest16(digest)
+    return digest
+
+
+class ManifestStat:
+    """
+    The lstat of a source entry as the manifest has it, with its digest
+    for a file and its target for a symlink.  It stands in for the lstat of
+    the source path in FileContext.stat_cache.
+    """
+    __slots__ = ('st_mode', 'st_uid', 'st_gid', 'st_size', 'st_mtime_ns',
+                 'st_ctime_ns', 'st_mtime', 'st_ctime', 'digest', 'target')
+
+    def __init__(self, mode, uid, gid, size, mtime_ns, ctime_ns, digest, target):
+        self.st_mode = mode
+        self.st_uid = uid
+        self.st_gid = gid
+        self.st_size = size
+        self.st_mtime_ns = mtime_ns
+        self.st_ctime_ns = ctime_ns
+        # as os.stat makes its float times
+        sec, nsec = divmod(mtime_ns, 1000000000)
+        self.st_mtime = sec + nsec * 1e-9
+        sec, nsec = divmod(ctime_ns, 1000000000)
+        self.st_ctime = sec + nsec * 1e-9
+        self.digest = digest
+        self.target = target
+
+
+class Manifest:
+    """
+    A source tree manifest, memory mapped: a header naming the algorithm
+    of its digests, one fixed size record per entry sorted by path, then the paths, each followed by the target
+    of a symlink.  Paths are relative to the root of the tree, whose own
+    entry has the empty path.  Opening costs the same for any number of
+    entries; find() is a binary search over the records.
+    """
+    # magic, count, algorithm
+    HEADER = struct.Struct('<8sI16s')
+    # path offset, path length, mode, uid, gid, size, mtime_ns, ctime_ns,
+    # Digest16
+    RECORD = struct.Struct('<QIIIIQqq16s')
+    MAGIC = b'nxFmnf\x00\x02'
+
+    def __init__(self, path):
+        """
+        Raises OSError if the manifest cannot be read and ValueError if it
+        is damaged.
+        """
+        self.path = path
+        with open(path, 'rb') as F:
+            self.st = os.fstat(F.fileno())
+            self.map = mmap.mmap(F.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < self.HEADER.size:
+            self.close()
+            raise ValueError('short manifest')
+        magic, self.count, algorithm = self.HEADER.unpack_from(self.map)
+        self.names = self.HEADER.size + self.count * self.RECORD.size
+        if magic != self.MAGIC or len(self.map) < self.names:
+            self.close()
+            raise ValueError('damaged manifest')
+        self.algorithm = algorithm.rstrip(b'\0').decode('ascii', 'replace')
+        if self.algorithm not in filehash.ALGORITHMS:
+            self.close()
+            raise ValueError('digests of ' + self.algorithm + ', which this python does not have')
+
+    def close(self):
+        self.map.close()
+
+    def __len__(self):
+        return self.count
+
+    def name(self, i):
+        offset, length = struct.unpack_from('<QI', self.map, self.HEADER.size + i * self.RECORD.size)
+        offset += self.names
+        return self.map[offset:offset + length]
+
+    def entry(self, i):
+        """
+        The path (bytes) and ManifestStat of the i-th entry.
+        """
+        offset, length, mode, uid, gid, size, mtime_ns, ctime_ns, digest = \
+            self.RECORD.unpack_from(self.map, self.HEADER.size + i * self.RECORD.size)
+        offset += self.names
+        name = self.map[offset:offset + length]
+        target = None
+        if stat.S_ISLNK(mode):
+            # the size of a symlink is the length of its target
+            target = self.map[offset + length:offset + length + size]
+        return name, ManifestStat(mode, uid, gid, size, mtime_ns, ctime_ns, digest, target)
+
+    def index(self, name):
+        """
+        Index of the first entry whose path is not less than name (bytes).
+        """
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, name):
+        """
+        ManifestStat of the entry with path name (bytes), or None.
+        """
+        i = self.index(name)
+        if i < self.count and self.name(i) == name:
+            return self.entry(i)[1]
+        return None
+
+    def subtree(self, name):
+        """
+        The entries of path name and of the paths under it, as __iter__.
+        """
+        under = name + b'/'
+        for i in range(self.index(name), self.count):
+            entry_name = self.name(i)
+            if entry_name == name or entry_name.startswith(under):
+                yield self.entry(i)
+            elif not entry_name.startswith(name):
+                # name-1 and the like sort between name and name/
+                return
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.entry(i)
+
+
+def OpenManifest(SourcePath, Checksum):
+    """
+    The Manifest published beside the directory SourcePath, or None if
+    there is none or it cannot be used: it is damaged, or its digests are
+    not of Checksum when that compares contents.
+    """
+    path = SourcePath.rstrip('/') + MANIFEST_SUFFIX
+    try:
+        manifest = Manifest(path)
+    except (IOError, OSError) as error:
+        if error.errno != errno.ENOENT:
+            LG().Log('WARNING', "Cannot read manifest " + path + " Error: " + str(error))
+        return None
+    except ValueError as error:
+        LG().Log('WARNING', "Not using damaged manifest " + path + " Error: " + str(error))
+        return None
+    if manifest.find(b'') is None:
+        LG().Log('WARNING', "Not using manifest " + path + " without an entry for its root")
+        manifest.close()
+        return None
+    if Checksum in CONTENT_CHECKSUMS and manifest.algorithm != Checksum:
+        LG().Log('INFO', "Not using manifest " + path + " of " + manifest.algorithm + " digests for Checksum " + Checksum)
+        manifest.close()
+        return None
+    return manifest
+
+
+def WriteManifest(SourcePath, ManifestPath=None, algorithm=None):
+    """
+    Writes the manifest of the tree at SourcePath, by default beside it,
+    with digests of algorithm, by default HashAlgorithm(), and returns its
+    number of entries.  Symlinks are recorded, not followed.  Raises
+    OSError or IOError on a failure.
+    """
+    root = SourcePath.rstrip('/')
+    if ManifestPath is None:
+        ManifestPath = root + MANIFEST_SUFFIX
+    if algorithm is None:
+        algorithm = HashAlgorithm()
+    entries = []
+    pending = [(b'', root)]
+    while pending:
+        name, path = pending.pop()
+        st = os.lstat(path)
+        size = st.st_size
+        digest = b''
+        target = b''
+        if stat.S_ISDIR(st.st_mode):
+            for entry_name in os.listdir(path):
+                if name:
+                    pending.append((name + b'/' + os.fsencode(entry_name), os.path.join(path, entry_name)))
+                else:
+                    pending.append((os.fsencode(entry_name), os.path.join(path, entry_name)))
+        elif stat.S_ISREG(st.st_mode):
+            digest = HashFile(path, algorithm)
+            if digest is None:
+                raise IOError(errno.EIO, 'Cannot read ' + path)
+            digest = Digest16(digest)
+        elif stat.S_ISLNK(st.st_mode):
+            target = os.fsencode(os.readlink(path))
+            size = len(target)
+        entries.append((name, target, size, st, digest))
+    entries.sort(key=lambda e: e[0])
+    records = []
+    names = []
+    offset = 0
+    for name, target, size, st, digest in entries:
+        records.append(Manifest.RECORD.pack(offset, len(name), st.st_mode, st.st_uid, st.st_gid, size,
+                                            st.st_mtime_ns, st.st_ctime_ns, digest))
+        names.append(name + target)
+        offset += len(name) + len(target)
+    tmp = ManifestPath + '.' + str(os.getpid())
+    with open(tmp, 'wb') as F:
+        F.write(Manifest.HEADER.pack(Manifest.MAGIC, len(records), algorithm.encode('ascii')))
+        F.write(b''.join(records))
+        F.write(b''.join(names))
+    os.rename(tmp, ManifestPath)
+    return len(entries)
+
+
+def JournalPath(root):
+    return cache_file_dir + journal_cache_name + md5const(root.encode('utf-8')).hexdigest() + '.log'
+
+
+def WatcherRunning():
+    """
+    True if nxFileWatcher.py has written its status lately.
+    """
+    try:
+        with open(cache_file_dir + journal_cache_name + 'watcher.json') as F:
+            status = json.load(F)
+        if JOURNAL_HEARTBEAT * 3 < time.time() - status['heartbeat']:
+            return False
+        os.kill(status['pid'], 0)
+    except (IOError, OSError) as error:
+        return error.errno == errno.EPERM
+    except (ValueError, KeyError, TypeError):
+        return False
+    return True
+
+
+class ChangeJournal:
+    """
+    The journal nxFileWatcher.py keeps of the tree at root: a header
+    naming its generation, then the paths, relative to root, of the
+    entries changed since, each followed by a NUL.  Each time the watcher
+    can no longer vouch for the journal it starts a new one, of a new
+    generation.
+    """
+    HEADER = struct.Struct('<8s16s')
+    MAGIC = b'nxFjnl\x00\x01'
+
+    def __init__(self, root):
+        """
+        Raises OSError if the tree is not watched and ValueError if the
+        journal is damaged.
+        """
+        self.root = root
+        self.path = JournalPath(root)
+        self.file = open(self.path, 'rb')
+        header = self.file.read(self.HEADER.size)
+        if len(header) != self.HEADER.size or header[:8] != self.MAGIC:
+            self.file.close()
+            raise ValueError('damaged journal')
+        self.generation = self.HEADER.unpack(header)[1].decode('ascii')
+
+    def close(self):
+        self.file.close()
+
+    def changes(self, offset=None):
+        """
+        The paths journaled from offset on, and the offset after the last
+        of them.  Without an offset, no paths are returned.
+        """
+        start = offset
+        if start is None:
+            start = self.HEADER.size
+        self.file.seek(start)
+        data = self.file.read()
+        # a batch the watcher is still writing is left to the next Test
+        end = data.rfind(b'\0') + 1
+        paths = set()
+        if offset is not None:
+            for name in data[:end].split(b'\0')[:-1]:
+                paths.add(os.fsdecode(name))
+        return paths, start + end
+
+
+def RegisterJournalRoot(root):
+    """
+    Lists root for the watcher to journal from its next status update on.
+    """
+    path = cache_file_dir + journal_cache_name + 'roots'
+    try:
+        with open(path, 'a+') as F:
+            fcntl.flock(F.fileno(), fcntl.LOCK_EX)
+            F.seek(0)
+            if root not in F.read().splitlines():
+                F.write(root + '\n')
+    except (IOError, OSError) as error:
+        LG().Log('WARNING', "Cannot list " + root + " in " + path + " Error: " + str(error))
+
+
+def OpenJournals(DestinationPath, SourcePath, manifest):
+    """
+    The ChangeJournals of the destination and of the source (unless it has
+    a manifest), or None if one of them is not kept.
+    """
+    if not WatcherRunning():
+        return None
+    roots = [DestinationPath]
+    if SourcePath and manifest is None:
+        roots.append(SourcePath)
+    journals = []
+    for root in roots:
+        root = os.path.normpath(os.path.abspath(root))
+        try:
+            journals.append(ChangeJournal(root))
+        except (IOError, OSError) as error:
+            if error.errno == errno.ENOENT:
+                RegisterJournalRoot(root)
+            break
+        except ValueError:
+            break
+    if len(journals) != len(roots):
+        for journal in journals:
+            journal.close()
+        return None
+    return journals
+
+
+def CleanMarkPath(DestinationPath, SourcePath, fc):
+    key = json.dumps([DestinationPath, SourcePath, fc.Checksum, fc.Links, fc.Owner, fc.Group, fc.Mode])
+    return cache_file_dir + journal_cache_name + md5const(key.encode('utf-8')).hexdigest() + '.clean'
+
+
+def JournalChanges(journals, mark_path, manifest):
+    """
+    The paths changed in the journaled trees since the Test that wrote
+    the mark at mark_path found them in order, or None if they are not
+    known; and the mark for this Test to write if it finds them in order.
+    """
+    mark = None
+    try:
+        with open(mark_path) as F:
+            mark = json.load(F)
+    except (IOError, OSError, ValueError):
+        pass
+    identity = None
+    if manifest is not None:
+        identity = [manifest.st.st_ino, manifest.st.st_size, manifest.st.st_mtime_ns]
+    valid = isinstance(mark, dict) and mark.get('manifest') == identity and \
+        len(mark.get('journals', [])) == len(journals)
+    changed = set()
+    new_mark = {'manifest': identity, 'journals': []}
+    for i in range(len(journals)):
+        journal = journals[i]
+        offset = None
+        if valid and mark['journals'][i][:2] == [journal.root, journal.generation]:
+            offset = mark['journals'][i][2]
+        else:
+            valid = False
+        paths, end = journal.changes(offset)
+        changed.update(paths)
+        new_mark['journals'].append([journal.root, journal.generation, end])
+    if not valid:
+        return None, new_mark
+    return changed, new_mark
+
+
+def WriteCleanMark(mark_path, mark):
+    tmp = mark_path + '.' + str(os.getpid())
+    try:
+        with open(tmp, 'w') as F:
+            json.dump(mark, F)
+        os.rename(tmp, mark_path)
+    except (IOError, OSError) as error:
+        LG().Log('WARNING', "Cannot write " + mark_path + " Error: " + str(error))
+
+
+def RemoveCleanMark(mark_path):
+    try:
+        os.remove(mark_path)
+    except OSError:
+        pass
+
+
+def CompareFileContents(SourcePath, DestinationPath, file_hash=None, size=None):
+    """
+    Compare the files byte by byte, reading both into two buffers that
+    are reused for the whole file, and stop at the first difference.
+    The contents are fed to file_hash, if given, while they are the same.
+    size, the size of the source when known, keeps the buffers of small
+    files small.
+    Return 0 if the files are the same, -1 if they differ or cannot be read.
+    """
+    block_size = COMPARE_BLOCK_SIZE
+    if size is not None and size < block_size:
+        # one block and the end of file
+        block_size = size + 1
+    src_buf = bytearray(block_size)
+    dest_buf = bytearray(block_size)
+    with opened_bin_w_error(SourcePath, 'rb') as (src_file, src_error):
+        if src_error:
+            print("Exception opening source file " + SourcePath  + " Error Code: " + str(src_error.errno) +
+                  " Error: " + src_error.strerror, file=sys.stderr)
+            LG().Log('ERROR', "Exception opening source file " + SourcePath + " Error Code: " + str(src_error.errno) +
+                    " Error: " + src_error.strerror)
+            return -1
+        with opened_bin_w_error(DestinationPath, 'rb') as (dest_file, dest_error):
+            if dest_error:
+                print("Exception opening destination file " + DestinationPath + " Error Code: " + str(dest_error.errno) +
+                      " Error: " + dest_error.strerror, file=sys.stderr)
+                LG().Log('ERROR', "Exception opening destination file " + DestinationPath + " Error Code: " + str(dest_error.errno) +
+                      " Error: " + dest_error.strerror)
+                return -1
+            while True:
+                src_len = src_file.readinto(src_buf)
+                dest_len = dest_file.readinto(dest_buf)
+                if src_len != dest_len:
+                    return -1
+                if src_len == 0:
+                    return 0
+                if src_len < block_size:
+                    # last block: bytearray comparison is a memcmp, a
+                    # memoryview one is not
+                    if src_buf[:src_len] != dest_buf[:dest_len]:
+                        return -1
+                    if file_hash is not None:
+                        file_hash.update(memoryview(src_buf)[:src_len])
+                elif src_buf != dest_buf:
+                    return -1
+                elif file_hash is not None:
+                    file_hash.update(src_buf)
+
+
 def RemoveTree(path):
     error = None
     try:
@@ -477,40 +1420,47 @@ def RemovePath(path):
 
 
 def TestOwnerGroupMode(DestinationPath, SourcePath, fc):
-    stat_info = LStatFile(DestinationPath)
+    stat_info = CachedLStat(DestinationPath, fc)
+    if stat_info is None:
+        # logs the error
+        LStatFile(DestinationPath)
+        return False
 
     if SourcePath:
-        stat_info_src = LStatFile(SourcePath)
+        stat_info_src = CachedLStat(SourcePath, fc)
+        if stat_info_src is None:
+            LStatFile(SourcePath)
+            return False
 
     if fc.Owner:
         try:
-            Specified_Owner_ID = pwd.getpwnam(fc.Owner)[2]
+            Specified_Owner_ID = idcache.getpwnam(fc.Owner)[2]
         except KeyError as error:
             print("Exception obtaining gid from group name " + fc.Group  + " Error: " + repr(error), file=sys.stderr)
             LG().Log('ERROR', "Exception obtaining gid from group name " + fc.Group + " Error: " + repr(error))
             return False
-        if Specified_Owner_ID != pwd.getpwuid(stat_info.st_uid)[2]:
+        if Specified_Owner_ID != idcache.getpwuid(stat_info.st_uid)[2]:
             return False
     elif SourcePath:
         # Owner wasn't specified, if SourcePath is specified then check that the Owners match
-        if pwd.getpwuid(stat_info.st_uid)[2] != pwd.getpwuid(stat_info_src.st_uid)[2]:
+        if idcache.getpwuid(stat_info.st_uid)[2] != idcache.getpwuid(stat_info_src.st_uid)[2]:
             return False
 
     if fc.Group:
         try:
-            Specified_Group_ID = grp.getgrnam(fc.Group)[2]
+            Specified_Group_ID = idcache.getgrnam(fc.Group)[2]
         except KeyError as error:
             print("Exception obtaining gid from group name " + fc.Group  + " Error: " +  repr(error), file=sys.stderr)
             LG().Log('ERROR', "Exception obtaining gid from group name " + fc.Group + " Error: " + repr(error))
             return False
-        if Specified_Group_ID != grp.getgrgid(stat_info.st_gid)[2]:
+        if Specified_Group_ID != idcache.getgrgid(stat_info.st_gid)[2]:
             return False
     elif SourcePath:
         # Group wasn't specified, if SourcePath is specified then check that the Groups match
-        if grp.getgrgid(stat_info.st_gid)[2] != grp.getgrgid(stat_info_src.st_gid)[2]:
+        if idcache.getgrgid(stat_info.st_gid)[2] != idcache.getgrgid(stat_info_src.st_gid)[2]:
             return False
     # Mode is irrelevant to symlinks
-    if not os.path.islink(DestinationPath):
+    if not stat.S_ISLNK(stat_info.st_mode):
         if fc.Mode:
             if str(oct(stat_info.st_mode))[-3:] != fc.Mode:
                 return False
@@ -606,44 +1556,45 @@ def SetOwnerGroupMode(DestinationPath, SourcePath, fc):
         return False
 
     if SourcePath:
-        stat_info_src = LStatFile(SourcePath)
+        stat_info_src = CachedLStat(SourcePath, fc)
         if stat_info_src is None:
+            LStatFile(SourcePath)
             return False
 
     if fc.Owner:
-        Specified_Owner_ID = pwd.getpwnam(fc.Owner)[2]
-        if Specified_Owner_ID != pwd.getpwuid(stat_info.st_uid)[2]:
+        Specified_Owner_ID = idcache.getpwnam(fc.Owner)[2]
+        if Specified_Owner_ID != idcache.getpwuid(stat_info.st_uid)[2]:
             print("Changing owner of " + DestinationPath + " to " + str(Specified_Owner_ID))
             LG().Log('INFO', "Changing owner of " + DestinationPath + " to " + str(Specified_Owner_ID))
             if LChown(DestinationPath, Specified_Owner_ID, -1) is not None :
                 return False
 
     elif SourcePath:
-        src_uid = pwd.getpwuid(stat_info_src.st_uid)[2]
-        if pwd.getpwuid(stat_info.st_uid)[2] != src_uid:
+        src_uid = idcache.getpwuid(stat_info_src.st_uid)[2]
+        if idcache.getpwuid(stat_info.st_uid)[2] != src_uid:
             print("Changing owner of " + DestinationPath + " to " + str(src_uid))
             LG().Log('INFO', "Changing owner of " + DestinationPath + " to " + str(src_uid))
             if LChown(DestinationPath, src_uid, -1) is not None :
                 return False
 
     if fc.Group:
-        Specified_Group_ID = grp.getgrnam(fc.Group)[2]
-        if Specified_Group_ID != grp.getgrgid(stat_info.st_gid)[2]:
+        Specified_Group_ID = idcache.getgrnam(fc.Group)[2]
+        if Specified_Group_ID != idcache.getgrgid(stat_info.st_gid)[2]:
             print("Changing group of " + DestinationPath + " to " + str(Specified_Group_ID))
             LG().Log('INFO', "Changing group of " + DestinationPath + " to " + str(Specified_Group_ID))
             if LChown(DestinationPath, -1, Specified_Group_ID) is not None :
                 return False
 
     elif SourcePath:
-        src_gid = grp.getgrgid(stat_info_src.st_gid)[2]
-        if grp.getgrgid(stat_info.st_gid)[2] != src_gid:
+        src_gid = idcache.getgrgid(stat_info_src.st_gid)[2]
+        if idcache.getgrgid(stat_info.st_gid)[2] != src_gid:
             print("Changing group of " + DestinationPath + " to " + str(src_gid))
             LG().Log('INFO', "Changing group of " + DestinationPath + " to " + str(src_gid))
             if LChown(DestinationPath, src_gid , -1) is not None :
                 return False
 
     # Mode is irrelevant to symlinks
-    if not os.path.islink(DestinationPath):
+    if not stat.S_ISLNK(stat_info.st_mode):
         if fc.Mode:
             if str(oct(stat_info.st_mode))[-3:] != fc.Mode:
                 print("Changing mode of " + DestinationPath + " to " + fc.Mode)
@@ -661,11 +1612,12 @@ def SetOwnerGroupMode(DestinationPath, SourcePath, fc):
 
 
 def SetDirectoryRecursive(DestinationPath, SourcePath, fc):
+    fc.stat_cache.pop(DestinationPath, None)
     if not os.path.exists(DestinationPath):
         MakeDirs(DestinationPath)
     if SetOwnerGroupMode(DestinationPath, SourcePath, fc) is False:
         return False
-    Destination_subfiles = ListDir(DestinationPath)
+    Destination_subfiles = ScanDir(DestinationPath, fc)
     if Destination_subfiles is None:
         return False
     if not SourcePath:
@@ -675,38 +1627,129 @@ def SetDirectoryRecursive(DestinationPath, SourcePath, fc):
         # Enforce Owner/Group/Mode specified
         for f in Destination_subfiles:
             f_destpath = os.path.join(DestinationPath, f)
-            if not os.path.islink(f_destpath):
-                if os.path.isfile(f_destpath):
-                    if SetOwnerGroupMode(f_destpath, "", fc) is False :
-                        return False
-                elif os.path.isdir(f_destpath):
-                    if SetDirectoryRecursive(f_destpath, "", fc) is False :
-                        return False
+            kind = PathKind(f_destpath, fc)
+            if kind == 'file':
+                if fc.workers is not None:
+                    fc.workers.submit(f_destpath, SetOwnerGroupMode, f_destpath, "", fc)
+                elif SetOwnerGroupMode(f_destpath, "", fc) is False :
+                    return False
+            elif kind == 'directory':
+                if SetDirectoryRecursive(f_destpath, "", fc) is False :
+                    return False
         return True
 
-    Source_subfiles = ListDir(SourcePath)
+    Source_subfiles = ScanDir(SourcePath, fc)
     # For all files in SourcePath's directory, ensure they exist with proper contents and stat in DestionationPath's directory
     for f in Source_subfiles:
         f_srcpath = os.path.join(SourcePath, f)
         f_destpath = os.path.join(DestinationPath, f)
 
-        if os.path.islink(f_srcpath):
+        kind = PathKind(f_srcpath, fc)
+        if kind == 'link':
             if TestLink(f_destpath, f_srcpath, fc) is False:
                 if SetLink(f_destpath, f_srcpath, fc) is False:
                     return False
-        elif os.path.isfile(f_srcpath):
-            if TestFile(f_destpath, f_srcpath, fc) is False:
-                if SetFile(f_destpath, f_srcpath, fc) is False:
-                    return False
-        elif os.path.isdir(f_srcpath):
+        elif kind == 'file':
+            if fc.workers is not None:
+                fc.workers.submit(f_destpath, SetFileIfChanged, f_destpath, f_srcpath, fc)
+            elif SetFileIfChanged(f_destpath, f_srcpath, fc) is False:
+                return False
+        elif kind == 'directory':
             if fc.Recurse :
                 if SetDirectoryRecursive(f_destpath, f_srcpath, fc) is False:
                     return False
     return True
 
 
+def SetFileIfChanged(DestinationPath, SourcePath, fc):
+    if TestFile(DestinationPath, SourcePath, fc) is False:
+        return SetFile(DestinationPath, SourcePath, fc)
+    return True
+
+
+class SetWorkers:
+    """
+    The thread pool a recursive directory Set hands its files to.  The walk
+    stays on the calling thread, so a directory is created, with its owner,
+    group and mode, before any entry in it is queued, and the entries of a
+    directory are queued in the order they are listed.  A file that fails
+    does not stop the others; wait() returns the failures.
+    """
+
+    def __init__(self, threads):
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+        self.slots = threading.BoundedSemaphore(threads * SET_QUEUE_PER_THREAD)
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.failed = []
+
+    def submit(self, path, fn, *args):
+        self.slots.acquire()
+        self.queued += 1
+        try:
+            self.executor.submit(self.run, path, fn, args)
+        except:
+            self.slots.release()
+            raise
+
+    def run(self, path, fn, args):
+        try:
+            try:
+                if fn(*args) is False:
+                    self.add_failure(path, 'failed')
+            except Exception as error:
+                print("Exception setting " + path + " Error: " + str(error), file=sys.stderr)
+                LG().Log('ERROR', "Exception setting " + path + " Error: " + str(error))
+                self.add_failure(path, str(error))
+        finally:
+            self.slots.release()
+
+    def add_failure(self, path, reason):
+        with self.lock:
+            self.failed.append((path, reason))
+
+    def wait(self):
+        """
+        Wait for the queued files and return the (path, reason) of each
+        that failed.
+        """
+        self.executor.shutdown(wait=True)
+        return self.failed
+
+
+def ReadConf(name):
+    """
+    The value of name in dsc.conf, or None.
+    """
+    path = helperlib.CONFIG_SYSCONFDIR + '/' + helperlib.CONFIG_SYSCONFDIR_DSC + '/dsc.conf'
+    if not os.path.isfile(path):
+        return None
+    txt, error = ReadFile(path)
+    if error :
+        return None
+    for l in txt.splitlines():
+        if l.startswith(name + '='):
+            return l.split('=')[-1].strip()
+    return None
+
+
+def IntFromConf(name, default):
+    """
+    The value of name in dsc.conf, at least 1, or default.
+    """
+    info = ReadConf(name)
+    if info is None:
+        return default
+    try:
+        return max(1, int(info))
+    except ValueError:
+        LG().Log('WARNING', "Ignoring " + name + "=" + info + " in dsc.conf")
+    return default
+
+
 def SetFile(DestinationPath, SourcePath, fc):
     error = None
+    fc.stat_cache.pop(DestinationPath, None)
     if os.path.exists(DestinationPath) and (os.path.islink(DestinationPath) or os.path.isdir(DestinationPath)):
         if fc.Force :
             RemovePath(DestinationPath)
@@ -720,6 +1763,7 @@ def SetFile(DestinationPath, SourcePath, fc):
             if ret != 0:
                 raise Exception('Unable to retrieve remote resource '+fc.SourcePath+' Error is ' + str(ret))
             else:
+                # the cached copy, which stays for the next Test and Set
                 SourcePath = fc.LocalPath
         should_copy_file = False
         if os.path.isfile(DestinationPath):
@@ -730,7 +1774,12 @@ def SetFile(DestinationPath, SourcePath, fc):
         else:
             should_copy_file = True
         if should_copy_file:
-            if CopyFile(SourcePath, DestinationPath) is False :
+            delta_min_size = IntFromConf('nxFileDeltaMinSize', DELTA_MIN_SIZE)
+            if delta_min_size is not None and os.path.isfile(DestinationPath) and \
+                    delta_min_size <= os.path.getsize(DestinationPath):
+                if nxFileDelta.DeltaUpdateFile(SourcePath, DestinationPath) is not None :
+                    return False
+            elif CopyFile(SourcePath, DestinationPath) is not None :
                 return False
     elif fc.Contents:
         if WriteFile(DestinationPath, fc.Contents) is not None:
@@ -748,8 +1797,6 @@ def SetFile(DestinationPath, SourcePath, fc):
             print("Exception creating file " + DestinationPath + " Error Code: " + str(error.errno) + " Error: " +error.strerror, file=sys.stderr)
             LG().Log('ERROR', "Exception creating file " + DestinationPath + " Error Code: " + str(error.errno) + " Error: " + error.strerror)
     SetOwnerGroupMode(DestinationPath, SourcePath, fc)
-    if len(fc.LocalPath) > 0 :
-        RemoveFile(fc.LocalPath)
     return True
 
 
@@ -762,10 +1809,29 @@ def SetDirectory(DestinationPath, SourcePath, fc):
             LG().Log("ERROR", "Unable to overwrite currently existing non-directory object at " + DestinationPath + " without the Force option being true.")
             return False
 
-    return SetDirectoryRecursive(DestinationPath, SourcePath, fc)
+    threads = IntFromConf('nxFileSetThreads', SET_THREADS)
+    if threads < 2:
+        return SetDirectoryRecursive(DestinationPath, SourcePath, fc)
+    fc.workers = SetWorkers(threads)
+    try:
+        retval = SetDirectoryRecursive(DestinationPath, SourcePath, fc)
+    finally:
+        failed = fc.workers.wait()
+        queued = fc.workers.queued
+        fc.workers = None
+    if len(failed) > 0:
+        failed.sort()
+        paths = ', '.join([path + ' (' + reason + ')' for path, reason in failed[:10]])
+        if len(failed) > 10:
+            paths += ', ...'
+        print("Error: Unable to set " + str(len(failed)) + " of " + str(queued) + " files under " + DestinationPath + ": " + paths, file=sys.stderr)
+        LG().Log("ERROR", "Unable to set " + str(len(failed)) + " of " + str(queued) + " files under " + DestinationPath + ": " + paths)
+        return False
+    return retval
 
 
 def SetLink(DestinationPath, SourcePath, fc):
+    fc.stat_cache.pop(DestinationPath, None)
     if SourcePath is None or len(SourcePath) < 1 or not os.path.exists(SourcePath) :
         print("Error: Need a valid source path in order to create a new symbolic link.")
         LG().Log("ERROR", "Need a valid source path in order to create a new symbolic link.")
@@ -857,7 +1923,8 @@ def Set(DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, Re
 
 
 def TestDirectory(DestinationPath, SourcePath, fc):
-    if not os.path.exists(DestinationPath) or not os.path.isdir(DestinationPath):
+    kind = PathKind(DestinationPath, fc)
+    if kind is None or (kind != 'directory' and not (kind == 'link' and os.path.isdir(DestinationPath))):
         return False
 
     if TestOwnerGroupMode(DestinationPath, SourcePath, fc) is False:
@@ -866,7 +1933,7 @@ def TestDirectory(DestinationPath, SourcePath, fc):
     if fc.Recurse is False:
         return True
 
-    Destination_subfiles = ListDir(DestinationPath)
+    Destination_subfiles = ScanDir(DestinationPath, fc)
     if Destination_subfiles is None:
         return False
 
@@ -874,19 +1941,20 @@ def TestDirectory(DestinationPath, SourcePath, fc):
         # Enforce Owner/Group/Mode specified
         for f in Destination_subfiles:
             f_destpath = os.path.join(DestinationPath, f)
-            if not os.path.islink(f_destpath):
-                if os.path.isfile(f_destpath):
-                    if TestOwnerGroupMode(f_destpath, "", fc) is False:
-                        return False
-                elif os.path.isdir(f_destpath):
-                    if TestDirectory(f_destpath, "", fc) is False:
-                        return False
+            kind = PathKind(f_destpath, fc)
+            if kind == 'file':
+                if TestOwnerGroupMode(f_destpath, "", fc) is False:
+                    return False
+            elif kind == 'directory':
+                if TestDirectory(f_destpath, "", fc) is False:
+                    return False
         return True
 
-    Source_subfiles = ListDir(SourcePath)
+    Source_subfiles = ScanDir(SourcePath, fc)
     if Source_subfiles is None:
         return False
 
+    Destination_subfiles = set(Destination_subfiles)
     for f in Source_subfiles:
         if f not in Destination_subfiles:
             print("File: " + f + " does not exist in: " + SourcePath)
@@ -896,21 +1964,198 @@ def TestDirectory(DestinationPath, SourcePath, fc):
         f_destpath = os.path.join(DestinationPath, f)
         f_srcpath = os.path.join(SourcePath, f)
 
-        if os.path.islink(f_srcpath):
+        kind = PathKind(f_srcpath, fc)
+        if kind == 'link':
             if TestLink(f_destpath, f_srcpath, fc) is False:
                 return False
-        elif os.path.isfile(f_srcpath):
+        elif kind == 'file':
             if TestFile(f_destpath, f_srcpath, fc) is False:
                 return False
-        elif os.path.isdir(f_srcpath):
+        elif kind == 'directory':
             if TestDirectory(f_destpath, f_srcpath, fc) is False:
                 return False
 
     return True
 
 
+def TestDirectoryTree(DestinationPath, SourcePath, fc):
+    """
+    TestDirectory, against the manifest of the source when it has one.
+    When the trees are journaled, only the paths changed since the last
+    Test that found them in order are checked.
+    """
+    if fc.Recurse is False:
+        return TestDirectory(DestinationPath, SourcePath, fc)
+    manifest = None
+    if SourcePath:
+        manifest = OpenManifest(SourcePath, fc.Checksum)
+    journals = None
+    try:
+        journals = OpenJournals(DestinationPath, SourcePath, manifest)
+        if journals is None:
+            return TestWholeDirectory(DestinationPath, SourcePath, manifest, fc)
+        mark_path = CleanMarkPath(DestinationPath, SourcePath, fc)
+        changed, mark = JournalChanges(journals, mark_path, manifest)
+        if changed is None:
+            result = TestWholeDirectory(DestinationPath, SourcePath, manifest, fc)
+        else:
+            result = TestChangedPaths(DestinationPath, SourcePath, manifest, changed, fc)
+        if result is False:
+            RemoveCleanMark(mark_path)
+        else:
+            WriteCleanMark(mark_path, mark)
+        return result
+    finally:
+        if journals is not None:
+            for journal in journals:
+                journal.close()
+        if manifest is not None:
+            manifest.close()
+
+
+def TestWholeDirectory(DestinationPath, SourcePath, manifest, fc):
+    if manifest is not None:
+        return TestDirectoryManifest(DestinationPath, SourcePath, manifest, fc)
+    return TestDirectory(DestinationPath, SourcePath, fc)
+
+
+def TestChangedPaths(DestinationPath, SourcePath, manifest, changed, fc):
+    """
+    TestDirectory of the root and of the paths in changed (relative to
+    the trees) with what is under them.
+    """
+    if '' in changed:
+        return TestWholeDirectory(DestinationPath, SourcePath, manifest, fc)
+    if manifest is not None:
+        if TestManifestEntry(DestinationPath, SourcePath, manifest, b'', manifest.find(b''), fc) is False:
+            return False
+    else:
+        kind = PathKind(DestinationPath, fc)
+        if kind is None or (kind != 'directory' and not (kind == 'link' and os.path.isdir(DestinationPath))):
+            return False
+        if TestOwnerGroupMode(DestinationPath, SourcePath, fc) is False:
+            return False
+    checked = set()
+    # parents first, so that what is under them is not checked twice
+    for name in sorted(changed, key=lambda n: n.count('/')):
+        name = ChangedPathToCheck(DestinationPath, SourcePath, manifest, name, checked, fc)
+        if name is None:
+            continue
+        checked.add(name)
+        if TestChangedPath(DestinationPath, SourcePath, manifest, name, fc) is False:
+            return False
+    return True
+
+
+def ChangedPathToCheck(DestinationPath, SourcePath, manifest, name, checked, fc):
+    """
+    The path to check for a change to name: name, or the symlink above it
+    in the source, which TestLink checks as a whole; None if a path above
+    it is checked already, or a walk of the trees would not reach it.
+    """
+    parts = name.split('/')
+    for i in range(1, len(parts)):
+        parent = '/'.join(parts[:i])
+        if parent in checked:
+            return None
+        if manifest is not None:
+            entry = manifest.find(os.fsencode(parent))
+            if entry is None:
+                return None
+            if entry.target is not None:
+                return parent
+        elif SourcePath:
+            kind = PathKind(os.path.join(SourcePath, parent), fc)
+            if kind == 'link':
+                return parent
+            if kind != 'directory':
+                return None
+        elif PathKind(os.path.join(DestinationPath, parent), fc) != 'directory':
+            return None
+    return name
+
+
+def TestChangedPath(DestinationPath, SourcePath, manifest, name, fc):
+    f_destpath = os.path.join(DestinationPath, name)
+    if manifest is not None:
+        for entry_name, entry in manifest.subtree(os.fsencode(name)):
+            if TestManifestEntry(DestinationPath, SourcePath, manifest, entry_name, entry, fc) is False:
+                return False
+        return True
+    if not SourcePath:
+        # Enforce Owner/Group/Mode specified, as TestDirectory
+        kind = PathKind(f_destpath, fc)
+        if kind == 'file':
+            return TestOwnerGroupMode(f_destpath, "", fc)
+        elif kind == 'directory':
+            return TestDirectory(f_destpath, "", fc)
+        return True
+    f_srcpath = os.path.join(SourcePath, name)
+    kind = PathKind(f_srcpath, fc)
+    if kind == 'link':
+        return TestLink(f_destpath, f_srcpath, fc)
+    elif kind == 'file':
+        return TestFile(f_destpath, f_srcpath, fc)
+    elif kind == 'directory':
+        return TestDirectory(f_destpath, f_srcpath, fc)
+    # not in the source: nothing to check
+    return True
+
+
+def TestDirectoryManifest(DestinationPath, SourcePath, manifest, fc):
+    """
+    TestDirectory of a recursive resource whose source has a manifest:
+    each entry of the manifest is checked in the destination, with the
+    lstat the manifest has standing in for that of the source, and the
+    digest of each destination file compared with the one it has.
+    """
+    for name, entry in manifest:
+        if TestManifestEntry(DestinationPath, SourcePath, manifest, name, entry, fc) is False:
+            return False
+    return True
+
+
+def TestManifestEntry(DestinationPath, SourcePath, manifest, name, entry, fc):
+    if name:
+        name = os.fsdecode(name)
+        f_destpath = os.path.join(DestinationPath, name)
+        f_srcpath = os.path.join(SourcePath, name)
+    else:
+        f_destpath = DestinationPath
+        f_srcpath = SourcePath
+    fc.stat_cache[f_srcpath] = entry
+    kind = PathKind(f_destpath, fc)
+    if kind is None:
+        if name:
+            print("File: " + name + " does not exist in: " + DestinationPath)
+            LG().Log('ERROR', "File: " + name + " does not exist in: " + DestinationPath)
+        return False
+    if entry.target is not None:
+        # the source is read for its links, as TestLink follows them
+        if TestLink(f_destpath, f_srcpath, fc) is False:
+            return False
+    elif stat.S_ISDIR(entry.st_mode):
+        if kind != 'directory' and not (kind == 'link' and os.path.isdir(f_destpath)):
+            return False
+        if TestOwnerGroupMode(f_destpath, f_srcpath, fc) is False:
+            return False
+    elif stat.S_ISREG(entry.st_mode):
+        if kind != 'file':
+            return False
+        if TestOwnerGroupMode(f_destpath, f_srcpath, fc) is False:
+            return False
+        stat_dest = CachedLStat(f_destpath, fc)
+        if fc.Checksum in CONTENT_CHECKSUMS:
+            if stat_dest.st_size != entry.st_size or \
+                    FileDigest(f_destpath, stat_dest, manifest.algorithm) != entry.digest:
+                return False
+        elif CompareFiles(f_destpath, f_srcpath, fc.Checksum, stat_dest, entry) == -1:
+            return False
+    return True
+
+
 def TestFile(DestinationPath, SourcePath, fc):
-    if not os.path.exists(DestinationPath) or not os.path.isfile(DestinationPath) or os.path.islink(DestinationPath):
+    if PathKind(DestinationPath, fc) != 'file':
         return False
 
     if '://' in SourcePath:
@@ -920,10 +2165,11 @@ def TestFile(DestinationPath, SourcePath, fc):
         return False
 
     if SourcePath and len(SourcePath) > 0:
-        if not os.path.isfile(SourcePath):
+        src_kind = PathKind(SourcePath, fc)
+        if src_kind != 'file' and not (src_kind == 'link' and os.path.isfile(SourcePath)):
             return False
 
-        if os.path.islink(SourcePath):
+        if src_kind == 'link':
             if fc.Links == "follow":
                 if os.path.isdir(os.path.realpath(SourcePath)):
                     print("Error: Expecting a file, but source link points to directory")
@@ -934,7 +2180,8 @@ def TestFile(DestinationPath, SourcePath, fc):
                     return False
                 if os.readlink(DestinationPath) != os.readlink(SourcePath):
                     return False
-        elif CompareFiles(DestinationPath, SourcePath,  fc.Checksum) == -1:
+        elif CompareFiles(DestinationPath, SourcePath, fc.Checksum,
+                          CachedLStat(DestinationPath, fc), CachedLStat(SourcePath, fc)) == -1:
             return False
 
     elif fc.Contents:
@@ -987,7 +2234,7 @@ def Test(DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, R
             if TestFile(DestinationPath, SourcePath, fc) is False:
                 return [-1]
         elif fc.Type == "directory":
-            if TestDirectory(DestinationPath, SourcePath, fc) is False:
+            if TestDirectoryTree(DestinationPath, SourcePath, fc) is False:
                 return [-1]
         elif fc.Type == "link":
             if TestLink(DestinationPath, SourcePath, fc) is False:
@@ -1017,8 +2264,8 @@ def Get(DestinationPath, SourcePath, Ensure, Type, Force, Contents, Checksum, Re
 
     stat_info = os.lstat(DestinationPath)
 
-    Owner = pwd.getpwuid(stat_info.st_uid)[0]
-    Group = grp.getgrgid(stat_info.st_gid)[0]
+    Owner = idcache.getpwuid(stat_info.st_uid)[0]
+    Group = idcache.getgrgid(stat_info.st_gid)[0]
     Mode = str(oct(stat_info.st_mode))[-3:]
     if os.path.islink(DestinationPath):
         Type = "link"
@@ -1061,104 +2308,35 @@ def GetTimeFromString(s):
     return st
 
 
-def SetProxyFromConf():
-    """
-    Check for PROXY definition in dsc.conf.
-    All we must do is set the appropriate value in the environment.
-    HTTP_PROXY
-    HTTPS_PROXY
-    """
-    path = helperlib.CONFIG_SYSCONFDIR + '/' + helperlib.CONFIG_SYSCONFDIR_DSC + '/dsc.conf'
-    txt, error = ReadFile(path)
-    if error :
-        return
-    for l in txt.splitlines():
-        if l.startswith('PROXY'):
-            info = l.split('=')[1].strip()
-            if 'https' in info:
-                os.environ['HTTPS_PROXY'] = info
-            if 'http:' in info:
-                os.environ['HTTP_PROXY'] = info
-    return
-        
 def GetRemoteFile(fc):
-    SetProxyFromConf()
-    req = urllib.request.Request(fc.SourcePath)
-    try:
-        resp = urllib.request.urlopen(req)
-    except urllib.error.URLError as e:
-        print(repr(e))
-        LG().Log('ERROR', repr(e))
+    if nxFileRemote.FetchRemoteFile(fc) is None:
         return 1
-    fc.LocalPath = '/tmp/'+os.path.basename(fc.DestinationPath)+'_remote'
-    data=b'keep going'
-    hasWritten = False
-    with (open(fc.LocalPath, 'wb+')) as F:
-        try:
-            while data:
-                data = resp.read(1048576)
-                if data is not None and len(data) > 0:
-                    hasWritten = True
-                    F.write(data)
-            if hasWritten == False:
-                LG().Log('ERROR', "Data at URL: " + fc.SourcePath + " was empty. Please ensure this file exists at this remote location.")
-                F.close()
-                os.unlink(fc.LocalPath)
-                return 1
-        except Exception as e:
-            F.close()
-            os.unlink(fc.LocalPath)
-            print(repr(e))
-            LG().Log('ERROR', repr(e))
-            return 1
+    fc.LocalPath = nxFileRemote.RemoteCachePaths(fc.SourcePath)[1]
     return 0
 
+
 def TestRemoteFile(fc):
-    SetProxyFromConf()
-    req = urllib.request.Request(fc.SourcePath)
-    try:
-        resp = urllib.request.urlopen(req)
-    except urllib.request.URLError as e:
-        print(repr(e))
-        LG().Log('ERROR', repr(e))
-        return False
-    h = resp.info()
-    if fc.Checksum != 'md5' :  # if not 'md5' check the last_modified header time before we download
-        lm = h.get('last-modified')
-        remote_mtime = GetTimeFromString(lm)
-        destination_mtime = None
+    if fc.Checksum not in CONTENT_CHECKSUMS :  # if not a digest check the last_modified header time
         dst_st = None
         if os.path.exists(fc.DestinationPath):
             dst_st = LStatFile(fc.DestinationPath)
-        if dst_st is not None:
-            if fc.Checksum == 'ctime':
-                destination_mtime = time.gmtime(dst_st.st_ctime)
-            else:
-                destination_mtime = time.gmtime(dst_st.st_mtime)
-        if remote_mtime is not None and destination_mtime is not None and destination_mtime >= remote_mtime:
+        if dst_st is None:
+            return False
+        remote_mtime = GetTimeFromString(nxFileRemote.RemoteLastModified(fc.SourcePath))
+        if fc.Checksum == 'ctime':
+            destination_mtime = time.gmtime(dst_st.st_ctime)
+        else:
+            destination_mtime = time.gmtime(dst_st.st_mtime)
+        if remote_mtime is not None and destination_mtime >= remote_mtime:
             return True
         else:
             return False
-    #md5
+    #md5, sha-256, blake2b, xxh3, xxh128
     if not os.path.exists(fc.DestinationPath):
         return False
-    src_data=b'keep going'
-    dest_data=b'keep going'
-    src_hash = md5const()
-    dest_hash = md5const()
-    with (open(fc.DestinationPath, 'rb')) as F:
-        try:
-            while src_data or dest_data:
-                src_data = resp.read(1048576)
-                src_hash.update(src_data)
-                dest_data = F.read(1048576)
-                dest_hash.update(dest_data)
-                if src_hash.hexdigest() != dest_hash.hexdigest():
-                    return False
-        except Exception as e:
-            F.close()
-            return False
-    return True
+    if nxFileRemote.FetchRemoteFile(fc) is None:
+        return False
+    return CompareFiles(fc.DestinationPath, nxFileRemote.RemoteCachePaths(fc.SourcePath)[1], fc.Checksum) == 0
 
 
 class FileContext:
@@ -1186,6 +2364,12 @@ class FileContext:
         self.Owner = Owner
         self.Group = Group
         self.ModifiedDate=None
+        # lstat results, or DirEntry objects to take them from, by path;
+        # see CachedLStat
+        self.stat_cache = {}
+        # SetWorkers of a recursive directory Set, or None to set files
+        # one after the other
+        self.workers = None
         error=None
 
         if Mode:
@@ -10,24 +10,38 @@ from __future__ import with_statement
 from contextlib import contextmanager
 
 import os
-import pwd
-import grp
+import sys
+import stat
+import struct
+import tempfile
+import time
 import codecs
 import fnmatch
-import copy
 import imp
 protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 LG = nxDSCLog.DSCLog
-try:
-    import hashlib
-    md5const = hashlib.md5
-    shaconst = hashlib.sha256
-except ImportError: # Only sha-1 is available for python2.4.
-    import md5
-    md5const = md5.md5
-    import sha
-    shaconst = sha.sha
+filehash = imp.load_source('filehash', '../filehash.py')
+idcache = imp.load_source('idcache', '../idcache.py')
+
+# Only reads the trees it lists; the index it keeps is replaced whole
+# by rename, so two inventories may run at once.
+THREAD_SAFE = True
+
+# The Checksum and Contents of each regular file an inventory reports are
+# kept, by (st_dev, st_ino), in an index per inventory filter under
+# cache_file_dir, and reported from it without opening the file while it
+# keeps its size, mtime, ctime, mode, owner and group.  As the Contents
+# are those of files other users may not read, only root may read the
+# index and its directory.
+INVENTORY_INDEX = True
+cache_file_dir = '/var/opt/microsoft/dsc/cache/nxFileInventory/'
+# A file whose ctime is this close to the time it was read may change
+# again without its timestamps changing (coarse timestamp granularity), so
+# it is not indexed and is read again by the next inventory.
+INDEX_RACY_NS = 2 * 1000000000
+# time.time_ns is new in python 3.7
+time_ns = getattr(time, 'time_ns', None) or (lambda: int(time.time() * 1000000000))
 
 # [ClassVersion("1.0.0"), Description("The configuration provider for files and directories."), FriendlyName("nxFileInventory")]
 # class MSFT_nxFileInventoryResource:OMI_BaseResource
@@ -36,7 +50,7 @@ except ImportError: # Only sha-1 is available for python2.4.
 #   [Write, InventoryFilter] boolean Recurse;  //default = false
 #   [Write, InventoryFilter] boolean UseSudo;  //default = false
 #   [Write, ValueMap{"follow", "manage", "ignore" }, Values{"follow", "manage", "ignore"},InventoryFilter] string Links; //default follow
-#   [Write, ValueMap{"md5", "sha-256", "mtime", "ctime"}, Values{"md5","sha-256","mtime","ctime"},InventoryFilter] string Checksum; //default md5
+#   [Write, ValueMap{"md5", "sha-256", "blake2b", "xxh3", "xxh128", "mtime", "ctime"}, Values{"md5","sha-256","blake2b","xxh3","xxh128","mtime","ctime"},InventoryFilter] string Checksum; //default md5
 #   [Write, ValueMap{"file", "directory", "*"},Values{"file", "directory","*"}, InventoryFilter] string Type; //default *
 #   [Write, InventoryFilter] uint32 MaxContentsReturnable;  //default 1024 bytes
 #   [Write, InventoryFilter] uint64 MaxOutputSize; //default 10485760 bytes
@@ -110,11 +124,19 @@ def Inventory_Marshall(DestinationPath, Recurse, Links, Checksum, Type, MaxConte
     DestinationPath, Recurse, Links, Checksum, Type, MaxContentsReturnable, MaxOutputSize, UseSudo \
                      = init_locals(DestinationPath, Recurse, Links, Checksum, Type, MaxContentsReturnable, MaxOutputSize, UseSudo)
     retval = 0
+    Inventory = DoInventory(DestinationPath, Recurse, Links, Checksum, Type, MaxContentsReturnable, MaxOutputSize, UseSudo)
+    # The instances are produced while the response is written, so only
+    # one file's information is held at a time.
+    _Inventory = protocol.MI_InstanceA(InventoryInstances(Inventory, MaxOutputSize))
+    retd = {}
+    retd["__Inventory"] = _Inventory
+    return retval, retd
+
+
+def InventoryInstances(Inventory, MaxOutputSize):
     out_size_cur = 158 # xml output header + footer length.
     xml_overhead_array_element = 99 # xml output overhead per Inventory array entry.
     xml_overhead_param = 102 # xml output overhead per Inventory parameter.
-    _Inventory = []
-    Inventory = DoInventory(DestinationPath, Recurse, Links, Checksum, Type, MaxContentsReturnable, MaxOutputSize, UseSudo)
     for d in Inventory:
         if out_size_cur <  MaxOutputSize:
             out_size_cur += xml_overhead_array_element
@@ -136,15 +158,31 @@ def Inventory_Marshall(DestinationPath, Recurse, Links, Checksum, Type, MaxConte
         d['Group'] = protocol.MI_String(d['Group'])
         d['Owner'] = protocol.MI_String(d['Owner'])
         d['FileSize'] = protocol.MI_Uint64(d['FileSize'])
-        _Inventory.append(d)
-    _Inventory = protocol.MI_InstanceA(_Inventory)
-    retd = {}
-    retd["__Inventory"] = _Inventory
-    return retval, retd
+        yield d
 
 
 def DoInventory(DestinationPath, Recurse, Links, Checksum, Type, MaxContentsReturnable, MaxOutputSize, UseSudo):
-    Inventory = []
+    """
+    Walks DestinationPath and yields the information dict of each
+    matching file or directory as it is found, then saves the index of
+    the files it reported.  When the walk is cut short (MaxOutputSize),
+    the index also keeps the entries it did not reach.
+    """
+    index = None
+    if INVENTORY_INDEX:
+        index = InventoryIndex(InventoryIndexPath(DestinationPath, Recurse, Links, Checksum, Type,
+                                                  MaxContentsReturnable))
+    complete = False
+    try:
+        for d in WalkInventory(DestinationPath, Recurse, Links, Checksum, Type, MaxContentsReturnable, index):
+            yield d
+        complete = True
+    finally:
+        if index is not None:
+            index.save(complete)
+
+
+def WalkInventory(DestinationPath, Recurse, Links, Checksum, Type, MaxContentsReturnable, index):
     full_path = DestinationPath.split('/')
     if full_path[-1] == '':
         full_path[-1] = '*'
@@ -161,15 +199,15 @@ def DoInventory(DestinationPath, Recurse, Links, Checksum, Type, MaxContentsRetu
     if not os.path.exists(top):
         print("Error: Unable to read 'DestinationPath': " + DestinationPath)
         LG().Log("ERROR","Unable to read 'DestinationPath': " + DestinationPath)
-        return Inventory
+        return
     if not wildcard_path:
         if Links == 'ignore' and os.path.islink(top):
-            return Inventory
+            return
         if Type != 'directory' and os.path.isfile(top): # This is s single file.
-            d = GetFileInfo(top, Links, MaxContentsReturnable, Checksum)
+            d = GetFileInfo(top, Links, MaxContentsReturnable, Checksum, index)
             if 'DestinationPath' in d.keys():
-                Inventory.append(copy.deepcopy(d))
-            return Inventory
+                yield d
+            return
         if '*' not in full_path[-1] and '?' not in full_path[-1]:
             full_path.append('*') # It is a directory without the trailing '/', so add it.
     dirs = set()
@@ -191,9 +229,9 @@ def DoInventory(DestinationPath, Recurse, Links, Checksum, Type, MaxContentsRetu
                     continue
                 if Type != 'directory':
                     d = GetFileInfo(os.path.join(dirpath, filename),\
-                                    Links, MaxContentsReturnable, Checksum)
+                                    Links, MaxContentsReturnable, Checksum, index)
                     if 'DestinationPath' in d.keys():
-                        Inventory.append(copy.deepcopy(d))
+                        yield d
         for dirname in dirnames:
             if not ( Recurse and dlen+1 >= full_path_len ):
                 if ( do_wildcard and not fnmatch.fnmatch(dirname, full_path[dlen]) ) or \
@@ -208,18 +246,19 @@ def DoInventory(DestinationPath, Recurse, Links, Checksum, Type, MaxContentsRetu
             if Type != 'file' and ( dlen+1 == full_path_len  or  ( Recurse and dlen >= full_path_len ) ) :
                 d = GetDirInfo(os.path.join(dirpath, dirname), st, Checksum, Links)
                 if 'DestinationPath' in d.keys():
-                    Inventory.append(copy.deepcopy(d))
+                    yield d
         dirnames[:] = scandirs
-    return Inventory
 
 
-def GetFileInfo(fname, Links, MaxContentsReturnable, Checksum):
+def GetFileInfo(fname, Links, MaxContentsReturnable, Checksum, index=None):
     """
     Return a dictionary of info for file.
     If 'Links' == 'follow', no link files will appear here,
     those links will be sent to GetDirInfo() as direcroties.
     Therefore only LStatFile is used.
     If file is link and 'Links' == 'ignore' {} is returned.
+    The Checksum and Contents of a regular file are taken from index
+    when it has them, and stored in it otherwise.
     """
     d = {}
 
@@ -238,11 +277,11 @@ def GetFileInfo(fname, Links, MaxContentsReturnable, Checksum):
         return {}
     d['DestinationPath'] = fname
     try:
-        d['Owner'] = pwd.getpwuid(stat_info.st_uid).pw_name
+        d['Owner'] = idcache.getpwuid(stat_info.st_uid).pw_name
     except:
         d['Owner'] = str(stat_info.st_uid)
     try:
-        d['Group'] = grp.getgrgid(stat_info.st_gid).gr_name
+        d['Group'] = idcache.getgrgid(stat_info.st_gid).gr_name
     except:
         d['Group'] = str(stat_info.st_gid)
     d['Mode'] = str(oct(stat_info.st_mode))[-3:]
@@ -253,7 +292,7 @@ def GetFileInfo(fname, Links, MaxContentsReturnable, Checksum):
     # dont attempt to read the file
     if stat_info.st_size == 0:
        d['Contents'] = ''
-       if Checksum == 'md5' or Checksum == 'sha-256':
+       if Checksum in filehash.CHECKSUMS:
         d['Checksum'] = "" 
        elif Checksum == "ctime":
         d['Checksum']= str(int(stat_info.st_ctime))
@@ -261,7 +300,14 @@ def GetFileInfo(fname, Links, MaxContentsReturnable, Checksum):
         d['Checksum']= str(int(stat_info.st_mtime))
        return d
 
-    if Checksum == 'md5' or Checksum == 'sha-256':
+    indexed = index is not None and stat.S_ISREG(stat_info.st_mode)
+    if indexed:
+        entry = index.find(stat_info)
+        if entry is not None:
+            d['Checksum'], d['Contents'] = entry
+            return d
+        read_ns = time_ns()
+    if Checksum in filehash.CHECKSUMS:
        try:
         d['Checksum'] = GetChecksum(fname,Checksum)
        except:
@@ -270,12 +316,18 @@ def GetFileInfo(fname, Links, MaxContentsReturnable, Checksum):
         d['Checksum']= str(int(stat_info.st_ctime))
     else : # Checksum == "mtime":
         d['Checksum']= str(int(stat_info.st_mtime))
+    error = None
     if d['Type'] == 'link' and Links == 'manage' :
         d['Contents'] = 'Symlink to ' + os.readlink(fname) 
     else :
         d['Contents'], error = ReadFileLimited(fname,MaxContentsReturnable)
     if d['Contents'] is None:
         d['Contents'] = ''
+    # a file that could not be read, or changed as it was, is read again
+    # by the next inventory
+    if indexed and error is None and d['Checksum'] and isinstance(d['Checksum'], str) and \
+            stat_info.st_ctime_ns < read_ns - INDEX_RACY_NS:
+        index.store(stat_info, d['Checksum'], d['Contents'])
     return d
 
 def GetDirInfo(dname, stat_info, Checksum, Links):
@@ -290,14 +342,14 @@ def GetDirInfo(dname, stat_info, Checksum, Links):
     d['Type'] = 'directory'
     d['DestinationPath'] = dname
     try:
-        d['Owner'] = pwd.getpwuid(stat_info.st_uid).pw_name
+        d['Owner'] = idcache.getpwuid(stat_info.st_uid).pw_name
     except:
         d['Owner'] = str(stat_info.st_uid)
     try:
-        d['Group'] = grp.getgrgid(stat_info.st_gid).gr_name
+        d['Group'] = idcache.getgrgid(stat_info.st_gid).gr_name
     except:
         d['Group'] = str(stat_info.st_gid)
-    if Checksum == 'md5' or Checksum == 'sha-256':
+    if Checksum in filehash.CHECKSUMS:
         d['Checksum'] = '0'
     elif Checksum == "ctime":
         d['Checksum']= str(int(stat_info.st_ctime))
@@ -313,6 +365,122 @@ def GetDirInfo(dname, stat_info, Checksum, Links):
     return d
 
 
+def InventoryIndexPath(DestinationPath, Recurse, Links, Checksum, Type, MaxContentsReturnable):
+    key = repr((DestinationPath, bool(Recurse), Links, Checksum, Type, MaxContentsReturnable))
+    return cache_file_dir + filehash.md5const(key.encode('utf-8')).hexdigest() + '.idx'
+
+
+class InventoryIndex:
+    """
+    The Checksum and Contents an inventory reported for each regular
+    file, by (st_dev, st_ino), with the st_size, st_mtime_ns, st_ctime_ns,
+    st_mode, st_uid and st_gid the file had.  The index is a header and a
+    record per file, each followed by its Checksum and Contents.
+    """
+    # magic, count
+    HEADER = struct.Struct('<8sI')
+    # dev, ino, size, mtime_ns, ctime_ns, mode, uid, gid, checksum length,
+    # contents length
+    RECORD = struct.Struct('<QQQqqIIIII')
+    MAGIC = b'nxFinv\x00\x01'
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = self.read_index()
+        self.seen = {}
+        self.hits = 0
+        self.misses = 0
+
+    def read_index(self):
+        entries = {}
+        try:
+            with open(self.path, 'rb') as F:
+                data = F.read()
+        except (IOError, OSError):
+            return entries
+        if len(data) < self.HEADER.size:
+            return entries
+        magic, count = self.HEADER.unpack_from(data)
+        if magic != self.MAGIC:
+            LG().Log('WARNING', "Discarding damaged inventory index " + self.path)
+            return entries
+        offset = self.HEADER.size
+        try:
+            for i in range(count):
+                rec = self.RECORD.unpack_from(data, offset)
+                offset += self.RECORD.size
+                checksum = data[offset:offset + rec[8]].decode('ascii')
+                offset += rec[8]
+                contents = data[offset:offset + rec[9]].decode('ascii')
+                offset += rec[9]
+                entries[(rec[0], rec[1])] = rec[2:8] + (checksum, contents)
+        except (struct.error, UnicodeDecodeError):
+            LG().Log('WARNING', "Discarding damaged inventory index " + self.path)
+            return {}
+        if offset != len(data):
+            LG().Log('WARNING', "Discarding damaged inventory index " + self.path)
+            return {}
+        return entries
+
+    def find(self, st):
+        """
+        (Checksum, Contents) of the file whose lstat is st, or None.
+        """
+        key = (st.st_dev, st.st_ino)
+        entry = self.entries.get(key)
+        if entry is None or entry[:6] != (st.st_size, st.st_mtime_ns, st.st_ctime_ns,
+                                          st.st_mode, st.st_uid, st.st_gid):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.seen[key] = entry
+        return entry[6:]
+
+    def store(self, st, checksum, contents):
+        self.seen[(st.st_dev, st.st_ino)] = (st.st_size, st.st_mtime_ns, st.st_ctime_ns,
+                                             st.st_mode, st.st_uid, st.st_gid, checksum, contents)
+
+    def save(self, complete):
+        """
+        Writes the entries of the files reported, with the rest of the
+        old ones unless the walk was complete, if they differ from what
+        was read.
+        """
+        if complete:
+            entries = self.seen
+            changed = self.misses or len(entries) != len(self.entries)
+        else:
+            entries = self.entries
+            entries.update(self.seen)
+            changed = self.misses
+        LG().Log('INFO', "nxFileInventory index " + self.path + ": " + str(self.hits) + " hits, " +
+                 str(self.misses) + " misses")
+        if not changed:
+            return
+        tmp = None
+        try:
+            if not os.path.isdir(cache_file_dir):
+                os.makedirs(cache_file_dir, 0o700)
+            elif stat.S_IMODE(os.stat(cache_file_dir).st_mode) & 0o077:
+                os.chmod(cache_file_dir, 0o700)
+            # created 0600
+            fd, tmp = tempfile.mkstemp(prefix=os.path.basename(self.path) + '.', dir=cache_file_dir)
+            with os.fdopen(fd, 'wb') as F:
+                F.write(self.HEADER.pack(self.MAGIC, len(entries)))
+                for key, entry in entries.items():
+                    checksum = entry[6].encode('ascii')
+                    contents = entry[7].encode('ascii')
+                    F.write(self.RECORD.pack(*(key + entry[:6] + (len(checksum), len(contents)))))
+                    F.write(checksum)
+                    F.write(contents)
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as error:
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+            print("Exception writing inventory index " + self.path + " Error: " + str(error), file=sys.stderr)
+            LG().Log('ERROR', "Exception writing inventory index " + self.path + " Error: " + str(error))
+
+
 @contextmanager
 def opened_w_error(filename, mode="r"):
     try:
@@ -380,17 +548,12 @@ def StatFile(path):
     return d
 
 def GetChecksum(fname, Checksum):
-    src_error = None
-    src_block = b'loopme'
-    if Checksum == "md5":
-        src_hash = md5const()
-    else : # sha-256
-        src_hash = shaconst()
-    with opened_bin_w_error(fname, 'rb') as (src_file, src_error):
-        if src_error:
-            return ""
-        while src_block :
-            src_block = src_file.read(8192)
-            src_hash.update(src_block)
-        return src_hash.hexdigest()
+    try:
+        return filehash.hash_file(fname, Checksum).hexdigest()
+    except (IOError, OSError):
+        return ""
+    except ValueError:
+        LG().Log('ERROR', 'Checksum ' + Checksum + ' is not available, this python has ' +
+                 ', '.join(filehash.available()))
+        return ""
 
@@ -16,6 +16,10 @@ protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 LG = nxDSCLog.DSCLog
 
+# iptables, ufw and SuSEfirewall2 rules are listed, changed and saved
+# as a whole set.
+THREAD_SAFE = False
+
 # [ClassVersion("1.0.0"), FriendlyName("nxFirewallResource")]
 # class MSFT_nxFirewallResource:OMI_BaseResource
 # {
@@ -15,8 +15,14 @@ import fnmatch
 protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 helperlib = imp.load_source('helperlib', '../helperlib.py')
+idcache = imp.load_source('idcache', '../idcache.py')
 LG = nxDSCLog.DSCLog
 
+# groupadd and groupmod lock /etc/group, which nxUser changes through
+# useradd; requests for either module take the nxUser lock.
+THREAD_SAFE = False
+THREAD_LOCK = 'nxUser'
+
 # [ClassVersion("1.0.0"), FriendlyName("nxGroup"),SupportsInventory()]
 # class MSFT_nxGroupResource:OMI_BaseResource
 # {
@@ -58,6 +64,9 @@ def Set_Marshall(GroupName, Ensure, Members, MembersToInclude, MembersToExclude,
                   MembersToExclude, PreferredGroupID)
     retval = Set(GroupName, Ensure, Members, MembersToInclude,
                  MembersToExclude, PreferredGroupID)
+    # the providers that look owners up must not go on with the group
+    # this Set replaced, nor miss the one it created
+    idcache.clear()
     return retval
 
 
@@ -104,6 +113,14 @@ def Inventory_Marshall(GroupName, Ensure, Members, MembersToInclude, MembersToEx
     retval = 0
     (retval, Inventory) = GetInventory(GroupName, Ensure, Members, MembersToInclude,
             MembersToExclude, PreferredGroupID)
+    Inventory = protocol.MI_InstanceA(InventoryInstances(Inventory))
+    retd = {}
+    retd["__Inventory"] = Inventory
+    return retval, retd
+
+
+def InventoryInstances(Inventory):
+    # converted one group at a time while the response is written
     for d in Inventory:
         d['GroupName'] = protocol.MI_String(d['GroupName'])
         d['Ensure'] = protocol.MI_String(d['Ensure'])
@@ -112,10 +129,7 @@ def Inventory_Marshall(GroupName, Ensure, Members, MembersToInclude, MembersToEx
         d['MembersToExclude'] = protocol.MI_StringA(d['MembersToExclude'])
         d['PreferredGroupID'] = protocol.MI_String(d['PreferredGroupID'])
         d['GroupID'] = protocol.MI_String(d['GroupID'])
-    Inventory = protocol.MI_InstanceA(Inventory)
-    retd = {}
-    retd["__Inventory"] = Inventory
-    return retval, retd
+        yield d
 
 
 ############################################################
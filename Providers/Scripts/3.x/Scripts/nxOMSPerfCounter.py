@@ -14,6 +14,10 @@ nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 
 LG = nxDSCLog.DSCLog
 
+# The perf counter section of omsagent.conf is read, changed and
+# written back whole by Set_Marshall.
+THREAD_SAFE = False
+
 conf_path = '/etc/opt/microsoft/omsagent/conf/omsagent.conf'
 omi_map_path = '/etc/opt/microsoft/omsagent/conf/omsagent.d/omi_mapping.json'
 omi_map = None
@@ -28,24 +32,22 @@ def init_vars(HeartbeatIntervalSeconds, PerfCounterObject):
     init_omi_map()
     if PerfCounterObject is not None:
         for perf in PerfCounterObject:
+            # nested values arrive plain from client.py; tests may still
+            # pass MI_Value objects
+            for key in list(perf.keys()):
+                if 'value' in dir(perf[key]):
+                    perf[key] = perf[key].value
             new_perfs = []
-            if len(perf['PerformanceCounter'].value):
-                for perf_counter in perf['PerformanceCounter'].value:
+            if len(perf['PerformanceCounter']):
+                for perf_counter in perf['PerformanceCounter']:
                     new_perfs.append(perf_counter)
                 perf['PerformanceCounter'] = new_perfs
-            if perf['InstanceName'].value is None:
+            if perf['InstanceName'] is None:
                 perf['InstanceName'] = ''
-            else:
-                perf['InstanceName'] = perf['InstanceName'].value
-            if perf['ObjectName'].value is None:
+            if perf['ObjectName'] is None:
                 perf['ObjectName'] = ''
-            else:
-                perf['ObjectName'] = perf['ObjectName'].value
-            if perf['AllInstances'].value is None:
+            if perf['AllInstances'] is None:
                 perf['AllInstances'] = False
-            else:
-                perf['AllInstances'] = perf['AllInstances'].value.value
-            perf['IntervalSeconds'] = perf['IntervalSeconds'].value.value
 
 
 def Set_Marshall(Name, HeartbeatIntervalSeconds, PerfCounterObject):
@@ -16,6 +16,10 @@ nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 
 LG = nxDSCLog.DSCLog
 
+# Writes the same customlog.conf as nxOMSCustomLog, under its lock.
+THREAD_SAFE = False
+THREAD_LOCK = 'nxOMSCustomLog'
+
 CONF_PATH = '/etc/opt/microsoft/omsagent/conf/omsagent.d/customlog.conf'
 RESOURCE_DIR = '/opt/microsoft/omsconfig/modules/nxOMSSudoCustomLog/DSCResources/MSFT_nxOMSSudoCustomLogResource/'
 RESOURCE_PLUGIN_DIR = RESOURCE_DIR + 'CustomLog/Plugin/'
@@ -50,12 +54,16 @@ def init_vars(Ensure, CustomLogObjects):
     new_customlogs=[]
     if CustomLogObjects is not None :
         for customlog in CustomLogObjects:
-            if 'value' in dir(customlog['LogName']):
-                customlog['LogName']=customlog['LogName'].value
+            # nested values arrive plain from client.py; tests may still
+            # pass MI_Value objects
+            for key in list(customlog.keys()):
+                if 'value' in dir(customlog[key]):
+                    customlog[key] = customlog[key].value
+            if customlog['LogName'] is not None:
                 new_filepaths=[]
                
-                if 'value' in dir(customlog['FilePath']):    
-                    for filepath in customlog['FilePath'].value:
+                if customlog['FilePath'] is not None:
+                    for filepath in customlog['FilePath']:
                         if filepath is not None and len(filepath) > 0:
                             new_filepaths.append(filepath)
 
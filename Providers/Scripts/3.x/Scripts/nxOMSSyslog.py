@@ -13,6 +13,10 @@ nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 
 LG = nxDSCLog.DSCLog
 
+# init_vars keeps the syslog configuration to rewrite in the module
+# global conf_path, and Set_Marshall rewrites that file whole.
+THREAD_SAFE = False
+
 rsyslog_conf_path = '/etc/rsyslog.conf'
 rsyslog_inc_conf_path = '/etc/rsyslog.d/95-omsagent.conf'
 syslog_ng_conf_path = '/etc/syslog-ng/syslog-ng.conf'
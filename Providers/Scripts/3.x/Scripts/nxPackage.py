@@ -30,6 +30,10 @@ nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 helperlib = imp.load_source('helperlib', '../helperlib.py')
 LG = nxDSCLog.DSCLog
 
+# dpkg, rpm and zypper hold a system wide lock, so a second package
+# request running alongside would fail rather than wait.
+THREAD_SAFE = False
+
 # [ClassVersion("1.0.0"),FriendlyName("nxPackage"),SupportsInventory()]
 # class MSFT_nxPackageResource : OMI_BaseResource
 # {
@@ -146,6 +150,14 @@ def Inventory_Marshall(Ensure, PackageManager, Name, FilePath, PackageGroup, Arg
         Ensure, PackageManager, Name, FilePath, PackageGroup, Arguments, ReturnCode)
     retval, pkgs = GetAll(Ensure, PackageManager, Name,
                           FilePath, PackageGroup, Arguments, ReturnCode)
+    Inventory = protocol.MI_InstanceA(InventoryInstances(pkgs, PackageManager, Arguments))
+    retd = {}
+    retd["__Inventory"] = Inventory
+    return retval, retd
+
+
+def InventoryInstances(pkgs, PackageManager, Arguments):
+    # converted one package at a time while the response is written
     for p in pkgs:
         p['Ensure'] = protocol.MI_String('present')
         p['PackageManager'] = protocol.MI_String(PackageManager)
@@ -161,10 +173,7 @@ def Inventory_Marshall(Ensure, PackageManager, Name, FilePath, PackageGroup, Arg
         p['Size'] = protocol.MI_Uint32(int(p['Size']))
         p['Version'] = protocol.MI_String(p['Version'])
         p['Installed'] = protocol.MI_Boolean(True)
-    Inventory = protocol.MI_InstanceA(pkgs)
-    retd = {}
-    retd["__Inventory"] = Inventory
-    return retval, retd
+        yield p
 
 #
 # Begin user defined DSC functions
@@ -8,8 +8,6 @@ from contextlib import contextmanager
 
 import subprocess
 import shutil
-import pwd
-import grp
 import os
 import sys
 import stat
@@ -18,8 +16,13 @@ import imp
 import codecs
 protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
+idcache = imp.load_source('idcache', '../idcache.py')
 LG = nxDSCLog.DSCLog
 
+# The scripts are started with a preexec_fn that drops to User, and
+# subprocess does not support preexec_fn with other threads running.
+THREAD_SAFE = False
+
 # 	[Key] string GetScript;
 # 	[Key] string SetScript;
 # 	[Key] string TestScript;
@@ -157,7 +160,7 @@ def WriteFile(path, contents):
 def GetUID(User):
     uid = None
     try:
-        uid = pwd.getpwnam(User)[2]
+        uid = idcache.getpwnam(User)[2]
     except KeyError:
         Print('ERROR: Unknown UID for ' + User, file=sys.stderr)
         LG().Log('ERROR', 'ERROR: Unknown UID for ' + User)
@@ -167,7 +170,7 @@ def GetUID(User):
 def GetGID(Group):
     gid = None
     try:
-        gid = grp.getgrnam(Group)[2]
+        gid = idcache.getgrnam(Group)[2]
     except KeyError:
         Print('ERROR: Unknown GID for ' + Group, file=sys.stderr)
         LG().Log('ERROR', 'ERROR: Unknown GID for ' + Group)
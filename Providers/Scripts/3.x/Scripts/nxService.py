@@ -21,6 +21,10 @@ nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 helperlib = imp.load_source('helperlib', '../helperlib.py')
 LG = nxDSCLog.DSCLog
 
+# chkconfig, update-rc.d and systemctl enable rewrite the same init
+# links and unit symlinks, so two nxService requests must not overlap.
+THREAD_SAFE = False
+
 # [ClassVersion("1.0.0"),FriendlyName("nxService"), SupportsInventory()]
 # class MSFT_nxServiceResource : OMI_BaseResource
 # {
@@ -112,7 +116,15 @@ def Inventory_Marshall(Name, Controller, Enabled, State):
     sc.FilterEnabled = FilterEnabled
     if not GetAll(sc):
         return -1, {"__Inventory": {}}
-    for srv in sc.services_list:
+    Inventory = protocol.MI_InstanceA(InventoryInstances(sc.services_list))
+    retd = {}
+    retd["__Inventory"] = Inventory
+    return 0, retd
+
+
+def InventoryInstances(services_list):
+    # converted one service at a time while the response is written
+    for srv in services_list:
         srv['Name'] = protocol.MI_String(srv['Name'])
         srv['Controller'] = protocol.MI_String(srv['Controller'])
         srv['Enabled'] = protocol.MI_Boolean(srv['Enabled'])
@@ -123,10 +135,7 @@ def Inventory_Marshall(Name, Controller, Enabled, State):
         srv['Path'] = protocol.MI_String(srv['Path'])
         srv['Description'] = protocol.MI_String(srv['Description'])
         srv['Runlevels'] = protocol.MI_String(srv['Runlevels'])
-    Inventory = protocol.MI_InstanceA(sc.services_list)
-    retd = {}
-    retd["__Inventory"] = Inventory
-    return 0, retd
+        yield srv
 
 #
 # Begin user defined DSC functions
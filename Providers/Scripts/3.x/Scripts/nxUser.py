@@ -14,8 +14,14 @@ import fnmatch
 protocol = imp.load_source('protocol', '../protocol.py')
 nxDSCLog = imp.load_source('nxDSCLog', '../nxDSCLog.py')
 helperlib = imp.load_source('helperlib', '../helperlib.py')
+idcache = imp.load_source('idcache', '../idcache.py')
 LG = nxDSCLog.DSCLog
 
+# useradd, usermod and userdel lock /etc/passwd and /etc/group, which
+# nxGroup changes as well; both modules take the nxUser lock.
+THREAD_SAFE = False
+THREAD_LOCK = 'nxUser'
+
 # [ClassVersion("1.0.0"), FriendlyName("nxUser"),SupportsInventory()]
 # class MSFT_nxUserResource : OMI_BaseResource
 # {
@@ -67,6 +73,9 @@ def Set_Marshall(UserName, Ensure, FullName, Description, Password, Disabled, Pa
                   Disabled, PasswordChangeRequired, HomeDirectory, GroupID)
     retval = Set(UserName, Ensure, FullName, Description, Password,
                  Disabled, PasswordChangeRequired, HomeDirectory, GroupID)
+    # the providers that look owners up must not go on with the user
+    # this Set replaced, nor miss the one it created
+    idcache.clear()
     return retval
 
 
@@ -114,6 +123,14 @@ def Inventory_Marshall(UserName, Ensure, FullName, Description, Password, Disabl
                   Disabled, PasswordChangeRequired, HomeDirectory, GroupID)
     (retval, Inventory) = GetInventory(
         UserName, Ensure, FullName, Description, Password, Disabled, PasswordChangeRequired, HomeDirectory, GroupID)
+    Inventory = protocol.MI_InstanceA(InventoryInstances(Inventory))
+    retd = {}
+    retd["__Inventory"] = Inventory
+    return retval, retd
+
+
+def InventoryInstances(Inventory):
+    # converted one user at a time while the response is written
     for d in Inventory:
         d['UserName'] = protocol.MI_String(d['UserName'])
         d['Ensure'] = protocol.MI_String('Present')
@@ -125,11 +142,7 @@ def Inventory_Marshall(UserName, Ensure, FullName, Description, Password, Disabl
         d['HomeDirectory'] = protocol.MI_String(d['HomeDirectory'])
         d['GroupID'] = protocol.MI_String(d['GroupID'])
         d['UserID'] = protocol.MI_String(d['UserID'])
-        d = protocol.MI_Instance(d)
-    Inventory = protocol.MI_InstanceA(Inventory)
-    retd = {}
-    retd["__Inventory"] = Inventory
-    return retval, retd
+        yield d
 
 
 ############################################################
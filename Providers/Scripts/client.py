@@ -3,17 +3,62 @@
 #============================================================================
 import os
 import protocol
+import requeststats
 import socket
 import struct
 import sys
 import traceback
 import ctypes
+import errno
+import select
+import signal
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 DO_TRACE = True
 DO_VERBOSE_TRACE  = False
 ScriptsDir = "<DSC_SCRIPT_PATH>"
 VarDir = "<PYTHON_PID_DIR>"
 
+# Persistent host mode (client.py --host [control socket path]).
+# The host keeps a pool of pre-forked workers that already have the
+# provider modules imported.  OMI hands each new session socket to the
+# host over the control socket (SCM_RIGHTS) instead of exec'ing a fresh
+# interpreter, and the host passes it on to an idle worker.
+HOST_MIN_WORKERS = 1
+HOST_MAX_WORKERS = 4
+HOST_IDLE_TIMEOUT_SEC = 300
+HOST_MAX_REQUESTS = 100
+HOST_SOCKET_NAME = 'dsc_python_host.sock'
+HOST_PID_NAME = 'dsc_python_host.pid'
+
+# Request op codes, matching PythonProvider.hpp.  A BATCH frame carries
+# an int32 count followed by that many (op, class name, values) requests
+# and is answered with the count followed by one ordinary response per
+# request, in order.
+OP_NAMES = ('Test','Set','Get','Inventory')
+OP_BATCH = 4
+
+# Multiplexed requests.  A MUX frame is a uint32 request id followed by an
+# ordinary request.  It is queued to a pool of MUX_MAX_WORKERS threads and
+# answered, whenever it finishes, with the request id followed by the
+# ordinary response, so responses may come back out of order.  Frames
+# without the MUX op are answered in order once the multiplexed requests
+# in flight are done.  The requests of a provider module take a per-module
+# lock, or the lock named by THREAD_LOCK when several modules share state,
+# unless the module has been found safe to run on several threads at once
+# and sets THREAD_SAFE = True.
+OP_MUX = 5
+MUX_MAX_WORKERS = 4
+MUX_QUEUE_SIZE = 16
+
+# Request measurements (see requeststats.py); set up with the pid file.
+stats = None
+
 def trace (text):
     if DO_TRACE:
         sys.stdout.write (text + '\n')
@@ -34,18 +79,60 @@ def read_uchar (fd):
     return val
 
 
+def read_int (fd):
+    buf = fd.recv (4)
+    return struct.unpack ('@i', buf)[0]
+
+
 def read_request (fd):
     verbose_trace ('<read_request>')
     op_type = read_uchar (fd)
     if op_type == None:
         return None
+    return read_request_op (fd, op_type)
+
+
+def read_request_op (fd, op_type):
     verbose_trace ('  op_type: ' + str(op_type))
+    if op_type == OP_BATCH:
+        return (op_type, '', read_batch (fd))
+    if op_type == OP_MUX:
+        return read_mux (fd)
+    return read_request_body (fd, op_type)
+
+
+def read_request_body (fd, op_type):
     op_name = protocol.read_string (fd)
     verbose_trace ('  op_name: "'+ op_name +'"')
-    d = protocol.read_values (fd)
+    d = protocol.read_plain_values (fd)
     verbose_trace ('</read_request>')
     return (op_type, op_name, d)
 
+
+def read_batch (fd):
+    count = read_int (fd)
+    trace ('batch of ' + str(count) + ' requests')
+    reqs = []
+    for i in range (count):
+        op_type = read_uchar (fd)
+        if op_type == None:
+            raise socket.error ('connection closed inside a batch')
+        reqs.append (read_request_body (fd, op_type))
+    return reqs
+
+
+def read_mux (fd):
+    req_id = struct.unpack ('@I', fd.recv (4))[0]
+    op_type = read_uchar (fd)
+    if op_type == None:
+        raise socket.error ('connection closed inside a multiplexed request')
+    if op_type == OP_BATCH:
+        req = (op_type, '', read_batch (fd))
+    else:
+        req = read_request_body (fd, op_type)
+    verbose_trace ('  request id: ' + str(req_id))
+    return (OP_MUX, req_id, req)
+
     
 def write_int (fd, val):
     verbose_trace ('<write_int>')
@@ -71,38 +158,128 @@ def write_failed (s, fail_code, text=''):
 
 
 def translate_input (d):
-    """ This method is a convenience for a protocol chnage and should be
-        removed when the handlers are updated."""
+    """ Requests are decoded with protocol.read_plain_values, so the values
+        are already the plain Python values the handlers take.  Only the
+        keys are converted, as python 2 needs str keyword names."""
     verbose_trace ('<translate_input>')
-    oldStyleD = dict ()
     if sys.version > '2.9':
-        for key, value in d.items():
-            if type(key) != str:
-                key=str(key)
-            if hasattr(value,'value') and hasattr(value.value,'value') :
-                oldStyleD[key] = value.value.value
-            else :
-                oldStyleD[key] = value.value
-    else:
-        for key, value in d.iteritems():
-            if type(key) != str:
-                key=str(key)
-            if hasattr(value,'value') and hasattr(value.value,'value') :
-                oldStyleD[key] = value.value.value
-            else:
-                oldStyleD[key] = value.value
+        verbose_trace ('</translate_input>')
+        return d
+    oldStyleD = dict ()
+    for key, value in d.iteritems():
+        if type(key) != str:
+            key=str(key)
+        oldStyleD[key] = value
     verbose_trace ('</translate_input>')
     return oldStyleD
 
 
+# Provider modules are imported the first time a request names them
+# rather than all at start up.  A provider that fails to import only
+# fails its own requests; the error is remembered in provider_errors.
+provider_modules = {}
+provider_errors = {}
+provider_locks = {}
+provider_locks_guard = threading.Lock ()
+
+def provider_names ():
+    import Scripts
+    return getattr (Scripts, '__all__', [])
+
+
+def load_provider (name):
+    if name in provider_modules:
+        return provider_modules[name]
+    if name in provider_errors:
+        return None
+    if name not in provider_names ():
+        provider_errors[name] = 'Unable to find module: ' + name
+        sys.stderr.write (provider_errors[name])
+        return None
+    try:
+        the_module = __import__ ('Scripts.' + name, globals (), locals (), [name])
+    except:
+        provider_errors[name] = 'Unable to import module: ' + name + ': ' + \
+            repr (sys.exc_info()[1])
+        sys.stderr.write (provider_errors[name] + '\n')
+        traceback.print_tb (sys.exc_info()[2])
+        return None
+    provider_modules[name] = the_module
+    return the_module
+
+
+def provider_lock (name):
+    """ Returns the lock a request for module name has to hold, or None
+        when the module declares THREAD_SAFE = True."""
+    the_module = load_provider (name)
+    if the_module is None or getattr (the_module, 'THREAD_SAFE', False):
+        return None
+    key = getattr (the_module, 'THREAD_LOCK', name)
+    provider_locks_guard.acquire ()
+    try:
+        if key not in provider_locks:
+            provider_locks[key] = threading.Lock ()
+        lock = provider_locks[key]
+    finally:
+        provider_locks_guard.release ()
+    return lock
+
+
+def preload_providers ():
+    for name in provider_names ():
+        load_provider (name)
+
+
+def flush_log ():
+    # providers share the nxDSCLog module they load from ../nxDSCLog.py;
+    # it buffers its lines, and a forked host worker exits without
+    # running atexit
+    log = sys.modules.get ('nxDSCLog')
+    if log is not None and 'flush' in log.__dict__:
+        log.flush ()
+
+
+events = None
+
+def event_log ():
+    """ nxDSCLog.DSCEventLog for the resource events, or None when
+        nxDSCLog cannot be loaded."""
+    global events
+    if events is None:
+        try:
+            log = sys.modules.get ('nxDSCLog')
+            if log is None:
+                import imp
+                log = imp.load_source ('nxDSCLog', '../nxDSCLog.py')
+            events = log.DSCEventLog ()
+        except:
+            sys.stderr.write ('Unable to start resource events: ' +
+                              repr (sys.exc_info()[1]) + '\n')
+            events = False
+    if events is False:
+        return None
+    return events
+
+
+def start_event (req):
+    log = event_log ()
+    if log is None or len (OP_NAMES) <= req[0]:
+        return None
+    return log.Start (req[1], OP_NAMES[req[0]], req[2])
+
+
+def end_event (event, outcome):
+    if event is not None:
+        event_log ().End (event, outcome)
+
+
 def callMOF (req):
     oldStyleDict = translate_input (req[2])
     trace ('MOF=' + repr ((req[0], req[1], oldStyleDict)))
-    op = ('Test','Set','Get','Inventory')
-    if req[1] not in globals().keys():
-        sys.stderr.write('Unable to find module: ' + req[1])
+    op = OP_NAMES
+    the_module = load_provider (req[1])
+    if the_module is None:
         return None
-    the_module = globals ()[req[1]]
     method_name = op[req[0]] + '_Marshall'
     if not method_name in the_module.__dict__.keys():
         sys.stderr.write ('Unable to find method: ' + method_name)
@@ -113,40 +290,533 @@ def callMOF (req):
     return ret
 
     
+def handle_batch (fd, batch):
+    trace ('<handle_batch>')
+    write_int (fd, len (batch[2]))
+    for req in batch[2]:
+        if req[0] >= len (OP_NAMES):
+            write_failed (fd, 1, 'Unsupported op in batch: ' + str(req[0]))
+            continue
+        # each response is built on its own so that a resource that raises
+        # part way through leaves a clean failure entry and the rest of the
+        # batch still gets answered.  Only a response larger than
+        # WRITE_FLUSH_SIZE is passed on before it is complete; a streamed
+        # Inventory is spooled whole before any of it is, so its generator
+        # cannot fail after that.
+        out = protocol.SocketWriter (fd, protocol.WRITE_FLUSH_SIZE)
+        try:
+            handle_request (out, req)
+        except socket.error:
+            raise
+        except:
+            sys.stderr.write ('\nException: ')
+            sys.stderr.write (repr(sys.exc_info())+'\n')
+            traceback.print_tb (sys.exc_info()[2])
+            if 0 < out.sent:
+                # what was sent cannot be taken back
+                raise socket.error ('response to ' + repr (req) +
+                                    ' failed after it was partly sent')
+            out = protocol.SocketWriter (fd)
+            write_failed (out, 1, 'Error occurred processing '+ repr (req))
+        out.flush ()
+    trace ('</handle_batch>')
+
+
 def handle_request (fd, req):
+    if req[0] == OP_BATCH:
+        handle_batch (fd, req)
+        return
+    # held until the response is written, as a streamed Inventory runs
+    # provider code while it is encoded
+    lock = provider_lock (req[1])
+    if lock is not None:
+        lock.acquire ()
+    try:
+        respond (fd, req)
+    finally:
+        if lock is not None:
+            lock.release ()
+
+
+def request_key (req):
+    """ (provider, op) under which a request is measured."""
+    if req[0] == OP_MUX:
+        req = req[2]
+    if req[0] == OP_BATCH:
+        return ('(batch)', 'Batch')
+    if req[0] < len (OP_NAMES):
+        return (req[1], OP_NAMES[req[0]])
+    return (req[1], str (req[0]))
+
+
+def respond (fd, req):
     trace ('<handle_request>')
-    r = callMOF (req)
-    if len (r) < 2 :
-        ret = None
-        rval = r[0]
-    else:
-        rval = r[0]
-        ret = r[1]
-    if rval == 0:
-        write_success (fd, ret)
-    else:
-        write_failed (fd,1, 'Error occurred processing '+ repr (req))
-    trace ('</handle_request>')
+    event = start_event (req)
+    outcome = 'error'
+    try:
+        start = requeststats.clock ()
+        before = fd.total
+        r = callMOF (req)
+        called = requeststats.clock ()
+        if r is None:
+            write_failed (fd, 1, 'Error occurred processing ' + repr (req))
+            record_call (req, start, called, fd.total - before)
+            trace ('</handle_request>')
+            return
+        if len (r) < 2 :
+            ret = None
+            rval = r[0]
+        else:
+            rval = r[0]
+            ret = r[1]
+        if rval == 0:
+            write_success (fd, ret)
+            outcome = 'ok'
+        else:
+            write_failed (fd,1, 'Error occurred processing '+ repr (req))
+            outcome = 'failed'
+        record_call (req, start, called, fd.total - before)
+        trace ('</handle_request>')
+    finally:
+        end_event (event, outcome)
 
 
+def record_call (req, start, called, nbytes):
+    if stats is not None:
+        provider, op = request_key (req)
+        stats.record_call (provider, op, called - start,
+                           requeststats.clock () - called, nbytes)
 
-def main (argv):
-    default_timeout_sec = 85
-    socket.setdefaulttimeout(default_timeout_sec)
-    fd = socket.fromfd (int (argv[1]), socket.AF_UNIX, socket.SOCK_STREAM)
+
+class MuxWriter (protocol.SocketWriter):
+    """ SocketWriter for one MUX response.  It takes lock the first time it
+        sends and holds it until release (), so that a response larger
+        than limit goes to the socket in pieces that no other response is
+        sent between."""
+
+    def __init__ (self, sock, lock, limit):
+        protocol.SocketWriter.__init__ (self, sock, limit)
+        self.lock = lock
+        self.locked = False
+
+    def flush (self):
+        if 0 < len (self.chunks) and not self.locked:
+            self.lock.acquire ()
+            self.locked = True
+        protocol.SocketWriter.flush (self)
+
+    def release (self):
+        if self.locked:
+            self.locked = False
+            self.lock.release ()
+
+
+class Multiplexer:
+    """ Runs MUX requests on a pool of threads.  Each response is written
+        to its own MuxWriter and sent as soon as its request is done, or
+        from when it reaches WRITE_FLUSH_SIZE bytes, under write_lock."""
+
+    def __init__ (self, sock, workers):
+        self.sock = sock
+        self.requests = queue.Queue (MUX_QUEUE_SIZE)
+        self.write_lock = threading.Lock ()
+        self.idle = threading.Condition ()
+        self.in_flight = 0
+        self.threads = []
+        for i in range (workers):
+            t = threading.Thread (target = self.work)
+            t.daemon = True
+            t.start ()
+            self.threads.append (t)
+
+    def submit (self, req_id, req):
+        # blocks while MUX_QUEUE_SIZE requests are already waiting
+        self.idle.acquire ()
+        self.in_flight += 1
+        self.idle.release ()
+        self.requests.put ((req_id, req))
+
+    def work (self):
+        while True:
+            item = self.requests.get ()
+            if item is None:
+                break
+            try:
+                self.respond (item[0], item[1])
+            finally:
+                self.idle.acquire ()
+                self.in_flight -= 1
+                if self.in_flight == 0:
+                    self.idle.notify ()
+                self.idle.release ()
+
+    def respond (self, req_id, req):
+        trace ('<mux request ' + str(req_id) + '>')
+        out = MuxWriter (self.sock, self.write_lock, protocol.WRITE_FLUSH_SIZE)
+        try:
+            try:
+                out.sendall (struct.pack ('@I', req_id))
+                try:
+                    handle_request (out, req)
+                except:
+                    sys.stderr.write ('\nException: ')
+                    sys.stderr.write (repr(sys.exc_info())+'\n')
+                    traceback.print_tb (sys.exc_info()[2])
+                    if 0 < out.sent:
+                        # the response cannot be finished, and nothing
+                        # after it could be read; end the session
+                        self.sock.shutdown (socket.SHUT_RDWR)
+                        return
+                    out.release ()
+                    out = MuxWriter (self.sock, self.write_lock, None)
+                    out.sendall (struct.pack ('@I', req_id))
+                    write_failed (out, 1, 'Error occurred processing '+ repr (req))
+                out.flush ()
+            except socket.error:
+                sys.stderr.write ('exception encountered')
+        finally:
+            out.release ()
+        if stats is not None:
+            stats.maybe_dump ()
+        trace ('</mux request ' + str(req_id) + '>')
+
+    def wait (self):
+        self.idle.acquire ()
+        while 0 < self.in_flight:
+            self.idle.wait ()
+        self.idle.release ()
+
+    def close (self):
+        self.wait ()
+        for t in self.threads:
+            self.requests.put (None)
+        for t in self.threads:
+            t.join ()
+
+
+def serve (fd):
+    # requests are read through a buffer and each response is collected
+    # and sent with one sendall, or in WRITE_FLUSH_SIZE pieces when it is
+    # larger than that
+    reader = protocol.SocketReader (fd)
+    writer = protocol.SocketWriter (fd, protocol.WRITE_FLUSH_SIZE)
+    mux = None
     read = 1
     out = ''
     while 0 < read:
         try:
-            req = read_request (fd)
+            req = None
+            op_type = read_uchar (reader)
+            if op_type != None:
+                # timed from the op byte so the wait for the request is
+                # not counted
+                start = requeststats.clock ()
+                before = reader.total - 1
+                req = read_request_op (reader, op_type)
+                if stats is not None:
+                    provider, op = request_key (req)
+                    stats.record_decode (provider, op,
+                                         requeststats.clock () - start,
+                                         reader.total - before)
             if req == None:
                 read = -1
+            elif req[0] == OP_MUX:
+                if mux is None:
+                    mux = Multiplexer (fd, MUX_MAX_WORKERS)
+                mux.submit (req[1], req[2])
             else:
                 trace ('Main: request len is '+str(len (req)))
-                handle_request (fd, req)
+                if mux is not None:
+                    mux.wait ()
+                handle_request (writer, req)
+                writer.flush ()
+                if stats is not None:
+                    stats.maybe_dump ()
         except socket.error:
             read = -1;
             sys.stderr.write('exception encountered')
+    if mux is not None:
+        mux.close ()
+    if stats is not None:
+        stats.dump ()
+    flush_log ()
+
+
+def main (argv):
+    default_timeout_sec = 85
+    socket.setdefaulttimeout(default_timeout_sec)
+    fd = socket.fromfd (int (argv[1]), socket.AF_UNIX, socket.SOCK_STREAM)
+    serve (fd)
+
+
+def host_supported ():
+    return hasattr (socket.socket, 'sendmsg') and \
+        hasattr (socket.socket, 'recvmsg') and hasattr (socket, 'SCM_RIGHTS')
+
+
+def send_fd (sock, tag, sessfd):
+    fds = struct.pack ('@i', sessfd)
+    sock.sendmsg ([tag.encode ('ascii')],
+                  [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+
+
+def recv_fd (sock):
+    """ Returns (tag, fd).  tag is None when the peer closed the socket
+        and fd is None when no descriptor came with the message."""
+    size = struct.calcsize ('@i')
+    msg, ancdata, flags, addr = sock.recvmsg (1, socket.CMSG_LEN (size))
+    if len (msg) < 1:
+        return (None, None)
+    sessfd = None
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            count = len (data) // size
+            fds = struct.unpack ('@%di' % count, data[:count * size])
+            if 0 < count:
+                sessfd = fds[0]
+            for extra in fds[1:]:
+                os.close (extra)
+    return (msg.decode ('ascii'), sessfd)
+
+
+def host_worker (ctl):
+    """ Worker loop: wait for a session fd from the host, serve it to the
+        end and report back: 'D' when it is ready for another session, 'X'
+        after the HOST_MAX_REQUESTS-th, when it exits."""
+    served = 0
+    while served < HOST_MAX_REQUESTS:
+        try:
+            tag, sessfd = recv_fd (ctl)
+        except socket.error:
+            break
+        if tag is None:
+            break
+        if sessfd is None:
+            continue
+        fd = socket.fromfd (sessfd, socket.AF_UNIX, socket.SOCK_STREAM)
+        os.close (sessfd)
+        fd.settimeout (85)
+        try:
+            try:
+                serve (fd)
+            except:
+                sys.stderr.write ('\nException: ')
+                sys.stderr.write (repr(sys.exc_info())+'\n')
+                traceback.print_tb (sys.exc_info()[2])
+        finally:
+            fd.close ()
+        served += 1
+        if served < HOST_MAX_REQUESTS:
+            done = 'D'
+        else:
+            done = 'X'
+        try:
+            ctl.sendall (done.encode ('ascii'))
+        except socket.error:
+            break
+    ctl.close ()
+
+
+class HostWorker:
+    def __init__ (self, pid, ctl):
+        self.pid = pid
+        self.ctl = ctl
+        self.busy = False
+        self.idle_since = time.time ()
+
+
+class Host:
+    def __init__ (self, path):
+        self.path = path
+        self.workers = []
+        self.pending = []
+        self.running = True
+
+    def listen (self):
+        if os.path.exists (self.path):
+            os.unlink (self.path)
+        old_mask = os.umask (int ('077', 8))
+        try:
+            self.listener = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+            self.listener.bind (self.path)
+        finally:
+            os.umask (old_mask)
+        self.listener.listen (16)
+
+    def spawn (self):
+        parent, child = socket.socketpair (socket.AF_UNIX, socket.SOCK_STREAM)
+        pid = os.fork ()
+        if pid == 0:
+            # drop everything that belongs to the host or to other sessions
+            parent.close ()
+            self.listener.close ()
+            for w in self.workers:
+                w.ctl.close ()
+            for sessfd in self.pending:
+                os.close (sessfd)
+            signal.signal (signal.SIGTERM, signal.SIG_DFL)
+            status = 0
+            try:
+                try:
+                    host_worker (child)
+                except:
+                    status = 1
+                    sys.stderr.write ('\nException: ')
+                    sys.stderr.write (repr(sys.exc_info())+'\n')
+                    traceback.print_tb (sys.exc_info()[2])
+            finally:
+                os._exit (status)
+        child.close ()
+        w = HostWorker (pid, parent)
+        self.workers.append (w)
+        trace ('host: started worker ' + str(pid))
+        return w
+
+    def retire (self, w):
+        if w in self.workers:
+            self.workers.remove (w)
+        w.ctl.close ()
+
+    def reap (self):
+        while True:
+            try:
+                pid, status = os.waitpid (-1, os.WNOHANG)
+            except OSError:
+                return
+            if pid == 0:
+                return
+            for w in self.workers[:]:
+                if w.pid == pid:
+                    trace ('host: worker ' + str(pid) + ' exited')
+                    self.retire (w)
+
+    def accept (self):
+        conn, addr = self.listener.accept ()
+        conn.settimeout (5)
+        try:
+            try:
+                tag, sessfd = recv_fd (conn)
+            except socket.error:
+                return
+            if sessfd is None:
+                return
+            try:
+                conn.sendall ('A'.encode ('ascii'))
+            except socket.error:
+                # the provider serves the session itself when it gets no
+                # ack, so the host must not
+                os.close (sessfd)
+                return
+            self.pending.append (sessfd)
+        finally:
+            conn.close ()
+
+    def dispatch (self):
+        while 0 < len (self.pending):
+            w = None
+            for candidate in self.workers:
+                if not candidate.busy:
+                    w = candidate
+                    break
+            if w is None:
+                if len (self.workers) >= HOST_MAX_WORKERS:
+                    return
+                w = self.spawn ()
+            sessfd = self.pending.pop (0)
+            try:
+                send_fd (w.ctl, 'S', sessfd)
+                w.busy = True
+                os.close (sessfd)
+            except socket.error:
+                self.pending.insert (0, sessfd)
+                self.retire (w)
+
+    def worker_ready (self, w):
+        try:
+            buf = w.ctl.recv (16)
+        except socket.error:
+            buf = ''
+        if len (buf) < 1 or buf[-1:] == 'X'.encode ('ascii'):
+            # the worker is recycling itself or died; a session sent to it
+            # now would be lost
+            self.retire (w)
+        else:
+            w.busy = False
+            w.idle_since = time.time ()
+
+    def trim (self):
+        now = time.time ()
+        for w in self.workers[:]:
+            if len (self.workers) <= HOST_MIN_WORKERS:
+                break
+            if not w.busy and HOST_IDLE_TIMEOUT_SEC < now - w.idle_since:
+                trace ('host: retiring idle worker ' + str(w.pid))
+                self.retire (w)
+
+    def stop (self, signum, frame):
+        self.running = False
+
+    def run (self):
+        self.listen ()
+        signal.signal (signal.SIGTERM, self.stop)
+        signal.signal (signal.SIGINT, self.stop)
+        while len (self.workers) < HOST_MIN_WORKERS:
+            self.spawn ()
+        try:
+            while self.running:
+                self.reap ()
+                self.dispatch ()
+                while len (self.workers) < HOST_MIN_WORKERS:
+                    self.spawn ()
+                watch = [self.listener]
+                for w in self.workers:
+                    watch.append (w.ctl)
+                try:
+                    ready = select.select (watch, [], [], 1)[0]
+                except select.error:
+                    if sys.exc_info()[1].args[0] == errno.EINTR:
+                        continue
+                    raise
+                for r in ready:
+                    if r is self.listener:
+                        self.accept ()
+                    else:
+                        for w in self.workers[:]:
+                            if w.ctl is r:
+                                self.worker_ready (w)
+                self.trim ()
+        finally:
+            self.listener.close ()
+            if os.path.exists (self.path):
+                os.unlink (self.path)
+            for w in self.workers[:]:
+                try:
+                    os.kill (w.pid, signal.SIGTERM)
+                except OSError:
+                    pass
+                self.retire (w)
+            for sessfd in self.pending:
+                os.close (sessfd)
+            self.pending = []
+
+
+def host_main (argv, pid_path):
+    if not host_supported ():
+        sys.stderr.write ('Host mode requires socket.sendmsg/recvmsg (python 3.3 or later)\n')
+        return 1
+    if 2 < len (argv):
+        path = argv[2]
+    else:
+        path = pid_path + '/' + HOST_SOCKET_NAME
+    # import every provider once so the forked workers start warm
+    preload_providers ()
+    trace ('host: listening on ' + path)
+    Host (path).run ()
+    return 0
+
+
+def is_host_mode (argv):
+    return 1 < len (argv) and argv[1] == '--host'
 
 ##############################
 try:
@@ -157,7 +827,12 @@ try:
         
         if not os.path.isdir(pid_path):
             os.system('mkdir -p ' + pid_path)
-        pid_file=pid_path+'/dsc_python_client.pid'
+        stats = requeststats.RequestStats (pid_path + '/' +
+                                           requeststats.STATS_NAME)
+        if is_host_mode (sys.argv):
+            pid_file=pid_path+'/'+HOST_PID_NAME
+        else:
+            pid_file=pid_path+'/dsc_python_client.pid'
         try:        
             F = open(pid_file,'w')
             F.write(str(os.getpid()) + "\n")
@@ -176,10 +851,11 @@ try:
         else:
             trace (ScriptsDir + '/3.x')
             os.chdir (ScriptsDir + '/3.x')
-        from Scripts import *
-        
         if __name__ == '__main__':
-            main (sys.argv)
+            if is_host_mode (sys.argv):
+                host_main (sys.argv, pid_path)
+            else:
+                main (sys.argv)
     
     
     except:
@@ -189,5 +865,6 @@ try:
         sys.stderr.write ('\n')
 
 finally:
-    sys.stderr.write ('Exiting - closing socket\n' )
-    (socket.fromfd(int (sys.argv[1]), socket.AF_UNIX, socket.SOCK_STREAM)).close()
+    if not is_host_mode (sys.argv):
+        sys.stderr.write ('Exiting - closing socket\n' )
+        (socket.fromfd(int (sys.argv[1]), socket.AF_UNIX, socket.SOCK_STREAM)).close()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#============================================================================
+# Copyright (c) Microsoft Corporation. All rights reserved. See license.txt for license information.
+#============================================================================
+"""
+Ranks the resources in the event files nxDSCLog.DSCEventLog writes, one
+JSON object per provider request, by the time spent on them.
+
+    eventsummary.py [-n TOP] [-o OP] [-p PROVIDER] [event file ...]
+
+Without files, the current event file and its rotated copies are read.
+"""
+import os
+import sys
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    json = None
+
+VarDir = "<PYTHON_PID_DIR>"
+CONFIG_SYSCONFDIR_DSC = "<CONFIG_SYSCONFDIR_DSC>"
+# as nxDSCLog.events_file_path
+EVENTS_SUFFIX = '_events.jsonl'
+
+
+def default_paths():
+    if CONFIG_SYSCONFDIR_DSC == "omsconfig":
+        path = "/var/opt/microsoft/omsconfig/omsconfig" + EVENTS_SUFFIX
+    else:
+        path = VarDir + "/log/dsc" + EVENTS_SUFFIX
+    paths = []
+    i = 1
+    while os.path.exists(path + '.' + str(i)):
+        paths.insert(0, path + '.' + str(i))
+        i += 1
+    if os.path.exists(path):
+        paths.append(path)
+    return paths
+
+
+class ResourceTotals:
+    def __init__(self, resource):
+        self.resource = resource
+        self.calls = 0
+        self.ops = {}
+        self.total = 0.0
+        self.max = 0.0
+        self.failures = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.subprocesses = 0
+
+    def add(self, event):
+        duration = event.get('duration') or 0.0
+        self.calls += 1
+        op = event.get('op', '?')
+        self.ops[op] = self.ops.get(op, 0) + 1
+        self.total += duration
+        if self.max < duration:
+            self.max = duration
+        if event.get('outcome') != 'ok':
+            self.failures += 1
+        self.bytes_read += event.get('bytes_read') or 0
+        self.bytes_written += event.get('bytes_written') or 0
+        self.subprocesses += event.get('subprocesses') or 0
+
+
+def read_events(paths, op=None, provider=None):
+    """ Totals by resource of the events in paths, and the number of
+        lines that could not be read."""
+    totals = {}
+    bad = 0
+    for path in paths:
+        F = open(path, 'r')
+        try:
+            for line in F:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # a line cut short by rotation or a crash
+                    bad += 1
+                    continue
+                if op is not None and event.get('op') != op:
+                    continue
+                if provider is not None and event.get('provider') != provider:
+                    continue
+                resource = event.get('resource', '?')
+                if resource not in totals:
+                    totals[resource] = ResourceTotals(resource)
+                totals[resource].add(event)
+        finally:
+            F.close()
+    return totals, bad
+
+
+def format_bytes(val):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if val < 1024:
+            return '%d%s' % (val, unit)
+        val = val // 1024
+    return '%dTB' % val
+
+
+def summarise(totals, top, out=sys.stdout):
+    ranked = list(totals.values())
+    ranked.sort(key=lambda t: t.total, reverse=True)
+    out.write('%10s %9s %6s %9s %5s %8s %8s %6s  %s\n' %
+              ('total', 'max', 'calls', 'mean', 'fail', 'read',
+               'written', 'procs', 'resource (ops)'))
+    for t in ranked[:top]:
+        ops = list(t.ops.items())
+        ops.sort()
+        out.write('%9.2fs %8.2fs %6d %8.3fs %5d %8s %8s %6d  %s (%s)\n' %
+                  (t.total, t.max, t.calls, t.total / t.calls, t.failures,
+                   format_bytes(t.bytes_read), format_bytes(t.bytes_written),
+                   t.subprocesses, t.resource,
+                   ' '.join(['%s:%d' % op for op in ops])))
+
+
+def main(argv):
+    parser = OptionParser(usage='%prog [-n TOP] [-o OP] [-p PROVIDER] [event file ...]')
+    parser.add_option('-n', '--top', type='int', default=20,
+                      help='number of resources to show (default 20)')
+    parser.add_option('-o', '--op', help='only Test, Set, Get or Inventory')
+    parser.add_option('-p', '--provider', help='only this provider')
+    options, paths = parser.parse_args(argv[1:])
+    if json is None:
+        sys.stderr.write('eventsummary.py needs python 2.6 or later\n')
+        return 1
+    if len(paths) == 0:
+        paths = default_paths()
+    if len(paths) == 0:
+        sys.stderr.write('No resource events found\n')
+        return 1
+    totals, bad = read_events(paths, options.op, options.provider)
+    summarise(totals, options.top)
+    if bad:
+        sys.stderr.write('Skipped %d unreadable lines\n' % bad)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#============================================================================
+# Copyright (c) Microsoft Corporation. All rights reserved. See license.txt for license information.
+#============================================================================
+"""
+File digests for the providers that hash files (nxFile, nxFileInventory),
+by the names their Checksum property takes:
+
+    md5, sha-256   hashlib (the md5 and sha modules on python 2.4, where
+                   sha-256 is sha-1, as nxFileInventory always had it)
+    blake2b        hashlib, python 3.6 and later
+    xxh3, xxh128   the xxhash module, when it is installed; not
+                   cryptographic, and several times faster than the rest
+
+hash_file() reads a file with readinto through one BLOCK_SIZE buffer per
+thread, reused for every file that thread hashes.
+"""
+import threading
+
+try:
+    import hashlib
+    md5const = hashlib.md5
+    shaconst = hashlib.sha256
+    blake2bconst = getattr(hashlib, 'blake2b', None)
+except ImportError:
+    import md5
+    md5const = md5.md5
+    import sha
+    shaconst = sha.sha
+    blake2bconst = None
+
+try:
+    import xxhash
+    xxh3const = getattr(xxhash, 'xxh3_64', None)
+    xxh128const = getattr(xxhash, 'xxh3_128', None)
+except ImportError:
+    xxh3const = None
+    xxh128const = None
+
+try:
+    bytearray
+    memoryview
+except NameError:
+    # python 2.5 and earlier: read() a new string per block
+    bytearray = None
+    memoryview = None
+
+BLOCK_SIZE = 1048576
+
+# every name, whether or not this python has it
+CHECKSUMS = ('md5', 'sha-256', 'blake2b', 'xxh3', 'xxh128')
+
+ALGORITHMS = {'md5': md5const, 'sha-256': shaconst}
+if blake2bconst is not None:
+    ALGORITHMS['blake2b'] = blake2bconst
+if xxh3const is not None:
+    ALGORITHMS['xxh3'] = xxh3const
+if xxh128const is not None:
+    ALGORITHMS['xxh128'] = xxh128const
+
+buffers = threading.local()
+
+
+def available():
+    names = list(ALGORITHMS.keys())
+    names.sort()
+    return names
+
+
+def new(name):
+    """ A new hash object of algorithm name; ValueError if this python
+        does not have it."""
+    if name not in ALGORITHMS:
+        raise ValueError('Unknown or unavailable checksum algorithm: ' + str(name))
+    return ALGORITHMS[name]()
+
+
+def digest(name, data):
+    file_hash = new(name)
+    file_hash.update(data)
+    return file_hash.digest()
+
+
+def hash_file(path, name):
+    """ The hash object of algorithm name fed the contents of the file at
+        path.  Raises IOError or OSError if the file cannot be read and
+        ValueError for an unavailable algorithm."""
+    file_hash = new(name)
+    # unbuffered, so that readinto fills the buffer directly
+    F = open(path, 'rb', 0)
+    try:
+        if bytearray is None:
+            while 1:
+                block = F.read(BLOCK_SIZE)
+                if not block:
+                    break
+                file_hash.update(block)
+            return file_hash
+        buf = getattr(buffers, 'buf', None)
+        if buf is None:
+            buf = buffers.buf = bytearray(BLOCK_SIZE)
+            buffers.view = memoryview(buf)
+        view = buffers.view
+        while 1:
+            n = F.readinto(buf)
+            if not n:
+                break
+            if n == BLOCK_SIZE:
+                file_hash.update(buf)
+            else:
+                file_hash.update(view[:n])
+    finally:
+        F.close()
+    return file_hash
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+#============================================================================
+# Copyright (c) Microsoft Corporation. All rights reserved. See license.txt for license information.
+#============================================================================
+"""
+User and group lookups for the providers that check owners (nxFile,
+nxFileInventory, nxArchive, nxScript), kept for TTL seconds so that a
+walk of a tree asks NSS (and so LDAP or SSSD) once per uid, gid or name
+rather than several times per file.
+
+getpwuid(), getpwnam(), getgrgid() and getgrnam() behave as those of pwd
+and grp, KeyError included.  An unknown uid or gid is remembered too, as
+the owner of many files may be; an unknown name is asked again, as it
+may be the user or group a previous resource has just created.  nxUser
+and nxGroup clear() the caches after each Set.
+
+With nxIdCachePreload=true in dsc.conf, /etc/passwd and /etc/group are
+read once, on the first lookup, for hosts where NSS consults them first.
+"""
+import time
+import pwd
+import grp
+import imp
+helperlib = imp.load_source('helperlib', '../helperlib.py')
+
+TTL = 300
+MAX_ENTRIES = 8192
+PASSWD_FILE = '/etc/passwd'
+GROUP_FILE = '/etc/group'
+
+struct_passwd = getattr(pwd, 'struct_passwd', tuple)
+struct_group = getattr(grp, 'struct_group', tuple)
+
+
+class IdCache:
+    """
+    The entries lookup has returned by key, each until it expires.  When
+    MAX_ENTRIES are held, the expired ones are dropped, and all of them if
+    none has expired.
+    """
+
+    def __init__(self, lookup, keep_misses):
+        self.lookup = lookup
+        self.keep_misses = keep_misses
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.time()
+        item = self.entries.get(key)
+        if item is not None and now < item[0]:
+            self.hits += 1
+            entry = item[1]
+        else:
+            self.misses += 1
+            try:
+                entry = self.lookup(key)
+            except KeyError:
+                entry = None
+            if entry is not None or self.keep_misses:
+                self.put(key, entry, now)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def put(self, key, entry, now):
+        if len(self.entries) >= MAX_ENTRIES:
+            for k, item in list(self.entries.items()):
+                if item[0] <= now:
+                    del self.entries[k]
+            if len(self.entries) >= MAX_ENTRIES:
+                self.entries.clear()
+        self.entries[key] = (now + TTL, entry)
+
+    def clear(self):
+        self.entries.clear()
+
+
+users_by_uid = IdCache(pwd.getpwuid, True)
+users_by_name = IdCache(pwd.getpwnam, False)
+groups_by_gid = IdCache(grp.getgrgid, True)
+groups_by_name = IdCache(grp.getgrnam, False)
+caches = (users_by_uid, users_by_name, groups_by_gid, groups_by_name)
+preloaded = None
+
+
+def PreloadFromConf():
+    """
+    Whether dsc.conf has nxIdCachePreload=true.
+    """
+    path = helperlib.CONFIG_SYSCONFDIR + '/' + helperlib.CONFIG_SYSCONFDIR_DSC + '/dsc.conf'
+    try:
+        F = open(path, 'r')
+    except (IOError, OSError):
+        return False
+    try:
+        for l in F.readlines():
+            if l.startswith('nxIdCachePreload='):
+                return l.split('=')[-1].strip().lower() == 'true'
+    finally:
+        F.close()
+    return False
+
+
+def ReadEntries(path, fields):
+    """
+    The lines of path split at ':', those with fields fields, with the
+    third (the id) made an int.
+    """
+    entries = []
+    try:
+        F = open(path, 'r')
+    except (IOError, OSError):
+        return entries
+    try:
+        for l in F.readlines():
+            entry = l.rstrip('\n').split(':')
+            if len(entry) != fields or l.startswith('+') or l.startswith('-'):
+                # NIS compat entries are for NSS to expand
+                continue
+            try:
+                entry[2] = int(entry[2])
+                if fields == 7:
+                    entry[3] = int(entry[3])
+            except ValueError:
+                continue
+            entries.append(entry)
+    finally:
+        F.close()
+    return entries
+
+
+def preload(passwd_file=PASSWD_FILE, group_file=GROUP_FILE):
+    """
+    Fills the caches with the entries of passwd_file and group_file,
+    without overriding what NSS has already answered.  The first entry of
+    a duplicated uid, gid or name wins, as it does for NSS.
+    """
+    global preloaded
+    preloaded = True
+    now = time.time()
+    for entry in ReadEntries(passwd_file, 7):
+        entry = struct_passwd(tuple(entry))
+        if entry[2] not in users_by_uid.entries:
+            users_by_uid.put(entry[2], entry, now)
+        if entry[0] not in users_by_name.entries:
+            users_by_name.put(entry[0], entry, now)
+    for entry in ReadEntries(group_file, 4):
+        if entry[3]:
+            entry[3] = entry[3].split(',')
+        else:
+            entry[3] = []
+        entry = struct_group(tuple(entry))
+        if entry[2] not in groups_by_gid.entries:
+            groups_by_gid.put(entry[2], entry, now)
+        if entry[0] not in groups_by_name.entries:
+            groups_by_name.put(entry[0], entry, now)
+
+
+def lookup(cache, key):
+    global preloaded
+    if preloaded is None:
+        if PreloadFromConf():
+            preload()
+        else:
+            preloaded = False
+    return cache.get(key)
+
+
+def getpwuid(uid):
+    return lookup(users_by_uid, uid)
+
+
+def getpwnam(name):
+    return lookup(users_by_name, name)
+
+
+def getgrgid(gid):
+    return lookup(groups_by_gid, gid)
+
+
+def getgrnam(name):
+    return lookup(groups_by_name, name)
+
+
+def clear():
+    global preloaded
+    for cache in caches:
+        cache.clear()
+    preloaded = None
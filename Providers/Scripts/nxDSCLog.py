@@ -8,11 +8,45 @@ import sys
 import time
 import inspect
 import codecs
+import atexit
+import threading
 import imp
 helperlib = imp.load_source('helperlib', '../helperlib.py')
 
+try:
+    import json
+except ImportError:
+    # python 2.4 and 2.5: no resource events
+    json = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 VarDir = "<PYTHON_PID_DIR>"
 
+# Lines are kept in memory and appended to the log in one write() when
+# FLUSH_SIZE bytes are pending, every FLUSH_INTERVAL_SEC, on ERROR and
+# FATAL messages, and at exit.  The file is opened with O_APPEND, so each
+# flush lands whole after whatever other processes appended before it.
+FLUSH_SIZE = 65536
+FLUSH_INTERVAL_SEC = 2
+
+# Resource events (DSCEventLog) go, one JSON object per line, to
+# EVENTS_SUFFIX next to the log.  It is rotated to .1 ... .EVENTS_BACKUPS
+# when it reaches EVENTS_MAX_SIZE.
+EVENTS_SUFFIX = '_events.jsonl'
+EVENTS_MAX_SIZE = 10 * 1024 * 1024
+EVENTS_BACKUPS = 4
+
+LEVELS = ((0, 'FATAL'), (1, 'ERROR'), (2, 'WARNING'), (3, 'INFO'),
+          (4, 'DEBUG'), (5, 'VERBOSE'))
+LEVEL_NUMBERS = {}
+for _num, _name in LEVELS:
+    LEVEL_NUMBERS[_name] = _num
+del _num, _name
+
 def Print(s, file=sys.stderr):
     file.write(s + '\n')
 
@@ -27,57 +61,418 @@ def opened_w_error(filename, mode="r"):
         return None, Exception('IOError')
     return f, None
 
+
+log_path = None
+
+
+def log_file_path():
+    global log_path
+    if log_path is None:
+        if helperlib.CONFIG_SYSCONFDIR_DSC == "omsconfig":
+            log_path = "/var/opt/microsoft/omsconfig/omsconfig.log"
+        else:
+            if not os.path.isdir(VarDir + '/log'):
+                os.system('mkdir -p ' + VarDir + '/log')
+            log_path = VarDir + "/log/dsc.log"
+    return log_path
+
+
+def events_file_path():
+    return os.path.splitext(log_file_path())[0] + EVENTS_SUFFIX
+
+
+class LogWriter(object):
+    """
+    Buffered appender shared by every DSCLog of this process.  The
+    descriptor is reopened when the file was rotated or removed, and a
+    forked child drops the lines it inherited, which are its parent's
+    to write.
+    """
+
+    def __init__(self, path, max_size=None, backups=0):
+        self.path = path
+        self.max_size = max_size
+        self.backups = backups
+        self.lock = threading.Lock()
+        self.fd = None
+        self.ino = None
+        self.pending = []
+        self.pending_size = 0
+        self.pid = None
+        self.thread_pid = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.after_fork)
+
+    def after_fork(self):
+        # the fork may have happened while the flush thread of the parent
+        # held the lock, which nothing in the child would then release
+        self.lock = threading.Lock()
+        self.forget_parent()
+
+    def forget_parent(self):
+        self.pid = os.getpid()
+        self.pending = []
+        self.pending_size = 0
+        self.fd = None
+
+    def write(self, line, urgent=False):
+        try:
+            data = line.encode('utf8', 'replace')
+        except UnicodeError:
+            # python 2 str that is not ascii: written as it is
+            data = line
+        self.lock.acquire()
+        try:
+            if self.pid != os.getpid():
+                self.forget_parent()
+            self.pending.append(data)
+            self.pending_size += len(data)
+            if urgent or FLUSH_SIZE <= self.pending_size:
+                self.flush_locked()
+            elif self.thread_pid != self.pid:
+                self.start_thread()
+        finally:
+            self.lock.release()
+
+    def start_thread(self):
+        self.thread_pid = self.pid
+        t = threading.Thread(target=self.run)
+        if hasattr(t, 'daemon'):
+            t.daemon = True
+        else:
+            # python 2.4 and 2.5
+            t.setDaemon(True)
+        t.start()
+
+    def run(self):
+        pid = os.getpid()
+        while self.pid == pid:
+            time.sleep(FLUSH_INTERVAL_SEC)
+            self.flush()
+
+    def flush(self):
+        self.lock.acquire()
+        try:
+            if self.pid == os.getpid():
+                self.flush_locked()
+        finally:
+            self.lock.release()
+
+    def flush_locked(self):
+        if len(self.pending) == 0:
+            return
+        data = self.pending[0][:0].join(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        try:
+            self.reopen_if_rotated()
+            while len(data):
+                data = data[os.write(self.fd, data):]
+            if self.max_size is not None and \
+                    self.max_size <= os.fstat(self.fd).st_size:
+                self.rotate_locked()
+        except (IOError, OSError):
+            Print("Exception opening logfile " + self.path + " Error: " +
+                  str(sys.exc_info()[1]), file=sys.stderr)
+            self.close_locked()
+
+    def reopen_if_rotated(self):
+        if self.fd is not None:
+            try:
+                if os.stat(self.path).st_ino == self.ino:
+                    return
+            except OSError:
+                pass
+            self.close_locked()
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                          int('666', 8))
+        self.ino = os.fstat(self.fd).st_ino
+
+    def rotate_locked(self):
+        lock_file = open(self.path + '.lock', 'a')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            # another process may have rotated it already
+            if self.max_size <= os.stat(self.path).st_size:
+                for i in range(self.backups - 1, 0, -1):
+                    older = self.path + '.' + str(i)
+                    if os.path.exists(older):
+                        os.rename(older, self.path + '.' + str(i + 1))
+                if 0 < self.backups:
+                    os.rename(self.path, self.path + '.1')
+                else:
+                    os.unlink(self.path)
+        finally:
+            lock_file.close()
+        self.close_locked()
+
+    def close_locked(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+        self.fd = None
+        self.ino = None
+
+
+# providers each load this file with imp.load_source, which runs it again
+# in the same module: keep the writers, and their buffers, from before
+try:
+    writers
+except NameError:
+    writers = {}
+    writers_lock = threading.Lock()
+
+
+def get_writer(path, max_size=None, backups=0):
+    writers_lock.acquire()
+    try:
+        if path not in writers:
+            writers[path] = LogWriter(path, max_size, backups)
+        return writers[path]
+    finally:
+        writers_lock.release()
+
+
+def flush():
+    """ Writes out what every DSCLog of this process has buffered."""
+    for writer in list(writers.values()):
+        writer.flush()
+
+if 'flush_registered' not in globals():
+    flush_registered = True
+    atexit.register(flush)
+
 # YYYY/MM/DD HH:MM:SS: LEVEL: FILE(LINE): \n message \n
 
 
 class DSCLog(object):
+    """
+    Providers create one per message (LG().Log(...)), so the log file
+    path and writer are looked up once per process.
+    """
+
+    levels = LEVELS
 
     def __init__(self):
-        self.levels = ((0, 'FATAL'), (1, 'ERROR'), (2, 'WARNING'), (3, 'INFO'),
-                       (4, 'DEBUG'), (5, 'VERBOSE'))
         self.current_level = self.GetCurrentLogLevel()
-        LogFile = VarDir + "/log/dsc.log"
-        if helperlib.CONFIG_SYSCONFDIR_DSC == "omsconfig":
-            LogFile = "/var/opt/microsoft/omsconfig/omsconfig.log"
-        else:
-            os.system('mkdir -p ' + VarDir + '/log')
-        self.file_path = LogFile
+        self.file_path = log_file_path()
+        self.writer = get_writer(self.file_path)
 
     def Log(self, log_level, message):
-        last_frame = inspect.currentframe().f_back
-        place = last_frame.f_globals['__file__'] + \
-            '('+str(last_frame.f_lineno)+')'
-        if message is None or len(message) is 0:
-            return
         if log_level is None:
             log_level = self.current_level
-        if type(log_level) == str:
-            t = log_level
-            log_level = 5
-            for num, strng in self.levels:
-                if t == strng:
-                    log_level = num
-        if log_level < 0 or log_level > 5 or len(message) < 1:
+        elif type(log_level) == str:
+            log_level = LEVEL_NUMBERS.get(log_level, 5)
+        if log_level < 0 or log_level > 5 or log_level > self.current_level:
             return
-        if log_level > self.current_level:
+        if message is None or len(message) == 0:
             return
+        last_frame = inspect.currentframe().f_back
+        place = last_frame.f_globals['__file__'] + \
+            '('+str(last_frame.f_lineno)+')'
         t = time.localtime()
         line = "%04u/%02u/%02u %02u:%02u:%02u: %s: %s:\n%s\n" % (t.tm_year,
             t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec,
             self.levels[log_level][1], place, message)
-        error = None
-        try:
-            F, error = opened_w_error(self.file_path, 'a')
-            if error:
-                Print("Exception opening logfile " + self.file_path +
-                      " Error: " + str(error), file=sys.stderr)
-            else:
-                F.write(line)
-                F.close()
-        except:
-            F.close()
-            Print("Exception opening logfile " + self.file_path +
-                  " Error: " + str(error), file=sys.stderr)
+        self.writer.write(line, log_level <= 1)
+
+    def Flush(self):
+        self.writer.flush()
 
     def GetCurrentLogLevel(self):
         return 5
+
+
+# Keys of the resources, from their schema.mof, by provider.  Others are
+# recorded under the provider name alone.
+RESOURCE_KEYS = {
+    'nxArchive': ('SourcePath', 'DestinationPath'),
+    'nxAvailableUpdates': ('Name',),
+    'nxComputer': ('Name',),
+    'nxEnvironment': ('Name',),
+    'nxFile': ('DestinationPath',),
+    'nxFileInventory': ('DestinationPath',),
+    'nxFileLine': ('FilePath', 'ContainsLine'),
+    'nxFirewall': ('Name',),
+    'nxGroup': ('GroupName',),
+    'nxIPAddress': ('IPAddress', 'InterfaceName'),
+    'nxMySqlDatabase': ('Name',),
+    'nxMySqlGrant': ('UserName', 'DatabaseName'),
+    'nxMySqlUser': ('Name',),
+    'nxNop': ('Name',),
+    'nxOMSAgentNPMConfig': ('ConfigType',),
+    'nxOMSCustomLog': ('Name',),
+    'nxOMSGenerateInventoryMof': ('FeatureName',),
+    'nxOMSPerfCounter': ('Name',),
+    'nxOMSPlugin': ('Name',),
+    'nxOMSSudoCustomLog': ('Name',),
+    'nxPackage': ('Name',),
+    'nxScript': ('GetScript', 'SetScript', 'TestScript'),
+    'nxService': ('Name',),
+    'nxSshAuthorizedKeys': ('KeyComment',),
+    'nxUser': ('UserName',),
+    }
+KEY_VALUE_MAX = 100
+
+clock = getattr(time, 'monotonic', time.time)
+
+# kept when this file is loaded again, as the writers are
+try:
+    spawns
+except NameError:
+    # count: the processes this thread has started
+    spawns = threading.local()
+    # the events of the requests being served, by id
+    in_flight = {}
+    in_flight_lock = threading.Lock()
+
+
+def thread_spawns():
+    return getattr(spawns, 'count', 0)
+
+
+def count_spawns():
+    """
+    Counts the processes each thread starts through subprocess, os.system
+    and, on python 2, os.popen, in spawns.count.
+    """
+    if 'spawns_counted' in globals():
+        return
+    global spawns_counted
+    spawns_counted = True
+    import subprocess
+    execute_child = subprocess.Popen._execute_child
+
+    def counted_execute_child(self, *args, **kwargs):
+        spawns.count = thread_spawns() + 1
+        return execute_child(self, *args, **kwargs)
+    subprocess.Popen._execute_child = counted_execute_child
+    names = ['system']
+    if sys.version < '3':
+        # os.popen is built on subprocess in python 3
+        names.append('popen')
+    for name in names:
+        wrap_spawn(name)
+
+
+def wrap_spawn(name):
+    spawn = getattr(os, name)
+
+    def counted(*args, **kwargs):
+        spawns.count = thread_spawns() + 1
+        return spawn(*args, **kwargs)
+    setattr(os, name, counted)
+
+
+def io_counters():
+    """ (rchar, wchar, shared): those of this thread, or on kernels before
+        3.17, which have no /proc/thread-self, those of the whole process
+        with shared True.  None without either."""
+    counters = read_io('/proc/thread-self/io')
+    if counters is not None:
+        return counters + (False,)
+    counters = read_io('/proc/self/io')
+    if counters is not None:
+        return counters + (True,)
+    return None
+
+
+def read_io(path):
+    counters = {}
+    try:
+        F = open(path, 'r')
+        try:
+            for line in F.readlines():
+                name, val = line.split(':', 1)
+                counters[name] = int(val)
+        finally:
+            F.close()
+    except (IOError, OSError, ValueError):
+        return None
+    if 'rchar' not in counters or 'wchar' not in counters:
+        return None
+    return (counters['rchar'], counters['wchar'])
+
+
+def resource_key(provider, args):
+    names = RESOURCE_KEYS.get(provider, ())
+    vals = []
+    for name in names:
+        val = args.get(name)
+        if hasattr(val, 'value'):
+            val = val.value
+        val = str(val)
+        if KEY_VALUE_MAX < len(val):
+            val = val[:KEY_VALUE_MAX] + '...'
+        vals.append(val)
+    if len(vals) == 0:
+        return provider
+    return provider + '[' + ', '.join(vals) + ']'
+
+
+class DSCEventLog(object):
+    """
+    One event per provider request:
+
+      {"time": ..., "pid": ..., "provider": "nxFile", "op": "Set",
+       "resource": "nxFile[/etc/motd]", "duration": 0.012,
+       "outcome": "ok", "bytes_read": 4096, "bytes_written": 4096,
+       "subprocesses": 0}
+
+    outcome is ok, failed (the provider returned an error) or error (it
+    raised or could not be called).  The byte counts are rchar and wchar
+    of /proc/thread-self/io over the request, and subprocesses the
+    processes started, by the thread that served it.  Where only the
+    counters of the whole process can be read, the byte counts are null
+    for a request that ran at the same time as another.
+    """
+
+    def __init__(self):
+        self.writer = None
+        if json is not None:
+            count_spawns()
+            self.writer = get_writer(events_file_path(), EVENTS_MAX_SIZE,
+                                     EVENTS_BACKUPS)
+
+    def Start(self, provider, op, args):
+        if self.writer is None:
+            return None
+        event = {'provider': provider, 'op': op,
+                 'resource': resource_key(provider, args),
+                 'start': clock(), 'io': io_counters(),
+                 'spawns': thread_spawns(), 'overlapped': False}
+        in_flight_lock.acquire()
+        try:
+            if in_flight:
+                event['overlapped'] = True
+                for other in in_flight.values():
+                    other['overlapped'] = True
+            in_flight[id(event)] = event
+        finally:
+            in_flight_lock.release()
+        return event
+
+    def End(self, event, outcome):
+        if event is None:
+            return
+        io = io_counters()
+        in_flight_lock.acquire()
+        try:
+            del in_flight[id(event)]
+        finally:
+            in_flight_lock.release()
+        record = {'time': time.time(), 'pid': os.getpid(),
+                  'provider': event['provider'], 'op': event['op'],
+                  'resource': event['resource'],
+                  'duration': round(clock() - event['start'], 6),
+                  'outcome': outcome,
+                  'bytes_read': None, 'bytes_written': None,
+                  'subprocesses': thread_spawns() - event['spawns']}
+        if io is not None and event['io'] is not None and \
+                not (io[2] and event['overlapped']):
+            record['bytes_read'] = io[0] - event['io'][0]
+            record['bytes_written'] = io[1] - event['io'][1]
+        self.writer.write(json.dumps(record) + '\n')
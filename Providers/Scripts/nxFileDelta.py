@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+#============================================================================
+# Copyright (c) Microsoft Corporation. All rights reserved. See license.txt for license information.
+#============================================================================
+"""
+Delta updates of a file from another, rsync style, for nxFile: a
+destination that differs from its source is patched where its
+DELTA_BLOCK_SIZE blocks differ, rather than copied whole.  nxFile decides
+when (nxFileDeltaMinSize in dsc.conf) and calls DeltaUpdateFile().
+
+It works through nxFile's copy functions and needs python 3 (os.pread),
+as the nxFile provider that loads it does.
+"""
+import io
+import os
+import stat
+import sys
+import tempfile
+import zlib
+
+# the nxFile module that loaded this one
+nxFile = None
+
+DELTA_BLOCK_SIZE = 65536
+# blocks after a changed one compared in place before a shift is assumed
+DELTA_LOOKAHEAD = 4
+# the file is copied whole instead once more than DELTA_MAX_LITERAL of
+# the source would be taken from it, or DELTA_MAX_SEARCHES byte by byte
+# searches for a moved block have found none
+DELTA_MAX_LITERAL = 0.5
+DELTA_MAX_SEARCHES = 8
+# blocks DeltaPlan reads of each file at a time
+DELTA_READ_AHEAD = 16
+
+EMPTY_BYTES = ''.encode('ascii')
+
+
+def LG():
+    return nxFile.LG()
+
+
+def RollingChecksum(checksum, out_byte, in_byte, block_size):
+    """
+    The zlib.adler32 of a block_size window with checksum, moved on by one
+    byte: out_byte leaves it and in_byte enters.
+    """
+    a = checksum & 0xffff
+    b = checksum >> 16
+    a = (a - out_byte + in_byte) % 65521
+    b = (b - block_size * out_byte + a - 1) % 65521
+    return (b << 16) | a
+
+
+class DeltaSignature:
+    """
+    The blocks of a file, as rsync sees its destination: by the weak,
+    rolling zlib.adler32 of each block, the indexes of the blocks with
+    it, and the nxFile.HashAlgorithm() digest of each block.
+    """
+
+    def __init__(self, fd, block_size):
+        self.block_size = block_size
+        self.new = nxFile.filehash.ALGORITHMS[nxFile.HashAlgorithm()]
+        self.weak = {}
+        self.strong = []
+        buf = bytearray(block_size)
+        os.lseek(fd, 0, os.SEEK_SET)
+        F = io.FileIO(fd, 'rb', closefd=False)
+        try:
+            while True:
+                n = F.readinto(buf)
+                if not n:
+                    break
+                block = memoryview(buf)[:n]
+                self.weak.setdefault(zlib.adler32(block), []).append(len(self.strong))
+                self.strong.append(self.new(block).digest())
+        finally:
+            F.close()
+
+    def find(self, block, weak):
+        """
+        The index of a block with the contents of block, whose adler32 is
+        weak, or None if there is none.
+        """
+        indexes = self.weak.get(weak)
+        if indexes is None:
+            return None
+        digest = self.new(block).digest()
+        for index in indexes:
+            if self.strong[index] == digest:
+                return index
+        return None
+
+
+class ReadAhead:
+    """
+    pread() of fd through a window of length bytes of it, for the mostly
+    forward reads of DeltaPlan, which looks at each block several times:
+    the part of the window still ahead is kept when it moves on, so the
+    file is read about once.
+    """
+
+    def __init__(self, fd, length):
+        self.fd = fd
+        self.length = length
+        self.start = 0
+        self.data = EMPTY_BYTES
+
+    def pread(self, length, offset):
+        end = offset + length
+        if offset < self.start or end > self.start + len(self.data):
+            kept = EMPTY_BYTES
+            if self.start <= offset < self.start + len(self.data):
+                kept = self.data[offset - self.start:]
+            self.data = kept + os.pread(self.fd, max(self.length, length) - len(kept), offset + len(kept))
+            self.start = offset
+        return self.data[offset - self.start:end - self.start]
+
+
+def ChangedInPlace(src, dest, offset, block_size):
+    """
+    Whether one of the DELTA_LOOKAHEAD blocks of the source from offset
+    on is where it was in the destination, so that no data was inserted
+    or removed before them.  src and dest are the ReadAheads of the files.
+    """
+    for i in range(DELTA_LOOKAHEAD):
+        block = src.pread(block_size, offset + i * block_size)
+        if not block:
+            return False
+        if dest.pread(len(block), offset + i * block_size) == block:
+            return True
+    return False
+
+
+def DeltaPlan(src_fd, size, dest_fd, block_size):
+    """
+    How to make dest_fd into src_fd, whose size is size: a list of
+    ('data', offset, length) to take from the source and ('block', offset,
+    dest_offset, length) to take from the destination, or None if copying
+    the source whole is cheaper.
+    A block of the source is first compared with the destination at the
+    same offset.  If neither it nor any of the DELTA_LOOKAHEAD blocks
+    after it are found there, data was inserted or removed, and the block
+    is looked up in the DeltaSignature of the destination, which is only
+    taken then, rolling the weak checksum on byte by byte for up to a
+    block to find where the destination's blocks resume.
+    That search runs in Python, so once DELTA_MAX_SEARCHES of them have
+    failed, or more than DELTA_MAX_LITERAL of the source is to be taken
+    from it, the files are taken to have too little in common.
+    """
+    plan = []
+    signature = None
+    literal = [0]
+    searches = 0
+    src = ReadAhead(src_fd, block_size * DELTA_READ_AHEAD)
+    dest = ReadAhead(dest_fd, block_size * DELTA_READ_AHEAD)
+
+    def add(op):
+        last = plan and plan[-1]
+        if last and last[0] == op[0] and last[1] + last[-1] == op[1] and \
+                (op[0] == 'data' or last[2] + last[3] == op[2]):
+            plan[-1] = last[:-1] + (last[-1] + op[-1],)
+        else:
+            plan.append(op)
+        if op[0] == 'data':
+            literal[0] += op[2]
+
+    offset = 0
+    while offset < size:
+        if literal[0] > size * DELTA_MAX_LITERAL or searches >= DELTA_MAX_SEARCHES:
+            return None
+        block = src.pread(block_size, offset)
+        if not block:
+            break
+        if dest.pread(len(block), offset) == block:
+            add(('block', offset, offset, len(block)))
+            offset += len(block)
+            continue
+        after = src.pread(block_size, offset + len(block))
+        if (not after and signature is None) or \
+                ChangedInPlace(src, dest, offset + len(block), block_size):
+            add(('data', offset, len(block)))
+            offset += len(block)
+            continue
+        if signature is None:
+            signature = DeltaSignature(dest_fd, block_size)
+        weak = zlib.adler32(block)
+        index = signature.find(block, weak)
+        if index is not None:
+            add(('block', offset, index * block_size, len(block)))
+            offset += len(block)
+            continue
+        if len(block) == block_size:
+            window = block + after
+            for shift in range(1, len(after) + 1):
+                weak = RollingChecksum(weak, window[shift - 1], window[shift + block_size - 1], block_size)
+                if weak in signature.weak:
+                    index = signature.find(window[shift:shift + block_size], weak)
+                    if index is not None:
+                        break
+            if index is not None:
+                add(('data', offset, shift))
+                add(('block', offset + shift, index * block_size, block_size))
+                offset += shift + block_size
+                continue
+            searches += 1
+        add(('data', offset, len(block)))
+        offset += len(block)
+    if literal[0] > size * DELTA_MAX_LITERAL:
+        return None
+    return plan
+
+
+def DeltaUpdateFile(spath, dpath):
+    """
+    Make dpath the same as spath, writing only what differs.  If dpath's
+    blocks are all still in place, the blocks taken from spath are written
+    over it in place; otherwise a temporary file is put together from
+    both and renamed over dpath.  When DeltaPlan finds too little in
+    common, spath is copied with nxFile.CopyFile.  Returns the error, like
+    CopyFile.
+    """
+    tmp = None
+    try:
+        src_fd = os.open(spath, os.O_RDONLY)
+        try:
+            size = os.fstat(src_fd).st_size
+            dest_fd = os.open(dpath, os.O_RDWR)
+            try:
+                plan = DeltaPlan(src_fd, size, dest_fd, DELTA_BLOCK_SIZE)
+                if plan is None:
+                    LG().Log('INFO', "Delta update of " + dpath + ": too little in common with " + spath + ", copying it")
+                    return nxFile.CopyFile(spath, dpath)
+                methods = nxFile.CopyMethods()
+                written = 0
+                if len([op for op in plan if op[0] == 'block' and op[1] != op[2]]) == 0:
+                    for op in plan:
+                        if op[0] == 'data':
+                            nxFile.CopyRange(src_fd, dest_fd, op[1], op[1], op[2], methods)
+                            written += op[2]
+                    os.ftruncate(dest_fd, size)
+                else:
+                    tmp_fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(dpath) + '.',
+                                                   dir=os.path.dirname(dpath) or '.')
+                    try:
+                        kept = nxFile.KeepAttributes(dpath, tmp_fd)
+                        os.fchmod(tmp_fd, stat.S_IMODE(os.fstat(dest_fd).st_mode))
+                        for op in plan:
+                            if op[0] == 'data':
+                                nxFile.CopyRange(src_fd, tmp_fd, op[1], op[1], op[2], methods)
+                            else:
+                                nxFile.CopyRange(dest_fd, tmp_fd, op[2], op[1], op[3], methods)
+                            written += op[-1]
+                        os.ftruncate(tmp_fd, size)
+                        if not kept:
+                            # the new file lacks what dpath carries, so
+                            # it is copied over dpath instead
+                            os.ftruncate(dest_fd, 0)
+                            nxFile.CopyExtents(tmp_fd, dest_fd, size)
+                            written = size
+                    finally:
+                        os.close(tmp_fd)
+                    if kept:
+                        os.rename(tmp, dpath)
+                    else:
+                        nxFile.RemoveFile(tmp)
+                        tmp = None
+            finally:
+                os.close(dest_fd)
+        finally:
+            os.close(src_fd)
+    except (OSError, IOError):
+        error = sys.exc_info()[1]
+        if tmp is not None and os.path.exists(tmp):
+            nxFile.RemoveFile(tmp)
+        sys.stderr.write("Exception updating " + dpath + ' from ' + spath + " Error Code: " + str(error.errno) + " Error: " + error.strerror + '\n')
+        LG().Log('ERROR', "Exception updating " + dpath + ' from ' + spath + " Error Code: " + str(error.errno) + " Error: " + error.strerror)
+        return error
+    LG().Log('INFO', "Delta update of " + dpath + ": wrote " + str(written) + " of " + str(size) + " bytes" +
+             (tmp is not None and " into a new file" or " in place"))
+    return None
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#============================================================================
+# Copyright (c) Microsoft Corporation. All rights reserved. See license.txt for license information.
+#============================================================================
+"""
+Writes the manifest nxFile checks a recursive directory resource against
+instead of walking its SourcePath: the path, lstat and digest of each
+entry of the tree.
+
+    nxFileManifest.py [-a ALGORITHM] [-o MANIFEST] SOURCE_DIR ...
+
+By default the manifest of SOURCE_DIR is SOURCE_DIR.nxmanifest, where
+nxFile looks for it, and its digests are of the algorithm nxFile hashes
+files with (nxFileHashAlgorithm in dsc.conf, md5 by default).  nxFile
+uses it for the resources whose Checksum is that algorithm, mtime or
+ctime.  Run it again whenever the tree changes.
+"""
+import os
+import sys
+import time
+from optparse import OptionParser
+
+ScriptsDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_nxFile():
+    # nxFile loads its helpers relative to the directory client.py runs
+    # the providers from
+    import imp
+    os.chdir(ScriptsDir + '/3.x')
+    return imp.load_source('nxFile', 'Scripts/nxFile.py')
+
+
+def main(argv):
+    parser = OptionParser(usage='%prog [-a ALGORITHM] [-o MANIFEST] SOURCE_DIR ...')
+    parser.add_option('-a', '--algorithm',
+                      help='digest algorithm: md5, sha-256, blake2b, xxh3 or xxh128')
+    parser.add_option('-o', '--output',
+                      help='write the manifest here (one SOURCE_DIR only)')
+    options, paths = parser.parse_args(argv[1:])
+    if sys.version < '3':
+        sys.stderr.write('nxFileManifest.py needs python 3\n')
+        return 1
+    if len(paths) == 0 or (options.output and len(paths) != 1):
+        parser.print_usage(sys.stderr)
+        return 1
+    paths = [os.path.abspath(path) for path in paths]
+    output = options.output
+    if output:
+        output = os.path.abspath(output)
+    for path in paths:
+        if not os.path.isdir(path):
+            sys.stderr.write('Not a directory: ' + path + '\n')
+            return 1
+    nxFile = load_nxFile()
+    if options.algorithm and options.algorithm not in nxFile.filehash.ALGORITHMS:
+        sys.stderr.write('Unavailable algorithm ' + options.algorithm + ', this python has ' +
+                         ', '.join(nxFile.filehash.available()) + '\n')
+        return 1
+    for path in paths:
+        start = time.time()
+        try:
+            count = nxFile.WriteManifest(path, output, options.algorithm)
+        except (IOError, OSError):
+            sys.stderr.write('Cannot write the manifest of ' + path + ': ' +
+                             str(sys.exc_info()[1]) + '\n')
+            return 1
+        sys.stdout.write('%s: %d entries in %.1f s\n' %
+                         (output or path + nxFile.MANIFEST_SUFFIX, count,
+                          time.time() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+#============================================================================
+# Copyright (c) Microsoft Corporation. All rights reserved. See license.txt for license information.
+#============================================================================
+"""
+Downloads of the http(s) SourcePaths of nxFile into a cache, kept under
+nxFile.cache_file_dir + remote_cache_name, each with its ETag,
+Last-Modified and md5, and downloaded again only when a conditional GET
+is not answered 304 Not Modified.
+
+Downloads go to a .part file beside the cached copy.  What a failed
+download fetched is kept, and resumed with Range requests by the next
+attempt, in the same or a later Test or Set.  nxFile calls
+FetchRemoteFile(), RemoteCachePaths() and RemoteLastModified().
+
+It needs python 3 (urllib.request, concurrent.futures), as the nxFile
+provider that loads it does.
+"""
+import base64
+import errno
+import io
+import os
+import sys
+import tempfile
+import threading
+try:
+    import hashlib
+    import json
+    import http.client
+    import urllib.error
+    import urllib.request
+    import concurrent.futures
+except ImportError:
+    # python 2, whose nxFile does not load this
+    pass
+
+# the nxFile module that loaded this one
+nxFile = None
+
+remote_cache_name = 'remote/'
+# seconds a read may stall before the range is requested again
+REMOTE_TIMEOUT = 30
+# requests for a range before a Test or Set gives up on it
+REMOTE_RETRIES = 3
+# ranges a file of at least REMOTE_SEGMENT_MIN_SIZE is fetched as at once;
+# nxFileDownloadSegments in dsc.conf overrides it
+REMOTE_SEGMENTS = 1
+REMOTE_SEGMENT_MIN_SIZE = 64 * 1048576
+# bytes fetched in a range between saves of the download's progress
+REMOTE_SAVE_INTERVAL = 16 * 1048576
+
+EMPTY_BYTES = ''.encode('ascii')
+
+
+def LG():
+    return nxFile.LG()
+
+
+def SetProxyFromConf():
+    """
+    Check for PROXY definition in dsc.conf.
+    All we must do is set the appropriate value in the environment.
+    HTTP_PROXY
+    HTTPS_PROXY
+    """
+    path = nxFile.helperlib.CONFIG_SYSCONFDIR + '/' + nxFile.helperlib.CONFIG_SYSCONFDIR_DSC + '/dsc.conf'
+    txt, error = nxFile.ReadFile(path)
+    if error :
+        return
+    for l in txt.splitlines():
+        if l.startswith('PROXY'):
+            info = l.split('=')[1].strip()
+            if 'https' in info:
+                os.environ['HTTPS_PROXY'] = info
+            if 'http:' in info:
+                os.environ['HTTP_PROXY'] = info
+    return
+
+
+def RemoteCachePaths(url):
+    """
+    The metadata and data files of the cached copy of url.
+    """
+    base = nxFile.cache_file_dir + remote_cache_name + nxFile.md5const(url.encode('utf-8')).hexdigest()
+    return base + '.json', base + '.data'
+
+
+def ReadRemoteCache(url):
+    """
+    The metadata of the cached copy of url, or None if there is none.
+    """
+    meta_path, data_path = RemoteCachePaths(url)
+    try:
+        F = open(meta_path, 'r')
+        try:
+            meta = json.load(F)
+        finally:
+            F.close()
+        st = os.stat(data_path)
+    except (IOError, OSError, ValueError):
+        return None
+    if meta.get('url') != url or meta.get('size') != st.st_size:
+        return None
+    return meta
+
+
+def WriteRemoteMeta(meta_path, meta):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(meta_path))
+    try:
+        F = os.fdopen(fd, 'w')
+        try:
+            json.dump(meta, F)
+        finally:
+            F.close()
+        os.rename(tmp, meta_path)
+    except:
+        os.unlink(tmp)
+        raise
+
+
+class RemoteChanged(Exception):
+    """
+    The server answered a Range request with the whole of a different
+    version of the file.
+    """
+
+
+class RemoteDownload:
+    """
+    The download of url into a .part file beside its cached copy.  The
+    file is fetched as byte ranges, [start, end, next] in state['ranges'],
+    next being the first byte of the range not yet written.  state also
+    keeps the ETag and Last-Modified the ranges are fetched under, for
+    If-Range, and is saved beside the .part file, so that a download that
+    fails is resumed where it stopped.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.meta_path, self.data_path = RemoteCachePaths(url)
+        base = self.data_path[:-len('.data')]
+        self.part_path = base + '.part'
+        self.state_path = base + '.part.json'
+        self.state = None
+        self.fd = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Pick up a download that stopped part way; False if there is none.
+        """
+        try:
+            F = open(self.state_path, 'r')
+            try:
+                state = json.load(F)
+            finally:
+                F.close()
+            self.fd = os.open(self.part_path, os.O_RDWR)
+        except (IOError, OSError, ValueError):
+            return False
+        if state.get('url') != self.url:
+            self.discard()
+            return False
+        self.state = state
+        return True
+
+    def start(self, resp):
+        """
+        Start the download from resp, the 200 answer to a GET.  Return True
+        if resp is to be read into the only range, False if the file was
+        split into ranges to fetch at once.
+        """
+        if not os.path.isdir(os.path.dirname(self.part_path)):
+            if nxFile.MakeDirs(os.path.dirname(self.part_path)) is not None:
+                raise OSError(errno.ENOENT, 'Unable to make ' + os.path.dirname(self.part_path))
+        size = resp.headers.get('Content-Length')
+        if size is not None:
+            size = int(size)
+        self.state = {'url': self.url, 'etag': resp.headers.get('ETag'),
+                      'last_modified': resp.headers.get('Last-Modified'),
+                      'size': size, 'digests': ExpectedDigests(resp.headers)}
+        # mode 0666, less the umask
+        self.fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 438)
+        segments = nxFile.IntFromConf('nxFileDownloadSegments', REMOTE_SEGMENTS)
+        if size is None or segments < 2 or size < REMOTE_SEGMENT_MIN_SIZE or \
+                resp.headers.get('Accept-Ranges') != 'bytes' or \
+                (self.state['etag'] is None and self.state['last_modified'] is None):
+            if size is None:
+                self.state['ranges'] = [[0, None, 0]]
+            else:
+                self.state['ranges'] = [[0, size - 1, 0]]
+            self.save()
+            return True
+        os.ftruncate(self.fd, size)
+        step = (size + segments - 1) // segments
+        self.state['ranges'] = [[start, min(start + step, size) - 1, start]
+                                for start in range(0, size, step)]
+        self.save()
+        return False
+
+    def save(self):
+        self.lock.acquire()
+        try:
+            WriteRemoteMeta(self.state_path, self.state)
+        finally:
+            self.lock.release()
+
+    def discard(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        for path in (self.part_path, self.state_path):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def read_range(self, r, resp):
+        """
+        Write the body of resp into range r from r[2] on.
+        """
+        unsaved = 0
+        while r[1] is None or r[2] <= r[1]:
+            data = resp.read(1048576)
+            if not data:
+                break
+            if r[1] is not None and r[1] + 1 - r[2] < len(data):
+                data = data[:r[1] + 1 - r[2]]
+            written = 0
+            while written < len(data):
+                written += os.pwrite(self.fd, data[written:], r[2] + written)
+            r[2] += len(data)
+            unsaved += len(data)
+            if REMOTE_SAVE_INTERVAL <= unsaved:
+                self.save()
+                unsaved = 0
+        if r[1] is None:
+            # the size is only known at the end
+            r[1] = r[2] - 1
+            self.state['size'] = r[2]
+        elif r[2] <= r[1]:
+            raise http.client.IncompleteRead(EMPTY_BYTES, r[1] + 1 - r[2])
+
+    def fetch_range(self, r):
+        """
+        Request range r from where it stopped until it is complete,
+        REMOTE_RETRIES times at most.
+        """
+        error = None
+        for attempt in range(REMOTE_RETRIES):
+            if r[1] is not None and r[1] < r[2]:
+                return
+            req = urllib.request.Request(self.url)
+            end = ''
+            if r[1] is not None:
+                end = str(r[1])
+            req.add_header('Range', 'bytes=' + str(r[2]) + '-' + end)
+            if self.state['etag'] or self.state['last_modified']:
+                req.add_header('If-Range', self.state['etag'] or self.state['last_modified'])
+            try:
+                resp = urllib.request.urlopen(req, timeout=REMOTE_TIMEOUT)
+                try:
+                    if resp.getcode() != 206:
+                        raise RemoteChanged(self.url)
+                    self.read_range(r, resp)
+                finally:
+                    resp.close()
+            except (urllib.error.URLError, http.client.HTTPException, OSError):
+                error = sys.exc_info()[1]
+                LG().Log('WARNING', "Download of " + self.url + " stopped at byte " + str(r[2]) + ": " + repr(error))
+        if r[1] is None or r[2] <= r[1]:
+            raise error
+
+    def run(self, resp=None):
+        """
+        Fetch what is missing, verify it and move it into the cache.
+        Return the metadata of the cached copy, or None if the download
+        failed; what it fetched is kept for the next attempt.
+        """
+        try:
+            try:
+                if resp is not None:
+                    try:
+                        self.read_range(self.state['ranges'][0], resp)
+                    except (http.client.HTTPException, OSError):
+                        if self.state['ranges'][0][1] is None:
+                            # without a size there is nothing to resume
+                            raise
+                        LG().Log('WARNING', "Download of " + self.url + " stopped at byte " +
+                                 str(self.state['ranges'][0][2]) + ": " + repr(sys.exc_info()[1]))
+                pending = [r for r in self.state['ranges'] if r[1] is None or r[2] <= r[1]]
+                if len(pending) > 1:
+                    executor = concurrent.futures.ThreadPoolExecutor(len(pending))
+                    try:
+                        futures = [executor.submit(self.fetch_range, r) for r in pending]
+                        for future in futures:
+                            future.result()
+                    finally:
+                        executor.shutdown(wait=True)
+                else:
+                    for r in pending:
+                        self.fetch_range(r)
+            finally:
+                if os.path.exists(self.state_path):
+                    self.save()
+        except RemoteChanged:
+            LG().Log('WARNING', "Remote file " + self.url + " changed during the download, starting again")
+            self.discard()
+            raise
+        except Exception:
+            e = sys.exc_info()[1]
+            print(repr(e))
+            LG().Log('ERROR', "Unable to download " + self.url + ": " + repr(e))
+            os.close(self.fd)
+            self.fd = None
+            return None
+        return self.finish()
+
+    def finish(self):
+        """
+        Check the size and the digests the server gave of the .part file,
+        then move it over the cached copy.
+        """
+        size = self.state['size']
+        hashes = {'md5': nxFile.md5const()}
+        for name in self.state['digests']:
+            if name not in hashes:
+                hashes[name] = hashlib.new(name)
+        total = 0
+        buf = bytearray(nxFile.COMPARE_BLOCK_SIZE)
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        F = io.FileIO(self.fd, 'rb', closefd=False)
+        try:
+            while True:
+                n = F.readinto(buf)
+                if not n:
+                    break
+                total += n
+                for h in hashes.values():
+                    h.update(memoryview(buf)[:n])
+        finally:
+            F.close()
+        os.close(self.fd)
+        self.fd = None
+        error = None
+        if total != size:
+            error = "has " + str(total) + " bytes, not " + str(size)
+        elif size == 0:
+            error = "was empty. Please ensure this file exists at this remote location."
+        for name, digest in self.state['digests'].items():
+            if hashes[name].digest() != DecodeDigest(digest):
+                error = "does not match its " + name + " digest " + digest
+        if error is not None:
+            print("Data at URL: " + self.url + " " + error)
+            LG().Log('ERROR', "Data at URL: " + self.url + " " + error)
+            self.discard()
+            return None
+        meta = {'url': self.url, 'etag': self.state['etag'],
+                'last_modified': self.state['last_modified'],
+                'md5': hashes['md5'].hexdigest(), 'size': size}
+        os.rename(self.part_path, self.data_path)
+        WriteRemoteMeta(self.meta_path, meta)
+        os.unlink(self.state_path)
+        return meta
+
+
+def ExpectedDigests(headers):
+    """
+    The digests the server gives of the body, base64 by hashlib name, from
+    the Content-MD5 and Digest (RFC 3230) headers.
+    """
+    digests = {}
+    if headers.get('Content-MD5'):
+        digests['md5'] = headers.get('Content-MD5').strip()
+    for item in (headers.get('Digest') or '').split(','):
+        name, sep, value = item.strip().partition('=')
+        name = {'md5': 'md5', 'sha': 'sha1', 'sha-256': 'sha256', 'sha-512': 'sha512'}.get(name.lower())
+        if name and sep:
+            digests[name] = value.strip()
+    return digests
+
+
+def DecodeDigest(value):
+    try:
+        return base64.b64decode(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def FetchRemoteFile(fc):
+    """
+    Bring the cached copy of fc.SourcePath up to date.  A download that
+    stopped part way is resumed.  Otherwise, when there is a copy, the GET
+    carries its ETag and Last-Modified in If-None-Match and
+    If-Modified-Since, and a 304 answer transfers no body.
+    Return the metadata of the copy, or None if it cannot be fetched.
+    """
+    SetProxyFromConf()
+    # a second time if the file changes during the download
+    for attempt in range(2):
+        download = RemoteDownload(fc.SourcePath)
+        try:
+            if download.load():
+                return download.run()
+            meta = ReadRemoteCache(fc.SourcePath)
+            req = urllib.request.Request(fc.SourcePath)
+            if meta is not None:
+                if meta.get('etag'):
+                    req.add_header('If-None-Match', meta['etag'])
+                if meta.get('last_modified'):
+                    req.add_header('If-Modified-Since', meta['last_modified'])
+            try:
+                resp = urllib.request.urlopen(req, timeout=REMOTE_TIMEOUT)
+            except urllib.error.HTTPError:
+                e = sys.exc_info()[1]
+                e.close()
+                if e.code == 304 and meta is not None:
+                    return meta
+                print(repr(e))
+                LG().Log('ERROR', repr(e))
+                return None
+            except (urllib.error.URLError, OSError):
+                e = sys.exc_info()[1]
+                print(repr(e))
+                LG().Log('ERROR', repr(e))
+                return None
+            try:
+                if download.start(resp):
+                    return download.run(resp)
+            finally:
+                resp.close()
+            return download.run()
+        except RemoteChanged:
+            continue
+        except OSError:
+            e = sys.exc_info()[1]
+            print(repr(e))
+            LG().Log('ERROR', "Unable to download " + fc.SourcePath + ": " + repr(e))
+            download.discard()
+            return None
+    return None
+
+
+def RemoteLastModified(url):
+    """
+    The Last-Modified header of url, asked for with a HEAD request so that
+    no body is transferred, or with a GET whose body is not read when the
+    server does not take HEAD.  None if there is none.
+    """
+    SetProxyFromConf()
+    for method in ('HEAD', 'GET'):
+        try:
+            resp = urllib.request.urlopen(urllib.request.Request(url, method=method), timeout=REMOTE_TIMEOUT)
+        except urllib.error.HTTPError:
+            e = sys.exc_info()[1]
+            e.close()
+            if method == 'HEAD' and e.code in (405, 501):
+                continue
+            print(repr(e))
+            LG().Log('ERROR', repr(e))
+            return None
+        except (urllib.error.URLError, OSError):
+            e = sys.exc_info()[1]
+            print(repr(e))
+            LG().Log('ERROR', repr(e))
+            return None
+        try:
+            return resp.headers.get('Last-Modified')
+        finally:
+            resp.close()
+    return None
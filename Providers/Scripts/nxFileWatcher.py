@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+#============================================================================
+# Copyright (c) Microsoft Corporation. All rights reserved. See license.txt for license information.
+#============================================================================
+"""
+Journals the changes to the trees of recursive nxFile directory resources
+with inotify, so that a Test checks only the paths changed since the last
+Test that found a tree in order.
+
+    nxFileWatcher.py [ROOT ...]
+
+Runs until it is stopped, watching each ROOT and the trees nxFile lists
+for it when it finds them unwatched.  While it is not running, nxFile
+checks whole trees, as it does without it.
+
+nxFile reads the journals (ChangeJournal); this is all that writes them.
+"""
+import errno
+import os
+import select
+import signal
+import struct
+import sys
+import time
+try:
+    import ctypes
+    import json
+except ImportError:
+    # python 2.4 and 2.5, which main() turns away
+    pass
+
+ScriptsDir = os.path.dirname(os.path.abspath(__file__))
+
+# the nxFile module, of load_nxFile()
+nxFile = None
+
+# a journal is started again once it has grown to JOURNAL_MAX_SIZE bytes
+JOURNAL_MAX_SIZE = 16 * 1048576
+# seconds events are let gather for, so that a file written in many
+# pieces is journaled once
+JOURNAL_BATCH_DELAY = 0.1
+
+# inotify(7)
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_DONT_FOLLOW = 0x2000000
+IN_EXCL_UNLINK = 0x4000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0x80000)
+
+
+def load_nxFile():
+    # nxFile loads its helpers relative to the directory client.py runs
+    # the providers from
+    import imp
+    global nxFile
+    os.chdir(ScriptsDir + '/3.x')
+    nxFile = imp.load_source('nxFile', 'Scripts/nxFile.py')
+    return nxFile
+
+
+def LG():
+    return nxFile.LG()
+
+
+class ChangeWatcher:
+    """
+    Keeps the nxFile.ChangeJournal of each tree it watches, with an
+    inotify watch on each directory.  The trees are those it is started
+    with and those nxFile lists in journal/roots.
+    """
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+        IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, roots):
+        self.dir = nxFile.cache_file_dir + nxFile.journal_cache_name
+        if not os.path.isdir(self.dir):
+            error = nxFile.MakeDirs(self.dir)
+            if error is not None:
+                raise error
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1: ' + os.strerror(ctypes.get_errno()))
+        self.roots = {}
+        for root in roots:
+            self.roots[os.path.normpath(os.path.abspath(root))] = None
+        # wd: (root, directory relative to root)
+        self.watches = {}
+        # root: paths to journal at the next flush
+        self.pending = {}
+        self.roots_mtime = None
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, 'inotify_add_watch ' + path + ': ' + os.strerror(err))
+        return wd
+
+    def remove_watches(self, root):
+        for wd, watch in list(self.watches.items()):
+            if watch[0] == root:
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def watch_tree(self, root, rel):
+        """
+        Watches the directory rel of root and those under it.
+        """
+        pending = [rel]
+        while pending:
+            rel = pending.pop()
+            path = root
+            if rel:
+                path = os.path.join(root, rel)
+            try:
+                self.watches[self.add_watch(path)] = (root, rel)
+                entries = list(os.scandir(path))
+            except OSError:
+                if sys.exc_info()[1].errno in (errno.ENOENT, errno.ENOTDIR):
+                    # gone or replaced since; its event tells
+                    continue
+                raise
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(rel and rel + '/' + entry.name or entry.name)
+
+    def start(self, root):
+        """
+        Starts a new generation of the journal of root.  If root cannot be
+        watched, its journal is removed, so that nxFile checks it whole;
+        it is tried again while it does not exist, but not when it has
+        run out of watches.
+        """
+        self.remove_watches(root)
+        state = self.roots.get(root)
+        if state:
+            os.close(state[0])
+        self.roots[root] = None
+        self.pending.pop(root, None)
+        path = nxFile.JournalPath(root)
+        try:
+            # watched before the journal starts, so that a Test that finds
+            # the new journal misses no change made after it started
+            self.watch_tree(root, '')
+            tmp = path + '.' + str(os.getpid())
+            F = open(tmp, 'wb')
+            try:
+                F.write(nxFile.ChangeJournal.HEADER.pack(nxFile.ChangeJournal.MAGIC,
+                                                         os.urandom(8).hex().encode('ascii')))
+            finally:
+                F.close()
+            os.rename(tmp, path)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        except (IOError, OSError):
+            error = sys.exc_info()[1]
+            self.remove_watches(root)
+            if os.path.exists(path):
+                os.remove(path)
+            if error.errno == errno.ENOSPC:
+                LG().Log('WARNING', "Not journaling " + root + ": out of inotify watches, see fs.inotify.max_user_watches")
+                self.roots[root] = False
+            elif error.errno != errno.ENOENT:
+                LG().Log('WARNING', "Not journaling " + root + " Error: " + str(error))
+            return
+        self.roots[root] = (fd, nxFile.ChangeJournal.HEADER.size)
+        LG().Log('INFO', "Journaling " + root + " with " + str(len([1 for w in self.watches.values() if w[0] == root])) + " watches")
+
+    def journal(self, root, rel):
+        if self.roots.get(root):
+            self.pending.setdefault(root, set()).add(rel)
+
+    def flush(self):
+        for root, paths in list(self.pending.items()):
+            fd, size = self.roots[root]
+            data = ''.encode('ascii').join([os.fsencode(rel + '\0') for rel in paths])
+            os.write(fd, data)
+            self.roots[root] = (fd, size + len(data))
+            if JOURNAL_MAX_SIZE <= size + len(data):
+                self.start(root)
+        self.pending = {}
+
+    def read_events(self):
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError:
+                if sys.exc_info()[1].errno == errno.EAGAIN:
+                    return
+                raise
+            offset = 0
+            restart = set()
+            while offset < len(data):
+                wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+                name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip('\0'.encode('ascii'))
+                offset += self.EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # events were lost
+                    restart.update(self.roots.keys())
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                watch = self.watches.get(wd)
+                if watch is None:
+                    continue
+                root, rel = watch
+                if name:
+                    name = os.fsdecode(name)
+                    rel = rel and rel + '/' + name or name
+                    if os.path.join(root, rel).startswith(nxFile.cache_file_dir):
+                        # our own hash cache and journals
+                        continue
+                elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    if not rel:
+                        restart.add(root)
+                    continue
+                self.journal(root, rel)
+                if mask & IN_ISDIR:
+                    if mask & IN_MOVED_FROM:
+                        # the watches under it name it by its old path
+                        restart.add(root)
+                    elif mask & (IN_CREATE | IN_MOVED_TO):
+                        try:
+                            self.watch_tree(root, rel)
+                        except OSError:
+                            restart.add(root)
+            self.flush()
+            for root in restart:
+                self.start(root)
+
+    def poll_roots(self):
+        path = self.dir + 'roots'
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self.roots_mtime:
+            return
+        self.roots_mtime = mtime
+        F = open(path)
+        try:
+            roots = F.read().splitlines()
+        finally:
+            F.close()
+        for root in roots:
+            if root and root not in self.roots:
+                self.roots[root] = None
+                self.start(root)
+
+    def write_status(self):
+        tmp = self.dir + 'watcher.json.' + str(os.getpid())
+        F = open(tmp, 'w')
+        try:
+            json.dump({'pid': os.getpid(), 'heartbeat': time.time(),
+                       'roots': sorted([root for root in self.roots if self.roots[root]])}, F)
+        finally:
+            F.close()
+        os.rename(tmp, self.dir + 'watcher.json')
+
+    def run(self):
+        for root in list(self.roots.keys()):
+            self.start(root)
+        last_status = 0
+        while True:
+            now = time.time()
+            if nxFile.JOURNAL_HEARTBEAT <= now - last_status:
+                self.poll_roots()
+                for root in list(self.roots.keys()):
+                    if self.roots[root] is None and os.path.isdir(root):
+                        self.start(root)
+                self.write_status()
+                last_status = now
+            readable = select.select([self.fd], [], [], nxFile.JOURNAL_HEARTBEAT)[0]
+            if readable:
+                time.sleep(JOURNAL_BATCH_DELAY)
+                self.read_events()
+
+    def close(self):
+        try:
+            os.remove(self.dir + 'watcher.json')
+        except OSError:
+            pass
+        for state in self.roots.values():
+            if state:
+                os.close(state[0])
+        os.close(self.fd)
+
+
+def stop(signum, frame):
+    sys.exit(0)
+
+
+def main(argv):
+    if len(argv) > 1 and argv[1].startswith('-'):
+        sys.stderr.write('Usage: nxFileWatcher.py [ROOT ...]\n')
+        return 1
+    if sys.version < '3':
+        sys.stderr.write('nxFileWatcher.py needs python 3\n')
+        return 1
+    roots = [os.path.abspath(root) for root in argv[1:]]
+    load_nxFile()
+    try:
+        watcher = ChangeWatcher(roots)
+    except OSError:
+        sys.stderr.write('Cannot watch: ' + str(sys.exc_info()[1]) + '\n')
+        return 1
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        watcher.run()
+    finally:
+        watcher.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -1,4 +1,3 @@
-import ctypes
 import struct
 import sys
 import time
@@ -78,6 +77,23 @@ MI_TYPE_NAMES={
 DO_TRACE = True
 DO_VERBOSE_TRACE = False
 
+# bytes read from the socket per refill of SocketReader's buffer
+READ_BUFFER_SIZE = 65536
+
+# a SocketWriter created with a limit sends what it holds once it reaches
+# that many bytes, so very large responses do not sit in memory
+WRITE_FLUSH_SIZE = 1048576
+
+# block size used to copy a spooled MI_InstanceA stream to the socket
+STREAM_CHUNK_SIZE = 65536
+
+EMPTY_BYTES = ''.encode('ascii')
+
+try:
+    HAVE_MEMORYVIEW = memoryview is not None
+except NameError:
+    HAVE_MEMORYVIEW = False
+
 
 def trace(text):
     if DO_TRACE:
@@ -89,29 +105,33 @@ def verbose_trace(text):
         trace(text)
 
 
+# The read path runs once per decoded value, so the trace text is only
+# built when DO_VERBOSE_TRACE is set.
 def read_string(fd):
-    verbose_trace('<read_string>')
     buf = fd.recv(4)
     strl = struct.unpack('@i', buf)[0]
-    verbose_trace('  len: ' + str(strl))
     text = ''
     if 0 < strl:
         buf = fd.recv(strl)
         text = buf.decode('utf8')
-    verbose_trace('  str: "' + text + '"')
-    verbose_trace('</read_string>')
+    if DO_VERBOSE_TRACE:
+        verbose_trace('<read_string>')
+        verbose_trace('  len: ' + str(strl))
+        verbose_trace('  str: "' + text + '"')
+        verbose_trace('</read_string>')
     return text
 
 
+OLD_ARG_NAMES = sys.version < '2.6'
+
 def read_arg_name(fd):
-    verbose_trace('<read_argname>')
     name = read_string(fd)
-    if sys.version < '2.6':
+    if OLD_ARG_NAMES:
         arg_name = name.encode('ascii', 'ignore')
     else:
         arg_name = name
-    verbose_trace('  arg_name: "' + arg_name + '"')
-    verbose_trace('</read_argname>')
+    if DO_VERBOSE_TRACE:
+        verbose_trace('  arg_name: "' + arg_name + '"')
     return arg_name
 
 
@@ -120,7 +140,8 @@ def read_values(fd):
     arg_dict = dict()
     buf = fd.recv(4)
     argc = struct.unpack('@i', buf)[0]
-    verbose_trace('  argc: ' + str(argc))
+    if DO_VERBOSE_TRACE:
+        verbose_trace('  argc: ' + str(argc))
     for _ in range(argc):
         arg_name = read_arg_name(fd)
         arg_val = MI_Value.read(fd)
@@ -133,33 +154,45 @@ def write_string(fd, st):
     verbose_trace('<write_string>')
     verbose_trace('  st: "' + st + '"')
     verbose_trace(st)
-    buf = struct.pack('@i', len(st))
-    if not isinstance(buf, str):
-        buf += bytes(st, 'utf8')
+    # the length is that of the utf8 encoding, not the number of characters
+    if sys.version > '2.9':
+        data = bytes(st, 'utf8')
+    elif type(st) != str:  # python 2 unicode
+        data = st.encode('utf8')
     else:
-        buf += st
-    fd.send(buf)
+        data = st
+    fd.send(struct.pack('@i', len(data)) + data)
     verbose_trace('</write_string>')
 
 
 def write_values(fd, d):
     trace('<write_values>')
-    buf = struct.pack('@i', len(d))
-    fd.send(buf)
-    verbose_trace('  len: ' + str(len(d)))
     if sys.version > '2.9':
+        items = []
         for key, value in d.items():
             verbose_trace('  key: ' + key)
-            if not hasattr(value, 'value'):
+            if not isinstance(value, MI_Value):
                 sys.stderr.write('\n  key: ' + key + ' is not mi_value\n')
-            verbose_trace('  value: ' + str(value.value))
-            if value.value is not None:
-                write_string(fd, key)
-                value.write(fd)
+            if DO_VERBOSE_TRACE:
+                verbose_trace('  value: ' + repr(value))
+            # is_null() leaves a streamed MI_InstanceA unconsumed
+            if not value.is_null():
+                items.append((key, value))
+        # the count has to match the values that follow it
+        buf = struct.pack('@i', len(items))
+        fd.send(buf)
+        verbose_trace('  len: ' + str(len(items)))
+        for key, value in items:
+            write_string(fd, key)
+            value.write(fd)
     else:
+        buf = struct.pack('@i', len(d))
+        fd.send(buf)
+        verbose_trace('  len: ' + str(len(d)))
         for key, value in d.iteritems():
             trace('  key: ' + key)
-            verbose_trace('  value: ' + repr(value.value))
+            if DO_VERBOSE_TRACE:
+                verbose_trace('  value: ' + repr(value))
             if value is not None:
                 verbose_trace('  writing value')
                 write_string(fd, key)
@@ -174,36 +207,214 @@ class file_desc:
         pass
 
 
-class MI_Value:
-    value = None
+class SocketReader:
+    """ Buffered reader for the request side of a session socket.
+        recv(n) returns exactly n bytes so the MI_* readers never see a
+        short read.  It returns an empty buffer when the peer closed the
+        socket between frames and raises socket.error when the peer closed
+        it part way through one.  total counts the bytes handed out."""
+
+    def __init__(self, sock, bufsize=READ_BUFFER_SIZE):
+        self.sock = sock
+        self.bufsize = bufsize
+        self.buf = EMPTY_BYTES
+        self.pos = 0
+        self.total = 0
+
+    def fill(self, need):
+        """ Returns the buffered bytes followed by at least need more bytes
+            from the socket, or fewer at end of stream."""
+        chunks = [self.buf[self.pos:]]
+        self.buf = EMPTY_BYTES
+        self.pos = 0
+        while 0 < need:
+            data = self.sock.recv(max(need, self.bufsize))
+            if len(data) == 0:
+                break
+            chunks.append(data)
+            need -= len(data)
+        return EMPTY_BYTES.join(chunks)
+
+    def recv(self, n):
+        end = self.pos + n
+        if end <= len(self.buf):
+            data = self.buf[self.pos:end]
+            self.pos = end
+            self.total += n
+            return data
+        data = self.fill(end - len(self.buf))
+        if len(data) < n:
+            if 0 < len(data):
+                import socket
+                raise socket.error('connection closed after ' + str(len(data)) +
+                                   ' of ' + str(n) + ' bytes')
+            return data
+        self.buf = data
+        self.pos = n
+        self.total += n
+        return data[:n]
+
+    def recv_view(self, n):
+        """ Like recv(n), but bytes that are already buffered come back as
+            a memoryview over the buffer instead of a copy."""
+        end = self.pos + n
+        if HAVE_MEMORYVIEW and end <= len(self.buf):
+            view = memoryview(self.buf)[self.pos:end]
+            self.pos = end
+            self.total += n
+            return view
+        return self.recv(n)
+
+
+class SocketWriter:
+    """ Collects a complete response and sends it with a single sendall
+        when flush() is called.  If limit is given, whatever has been
+        collected is sent as soon as it reaches limit bytes.  total counts
+        every byte written, including those already sent, and sent those
+        passed on to sock."""
+
+    def __init__(self, sock, limit=None):
+        self.sock = sock
+        self.limit = limit
+        self.chunks = []
+        self.size = 0
+        self.total = 0
+        self.sent = 0
+
+    def sendall(self, buf):
+        self.chunks.append(buf)
+        self.size += len(buf)
+        self.total += len(buf)
+        if self.limit is not None and self.size >= self.limit:
+            self.flush()
+
+    def send(self, buf):
+        self.sendall(buf)
+        return len(buf)
+
+    def flush(self):
+        if 0 < len(self.chunks):
+            data = EMPTY_BYTES.join(self.chunks)
+            self.chunks = []
+            self.size = 0
+            self.sock.sendall(data)
+            self.sent += len(data)
+
+
+class SpoolWriter:
+    """ Writer that appends to an anonymous temporary file.  Used to
+        encode a streamed MI_InstanceA, whose element count is only known
+        once every element has been produced."""
+
+    def __init__(self):
+        import tempfile
+        self.file = tempfile.TemporaryFile()
+        self.size = 0
+
+    def sendall(self, buf):
+        self.file.write(buf)
+        self.size += len(buf)
+
+    def send(self, buf):
+        self.sendall(buf)
+        return len(buf)
+
+    def copy_to(self, fd):
+        self.file.seek(0)
+        while True:
+            buf = self.file.read(STREAM_CHUNK_SIZE)
+            if len(buf) == 0:
+                break
+            fd.sendall(buf)
+
+    def close(self):
+        self.file.close()
+
+
+# Numeric arrays are packed and unpacked whole with one struct call using
+# a format such as '@1000I' instead of one call per element.
+def write_array(fd, array_type, code, vals):
+    """ Sends the type byte, the element count and the elements of a
+        numeric array as a single buffer."""
+    count = len(vals)
+    fd.sendall(struct.pack('@B', array_type) + struct.pack('@i', count) +
+               struct.pack('@' + str(count) + code, *vals))
+
+
+if hasattr(struct, 'unpack_from'):
+    def decode_array(code, buf, count, offset=0):
+        """ Decodes count elements from buf, which may be a memoryview, at
+            offset without copying it."""
+        return struct.unpack_from('@' + str(count) + code, buf, offset)
+else:
+    def decode_array(code, buf, count, offset=0):
+        size = struct.calcsize('@' + str(count) + code)
+        return struct.unpack('@' + str(count) + code,
+                             buf[offset:offset + size])
+
+
+def read_array(fd, code):
+    """ Reads the element count and the elements of a numeric array."""
+    buf = fd.recv(4)
+    count = struct.unpack('@i', buf)[0]
+    size = count * struct.calcsize('@' + code)
+    if hasattr(fd, 'recv_view'):
+        buf = fd.recv_view(size)
+    else:
+        buf = fd.recv(size)
+    return list(decode_array(code, buf, count))
+
+
+def plain(val):
+    """ Returns the Python scalar held by val, which may still be a ctypes
+        object from callers written against the older value classes."""
+    if hasattr(val, 'value'):
+        return val.value
+    return val
+
+
+def to_unsigned(val, bits):
+    return int(plain(val)) & ((1 << bits) - 1)
+
+
+def to_signed(val, bits):
+    half = 1 << (bits - 1)
+    return ((int(plain(val)) + half) & ((half << 1) - 1)) - half
+
+
+def to_bool(val):
+    return bool(plain(val))
+
+
+def to_float(val):
+    return float(plain(val))
+
+
+# The value classes keep plain Python scalars in .value (bool, int, long,
+# float, str) and use __slots__ so that large inventory responses do not
+# carry a __dict__ and a ctypes object per value.
+class MI_Value(object):
+    __slots__ = ('type', 'value')
 
     def __init__(self, type):
         self.type = type
+        self.value = None
 
     def __repr__(self):
         return MI_TYPE_NAMES[self.type]+': '+repr(self.value)
 
     def __eq__(self, other):
-        if not isinstance(other,MI_Value):
+        if not isinstance(other, MI_Value):
             return False
         if self.type != other.type:
             return False
-        if type(self.value) != list :
-            if hasattr(self.value,'value'):
-                return self.value.value == other.value.value
-            return self.value == other.value
-        else:
-            if len(self.value) != len(other.value):
-                return False
-            for index in range(len(self.value)):
-                if self.value[index] != other.value[index]:
-                    return False
-            return True
+        return self.value == other.value
 
     def __ne__(self, other):
-        if self.__eq__(self,other):
-            return False
-        return True
+        return not self.__eq__(other)
+
+    def is_null(self):
+        return self.value is None
 
     def write(self, fd):
         verbose_trace('  <MI_Value::write>')
@@ -217,423 +428,210 @@ class MI_Value:
 
     @staticmethod
     def read(fd):
-        verbose_trace('<MI_Value::read>')
         buf = fd.recv(1)
         type = struct.unpack('@B', buf)[0]
         switch = type & ~(MI_NULL_FLAG)
-        verbose_trace('  type: ' + str(switch))
+        if DO_VERBOSE_TRACE:
+            verbose_trace('<MI_Value::read>')
+            verbose_trace('  type: ' + str(switch))
         val = None
-        if MI_BOOLEAN == switch:
-            val = MI_Boolean.read(fd, type)
-        elif MI_UINT8 == switch:
-            val = MI_Uint8.read(fd, type)
-        elif MI_SINT8 == switch:
-            val = MI_Sint8.read(fd, type)
-        elif MI_UINT16 == switch:
-            val = MI_Uint16.read(fd, type)
-        elif MI_SINT16 == switch:
-            val = MI_Sint16.read(fd, type)
-        elif MI_UINT32 == switch:
-            val = MI_Uint32.read(fd, type)
-        elif MI_SINT32 == switch:
-            val = MI_Sint32.read(fd, type)
-        elif MI_UINT64 == switch:
-            val = MI_Uint64.read(fd, type)
-        elif MI_SINT64 == switch:
-            val = MI_Sint64.read(fd, type)
-        elif MI_REAL32 == switch:
-            val = MI_Real32.read(fd, type)
-        elif MI_REAL64 == switch:
-            val = MI_Real64.read(fd, type)
-        elif MI_CHAR16 == switch:
-            val = MI_Char16.read(fd, type)
-        elif MI_DATETIME == switch:
-            val = MI_Datetime.read(fd, type)
-        elif MI_STRING == switch:
-            val = MI_String.read(fd, type)
-        elif MI_INSTANCE == switch:
-            val = MI_Instance.read(fd, type)
-        elif MI_BOOLEANA == switch:
-            val = MI_BooleanA.read(fd, type)
-        elif MI_UINT8A == switch:
-            val = MI_Uint8A.read(fd, type)
-        elif MI_SINT8A == switch:
-            val = MI_Sint8A.read(fd, type)
-        elif MI_UINT16A == switch:
-            val = MI_Uint16A.read(fd, type)
-        elif MI_SINT16A == switch:
-            val = MI_Sint16A.read(fd, type)
-        elif MI_UINT32A == switch:
-            val = MI_Uint32A.read(fd, type)
-        elif MI_SINT32A == switch:
-            val = MI_Sint32A.read(fd, type)
-        elif MI_UINT64A == switch:
-            val = MI_Uint64A.read(fd, type)
-        elif MI_SINT64A == switch:
-            val = MI_Sint64A.read(fd, type)
-        elif MI_REAL32A == switch:
-            val = MI_Real32A.read(fd, type)
-        elif MI_REAL64A == switch:
-            val = MI_Real64A.read(fd, type)
-        elif MI_CHAR16A == switch:
-            val = MI_Char16A.read(fd, type)
-        elif MI_DATETIMEA == switch:
-            val = MI_DatetimeA.read(fd, type)
-        elif MI_STRINGA == switch:
-            val = MI_StringA.read(fd, type)
-        elif MI_INSTANCEA == switch:
-            val = MI_InstanceA.read(fd, type)
+        cls = MI_VALUE_CLASSES.get(switch)
+        if cls is not None:
+            val = cls.read(fd, type)
         else:
             trace('Received unexpected type: ' + str(type))
         verbose_trace('</MI_Value::read>')
         return val
 
 
-class MI_Boolean(MI_Value):
-    def __init__(self, val):
-        MI_Value.__init__(self, MI_BOOLEAN)
+class MI_Scalar(MI_Value):
+    """ Base for the fixed size scalar types.  Subclasses set fmt to the
+        struct format of the value and convert to normalise it."""
+    __slots__ = ()
+    fmt = None
+
+    def __init__(self, type, val):
+        MI_Value.__init__(self, type)
         if val is not None:
-            # ctypes.c_bool not available if python < 2.6.6
-            try:
-                self.value = ctypes.c_bool(val)
-            except:
-                self.value = ctypes.c_int(val)
+            self.value = self.convert(val)
+
+    def convert(self, val):
+        return val
 
     def write(self, fd):
-        verbose_trace('<MI_Boolean.write>')
-        MI_Value.write(self, fd)
-        if self.value is not None:
-            verbose_trace('  value: ' + str(self.value.value))
-            if self.value.value:
-                tmp = 1
-            else:
-                tmp = 0
-            buf = struct.pack('@B', tmp)
-            fd.sendall(buf)
-        verbose_trace('</MI_Boolean.write>')
+        verbose_trace('<' + self.__class__.__name__ + '.write>')
+        if self.value is None:
+            fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
+        else:
+            verbose_trace('  value: ' + str(self.value))
+            fd.sendall(struct.pack('@B', self.type) +
+                       struct.pack(self.fmt, self.value))
+        verbose_trace('</' + self.__class__.__name__ + '.write>')
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Boolean.read>')
+    def read(cls, fd, flags):
         val = None
         if 0 == (MI_NULL_FLAG & flags):
-            buf = fd.recv(1)
-            val = struct.unpack('@B', buf)[0]
-            verbose_trace('val is ' + str(int(val)) + '\n')
-            if val:
-                tmp = 'True'
-            else:
-                tmp = 'False'
-            verbose_trace('  value: ' + tmp)
-        rval = MI_Boolean(val)
-        verbose_trace('</MI_Boolean.read>')
+            buf = fd.recv(struct.calcsize(cls.fmt))
+            val = struct.unpack(cls.fmt, buf)[0]
+        rval = cls(val)
+        if DO_VERBOSE_TRACE:
+            verbose_trace('<' + cls.__name__ + '.read> ' + repr(val))
         return rval
+    read = classmethod(read)
+
 
+class MI_Boolean(MI_Scalar):
+    __slots__ = ()
+    fmt = '@B'
 
-class MI_Uint8(MI_Value):
     def __init__(self, val):
-        MI_Value.__init__(self, MI_UINT8)
-        if val is not None:
-            self.value = ctypes.c_ubyte(val)
+        MI_Scalar.__init__(self, MI_BOOLEAN, val)
+
+    def convert(self, val):
+        return to_bool(val)
 
     def write(self, fd):
-        verbose_trace('<MI_Uint8.write>')
-        MI_Value.write(self, fd)
-        if self.value is not None:
-            verbose_trace('  value: ' + str(self.value.value))
-            buf = struct.pack('@B', self.value.value)
-            fd.sendall(buf)
-        verbose_trace('</MI_Uint8.write>')
+        verbose_trace('<MI_Boolean.write>')
+        if self.value is None:
+            fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
+        else:
+            verbose_trace('  value: ' + str(self.value))
+            if self.value:
+                tmp = 1
+            else:
+                tmp = 0
+            fd.sendall(struct.pack('@B', self.type) + struct.pack('@B', tmp))
+        verbose_trace('</MI_Boolean.write>')
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Uint8.read>')
-        val = None
-        if 0 == (MI_NULL_FLAG & flags):
-            buf = fd.recv(1)
-            val = struct.unpack('@B', buf)[0]
-        rval = MI_Uint8(val)
-        verbose_trace('</MI_Uint8.read>')
-        return rval
 
+class MI_Uint8(MI_Scalar):
+    __slots__ = ()
+    fmt = '@B'
 
-class MI_Sint8(MI_Value):
     def __init__(self, val):
-        MI_Value.__init__(self, MI_SINT8)
-        if val is not None:
-            self.value = ctypes.c_byte(val)
+        MI_Scalar.__init__(self, MI_UINT8, val)
 
-    def write(self, fd):
-        verbose_trace('<MI_Sint8.write>')
-        MI_Value.write(self, fd)
-        if self.value is not None:
-            verbose_trace('  value: ' + str(self.value.value))
-            buf = struct.pack('@b', self.value.value)
-            fd.sendall(buf)
-        verbose_trace('</MI_Sint8.write>')
+    def convert(self, val):
+        return to_unsigned(val, 8)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Sint8.read>')
-        val = None
-        if 0 == (MI_NULL_FLAG & flags):
-            buf = fd.recv(1)
-            val = struct.unpack('@b', buf)[0]
-        rval = MI_Sint8(val)
-        verbose_trace('</MI_Sint8.read>')
-        return rval
 
+class MI_Sint8(MI_Scalar):
+    __slots__ = ()
+    fmt = '@b'
 
-class MI_Uint16(MI_Value):
     def __init__(self, val):
-        MI_Value.__init__(self, MI_UINT16)
-        if val is not None:
-            self.value = ctypes.c_ushort(val)
+        MI_Scalar.__init__(self, MI_SINT8, val)
 
-    def write(self, fd):
-        verbose_trace('<MI_Uint16.write>')
-        MI_Value.write(self, fd)
-        if self.value is not None:
-            verbose_trace('  value: ' + str(self.value.value))
-            buf = struct.pack('@H', self.value.value)
-            fd.sendall(buf)
-        verbose_trace('</MI_Uint16.write>')
+    def convert(self, val):
+        return to_signed(val, 8)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Uint16.read>')
-        val = None
-        if 0 == (MI_NULL_FLAG & flags):
-            buf = fd.recv(2)
-            val = struct.unpack('@H', buf)[0]
-        rval = MI_Uint16(val)
-        verbose_trace('</MI_Uint16.read>')
-        return rval
 
+class MI_Uint16(MI_Scalar):
+    __slots__ = ()
+    fmt = '@H'
 
-class MI_Sint16(MI_Value):
     def __init__(self, val):
-        MI_Value.__init__(self, MI_SINT16)
-        if val is not None:
-            self.value = ctypes.c_short(val)
+        MI_Scalar.__init__(self, MI_UINT16, val)
 
-    def write(self, fd):
-        verbose_trace('<MI_Sint16.write>')
-        MI_Value.write(self, fd)
-        if self.value is not None:
-            verbose_trace('  value: ' + str(self.value.value))
-            buf = struct.pack('@h', self.value.value)
-            fd.sendall(buf)
-        verbose_trace('</MI_Sint16.write>')
+    def convert(self, val):
+        return to_unsigned(val, 16)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Sint16.read>')
-        val = None
-        if 0 == (MI_NULL_FLAG & flags):
-            buf = fd.recv(2)
-            val = struct.unpack('@h', buf)[0]
-        rval = MI_Sint16(val)
-        verbose_trace('</MI_Sint16.read>')
-        return rval
 
+class MI_Sint16(MI_Scalar):
+    __slots__ = ()
+    fmt = '@h'
 
-class MI_Uint32(MI_Value):
     def __init__(self, val):
-        MI_Value.__init__(self, MI_UINT32)
-        if val is not None:
-            self.value = ctypes.c_uint(val)
+        MI_Scalar.__init__(self, MI_SINT16, val)
 
-    def write(self, fd):
-        verbose_trace('<MI_Uint32.write>')
-        MI_Value.write(self, fd)
-        if self.value is not None:
-            verbose_trace('  value: ' + str(self.value.value))
-            buf = struct.pack('@I', self.value.value)
-            fd.sendall(buf)
-        verbose_trace('</MI_Uint32.write>')
+    def convert(self, val):
+        return to_signed(val, 16)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Uint32.read>')
-        val = None
-        if 0 == (MI_NULL_FLAG & flags):
-            buf = fd.recv(4)
-            val = struct.unpack('@I', buf)[0]
-        rval = MI_Uint32(val)
-        verbose_trace('</MI_Uint32.read>')
-        return rval
 
+class MI_Uint32(MI_Scalar):
+    __slots__ = ()
+    fmt = '@I'
 
-class MI_Sint32(MI_Value):
     def __init__(self, val):
-        MI_Value.__init__(self, MI_SINT32)
-        if val is not None:
-            self.value = ctypes.c_int(val)
+        MI_Scalar.__init__(self, MI_UINT32, val)
 
-    def write(self, fd):
-        verbose_trace('<MI_Sint32.write>')
-        MI_Value.write(self, fd)
-        if self.value is not None:
-            verbose_trace('  value: ' + str(self.value.value))
-            buf = struct.pack('@i', self.value.value)
-            fd.sendall(buf)
-        verbose_trace('</MI_Sint32.write>')
+    def convert(self, val):
+        return to_unsigned(val, 32)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Sint32.read>')
-        val = None
-        if 0 == (MI_NULL_FLAG & flags):
-            buf = fd.recv(4)
-            val = struct.unpack('@i', buf)[0]
-        rval = MI_Sint32(val)
-        verbose_trace('</MI_Sint32.read>')
-        return rval
 
+class MI_Sint32(MI_Scalar):
+    __slots__ = ()
+    fmt = '@i'
 
-class MI_Uint64(MI_Value):
     def __init__(self, val):
-        MI_Value.__init__(self, MI_UINT64)
-        if val is not None:
-            self.value = ctypes.c_ulonglong(val)
+        MI_Scalar.__init__(self, MI_SINT32, val)
 
-    def write(self, fd):
-        verbose_trace('<MI_Uint64.write>')
-        MI_Value.write(self, fd)
-        if self.value is not None:
-            verbose_trace('  value: ' + str(self.value.value))
-            buf = struct.pack('@Q', self.value.value)
-            fd.sendall(buf)
-        verbose_trace('</MI_Uint64.write>')
+    def convert(self, val):
+        return to_signed(val, 32)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Uint64.read>')
-        val = None
-        if 0 == (MI_NULL_FLAG & flags):
-            buf = fd.recv(8)
-            val = struct.unpack('@Q', buf)[0]
-        rval = MI_Uint64(val)
-        verbose_trace('</MI_Uint64.read>')
-        return rval
 
+class MI_Uint64(MI_Scalar):
+    __slots__ = ()
+    fmt = '@Q'
 
-class MI_Sint64(MI_Value):
     def __init__(self, val):
-        MI_Value.__init__(self, MI_SINT64)
-        if val is not None:
-            self.value = ctypes.c_longlong(val)
+        MI_Scalar.__init__(self, MI_UINT64, val)
 
-    def write(self, fd):
-        verbose_trace('<MI_Sint64.write>')
-        MI_Value.write(self, fd)
-        if self.value is not None:
-            verbose_trace('  value: ' + str(self.value.value))
-            buf = struct.pack('@q', self.value.value)
-            fd.sendall(buf)
-        verbose_trace('</MI_Sint64.write>')
+    def convert(self, val):
+        return to_unsigned(val, 64)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Sint64.read>')
-        val = None
-        if 0 == (MI_NULL_FLAG & flags):
-            buf = fd.recv(8)
-            val = struct.unpack('@q', buf)[0]
-        rval = MI_Sint64(val)
-        verbose_trace('</MI_Sint64.read>')
-        return rval
 
+class MI_Sint64(MI_Scalar):
+    __slots__ = ()
+    fmt = '@q'
 
-class MI_Real32(MI_Value):
     def __init__(self, val):
-        MI_Value.__init__(self, MI_REAL32)
-        if val is not None:
-            self.value = ctypes.c_float(val)
+        MI_Scalar.__init__(self, MI_SINT64, val)
 
-    def write(self, fd):
-        verbose_trace('<MI_Real32.write>')
-        MI_Value.write(self, fd)
-        if self.value is not None:
-            verbose_trace('  value: ' + str(self.value.value))
-            buf = struct.pack('@f', self.value.value)
-            fd.sendall(buf)
-        verbose_trace('</MI_Real32.write>')
+    def convert(self, val):
+        return to_signed(val, 64)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Real32.read>')
-        val = None
-        if 0 == (MI_NULL_FLAG & flags):
-            buf = fd.recv(8)
-            val = struct.unpack('@f', buf)[0]
-        rval = MI_Real32(val)
-        verbose_trace('</MI_Real32.read>')
-        return rval
 
+class MI_Real32(MI_Scalar):
+    __slots__ = ()
+    fmt = '@f'
 
-class MI_Real64(MI_Value):
     def __init__(self, val):
-        MI_Value.__init__(self, MI_REAL64)
-        if val is not None:
-            self.value = ctypes.c_double(val)
+        MI_Scalar.__init__(self, MI_REAL32, val)
 
-    def write(self, fd):
-        verbose_trace('<MI_Real64.write>')
-        MI_Value.write(self, fd)
-        if self.value is not None:
-            verbose_trace('  value: ' + str(self.value.value))
-            buf = struct.pack('@d', self.value.value)
-            fd.sendall(buf)
-        verbose_trace('</MI_Real64.write>')
+    def convert(self, val):
+        return to_float(val)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Real64.read>')
-        val = None
-        if 0 == (MI_NULL_FLAG & flags):
-            buf = fd.recv(8)
-            val = struct.unpack('@d', buf)[0]
-        rval = MI_Real64(val)
-        verbose_trace('</MI_Real64.read>')
-        return rval
 
+class MI_Real64(MI_Scalar):
+    __slots__ = ()
+    fmt = '@d'
 
-class MI_Char16(MI_Value):
     def __init__(self, val):
-        MI_Value.__init__(self, MI_CHAR16)
-        if val is not None:
-            self.value = ctypes.c_ushort(val)
+        MI_Scalar.__init__(self, MI_REAL64, val)
 
-    def write(self, fd):
-        verbose_trace('<MI_Char16.write>')
-        MI_Value.write(self, fd)
-        if self.value is not None:
-            verbose_trace('  value: ' + str(self.value.value))
-            buf = struct.pack('@H', self.value.value)
-            fd.sendall(buf)
-        verbose_trace('</MI_Char16.write>')
+    def convert(self, val):
+        return to_float(val)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Char16.read>')
-        val = None
-        if 0 == (MI_NULL_FLAG & flags):
-            buf = fd.recv(2)
-            val = struct.unpack('@H', buf)[0]
-        rval = MI_Char16(val)
-        verbose_trace('</MI_Char16.read>')
-        return rval
+
+class MI_Char16(MI_Scalar):
+    __slots__ = ()
+    fmt = '@H'
+
+    def __init__(self, val):
+        MI_Scalar.__init__(self, MI_CHAR16, val)
+
+    def convert(self, val):
+        return to_unsigned(val, 16)
 
 
 class MI_Datetime(MI_Value):
+    __slots__ = ()
+
     def __init__(self, isTimestamp):
         MI_Value.__init__(self, MI_DATETIME)
-        try:
-            self.value = ctypes.c_bool(isTimestamp)
-        except:
-            self.value = ctypes.c_int(isTimestamp)
+        if isTimestamp is not None:
+            self.value = to_bool(isTimestamp)
 
     def write(self, fd):
         verbose_trace('  <MI_Datetime.write>')
@@ -654,11 +652,7 @@ class MI_Datetime(MI_Value):
         verbose_trace('  <MI_Datetime.read_data>')
         rval = None
         buf = fd.recv(1)
-        isTimestamp = None
-        try:
-            isTimestamp = ctypes.c_bool(struct.unpack('@B', buf)[0])
-        except:
-            isTimestamp = ctypes.c_int(struct.unpack('@B', buf)[0])
+        isTimestamp = struct.unpack('@B', buf)[0]
         if isTimestamp:
             rval = MI_Timestamp.read_data(fd)
         else:
@@ -668,6 +662,9 @@ class MI_Datetime(MI_Value):
 
 
 class MI_Timestamp(MI_Datetime):
+    __slots__ = ('year', 'month', 'day', 'hour', 'minute', 'second',
+                 'microseconds', 'utc')
+
     def __init__(self,
                  year=None,
                  month=None,
@@ -688,46 +685,14 @@ class MI_Timestamp(MI_Datetime):
             MI_Datetime.__init__(self, None)
         else:
             MI_Datetime.__init__(self, True)
-
-        if year is None:
-            self.year = ctypes.c_uint(0)
-        else:
-            self.year = ctypes.c_uint(year)
-
-        if month is None:
-            self.month = ctypes.c_uint(0)
-        else:
-            self.month = ctypes.c_uint(month)
-
-        if day is None:
-            self.day = ctypes.c_uint(0)
-        else:
-            self.day = ctypes.c_uint(day)
-
-        if hour is None:
-            self.hour = ctypes.c_uint(0)
-        else:
-            self.hour = ctypes.c_uint(hour)
-
-        if minute is None:
-            self.minute = ctypes.c_uint(0)
-        else:
-            self.minute = ctypes.c_uint(minute)
-
-        if second is None:
-            self.second = ctypes.c_uint(0)
-        else:
-            self.second = ctypes.c_uint(second)
-
-        if microseconds is None:
-            self.microseconds = ctypes.c_uint32(0)
-        else:
-            self.microseconds = ctypes.c_uint32(microseconds)
-
-        if utc is None:
-            self.utc = ctypes.c_int(0)
-        else:
-            self.utc = ctypes.c_int(int(utc))
+        self.year = to_unsigned(year or 0, 32)
+        self.month = to_unsigned(month or 0, 32)
+        self.day = to_unsigned(day or 0, 32)
+        self.hour = to_unsigned(hour or 0, 32)
+        self.minute = to_unsigned(minute or 0, 32)
+        self.second = to_unsigned(second or 0, 32)
+        self.microseconds = to_unsigned(microseconds or 0, 32)
+        self.utc = to_signed(utc or 0, 32)
 
     def write(self, fd):
         verbose_trace('<MI_Timestamp.write>')
@@ -738,58 +703,23 @@ class MI_Timestamp(MI_Datetime):
 
     def write_data(self, fd):
         verbose_trace('  <MI_Timestamp.write_data>')
-        verbose_trace('    isTimestamp:' + str(self.value.value))
-        verbose_trace('    year:' + str(self.year.value))
-        verbose_trace('    month:' + str(self.month.value))
-        verbose_trace('    day:' + str(self.day.value))
-        verbose_trace('    hour:' + str(self.hour.value))
-        verbose_trace('    minute:' + str(self.minute.value))
-        verbose_trace('    second:' + str(self.second.value))
-        verbose_trace('    microseconds:' + str(self.microseconds.value))
-        verbose_trace('    utc:' + str(self.utc.value))
-        buf = struct.pack('@B', self.value.value)
-        buf += struct.pack('@I', self.year.value)
-        buf += struct.pack('@I', self.month.value)
-        buf += struct.pack('@I', self.day.value)
-        buf += struct.pack('@I', self.hour.value)
-        buf += struct.pack('@I', self.minute.value)
-        buf += struct.pack('@I', self.second.value)
-        buf += struct.pack('@I', self.microseconds.value)
-        buf += struct.pack('@i', self.utc.value)
+        verbose_trace('    ' + repr((self.year, self.month, self.day,
+                                      self.hour, self.minute, self.second,
+                                      self.microseconds, self.utc)))
+        buf = struct.pack('@B', 1)
+        buf += struct.pack('@7I', self.year, self.month, self.day, self.hour,
+                           self.minute, self.second, self.microseconds)
+        buf += struct.pack('@i', self.utc)
         fd.sendall(buf)
         verbose_trace('  </MI_Timestamp.write_data>')
 
     @staticmethod
     def read_data(fd):
         verbose_trace('    <MI_Timestamp.read_data>')
-        buf = fd.recv(4)
-        year = struct.unpack('@I', buf)[0]
-        buf = fd.recv(4)
-        month = struct.unpack('@I', buf)[0]
-        buf = fd.recv(4)
-        day = struct.unpack('@I', buf)[0]
-        buf = fd.recv(4)
-        hour = struct.unpack('@I', buf)[0]
-        buf = fd.recv(4)
-        minute = struct.unpack('@I', buf)[0]
-        buf = fd.recv(4)
-        second = struct.unpack('@I', buf)[0]
-        buf = fd.recv(4)
-        microseconds = struct.unpack('@I', buf)[0]
-        buf = fd.recv(4)
-        utc = struct.unpack('@i', buf)[0]
-        buf = fd.recv(4)
-        rval = MI_Timestamp(year, month, day, hour, minute, second,
-                            microseconds, utc)
-        verbose_trace('      isTimestamp: True')
-        verbose_trace('      year:' + str(year))
-        verbose_trace('      month:' + str(month))
-        verbose_trace('      day:' + str(day))
-        verbose_trace('      hour:' + str(hour))
-        verbose_trace('      minute:' + str(minute))
-        verbose_trace('      second:' + str(second))
-        verbose_trace('      microseconds:' + str(microseconds))
-        verbose_trace('      utc:' + str(utc))
+        buf = fd.recv(32)
+        fields = struct.unpack('@7Ii', buf)
+        rval = MI_Timestamp(*fields)
+        verbose_trace('      ' + repr(fields))
         verbose_trace('    </MI_Timestamp.read_data>')
         return rval
 
@@ -804,6 +734,8 @@ class MI_Timestamp(MI_Datetime):
 
 
 class MI_Interval(MI_Datetime):
+    __slots__ = ('days', 'hours', 'minutes', 'seconds', 'microseconds')
+
     def __init__(self,
                  days=None,
                  hours=None,
@@ -817,32 +749,12 @@ class MI_Interval(MI_Datetime):
            microseconds is None:
             MI_Datetime.__init__(self, None)
         else:
-            MI_Datetime.__init__(self, True)
-
-        if days is None:
-            self.day = ctypes.c_uint(0)
-        else:
-            self.days = ctypes.c_uint(days)
-
-        if hours is None:
-            self.hour = ctypes.c_uint(0)
-        else:
-            self.hours = ctypes.c_uint(hours)
-
-        if minutes is None:
-            self.minute = ctypes.c_uint(0)
-        else:
-            self.minutes = ctypes.c_uint(minutes)
-
-        if seconds is None:
-            self.second = ctypes.c_uint(0)
-        else:
-            self.seconds = ctypes.c_uint(seconds)
-
-        if microseconds is None:
-            self.microseconds = ctypes.c_uint32(0)
-        else:
-            self.microseconds = ctypes.c_uint32(microseconds)
+            MI_Datetime.__init__(self, False)
+        self.days = to_unsigned(days or 0, 32)
+        self.hours = to_unsigned(hours or 0, 32)
+        self.minutes = to_unsigned(minutes or 0, 32)
+        self.seconds = to_unsigned(seconds or 0, 32)
+        self.microseconds = to_unsigned(microseconds or 0, 32)
 
     def write(self, fd):
         verbose_trace('<MI_Interval.write>')
@@ -853,47 +765,28 @@ class MI_Interval(MI_Datetime):
 
     def write_data(self, fd):
         verbose_trace('  <MI_Interval.write_data>')
-        verbose_trace('    isTimestamp:' + str(self.value.value))
-        verbose_trace('    days:' + str(self.days.value))
-        verbose_trace('    hours:' + str(self.hours.value))
-        verbose_trace('    minutes:' + str(self.minutes.value))
-        verbose_trace('    seconds:' + str(self.seconds.value))
-        verbose_trace('    microseconds:' + str(self.microseconds.value))
-        buf = struct.pack('@B', self.value.value)
-        buf += struct.pack('@I', self.days.value)
-        buf += struct.pack('@I', self.hours.value)
-        buf += struct.pack('@I', self.minutes.value)
-        buf += struct.pack('@I', self.seconds.value)
-        buf += struct.pack('@I', self.microseconds.value)
+        verbose_trace('    ' + repr((self.days, self.hours, self.minutes,
+                                      self.seconds, self.microseconds)))
+        buf = struct.pack('@B', 0)
+        buf += struct.pack('@5I', self.days, self.hours, self.minutes,
+                           self.seconds, self.microseconds)
         fd.sendall(buf)
         verbose_trace('  </MI_Interval.write>')
 
     @staticmethod
     def read_data(fd):
         verbose_trace('    <MI_Interval.read_data>')
-        buf = fd.recv(4)
-        days = struct.unpack('@I', buf)[0]
-        buf = fd.recv(4)
-        hours = struct.unpack('@I', buf)[0]
-        buf = fd.recv(4)
-        minutes = struct.unpack('@I', buf)[0]
-        buf = fd.recv(4)
-        seconds = struct.unpack('@I', buf)[0]
-        buf = fd.recv(4)
-        microseconds = struct.unpack('@I', buf)[0]
-        buf = fd.recv(4)
-        rval = MI_Timestamp(days, hours, minutes, seconds, microseconds)
-        verbose_trace('      isTimestamp: False')
-        verbose_trace('      days:' + str(days))
-        verbose_trace('      hours:' + str(hours))
-        verbose_trace('      minutes:' + str(minutes))
-        verbose_trace('      seconds:' + str(seconds))
-        verbose_trace('      microseconds:' + str(microseconds))
+        buf = fd.recv(20)
+        fields = struct.unpack('@5I', buf)
+        rval = MI_Interval(*fields)
+        verbose_trace('      ' + repr(fields))
         verbose_trace('    </MI_Interval.read_data>')
         return rval
 
 
 class MI_String(MI_Value):
+    __slots__ = ()
+
     def __init__(self, val):
         MI_Value.__init__(self, MI_STRING)
         if val is not None:
@@ -928,16 +821,16 @@ class MI_String(MI_Value):
 
     @staticmethod
     def read(fd, flags):
-        verbose_trace('<MI_String.read>')
         strg = None
         if 0 == (MI_NULL_FLAG & flags):
             strg = read_string(fd)
         rval = MI_String(strg)
-        verbose_trace('</MI_String.read>')
         return rval
 
 
 class MI_Instance(MI_Value):
+    __slots__ = ()
+
     def __init__(self, val):
         MI_Value.__init__(self, MI_INSTANCE)
         if val is not None:
@@ -961,573 +854,216 @@ class MI_Instance(MI_Value):
         return rval
 
 
-class MI_BooleanA(MI_Value):
-    def __init__(self, vals):
-        MI_Value.__init__(self, MI_BOOLEANA)
+class MI_NumericArray(MI_Value):
+    """ Base for the fixed size array types.  Subclasses set code to the
+        struct code of one element and convert to normalise an element."""
+    __slots__ = ()
+    code = None
+
+    def __init__(self, type, vals):
+        MI_Value.__init__(self, type)
         self.value = []
         if vals is not None:
             for val in vals:
-                try:
-                    self.value.append(ctypes.c_bool(val))
-                except:
-                    self.value.append(ctypes.c_int(val))
+                self.value.append(self.convert(val))
+
+    def convert(self, val):
+        return val
+
+    def elements(self):
+        return self.value
 
     def write(self, fd):
-        verbose_trace('<MI_BooleanA.write>')
+        verbose_trace('<' + self.__class__.__name__ + '.write>')
         if self.value is not None and 0 < len(self.value):
-            MI_Value.write(self, fd)
             verbose_trace('  len:' + str(len(self.value)))
-            buf = struct.pack('@i', len(self.value))
-            fd.sendall(buf)
-            verbose_trace('    <values>')
-            for val in self.value:
-                verbose_trace('      value: ' + str(val.value))
-                if val.value:
-                    tmp = 1
-                else:
-                    tmp = 0
-                buf = struct.pack('@B', tmp)
-                fd.sendall(buf)
-            verbose_trace('  </values>')
+            write_array(fd, self.type, self.code, self.elements())
         else:
             verbose_trace('    type: ' + str(self.type))
             fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
-        verbose_trace('</MI_BooleanA.write>')
+        verbose_trace('</' + self.__class__.__name__ + '.write>')
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_BooleanA.read>')
-        vals = None
+    def decode(vals):
+        return vals
+    decode = staticmethod(decode)
+
+    def read(cls, fd, flags):
+        verbose_trace('<' + cls.__name__ + '.read>')
+        rval = cls(None)
         if 0 == (MI_NULL_FLAG & flags):
-            vals = []
-            buf = fd.recv(4)
-            length = struct.unpack('@i', buf)[0]
-            verbose_trace('  len:' + str(length))
-            for _ in range(length):
-                buf = fd.recv(1)
-                val = struct.unpack('@B', buf)[0]
-                verbose_trace('  value: ' + str(val))
-                vals.append(val)
-        rval = MI_BooleanA(vals)
-        verbose_trace('</MI_BooleanA.read>')
+            # decoded elements are already in range, skip convert()
+            rval.value = cls.decode(read_array(fd, cls.code))
+            verbose_trace('  len:' + str(len(rval.value)))
+        verbose_trace('</' + cls.__name__ + '.read>')
         return rval
+    read = classmethod(read)
+
 
+class MI_BooleanA(MI_NumericArray):
+    __slots__ = ()
+    code = 'B'
 
-class MI_Uint8A(MI_Value):
     def __init__(self, vals):
-        MI_Value.__init__(self, MI_UINT8A)
-        self.value = []
-        if vals is not None:
-            for val in vals:
-                self.value.append(ctypes.c_ubyte(val))
+        MI_NumericArray.__init__(self, MI_BOOLEANA, vals)
 
-    def write(self, fd):
-        verbose_trace('<MI_Uint8A.write>')
-        if self.value is not None and 0 < len(self.value):
-            MI_Value.write(self, fd)
-            verbose_trace('  len:' + str(len(self.value)))
-            buf = struct.pack('@i', len(self.value))
-            fd.sendall(buf)
-            verbose_trace('    <values>')
-            for val in self.value:
-                verbose_trace('      value: ' + str(val.value))
-                buf = struct.pack('@B', val.value)
-                fd.sendall(buf)
-            verbose_trace('  </values>')
-        else:
-            verbose_trace('    type: ' + str(self.type))
-            fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
-        verbose_trace('</MI_Uint8A.write>')
+    def convert(self, val):
+        return to_bool(val)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_UintA.read>')
-        vals = None
-        if 0 == (MI_NULL_FLAG & flags):
-            vals = []
-            buf = fd.recv(4)
-            length = struct.unpack('@i', buf)[0]
-            verbose_trace('  len:' + str(length))
-            for _ in range(length):
-                buf = fd.recv(1)
-                val = struct.unpack('@B', buf)[0]
-                verbose_trace('  value: ' + str(val))
-                vals.append(val)
-        rval = MI_Uint8A(vals)
-        verbose_trace('</MI_Uint8A.read>')
-        return rval
+    def elements(self):
+        return [val and 1 or 0 for val in self.value]
+
+    def decode(vals):
+        return [val != 0 for val in vals]
+    decode = staticmethod(decode)
 
 
-class MI_Sint8A(MI_Value):
+class MI_Uint8A(MI_NumericArray):
+    __slots__ = ()
+    code = 'B'
+
     def __init__(self, vals):
-        MI_Value.__init__(self, MI_SINT8A)
-        self.value = []
-        if vals is not None:
-            for val in vals:
-                self.value.append(ctypes.c_byte(val))
+        MI_NumericArray.__init__(self, MI_UINT8A, vals)
 
-    def write(self, fd):
-        verbose_trace('<MI_Sint8A.write>')
-        if self.value is not None and 0 < len(self.value):
-            MI_Value.write(self, fd)
-            verbose_trace('  len:' + str(len(self.value)))
-            buf = struct.pack('@i', len(self.value))
-            fd.sendall(buf)
-            verbose_trace('    <values>')
-            for val in self.value:
-                verbose_trace('      value: ' + str(val.value))
-                buf = struct.pack('@b', val.value)
-                fd.sendall(buf)
-            verbose_trace('  </values>')
-        else:
-            verbose_trace('    type: ' + str(self.type))
-            fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
-        verbose_trace('</MI_Sint8A.write>')
+    def convert(self, val):
+        return to_unsigned(val, 8)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_SintA.read>')
-        vals = None
-        if 0 == (MI_NULL_FLAG & flags):
-            vals = []
-            buf = fd.recv(4)
-            length = struct.unpack('@i', buf)[0]
-            verbose_trace('  len:' + str(length))
-            for _ in range(length):
-                buf = fd.recv(1)
-                val = struct.unpack('@b', buf)[0]
-                verbose_trace('  value: ' + str(val))
-                vals.append(val)
-        rval = MI_Sint8A(vals)
-        verbose_trace('</MI_Sint8A.read>')
-        return rval
 
+class MI_Sint8A(MI_NumericArray):
+    __slots__ = ()
+    code = 'b'
 
-class MI_Uint16A(MI_Value):
     def __init__(self, vals):
-        verbose_trace('<MI_Uint16A>')
-        MI_Value.__init__(self, MI_UINT16A)
-        self.value = []
-        if vals is not None:
-            for val in vals:
-                if isinstance(val, ctypes.c_ushort):
-                    self.value.append(val)
-                else:
-                    self.value.append(ctypes.c_ushort(val))
-        verbose_trace('</MI_Uint16A>')
+        MI_NumericArray.__init__(self, MI_SINT8A, vals)
 
-    def write(self, fd):
-        verbose_trace('<MI_Uint16A.write>')
-        if self.value is not None and 0 < len(self.value):
-            MI_Value.write(self, fd)
-            verbose_trace('  len:' + str(len(self.value)))
-            buf = struct.pack('@i', len(self.value))
-            fd.sendall(buf)
-            verbose_trace('  <values>')
-            for val in self.value:
-                verbose_trace('    value: ' + str(val.value))
-                buf = struct.pack('@H', val.value)
-                fd.sendall(buf)
-            verbose_trace('  </values>')
-        else:
-            verbose_trace('    type: ' + str(self.type))
-            fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
-        verbose_trace('</MI_Uint16A.write>')
+    def convert(self, val):
+        return to_signed(val, 8)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Uint16A.read>')
-        vals = None
-        if 0 == (MI_NULL_FLAG & flags):
-            vals = []
-            buf = fd.recv(4)
-            length = struct.unpack('@i', buf)[0]
-            verbose_trace('  len:' + str(length))
-            for _ in range(length):
-                buf = fd.recv(2)
-                val = struct.unpack('@H', buf)[0]
-                verbose_trace('  value: ' + str(val))
-                vals.append(val)
-        rval = MI_Uint16A(vals)
-        verbose_trace('</MI_Uint16A.read>')
-        return rval
 
+class MI_Uint16A(MI_NumericArray):
+    __slots__ = ()
+    code = 'H'
 
-class MI_Sint16A(MI_Value):
     def __init__(self, vals):
-        MI_Value.__init__(self, MI_SINT16A)
-        self.value = []
-        if vals is not None:
-            for val in vals:
-                self.value.append(ctypes.c_short(val))
+        MI_NumericArray.__init__(self, MI_UINT16A, vals)
 
-    def write(self, fd):
-        verbose_trace('<MI_Sint16A.write>')
-        if self.value is not None and 0 < len(self.value):
-            MI_Value.write(self, fd)
-            verbose_trace('  len:' + str(len(self.value)))
-            buf = struct.pack('@i', len(self.value))
-            fd.sendall(buf)
-            verbose_trace('    <values>')
-            for val in self.value:
-                verbose_trace('      value: ' + str(val.value))
-                buf = struct.pack('@h', val.value)
-                fd.sendall(buf)
-            verbose_trace('  </values>')
-        else:
-            verbose_trace('    type: ' + str(self.type))
-            fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
-        verbose_trace('</MI_Sint16A.write>')
+    def convert(self, val):
+        return to_unsigned(val, 16)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Sint16A.read>')
-        vals = None
-        if 0 == (MI_NULL_FLAG & flags):
-            vals = []
-            buf = fd.recv(4)
-            len = struct.unpack('@i', buf)[0]
-            verbose_trace('  len:' + str(len))
-            for _ in range(len):
-                buf = fd.recv(2)
-                val = struct.unpack('@h', buf)[0]
-                verbose_trace('  value: ' + str(val))
-                vals.append(val)
-        rval = MI_Sint16A(vals)
-        verbose_trace('</MI_Sint16A.read>')
-        return rval
 
+class MI_Sint16A(MI_NumericArray):
+    __slots__ = ()
+    code = 'h'
 
-class MI_Uint32A(MI_Value):
     def __init__(self, vals):
-        MI_Value.__init__(self, MI_UINT32A)
-        self.value = []
-        if vals is not None:
-            for val in vals:
-                self.value.append(ctypes.c_uint(val))
+        MI_NumericArray.__init__(self, MI_SINT16A, vals)
 
-    def write(self, fd):
-        verbose_trace('<MI_Uint32A.write>')
-        if self.value is not None and 0 < len(self.value):
-            MI_Value.write(self, fd)
-            verbose_trace('  len:' + str(len(self.value)))
-            buf = struct.pack('@i', len(self.value))
-            fd.sendall(buf)
-            verbose_trace('    <values>')
-            for val in self.value:
-                verbose_trace('      value: ' + str(val.value))
-                buf = struct.pack('@I', val.value)
-                fd.sendall(buf)
-            verbose_trace('  </values>')
-        else:
-            verbose_trace('    type: ' + str(self.type))
-            fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
-        verbose_trace('</MI_Uint32A.write>')
+    def convert(self, val):
+        return to_signed(val, 16)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Uint32A.read>')
-        vals = None
-        if 0 == (MI_NULL_FLAG & flags):
-            vals = []
-            buf = fd.recv(4)
-            length = struct.unpack('@i', buf)[0]
-            verbose_trace('  len:' + str(length))
-            for _ in range(length):
-                buf = fd.recv(4)
-                val = struct.unpack('@I', buf)[0]
-                verbose_trace('  value: ' + str(val))
-                vals.append(val)
-        rval = MI_Uint32A(vals)
-        verbose_trace('</MI_Uint32A.read>')
-        return rval
 
+class MI_Uint32A(MI_NumericArray):
+    __slots__ = ()
+    code = 'I'
 
-class MI_Sint32A(MI_Value):
     def __init__(self, vals):
-        MI_Value.__init__(self, MI_SINT32A)
-        self.value = []
-        if vals is not None:
-            for val in vals:
-                self.value.append(ctypes.c_int(val))
+        MI_NumericArray.__init__(self, MI_UINT32A, vals)
 
-    def write(self, fd):
-        verbose_trace('<MI_Sint32A.write>')
-        if self.value is not None and 0 < len(self.value):
-            MI_Value.write(self, fd)
-            verbose_trace('    len:' + str(len(self.value)))
-            buf = struct.pack('@i', len(self.value))
-            fd.sendall(buf)
-            verbose_trace('    <values>')
-            for val in self.value:
-                verbose_trace('      value: ' + str(val.value))
-                buf = struct.pack('@i', val.value)
-                fd.sendall(buf)
-            verbose_trace('  </values>')
-        else:
-            verbose_trace('    type: ' + str(self.type))
-            fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
-        verbose_trace('</MI_Sint32A.write>')
+    def convert(self, val):
+        return to_unsigned(val, 32)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Sint32A.read>')
-        vals = None
-        if 0 == (MI_NULL_FLAG & flags):
-            vals = []
-            buf = fd.recv(4)
-            length = struct.unpack('@i', buf)[0]
-            verbose_trace('  len:' + str(length))
-            for _ in range(length):
-                buf = fd.recv(4)
-                val = struct.unpack('@i', buf)[0]
-                verbose_trace('  value: ' + str(val))
-                vals.append(val)
-        rval = MI_Sint32A(vals)
-        verbose_trace('</MI_Sint32A.read>')
-        return rval
 
+class MI_Sint32A(MI_NumericArray):
+    __slots__ = ()
+    code = 'i'
 
-class MI_Uint64A(MI_Value):
     def __init__(self, vals):
-        MI_Value.__init__(self, MI_UINT64A)
-        self.value = []
-        if vals is not None:
-            for val in vals:
-                self.value.append(ctypes.c_ulonglong(val))
+        MI_NumericArray.__init__(self, MI_SINT32A, vals)
 
-    def write(self, fd):
-        verbose_trace('<MI_Uint64A.write>')
-        if self.value is not None and 0 < len(self.value):
-            MI_Value.write(self, fd)
-            verbose_trace('  len:' + str(len(self.value)))
-            buf = struct.pack('@i', len(self.value))
-            fd.sendall(buf)
-            verbose_trace('    <values>')
-            for val in self.value:
-                verbose_trace('      value: ' + str(val.value))
-                buf = struct.pack('@Q', val.value)
-                fd.sendall(buf)
-            verbose_trace('  </values>')
-        else:
-            verbose_trace('    type: ' + str(self.type))
-            fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
-        verbose_trace('</MI_Uint64A.write>')
+    def convert(self, val):
+        return to_signed(val, 32)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Uint64A.read>')
-        vals = None
-        if 0 == (MI_NULL_FLAG & flags):
-            vals = []
-            buf = fd.recv(4)
-            length = struct.unpack('@i', buf)[0]
-            verbose_trace('  len:' + str(length))
-            for _ in range(length):
-                buf = fd.recv(8)
-                val = struct.unpack('@Q', buf)[0]
-                verbose_trace('  value: ' + str(val))
-                vals.append(val)
-        rval = MI_Uint64A(vals)
-        verbose_trace('</MI_Uint64A.read>')
-        return rval
 
+class MI_Uint64A(MI_NumericArray):
+    __slots__ = ()
+    code = 'Q'
 
-class MI_Sint64A(MI_Value):
     def __init__(self, vals):
-        MI_Value.__init__(self, MI_SINT64A)
-        self.value = []
-        if vals is not None:
-            for val in vals:
-                self.value.append(ctypes.c_longlong(val))
+        MI_NumericArray.__init__(self, MI_UINT64A, vals)
 
-    def write(self, fd):
-        verbose_trace('<MI_Sint64A.write>')
-        if self.value is not None and 0 < len(self.value):
-            MI_Value.write(self, fd)
-            verbose_trace('  len:' + str(len(self.value)))
-            buf = struct.pack('@i', len(self.value))
-            fd.sendall(buf)
-            verbose_trace('    <values>')
-            for val in self.value:
-                verbose_trace('      value: ' + str(val.value))
-                buf = struct.pack('@q', val.value)
-                fd.sendall(buf)
-            verbose_trace('  </values>')
-        else:
-            verbose_trace('    type: ' + str(self.type))
-            fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
-        verbose_trace('</MI_Sint64A.write>')
+    def convert(self, val):
+        return to_unsigned(val, 64)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Sint64A.read>')
-        vals = None
-        if 0 == (MI_NULL_FLAG & flags):
-            vals = []
-            buf = fd.recv(4)
-            len = struct.unpack('@i', buf)[0]
-            verbose_trace('  len:' + str(len))
-            for _ in range(len):
-                buf = fd.recv(8)
-                val = struct.unpack('@q', buf)[0]
-                verbose_trace('  value: ' + str(val))
-                vals.append(val)
-        rval = MI_Sint64A(vals)
-        verbose_trace('</MI_Sint64A.read>')
-        return rval
 
+class MI_Sint64A(MI_NumericArray):
+    __slots__ = ()
+    code = 'q'
 
-class MI_Real32A(MI_Value):
     def __init__(self, vals):
-        MI_Value.__init__(self, MI_REAL32A)
-        self.value = []
-        if vals is not None:
-            for val in vals:
-                self.value.append(ctypes.c_float(val))
+        MI_NumericArray.__init__(self, MI_SINT64A, vals)
 
-    def write(self, fd):
-        verbose_trace('<MI_Real32A.write>')
-        if self.value is not None and 0 < len(self.value):
-            MI_Value.write(self, fd)
-            verbose_trace('  len:' + str(len(self.value)))
-            buf = struct.pack('@i', len(self.value))
-            fd.sendall(buf)
-            verbose_trace('    <values>')
-            for val in self.value:
-                verbose_trace('      value: ' + str(val.value))
-                buf = struct.pack('@f', val.value)
-                fd.sendall(buf)
-            verbose_trace('  </values>')
-        else:
-            verbose_trace('    type: ' + str(self.type))
-            fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
-        verbose_trace('</MI_Real32A.write>')
+    def convert(self, val):
+        return to_signed(val, 64)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Real32A.read>')
-        vals = None
-        if 0 == (MI_NULL_FLAG & flags):
-            vals = []
-            buf = fd.recv(4)
-            length = struct.unpack('@i', buf)[0]
-            verbose_trace('  len:' + str(length))
-            for _ in range(length):
-                buf = fd.recv(4)
-                val = struct.unpack('@f', buf)[0]
-                verbose_trace('  value: ' + str(val))
-                vals.append(val)
-        rval = MI_Real32A(vals)
-        verbose_trace('</MI_Real32A.read>')
-        return rval
 
+class MI_Real32A(MI_NumericArray):
+    __slots__ = ()
+    code = 'f'
 
-class MI_Real64A(MI_Value):
     def __init__(self, vals):
-        MI_Value.__init__(self, MI_REAL64A)
-        self.value = []
-        if vals is not None:
-            for val in vals:
-                self.value.append(ctypes.c_double(val))
+        MI_NumericArray.__init__(self, MI_REAL32A, vals)
 
-    def write(self, fd):
-        verbose_trace('<MI_Real64A.write>')
-        if self.value is not None and 0 < len(self.value):
-            MI_Value.write(self, fd)
-            verbose_trace('  len:' + str(len(self.value)))
-            buf = struct.pack('@i', len(self.value))
-            fd.sendall(buf)
-            verbose_trace('    <values>')
-            for val in self.value:
-                verbose_trace('      value: ' + str(val.value))
-                buf = struct.pack('@d', val.value)
-                fd.sendall(buf)
-            verbose_trace('  </values>')
-        else:
-            verbose_trace('    type: ' + str(self.type))
-            fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
-        verbose_trace('</MI_Real64A.write>')
+    def convert(self, val):
+        return to_float(val)
 
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Real64A.read>')
-        vals = None
-        if 0 == (MI_NULL_FLAG & flags):
-            vals = []
-            buf = fd.recv(4)
-            length = struct.unpack('@i', buf)[0]
-            verbose_trace('  len:' + str(length))
-            for _ in range(length):
-                buf = fd.recv(8)
-                val = struct.unpack('@d', buf)[0]
-                verbose_trace('  value: ' + str(val))
-                vals.append(val)
-        rval = MI_Real64A(vals)
-        verbose_trace('</MI_Real64A.read>')
-        return rval
+
+class MI_Real64A(MI_NumericArray):
+    __slots__ = ()
+    code = 'd'
+
+    def __init__(self, vals):
+        MI_NumericArray.__init__(self, MI_REAL64A, vals)
+
+    def convert(self, val):
+        return to_float(val)
+
+
+class MI_Char16A(MI_NumericArray):
+    __slots__ = ()
+    code = 'H'
+
+    def __init__(self, vals):
+        MI_NumericArray.__init__(self, MI_CHAR16A, vals)
+
+    def convert(self, val):
+        return to_unsigned(val, 16)
 
 
-class MI_Char16A(MI_Value):
+class MI_DatetimeA(MI_Value):
+    __slots__ = ()
+
     def __init__(self, vals):
-        MI_Value.__init__(self, MI_CHAR16A)
+        MI_Value.__init__(self, MI_DATETIMEA)
         self.value = []
         if vals is not None:
             for val in vals:
-                self.value.append(ctypes.c_ushort(val))
+                self.value.append(val)
+
+    def get_values(self):
+        return self.value
+    values = property(get_values)
 
     def write(self, fd):
-        verbose_trace('<MI_Char16A.write>')
+        verbose_trace('<MI_DatetimeA.write>')
         if self.value is not None and 0 < len(self.value):
             MI_Value.write(self, fd)
             verbose_trace('  len:' + str(len(self.value)))
             buf = struct.pack('@i', len(self.value))
             fd.sendall(buf)
-            verbose_trace('  <values>')
             for val in self.value:
-                verbose_trace('    value: ' + str(val.value))
-                buf = struct.pack('@H', val.value)
-                fd.sendall(buf)
-            verbose_trace('  </values>')
+                val.write_data(fd)
         else:
             verbose_trace('    type: ' + str(self.type))
             fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
-        verbose_trace('</MI_Char16A.write>')
-
-    @staticmethod
-    def read(fd, flags):
-        verbose_trace('<MI_Char16A.read>')
-        vals = None
-        if 0 == (MI_NULL_FLAG & flags):
-            vals = []
-            buf = fd.recv(4)
-            length = struct.unpack('@i', buf)[0]
-            verbose_trace('  len:' + str(length))
-            for i in range(length):
-                buf = fd.recv(2)
-                val = struct.unpack('@H', buf)[0]
-                verbose_trace('  value: ' + str(val))
-                vals.append(val)
-        rval = MI_Char16A(vals)
-        verbose_trace('</MI_Char16A.read>')
-        return rval
-
-
-class MI_DatetimeA(MI_Value):
-    def __init__(self, vals):
-        MI_Value.__init__(self, MI_DATETIMEA)
-        self.values = []
-        for val in vals:
-            self.values.append(val)
-
-    def write(self, fd):
-        verbose_trace('<MI_DatetimeA.write>')
-        MI_Value.write(self, fd)
-        verbose_trace('  len:' + str(len(self.values)))
-        buf = struct.pack('@i', len(self.values))
-        fd.sendall(buf)
-        for val in self.values:
-            val.write_data(fd)
         verbose_trace('</MI_DatetimeA.write>')
 
     @staticmethod
@@ -1548,6 +1084,8 @@ class MI_DatetimeA(MI_Value):
 
 
 class MI_StringA(MI_Value):
+    __slots__ = ()
+
     def __init__(self, vals):
         MI_Value.__init__(self, MI_STRINGA)
         self.value = []
@@ -1589,16 +1127,74 @@ class MI_StringA(MI_Value):
 
 
 class MI_InstanceA(MI_Value):
+    """ vals may be a list or any other iterable, typically a generator
+        from an Inventory_Marshall.  An iterable is only consumed when the
+        array is written, one instance at a time, or when .value is read,
+        which turns it into a list."""
+    __slots__ = ('items', 'pending')
+
     def __init__(self, vals=None):
+        self.pending = None
         MI_Value.__init__(self, MI_INSTANCEA)
         self.value = []
-        if vals is not None:
+        if isinstance(vals, (list, tuple)):
             for val in vals:
-                self.value.append(val)
+                self.items.append(val)
+        elif vals is not None:
+            self.pending = iter(vals)
+
+    def get_value(self):
+        if self.pending is not None:
+            pending = self.pending
+            self.pending = None
+            for val in pending:
+                self.items.append(val)
+        return self.items
+
+    def set_value(self, val):
+        self.pending = None
+        self.items = val
+
+    value = property(get_value, set_value)
+
+    def is_null(self):
+        return self.pending is None and self.items is None
+
+    def __repr__(self):
+        if self.pending is not None:
+            return MI_TYPE_NAMES[self.type] + ': <stream>'
+        return MI_Value.__repr__(self)
+
+    def write_stream(self, fd):
+        """ Encodes the pending instances into a spool file as they are
+            produced, then sends the type, the count and the spool in
+            STREAM_CHUNK_SIZE blocks.  The wire format is the same as for
+            a list."""
+        verbose_trace('<MI_InstanceA.write_stream>')
+        pending = self.pending
+        self.pending = None
+        spool = SpoolWriter()
+        try:
+            count = 0
+            for val in pending:
+                write_values(spool, val)
+                count += 1
+            verbose_trace('  len:' + str(count))
+            if 0 < count:
+                fd.sendall(struct.pack('@B', self.type) +
+                           struct.pack('@i', count))
+                spool.copy_to(fd)
+            else:
+                fd.sendall(struct.pack('@B', self.type | MI_NULL_FLAG))
+        finally:
+            spool.close()
+        verbose_trace('</MI_InstanceA.write_stream>')
 
     def write(self, fd):
         verbose_trace('<MI_InstanceA.write>')
-        if 0 < len(self.value):
+        if self.pending is not None:
+            self.write_stream(fd)
+        elif 0 < len(self.value):
             MI_Value.write(self, fd)
             verbose_trace('  len:' + str(len(self.value)))
             buf = struct.pack('@i', len(self.value))
@@ -1625,8 +1221,158 @@ class MI_InstanceA(MI_Value):
             verbose_trace('  len:' + str(length))
             for _ in range(length):
                 val = read_values(fd)
-                sys.stderr.write('....' + repr(val) + '....\n')
+                if DO_VERBOSE_TRACE:
+                    verbose_trace('  value: ' + repr(val))
                 vals.append(val)
         rval = MI_InstanceA(vals)
         verbose_trace('</MI_InstanceA.read>')
         return rval
+
+
+# type code -> value class, used by MI_Value.read
+MI_VALUE_CLASSES = {
+    MI_BOOLEAN: MI_Boolean,
+    MI_UINT8: MI_Uint8,
+    MI_SINT8: MI_Sint8,
+    MI_UINT16: MI_Uint16,
+    MI_SINT16: MI_Sint16,
+    MI_UINT32: MI_Uint32,
+    MI_SINT32: MI_Sint32,
+    MI_UINT64: MI_Uint64,
+    MI_SINT64: MI_Sint64,
+    MI_REAL32: MI_Real32,
+    MI_REAL64: MI_Real64,
+    MI_CHAR16: MI_Char16,
+    MI_DATETIME: MI_Datetime,
+    MI_STRING: MI_String,
+    MI_INSTANCE: MI_Instance,
+    MI_BOOLEANA: MI_BooleanA,
+    MI_UINT8A: MI_Uint8A,
+    MI_SINT8A: MI_Sint8A,
+    MI_UINT16A: MI_Uint16A,
+    MI_SINT16A: MI_Sint16A,
+    MI_UINT32A: MI_Uint32A,
+    MI_SINT32A: MI_Sint32A,
+    MI_UINT64A: MI_Uint64A,
+    MI_SINT64A: MI_Sint64A,
+    MI_REAL32A: MI_Real32A,
+    MI_REAL64A: MI_Real64A,
+    MI_CHAR16A: MI_Char16A,
+    MI_DATETIMEA: MI_DatetimeA,
+    MI_STRINGA: MI_StringA,
+    MI_INSTANCEA: MI_InstanceA,
+}
+
+
+# Plain decoding.  read_plain_values reads the same wire format as
+# read_values but builds the Python values directly, without MI_Value
+# objects: str, int, long, float, bool, None, dicts for instances and lists
+# for arrays.  A datetime becomes the tuple (year, month, day, hour, minute,
+# second, microseconds, utc) or, for an interval, (days, hours, minutes,
+# seconds, microseconds).  A null array becomes [], as .value of a null
+# MI_*A is [].
+def read_plain_values(fd):
+    arg_dict = {}
+    argc = struct.unpack('@i', fd.recv(4))[0]
+    for _ in range(argc):
+        if OLD_ARG_NAMES:
+            arg_name = read_arg_name(fd)
+        else:
+            arg_name = read_plain_text(fd)
+        arg_dict[arg_name] = read_plain(fd)
+    return arg_dict
+
+
+def read_plain(fd):
+    flags = ord(fd.recv(1))
+    reader = PLAIN_READERS.get(flags & ~MI_NULL_FLAG)
+    if reader is None:
+        trace('Received unexpected type: ' + str(flags))
+        return None
+    return reader(fd, flags)
+
+
+def read_plain_text(fd):
+    # read_string without the trace
+    strl = struct.unpack('@i', fd.recv(4))[0]
+    if 0 < strl:
+        return fd.recv(strl).decode('utf8')
+    return ''
+
+
+def plain_scalar_reader(cls):
+    fmt = cls.fmt
+    size = struct.calcsize(fmt)
+    is_bool = cls is MI_Boolean
+
+    def read(fd, flags):
+        if MI_NULL_FLAG & flags:
+            return None
+        val = struct.unpack(fmt, fd.recv(size))[0]
+        if is_bool:
+            return val != 0
+        return val
+    return read
+
+
+def plain_array_reader(cls):
+    code = cls.code
+    decode = cls.decode
+
+    def read(fd, flags):
+        if MI_NULL_FLAG & flags:
+            return []
+        return decode(read_array(fd, code))
+    return read
+
+
+def read_plain_datetime_data(fd):
+    if struct.unpack('@B', fd.recv(1))[0]:
+        return struct.unpack('@7Ii', fd.recv(32))
+    return struct.unpack('@5I', fd.recv(20))
+
+
+def read_plain_datetime(fd, flags):
+    if MI_NULL_FLAG & flags:
+        return None
+    return read_plain_datetime_data(fd)
+
+
+def read_plain_string(fd, flags):
+    if MI_NULL_FLAG & flags:
+        return None
+    return read_plain_text(fd)
+
+
+def read_plain_instance(fd, flags):
+    if MI_NULL_FLAG & flags:
+        return None
+    return read_plain_values(fd)
+
+
+def plain_list_reader(read_element):
+    def read(fd, flags):
+        vals = []
+        if 0 == (MI_NULL_FLAG & flags):
+            count = struct.unpack('@i', fd.recv(4))[0]
+            for _ in range(count):
+                vals.append(read_element(fd))
+        return vals
+    return read
+
+
+# type code -> function(fd, flags), used by read_plain
+PLAIN_READERS = {
+    MI_DATETIME: read_plain_datetime,
+    MI_STRING: read_plain_string,
+    MI_INSTANCE: read_plain_instance,
+    MI_DATETIMEA: plain_list_reader(read_plain_datetime_data),
+    MI_STRINGA: plain_list_reader(read_plain_text),
+    MI_INSTANCEA: plain_list_reader(read_plain_values),
+}
+for _type, _cls in MI_VALUE_CLASSES.items():
+    if issubclass(_cls, MI_Scalar):
+        PLAIN_READERS[_type] = plain_scalar_reader(_cls)
+    elif issubclass(_cls, MI_NumericArray):
+        PLAIN_READERS[_type] = plain_array_reader(_cls)
+del _type, _cls
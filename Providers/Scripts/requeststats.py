@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+#============================================================================
+# Copyright (c) Microsoft Corporation. All rights reserved. See license.txt for license information.
+#============================================================================
+"""
+Per-request measurements for client.py.
+
+client.py records, for every request, the time spent decoding it, in the
+provider's *_Marshall function and encoding the response, and the request
+and response sizes, keyed by provider and op.  They are kept in fixed
+bucket histograms and merged every DUMP_INTERVAL_SEC, and at the end of
+each session, into STATS_NAME next to dsc_python_client.pid.
+
+Run as a script to summarise that file:
+
+    requeststats.py [stats file]
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+
+try:
+    import json
+except ImportError:
+    # python 2.4 and 2.5: measurements are kept but never written
+    json = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+VarDir = "<PYTHON_PID_DIR>"
+STATS_NAME = 'dsc_python_stats.json'
+STATS_VERSION = 1
+DUMP_INTERVAL_SEC = 60
+
+# Upper bounds of the histogram buckets: 50us to about 10 minutes in steps
+# of 2**0.25 (so a percentile is within 19% of the true value), and 1 byte
+# to 4GB in powers of two.  Anything larger goes in a last, open bucket.
+SECONDS_BUCKETS = [0.00005 * 2 ** (i / 4.0) for i in range(96)]
+BYTES_BUCKETS = [2 ** i for i in range(33)]
+
+TIME_METRICS = ('decode', 'call', 'encode')
+BYTE_METRICS = ('request_bytes', 'response_bytes')
+
+clock = getattr(time, 'monotonic', time.time)
+
+
+def default_path():
+    return VarDir + '/run/python/' + repr(os.getuid()) + '/' + STATS_NAME
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def add(self, val):
+        self.counts[bisect.bisect_left(self.bounds, val)] += 1
+        self.count += 1
+        self.sum += val
+        if self.max < val:
+            self.max = val
+
+    def merge(self, d):
+        for i in range(len(self.counts)):
+            self.counts[i] += d['counts'][i]
+        self.count += d['count']
+        self.sum += d['sum']
+        if self.max < d['max']:
+            self.max = d['max']
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'max': self.max,
+                'counts': self.counts}
+
+    def percentile(self, p):
+        """ Upper bound of the bucket holding the p-th percentile, or the
+            largest value seen if that is smaller."""
+        if self.count == 0:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i in range(len(self.counts)):
+            seen += self.counts[i]
+            if rank <= seen and 0 < self.counts[i]:
+                if i < len(self.bounds) and self.bounds[i] < self.max:
+                    return self.bounds[i]
+                return self.max
+        return self.max
+
+
+def new_entry():
+    entry = {}
+    for name in TIME_METRICS:
+        entry[name] = Histogram(SECONDS_BUCKETS)
+    for name in BYTE_METRICS:
+        entry[name] = Histogram(BYTES_BUCKETS)
+    return entry
+
+
+def load_entries(d):
+    """ Histograms from a dump, keyed by 'provider op'.  A dump written
+        with other buckets is ignored."""
+    entries = {}
+    if d.get('version') != STATS_VERSION or \
+            d.get('seconds_buckets') != len(SECONDS_BUCKETS) or \
+            d.get('bytes_buckets') != len(BYTES_BUCKETS):
+        return entries
+    for key, metrics in d['stats'].items():
+        entries[key] = new_entry()
+        for name, h in metrics.items():
+            if name in entries[key]:
+                entries[key][name].merge(h)
+    return entries
+
+
+def dump_entries(entries):
+    stats = {}
+    for key, entry in entries.items():
+        stats[key] = {}
+        for name, h in entry.items():
+            stats[key][name] = h.to_dict()
+    return {'version': STATS_VERSION,
+            'seconds_buckets': len(SECONDS_BUCKETS),
+            'bytes_buckets': len(BYTES_BUCKETS),
+            'stats': stats}
+
+
+class RequestStats:
+    """ Histograms of the requests served by this process since the last
+        dump.  dump() adds them to the file, under an flock because other
+        client.py processes share it, and starts again from zero."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.last_dump = clock()
+
+    def add(self, provider, op, name, val):
+        key = provider + ' ' + op
+        self.lock.acquire()
+        try:
+            if key not in self.entries:
+                self.entries[key] = new_entry()
+            self.entries[key][name].add(val)
+        finally:
+            self.lock.release()
+
+    def record_decode(self, provider, op, secs, nbytes):
+        self.add(provider, op, 'decode', secs)
+        self.add(provider, op, 'request_bytes', nbytes)
+
+    def record_call(self, provider, op, call_secs, encode_secs, nbytes):
+        self.add(provider, op, 'call', call_secs)
+        self.add(provider, op, 'encode', encode_secs)
+        self.add(provider, op, 'response_bytes', nbytes)
+
+    def maybe_dump(self):
+        if DUMP_INTERVAL_SEC <= clock() - self.last_dump:
+            self.dump()
+
+    def dump(self):
+        self.lock.acquire()
+        try:
+            entries = self.entries
+            self.entries = {}
+            self.last_dump = clock()
+        finally:
+            self.lock.release()
+        if json is None or len(entries) == 0:
+            return
+        try:
+            self.merge_into_file(entries)
+        except (IOError, OSError, ValueError):
+            sys.stderr.write('Unable to write ' + self.path + ': ' +
+                             repr(sys.exc_info()[1]) + '\n')
+
+    def merge_into_file(self, entries):
+        lock_file = open(self.path + '.lock', 'a')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            total = {}
+            if os.path.exists(self.path):
+                F = open(self.path, 'r')
+                try:
+                    try:
+                        total = load_entries(json.load(F))
+                    except ValueError:
+                        # a damaged dump is replaced
+                        total = {}
+                finally:
+                    F.close()
+            for key, entry in entries.items():
+                if key not in total:
+                    total[key] = entry
+                    continue
+                for name, h in entry.items():
+                    total[key][name].merge(h.to_dict())
+            tmp = self.path + '.' + str(os.getpid())
+            F = open(tmp, 'w')
+            try:
+                json.dump(dump_entries(total), F)
+            finally:
+                F.close()
+            os.rename(tmp, self.path)
+        finally:
+            lock_file.close()
+
+
+def format_value(name, val):
+    if val is None:
+        return '-'
+    if name in BYTE_METRICS:
+        for unit in ('B', 'KB', 'MB'):
+            if val < 1024:
+                return '%d%s' % (val, unit)
+            val = val / 1024
+        return '%dGB' % val
+    if val < 1:
+        return '%.2fms' % (val * 1000)
+    return '%.2fs' % val
+
+
+def summarise(path, out=sys.stdout):
+    F = open(path, 'r')
+    try:
+        entries = load_entries(json.load(F))
+    finally:
+        F.close()
+    out.write('%-28s %-10s %-15s %8s %10s %10s %10s\n' %
+              ('provider', 'op', 'metric', 'count', 'p50', 'p95', 'p99'))
+    keys = list(entries.keys())
+    keys.sort()
+    for key in keys:
+        provider, op = key.split(' ', 1)
+        for name in TIME_METRICS + BYTE_METRICS:
+            h = entries[key][name]
+            if h.count == 0:
+                continue
+            out.write('%-28s %-10s %-15s %8d %10s %10s %10s\n' %
+                      (provider, op, name, h.count,
+                       format_value(name, h.percentile(50)),
+                       format_value(name, h.percentile(95)),
+                       format_value(name, h.percentile(99))))
+
+
+if __name__ == '__main__':
+    if json is None:
+        sys.stderr.write('requeststats.py needs python 2.6 or later\n')
+        sys.exit(1)
+    if 1 < len(sys.argv):
+        stats_path = sys.argv[1]
+    else:
+        stats_path = default_path()
+    if not os.path.exists(stats_path):
+        sys.stderr.write('No request statistics at ' + stats_path + '\n')
+        sys.exit(1)
+    summarise(stats_path)